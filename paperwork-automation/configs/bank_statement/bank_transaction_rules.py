@@ -1327,4 +1327,221 @@ FIRST DATA CANADA\(J\)''', re.IGNORECASE | re.MULTILINE),
         "是否登记线下付款表": False,
         "是否登记支票使用表": False,
     }),
-]
\ No newline at end of file
+]
+
+# Values written to the bank sheet when no rule matches - only 品名 is marked as pending
+UNMATCHED_SHEET_CLASSIFICATION: Dict[str, str] = {
+    "品名": "待确认",
+    "付款详情": "",
+    "单据号": "",
+    "附件": "",
+    "是否登记线下付款表": "",
+    "是否登记支票使用表": "",
+    "备注": "",
+}
+
+# Confirmation fields: True -> "待确认", string -> as-is, anything else -> ""
+CONFIRMATION_FIELDS = ("单据号", "附件", "是否登记线下付款表", "是否登记支票使用表", "备注")
+
+
+def format_sheet_classification(classification: Optional[Dict]) -> Dict[str, str]:
+    """
+    Convert a rule classification into the cell values written to the bank sheet.
+
+    Args:
+        classification: Classification dict of the matched rule, or None if no rule matched
+
+    Returns:
+        Dictionary with 品名, 付款详情 and the confirmation fields as strings
+    """
+    if classification is None:
+        return dict(UNMATCHED_SHEET_CLASSIFICATION)
+
+    result = {
+        "品名": classification.get("品名", "待确认"),
+        "付款详情": classification.get("付款详情", ""),
+    }
+    for field in CONFIRMATION_FIELDS:
+        value = classification.get(field, False)
+        if value == True:
+            result[field] = "待确认"
+        elif isinstance(value, str):
+            result[field] = value
+        else:
+            result[field] = ""
+    return result
+
+
+def _amount_predicate(amount_pattern):
+    """
+    Resolve an amount pattern once into a predicate on the absolute amount.
+
+    Mirrors the amount branch of TransactionMatchRule.matches() so the
+    pattern type is not re-dispatched for every transaction.
+    """
+    if amount_pattern is None:
+        return None
+    if isinstance(amount_pattern, (int, float)):
+        return lambda amount: abs(amount - amount_pattern) < 0.01
+    if isinstance(amount_pattern, tuple) and len(amount_pattern) == 2:
+        if isinstance(amount_pattern[0], str):
+            op, value = amount_pattern
+            if op == '>=':
+                return lambda amount: amount >= value
+            if op == '<=':
+                return lambda amount: amount <= value
+            return lambda amount: False
+        min_val, max_val = amount_pattern
+        return lambda amount: min_val <= amount <= max_val
+    return lambda amount: False
+
+
+class CompiledTransactionRules:
+    """
+    First-match classifier compiled from an ordered list of (rule, classification) tuples.
+
+    Gives the same answer as evaluating rule.matches() over the list in order,
+    but does far less work per transaction:
+    1. Rules are bucketed by transaction type ('credit' / 'debit'), untyped
+       rules are kept in every bucket at their original position
+    2. Plain string patterns are de-duplicated into one literal set and
+       screened with substring checks on the case-folded description, so only
+       rules whose literal occurs in the description become candidates
+    3. Amount patterns are resolved into predicates once and only evaluated
+       for candidate rules, in original rule order (first match wins)
+
+    Rules appended to the source list after compilation (e.g. via
+    BankDescriptionConfig.add_rule) trigger a recompile on the next lookup.
+    """
+
+    def __init__(self, rules: List[Tuple[TransactionMatchRule, Dict]]):
+        self.rules = rules
+        self.compile()
+
+    def compile(self):
+        """(Re)build the literal set and type buckets from self.rules"""
+        self._size = len(self.rules)
+        self._entries = []
+        self._literals = []
+        literal_ids = {}
+
+        for rule, classification in self.rules:
+            pattern = rule.description_pattern
+            literal_id = None
+            if isinstance(pattern, str) and pattern:
+                key = (pattern, rule.case_sensitive)
+                if key not in literal_ids:
+                    literal_ids[key] = len(self._literals)
+                    self._literals.append(rule)
+                literal_id = literal_ids[key]
+            self._entries.append((
+                rule, classification, literal_id,
+                _amount_predicate(rule.amount_pattern)))
+
+        self._buckets = {}
+        for transaction_type in ('credit', 'debit', None):
+            self._buckets[transaction_type] = self._build_bucket(transaction_type)
+
+    def _build_bucket(self, transaction_type: Optional[str]):
+        """
+        Collect the rules that can match a given transaction type.
+
+        Case-insensitive ASCII literals are screened with a plain substring test
+        against the lower-cased description; for ASCII text this is exactly what
+        re.IGNORECASE does. Other literals (case-sensitive or non-ASCII) and
+        all ASCII literals on non-ASCII text are screened with the rule's regex.
+        """
+        literal_positions = {}
+        always_candidates = []
+        for position, (rule, _, literal_id, _) in enumerate(self._entries):
+            if (rule.transaction_type is not None and transaction_type is not None
+                    and rule.transaction_type != transaction_type):
+                continue
+            if literal_id is None:
+                always_candidates.append(position)
+            else:
+                literal_positions.setdefault(literal_id, []).append(position)
+
+        folded_literals = []
+        regex_literals = []
+        for literal_id, positions in literal_positions.items():
+            rule = self._literals[literal_id]
+            pattern = rule.description_pattern
+            if not rule.case_sensitive and pattern.isascii():
+                folded_literals.append((pattern.lower(), rule.description_regex, positions))
+            else:
+                regex_literals.append((rule.description_regex, positions))
+        return folded_literals, regex_literals, always_candidates
+
+    def match(self, description: str, amount: Optional[float] = None,
+              transaction_type: Optional[str] = None) -> Optional[Tuple[TransactionMatchRule, Dict]]:
+        """
+        Find the first rule matching the transaction.
+
+        Args:
+            description: Transaction description
+            amount: Transaction amount (for exact amount matching)
+            transaction_type: 'credit' for incoming money, 'debit' for outgoing money
+
+        Returns:
+            The first matching (rule, classification) tuple, or None
+        """
+        if len(self.rules) != self._size:
+            self.compile()
+
+        bucket = self._buckets.get(transaction_type)
+        if bucket is None:
+            bucket = self._buckets[transaction_type] = self._build_bucket(transaction_type)
+        folded_literals, regex_literals, candidates = bucket
+
+        description = description or ""
+        if description.isascii():
+            folded = description.lower()
+            matched = [position for needle, _, positions in folded_literals
+                       if needle in folded for position in positions]
+        else:
+            matched = [position for _, regex, positions in folded_literals
+                       if regex.search(description) for position in positions]
+        matched.extend(position for regex, positions in regex_literals
+                       if regex.search(description) for position in positions)
+        if matched:
+            candidates = sorted(candidates + matched)
+
+        absolute_amount = abs(amount) if amount is not None else None
+        for position in candidates:
+            rule, classification, literal_id, amount_check = self._entries[position]
+            if (literal_id is None and rule.description_regex
+                    and not rule.description_regex.search(description)):
+                continue
+            if (amount_check is not None and absolute_amount is not None
+                    and not amount_check(absolute_amount)):
+                continue
+            return rule, classification
+        return None
+
+    def classify(self, description: str, amount: Optional[float] = None,
+                 transaction_type: Optional[str] = None) -> Optional[Dict]:
+        """Return the classification of the first matching rule, or None"""
+        found = self.match(description, amount, transaction_type)
+        return found[1] if found else None
+
+
+# Compiled once at import time; shared by every bank sheet writer
+COMPILED_TRANSACTION_RULES = CompiledTransactionRules(BANK_TRANSACTION_RULES)
+
+
+def classify_transaction(description: str, amount: Optional[float] = None,
+                         transaction_type: Optional[str] = None) -> Dict[str, str]:
+    """
+    Classify a transaction and return the values to write to the bank sheet.
+
+    Args:
+        description: Transaction description
+        amount: Transaction amount
+        transaction_type: 'credit' for incoming money, 'debit' for outgoing money
+
+    Returns:
+        Dictionary with classification data or default values
+    """
+    return format_sheet_classification(
+        COMPILED_TRANSACTION_RULES.classify(description, amount, transaction_type))
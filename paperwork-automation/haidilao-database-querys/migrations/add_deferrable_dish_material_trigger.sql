@@ -0,0 +1,34 @@
+-- Migration: Make the dish_material store consistency trigger deferrable
+-- Date: 2026-10-16
+-- Description: The dish-material mapping load now stages the whole file and
+--              upserts dish_material in one statement, after checking store
+--              consistency for all rows with a single anti-join. The per-row
+--              trigger becomes a constraint trigger (DEFERRABLE INITIALLY
+--              IMMEDIATE): behaviour is unchanged by default, and a bulk load can
+--              run SET CONSTRAINTS ... DEFERRED to check the rows at commit.
+--              Dishes are shared across stores, so only the material's store
+--              is compared (dish has no store_id column).
+
+CREATE OR REPLACE FUNCTION validate_dish_material_store_consistency()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Check if material belongs to the same store as the relationship
+    IF NOT EXISTS (
+        SELECT 1 FROM material m
+        WHERE m.id = NEW.material_id
+        AND m.store_id = NEW.store_id
+    ) THEN
+        RAISE EXCEPTION 'dish_material store_id must match material store_id';
+    END IF;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_dish_material_store_consistency ON dish_material;
+
+CREATE CONSTRAINT TRIGGER trigger_dish_material_store_consistency
+    AFTER INSERT OR UPDATE ON dish_material
+    DEFERRABLE INITIALLY IMMEDIATE
+    FOR EACH ROW
+    EXECUTE FUNCTION validate_dish_material_store_consistency();
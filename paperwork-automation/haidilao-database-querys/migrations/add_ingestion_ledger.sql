@@ -0,0 +1,23 @@
+-- Migration: Add ingestion_ledger table for incremental monthly extraction
+-- Date: 2026-10-16
+-- Description: The monthly automation re-read and re-upserted every dish sales,
+--              material detail, inventory and dish-material file on every run.
+--              ingestion_ledger records each source file an extractor loaded
+--              (path, size, mtime, SHA-256 of the content, target month and row
+--              counts), so a re-run skips files whose content has not changed.
+
+-- 数据导入台账 (Source File Ingestion Ledger)
+CREATE TABLE IF NOT EXISTS ingestion_ledger (
+    id SERIAL PRIMARY KEY,
+    source VARCHAR(50) NOT NULL, -- 导入步骤 (dish_sales, material_detail, inventory, dish_material)
+    file_path TEXT NOT NULL, -- 源文件绝对路径
+    file_size BIGINT NOT NULL, -- 文件大小 (字节)
+    file_mtime DOUBLE PRECISION NOT NULL, -- 文件修改时间 (Unix 时间戳)
+    content_hash CHAR(64) NOT NULL, -- 文件内容 SHA-256
+    target_year INTEGER NOT NULL CHECK (target_year >= 2020), -- 目标年份
+    target_month INTEGER NOT NULL CHECK (target_month >= 1 AND target_month <= 12), -- 目标月份
+    rows_read INTEGER DEFAULT 0, -- 读取行数
+    rows_written INTEGER DEFAULT 0, -- 写入行数
+    ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, -- 导入时间
+    UNIQUE(source, file_path, target_year, target_month) -- 同一步骤同一文件同一月份只记录一次
+);
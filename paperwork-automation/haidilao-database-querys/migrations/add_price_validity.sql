@@ -0,0 +1,160 @@
+-- Migration: Add validity ranges and as-of lookups to the price history tables
+-- Date: 2026-10-16
+-- Description: Reports looked up the price in effect for a month with a correlated
+--              "ORDER BY effective_year DESC, effective_month DESC LIMIT 1" subquery
+--              (or LEFT JOIN LATERAL) per usage/sales row, which neither price index
+--              covers. Each price row now carries valid_from (first day of its
+--              effective month) and valid_to (valid_from of the next price for the
+--              same item and store, NULL while current), maintained by statement-level
+--              triggers. material_price_as_of(date) / dish_price_as_of(date) return
+--              the one price per (item, store) in effect on a date, so reports join
+--              them once instead of running a subquery per row.
+
+-- ========================================
+-- VALIDITY COLUMNS
+-- ========================================
+
+ALTER TABLE material_price_history
+    ADD COLUMN IF NOT EXISTS valid_from DATE
+        GENERATED ALWAYS AS (make_date(effective_year, effective_month, 1)) STORED; -- 生效起始日 (生效月份第一天)
+ALTER TABLE material_price_history
+    ADD COLUMN IF NOT EXISTS valid_to DATE; -- 失效日 (下一条价格的生效日, 当前价格为 NULL)
+
+ALTER TABLE dish_price_history
+    ADD COLUMN IF NOT EXISTS valid_from DATE
+        GENERATED ALWAYS AS (make_date(effective_year, effective_month, 1)) STORED; -- 生效起始日 (生效月份第一天)
+ALTER TABLE dish_price_history
+    ADD COLUMN IF NOT EXISTS valid_to DATE; -- 失效日 (下一条价格的生效日, 当前价格为 NULL)
+
+-- Backfill valid_to for existing history
+UPDATE material_price_history h
+SET valid_to = ranges.valid_to
+FROM (
+    SELECT id,
+           LEAD(valid_from) OVER (PARTITION BY material_id, store_id ORDER BY valid_from) AS valid_to
+    FROM material_price_history
+) ranges
+WHERE h.id = ranges.id
+    AND h.valid_to IS DISTINCT FROM ranges.valid_to;
+
+UPDATE dish_price_history h
+SET valid_to = ranges.valid_to
+FROM (
+    SELECT id,
+           LEAD(valid_from) OVER (PARTITION BY dish_id, store_id ORDER BY valid_from) AS valid_to
+    FROM dish_price_history
+) ranges
+WHERE h.id = ranges.id
+    AND h.valid_to IS DISTINCT FROM ranges.valid_to;
+
+-- ========================================
+-- COVERING AS-OF INDEXES
+-- ========================================
+
+CREATE INDEX IF NOT EXISTS idx_material_price_asof
+    ON material_price_history(material_id, store_id, valid_from) INCLUDE (price, valid_to);
+CREATE INDEX IF NOT EXISTS idx_dish_price_asof
+    ON dish_price_history(dish_id, store_id, valid_from) INCLUDE (price, valid_to);
+
+-- ========================================
+-- VALIDITY MAINTENANCE
+-- ========================================
+
+-- Recompute valid_to for the (material, store) pairs a statement touched.
+-- The UPDATE below fires the update trigger again; the depth check ends it there.
+CREATE OR REPLACE FUNCTION refresh_material_price_validity()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF pg_trigger_depth() > 1 THEN
+        RETURN NULL;
+    END IF;
+
+    UPDATE material_price_history h
+    SET valid_to = ranges.valid_to
+    FROM (
+        SELECT p.id,
+               LEAD(p.valid_from) OVER (PARTITION BY p.material_id, p.store_id ORDER BY p.valid_from) AS valid_to
+        FROM material_price_history p
+        WHERE (p.material_id, p.store_id) IN (SELECT material_id, store_id FROM changed_rows)
+    ) ranges
+    WHERE h.id = ranges.id
+        AND h.valid_to IS DISTINCT FROM ranges.valid_to;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recompute valid_to for the (dish, store) pairs a statement touched.
+CREATE OR REPLACE FUNCTION refresh_dish_price_validity()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF pg_trigger_depth() > 1 THEN
+        RETURN NULL;
+    END IF;
+
+    UPDATE dish_price_history h
+    SET valid_to = ranges.valid_to
+    FROM (
+        SELECT p.id,
+               LEAD(p.valid_from) OVER (PARTITION BY p.dish_id, p.store_id ORDER BY p.valid_from) AS valid_to
+        FROM dish_price_history p
+        WHERE (p.dish_id, p.store_id) IN (SELECT dish_id, store_id FROM changed_rows)
+    ) ranges
+    WHERE h.id = ranges.id
+        AND h.valid_to IS DISTINCT FROM ranges.valid_to;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables allow one event per trigger, hence three triggers per table
+DROP TRIGGER IF EXISTS trigger_material_price_validity_insert ON material_price_history;
+DROP TRIGGER IF EXISTS trigger_material_price_validity_update ON material_price_history;
+DROP TRIGGER IF EXISTS trigger_material_price_validity_delete ON material_price_history;
+
+CREATE TRIGGER trigger_material_price_validity_insert AFTER INSERT ON material_price_history
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_material_price_validity();
+CREATE TRIGGER trigger_material_price_validity_update AFTER UPDATE ON material_price_history
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_material_price_validity();
+CREATE TRIGGER trigger_material_price_validity_delete AFTER DELETE ON material_price_history
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_material_price_validity();
+
+DROP TRIGGER IF EXISTS trigger_dish_price_validity_insert ON dish_price_history;
+DROP TRIGGER IF EXISTS trigger_dish_price_validity_update ON dish_price_history;
+DROP TRIGGER IF EXISTS trigger_dish_price_validity_delete ON dish_price_history;
+
+CREATE TRIGGER trigger_dish_price_validity_insert AFTER INSERT ON dish_price_history
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_dish_price_validity();
+CREATE TRIGGER trigger_dish_price_validity_update AFTER UPDATE ON dish_price_history
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_dish_price_validity();
+CREATE TRIGGER trigger_dish_price_validity_delete AFTER DELETE ON dish_price_history
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_dish_price_validity();
+
+-- ========================================
+-- AS-OF LOOKUPS
+-- ========================================
+
+-- Price of every (material, store) in effect on p_date. Plain SQL so the planner
+-- inlines it into the calling query as a range join on idx_material_price_asof.
+CREATE OR REPLACE FUNCTION material_price_as_of(p_date DATE)
+RETURNS TABLE (material_id INTEGER, store_id INTEGER, price NUMERIC) AS $$
+    SELECT h.material_id, h.store_id, h.price
+    FROM material_price_history h
+    WHERE h.valid_from <= p_date
+        AND (h.valid_to IS NULL OR h.valid_to > p_date)
+$$ LANGUAGE sql STABLE;
+
+-- Price of every (dish, store) in effect on p_date.
+CREATE OR REPLACE FUNCTION dish_price_as_of(p_date DATE)
+RETURNS TABLE (dish_id INTEGER, store_id INTEGER, price NUMERIC) AS $$
+    SELECT h.dish_id, h.store_id, h.price
+    FROM dish_price_history h
+    WHERE h.valid_from <= p_date
+        AND (h.valid_to IS NULL OR h.valid_to > p_date)
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,15 @@
+-- Migration: Add date indexes for report period range queries
+-- Date: 2026-10-16
+-- Description: ReportDataProvider filters daily_report and store_time_report with
+--              half-open date ranges (date >= start AND date < end) across all stores.
+--              The UNIQUE(store_id, date...) constraints lead with store_id, so these
+--              date-leading indexes let the planner use an index scan instead of
+--              reading every row ever loaded.
+
+CREATE INDEX IF NOT EXISTS idx_daily_report_date
+    ON daily_report(date);
+CREATE INDEX IF NOT EXISTS idx_store_time_report_date
+    ON store_time_report(date);
+
+ANALYZE daily_report;
+ANALYZE store_time_report;
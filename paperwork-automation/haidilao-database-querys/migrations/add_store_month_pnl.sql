@@ -0,0 +1,158 @@
+-- Migration: Add store_month_pnl materialized monthly P&L table
+-- Date: 2026-10-16
+-- Description: The gross revenue report recomputed store revenue, material cost and
+--              margin from dish_monthly_sale, material_monthly_usage and the price
+--              history tables on every run, once per month shown. store_month_pnl
+--              keeps one row per (store_id, year, month). The extraction scripts
+--              refresh the month they load with refresh_store_month_pnl(year, month),
+--              and the report sheets read the table with an indexed month range.
+--              Sales and usage are priced with dish_price_as_of / material_price_as_of
+--              on the first day of the month, like the report sheets, so apply
+--              add_price_validity.sql first. A price loaded for an earlier month
+--              also changes the later months that have no newer price for the item;
+--              refresh those months again (historical_backfill.py refreshes every
+--              month it loads).
+
+-- 门店月度损益汇总表 (Materialized Store Monthly P&L)
+CREATE TABLE IF NOT EXISTS store_month_pnl (
+    store_id INTEGER REFERENCES store(id), -- 外键：门店
+    year INTEGER NOT NULL CHECK (year >= 2020), -- 年份
+    month INTEGER NOT NULL CHECK (month >= 1 AND month <= 12), -- 月份 (1-12)
+    month_start DATE NOT NULL, -- 月份第一天 (用于跨月范围查询)
+    sales_revenue NUMERIC(16, 4) DEFAULT 0, -- 菜品销售额 (销售数量 - 退菜数量) × 当月价格
+    tax_amount NUMERIC(16, 4) DEFAULT 0, -- 税额
+    revenue NUMERIC(16, 4) DEFAULT 0, -- 不含税收入 (sales_revenue - tax_amount)
+    discount NUMERIC(16, 2) DEFAULT 0, -- 整月优惠总额 (daily_report.discount_total)
+    theoretical_cost NUMERIC(16, 4) DEFAULT 0, -- 理论物料成本 (BOM × 销售数量, 仅成本类物料)
+    actual_cost NUMERIC(16, 4) DEFAULT 0, -- 实际物料成本 (material_monthly_usage, 仅成本类物料)
+    gross_margin NUMERIC(10, 4) DEFAULT 0, -- 毛利率 (%) = (revenue - actual_cost) / revenue × 100
+    has_sales BOOLEAN NOT NULL DEFAULT FALSE, -- 本月是否有菜品销售记录
+    refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (store_id, year, month)
+);
+
+CREATE INDEX IF NOT EXISTS idx_store_month_pnl_month_start ON store_month_pnl(month_start);
+
+-- Rebuild one month of store_month_pnl from the monthly sales, usage and price tables.
+-- Uses the same formulas as the gross revenue report sheets, pricing sales and usage at the
+-- prices in effect on the first day of the month; returns the number of rows written.
+CREATE OR REPLACE FUNCTION refresh_store_month_pnl(p_year INTEGER, p_month INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    refreshed INTEGER;
+BEGIN
+    DELETE FROM store_month_pnl WHERE year = p_year AND month = p_month;
+
+    INSERT INTO store_month_pnl (
+        store_id, year, month, month_start, sales_revenue, tax_amount, revenue,
+        discount, theoretical_cost, actual_cost, gross_margin, has_sales
+    )
+    WITH sales AS (
+        SELECT
+            dms.store_id,
+            SUM((COALESCE(dms.sale_amount, 0) - COALESCE(dms.return_amount, 0)) * COALESCE(dph.price, 0)) AS sales_revenue,
+            SUM(COALESCE(dms.tax_amount, 0)) AS tax_amount
+        FROM dish_monthly_sale dms
+        LEFT JOIN dish_price_as_of(make_date(p_year, p_month, 1)) dph ON dph.dish_id = dms.dish_id
+            AND dph.store_id = dms.store_id
+        WHERE dms.year = p_year AND dms.month = p_month
+        GROUP BY dms.store_id
+    ),
+    actual AS (
+        SELECT
+            mmu.store_id,
+            SUM(COALESCE(mmu.material_used, 0) * COALESCE(mph.price, 0)) AS actual_cost
+        FROM material_monthly_usage mmu
+        JOIN material m ON m.id = mmu.material_id AND m.store_id = mmu.store_id
+        LEFT JOIN material_price_as_of(make_date(p_year, p_month, 1)) mph ON mph.material_id = m.id
+            AND mph.store_id = m.store_id
+        WHERE mmu.year = p_year AND mmu.month = p_month
+            AND mmu.material_use_type = '成本类'
+        GROUP BY mmu.store_id
+    ),
+    dish_sales AS (
+        SELECT dms.store_id, dms.dish_id, SUM(dms.sale_amount) AS total_quantity
+        FROM dish_monthly_sale dms
+        WHERE dms.year = p_year AND dms.month = p_month
+        GROUP BY dms.store_id, dms.dish_id
+    ),
+    theoretical AS (
+        SELECT
+            ds.store_id,
+            SUM(
+                CASE WHEN EXISTS (
+                    SELECT 1 FROM material_monthly_usage mmu
+                    WHERE mmu.material_id = m.id
+                      AND mmu.store_id = ds.store_id
+                      AND mmu.year = p_year
+                      AND mmu.month = p_month
+                      AND mmu.material_use_type = '成本类'
+                )
+                THEN ds.total_quantity * dm.standard_quantity * COALESCE(dm.loss_rate, 0) /
+                     COALESCE(NULLIF(dm.unit_conversion_rate, 0), 1) * COALESCE(mph.price, 0)
+                ELSE 0
+                END
+            ) AS theoretical_cost
+        FROM dish_sales ds
+        LEFT JOIN dish_material dm ON dm.dish_id = ds.dish_id AND dm.store_id = ds.store_id
+        LEFT JOIN material m ON m.id = dm.material_id AND m.store_id = ds.store_id
+        LEFT JOIN material_price_as_of(make_date(p_year, p_month, 1)) mph ON mph.material_id = m.id
+            AND mph.store_id = ds.store_id
+        GROUP BY ds.store_id
+    ),
+    discounts AS (
+        SELECT store_id, SUM(CAST(discount_total AS DECIMAL(15,2))) AS discount
+        FROM daily_report
+        WHERE date >= make_date(p_year, p_month, 1)
+            AND date < make_date(p_year, p_month, 1) + INTERVAL '1 month'
+        GROUP BY store_id
+    ),
+    stores AS (
+        SELECT store_id FROM sales
+        UNION SELECT store_id FROM actual
+        UNION SELECT store_id FROM theoretical
+        UNION SELECT store_id FROM discounts
+    )
+    SELECT
+        s.store_id,
+        p_year,
+        p_month,
+        make_date(p_year, p_month, 1),
+        COALESCE(sa.sales_revenue, 0),
+        COALESCE(sa.tax_amount, 0),
+        COALESCE(sa.sales_revenue, 0) - COALESCE(sa.tax_amount, 0),
+        COALESCE(d.discount, 0),
+        COALESCE(t.theoretical_cost, 0),
+        COALESCE(a.actual_cost, 0),
+        -- Clamped to the column range: a month with little revenue and a full month
+        -- of usage gives margins far below -100%
+        CASE
+            WHEN COALESCE(sa.sales_revenue, 0) - COALESCE(sa.tax_amount, 0) > 0 THEN
+                GREATEST(-999999.9999, LEAST(999999.9999,
+                    (COALESCE(sa.sales_revenue, 0) - COALESCE(sa.tax_amount, 0) - COALESCE(a.actual_cost, 0))
+                    / (COALESCE(sa.sales_revenue, 0) - COALESCE(sa.tax_amount, 0)) * 100))
+            ELSE 0
+        END,
+        sa.store_id IS NOT NULL
+    FROM stores s
+    LEFT JOIN sales sa ON sa.store_id = s.store_id
+    LEFT JOIN actual a ON a.store_id = s.store_id
+    LEFT JOIN theoretical t ON t.store_id = s.store_id
+    LEFT JOIN discounts d ON d.store_id = s.store_id
+    WHERE s.store_id IS NOT NULL;
+
+    GET DIAGNOSTICS refreshed = ROW_COUNT;
+    RETURN refreshed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Backfill every month that already has sales or usage data
+SELECT refresh_store_month_pnl(year, month)
+FROM (
+    SELECT DISTINCT year, month FROM dish_monthly_sale
+    UNION
+    SELECT DISTINCT year, month FROM material_monthly_usage
+) loaded_months
+ORDER BY year, month;
+
+ANALYZE store_month_pnl;
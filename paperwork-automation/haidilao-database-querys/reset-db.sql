@@ -5,6 +5,8 @@
 -- First drop all tables that depend on other tables
 
 -- Drop monthly performance tables (new)
+DROP TABLE IF EXISTS ingestion_ledger;
+DROP TABLE IF EXISTS store_month_pnl;
 DROP TABLE IF EXISTS monthly_combo_dish_sale;
 DROP TABLE IF EXISTS material_monthly_usage;
 DROP TABLE IF EXISTS dish_monthly_sale;
@@ -247,6 +249,8 @@ CREATE TABLE dish_price_history (
     effective_month INTEGER NOT NULL CHECK (effective_month >= 1 AND effective_month <= 12), -- 生效月份
     effective_year INTEGER NOT NULL CHECK (effective_year >= 2020), -- 生效年份
     is_active BOOLEAN DEFAULT TRUE,    -- 是否当前有效价格
+    valid_from DATE GENERATED ALWAYS AS (make_date(effective_year, effective_month, 1)) STORED, -- 生效起始日 (生效月份第一天)
+    valid_to DATE,                     -- 失效日 (下一条价格的生效日, 当前价格为 NULL; 由触发器维护)
     UNIQUE(dish_id, store_id, effective_month, effective_year) -- 同一菜品同一店同一月份只能有一个价格
 );
 
@@ -260,6 +264,8 @@ CREATE TABLE material_price_history (
     effective_month INTEGER NOT NULL CHECK (effective_month >= 1 AND effective_month <= 12), -- 生效月份
     effective_year INTEGER NOT NULL CHECK (effective_year >= 2020), -- 生效年份
     is_active BOOLEAN DEFAULT TRUE,    -- 是否当前有效价格
+    valid_from DATE GENERATED ALWAYS AS (make_date(effective_year, effective_month, 1)) STORED, -- 生效起始日 (生效月份第一天)
+    valid_to DATE,                     -- 失效日 (下一条价格的生效日, 当前价格为 NULL; 由触发器维护)
     UNIQUE(material_id, store_id, effective_month, effective_year) -- 同一物料同一门店同一月份只能有一个价格
 );
 
@@ -339,6 +345,40 @@ CREATE TABLE material_monthly_usage (
     UNIQUE(material_id, store_id, month, year) -- 同一物料同一门店同一月只能有一条记录
 );
 
+-- 门店月度损益汇总表 (Materialized Store Monthly P&L)
+CREATE TABLE store_month_pnl (
+    store_id INTEGER REFERENCES store(id), -- 外键：门店
+    year INTEGER NOT NULL CHECK (year >= 2020), -- 年份
+    month INTEGER NOT NULL CHECK (month >= 1 AND month <= 12), -- 月份 (1-12)
+    month_start DATE NOT NULL, -- 月份第一天 (用于跨月范围查询)
+    sales_revenue NUMERIC(16, 4) DEFAULT 0, -- 菜品销售额 (销售数量 - 退菜数量) × 当月价格
+    tax_amount NUMERIC(16, 4) DEFAULT 0, -- 税额
+    revenue NUMERIC(16, 4) DEFAULT 0, -- 不含税收入 (sales_revenue - tax_amount)
+    discount NUMERIC(16, 2) DEFAULT 0, -- 整月优惠总额 (daily_report.discount_total)
+    theoretical_cost NUMERIC(16, 4) DEFAULT 0, -- 理论物料成本 (BOM × 销售数量, 仅成本类物料)
+    actual_cost NUMERIC(16, 4) DEFAULT 0, -- 实际物料成本 (material_monthly_usage, 仅成本类物料)
+    gross_margin NUMERIC(10, 4) DEFAULT 0, -- 毛利率 (%) = (revenue - actual_cost) / revenue × 100
+    has_sales BOOLEAN NOT NULL DEFAULT FALSE, -- 本月是否有菜品销售记录
+    refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (store_id, year, month)
+);
+
+-- 数据导入台账 (Source File Ingestion Ledger)
+CREATE TABLE ingestion_ledger (
+    id SERIAL PRIMARY KEY,
+    source VARCHAR(50) NOT NULL, -- 导入步骤 (dish_sales, material_detail, inventory, dish_material)
+    file_path TEXT NOT NULL, -- 源文件绝对路径
+    file_size BIGINT NOT NULL, -- 文件大小 (字节)
+    file_mtime DOUBLE PRECISION NOT NULL, -- 文件修改时间 (Unix 时间戳)
+    content_hash CHAR(64) NOT NULL, -- 文件内容 SHA-256
+    target_year INTEGER NOT NULL CHECK (target_year >= 2020), -- 目标年份
+    target_month INTEGER NOT NULL CHECK (target_month >= 1 AND target_month <= 12), -- 目标月份
+    rows_read INTEGER DEFAULT 0, -- 读取行数
+    rows_written INTEGER DEFAULT 0, -- 写入行数
+    ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, -- 导入时间
+    UNIQUE(source, file_path, target_year, target_month) -- 同一步骤同一文件同一月份只记录一次
+);
+
 -- ========================================
 -- INDEXES FOR PERFORMANCE
 -- ========================================
@@ -380,15 +420,14 @@ CREATE INDEX idx_dish_material_material ON dish_material(material_id);
 CREATE OR REPLACE FUNCTION validate_dish_material_store_consistency()
 RETURNS TRIGGER AS $$
 BEGIN
-    -- Check if dish and material belong to the same store as the relationship
+    -- Check if material belongs to the same store as the relationship
+    -- (dishes are shared across stores)
     IF NOT EXISTS (
-        SELECT 1 FROM dish d, material m 
-        WHERE d.id = NEW.dish_id 
-        AND m.id = NEW.material_id 
-        AND d.store_id = NEW.store_id 
+        SELECT 1 FROM material m 
+        WHERE m.id = NEW.material_id 
         AND m.store_id = NEW.store_id
     ) THEN
-        RAISE EXCEPTION 'dish_material store_id must match both dish and material store_id';
+        RAISE EXCEPTION 'dish_material store_id must match material store_id';
     END IF;
     
     RETURN NEW;
@@ -396,8 +435,10 @@ END;
 $$ LANGUAGE plpgsql;
 
 -- Trigger to enforce store consistency on dish_material
-CREATE TRIGGER trigger_dish_material_store_consistency
-    BEFORE INSERT OR UPDATE ON dish_material
+-- (deferrable so bulk loads can check at commit with SET CONSTRAINTS ... DEFERRED)
+CREATE CONSTRAINT TRIGGER trigger_dish_material_store_consistency
+    AFTER INSERT OR UPDATE ON dish_material
+    DEFERRABLE INITIALLY IMMEDIATE
     FOR EACH ROW
     EXECUTE FUNCTION validate_dish_material_store_consistency();
 CREATE INDEX idx_material_child_type_active ON material_child_type(is_active);
@@ -421,6 +462,10 @@ CREATE INDEX idx_material_price_material_store ON material_price_history(materia
 CREATE INDEX idx_material_price_active ON material_price_history(is_active);
 CREATE INDEX idx_material_price_effective ON material_price_history(effective_year, effective_month);
 
+-- As-of price lookups (valid_from <= date < valid_to) read these without touching the table
+CREATE INDEX idx_dish_price_asof ON dish_price_history(dish_id, store_id, valid_from) INCLUDE (price, valid_to);
+CREATE INDEX idx_material_price_asof ON material_price_history(material_id, store_id, valid_from) INCLUDE (price, valid_to);
+
 -- Inventory count indexes
 CREATE INDEX idx_inventory_count_store_date ON inventory_count(store_id, year, month);
 CREATE INDEX idx_inventory_count_material ON inventory_count(material_id);
@@ -446,6 +491,221 @@ CREATE INDEX idx_material_monthly_usage_date ON material_monthly_usage(year, mon
 -- Month static data indexes
 CREATE INDEX idx_month_static_data_month ON month_static_data(month);
 
+-- Report period range indexes (date >= start AND date < end across all stores)
+CREATE INDEX idx_daily_report_date ON daily_report(date);
+CREATE INDEX idx_store_time_report_date ON store_time_report(date);
+
+-- Store monthly P&L indexes (month_start range reads for trend sheets)
+CREATE INDEX idx_store_month_pnl_month_start ON store_month_pnl(month_start);
+
+-- ========================================
+-- STORE MONTHLY P&L REFRESH
+-- ========================================
+
+-- Rebuild one month of store_month_pnl from the monthly sales, usage and price tables.
+-- Uses the same formulas as the gross revenue report sheets, pricing sales and usage at the
+-- prices in effect on the first day of the month; returns the number of rows written.
+CREATE OR REPLACE FUNCTION refresh_store_month_pnl(p_year INTEGER, p_month INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    refreshed INTEGER;
+BEGIN
+    DELETE FROM store_month_pnl WHERE year = p_year AND month = p_month;
+
+    INSERT INTO store_month_pnl (
+        store_id, year, month, month_start, sales_revenue, tax_amount, revenue,
+        discount, theoretical_cost, actual_cost, gross_margin, has_sales
+    )
+    WITH sales AS (
+        SELECT
+            dms.store_id,
+            SUM((COALESCE(dms.sale_amount, 0) - COALESCE(dms.return_amount, 0)) * COALESCE(dph.price, 0)) AS sales_revenue,
+            SUM(COALESCE(dms.tax_amount, 0)) AS tax_amount
+        FROM dish_monthly_sale dms
+        LEFT JOIN dish_price_as_of(make_date(p_year, p_month, 1)) dph ON dph.dish_id = dms.dish_id
+            AND dph.store_id = dms.store_id
+        WHERE dms.year = p_year AND dms.month = p_month
+        GROUP BY dms.store_id
+    ),
+    actual AS (
+        SELECT
+            mmu.store_id,
+            SUM(COALESCE(mmu.material_used, 0) * COALESCE(mph.price, 0)) AS actual_cost
+        FROM material_monthly_usage mmu
+        JOIN material m ON m.id = mmu.material_id AND m.store_id = mmu.store_id
+        LEFT JOIN material_price_as_of(make_date(p_year, p_month, 1)) mph ON mph.material_id = m.id
+            AND mph.store_id = m.store_id
+        WHERE mmu.year = p_year AND mmu.month = p_month
+            AND mmu.material_use_type = '成本类'
+        GROUP BY mmu.store_id
+    ),
+    dish_sales AS (
+        SELECT dms.store_id, dms.dish_id, SUM(dms.sale_amount) AS total_quantity
+        FROM dish_monthly_sale dms
+        WHERE dms.year = p_year AND dms.month = p_month
+        GROUP BY dms.store_id, dms.dish_id
+    ),
+    theoretical AS (
+        SELECT
+            ds.store_id,
+            SUM(
+                CASE WHEN EXISTS (
+                    SELECT 1 FROM material_monthly_usage mmu
+                    WHERE mmu.material_id = m.id
+                      AND mmu.store_id = ds.store_id
+                      AND mmu.year = p_year
+                      AND mmu.month = p_month
+                      AND mmu.material_use_type = '成本类'
+                )
+                THEN ds.total_quantity * dm.standard_quantity * COALESCE(dm.loss_rate, 0) /
+                     COALESCE(NULLIF(dm.unit_conversion_rate, 0), 1) * COALESCE(mph.price, 0)
+                ELSE 0
+                END
+            ) AS theoretical_cost
+        FROM dish_sales ds
+        LEFT JOIN dish_material dm ON dm.dish_id = ds.dish_id AND dm.store_id = ds.store_id
+        LEFT JOIN material m ON m.id = dm.material_id AND m.store_id = ds.store_id
+        LEFT JOIN material_price_as_of(make_date(p_year, p_month, 1)) mph ON mph.material_id = m.id
+            AND mph.store_id = ds.store_id
+        GROUP BY ds.store_id
+    ),
+    discounts AS (
+        SELECT store_id, SUM(CAST(discount_total AS DECIMAL(15,2))) AS discount
+        FROM daily_report
+        WHERE date >= make_date(p_year, p_month, 1)
+            AND date < make_date(p_year, p_month, 1) + INTERVAL '1 month'
+        GROUP BY store_id
+    ),
+    stores AS (
+        SELECT store_id FROM sales
+        UNION SELECT store_id FROM actual
+        UNION SELECT store_id FROM theoretical
+        UNION SELECT store_id FROM discounts
+    )
+    SELECT
+        s.store_id,
+        p_year,
+        p_month,
+        make_date(p_year, p_month, 1),
+        COALESCE(sa.sales_revenue, 0),
+        COALESCE(sa.tax_amount, 0),
+        COALESCE(sa.sales_revenue, 0) - COALESCE(sa.tax_amount, 0),
+        COALESCE(d.discount, 0),
+        COALESCE(t.theoretical_cost, 0),
+        COALESCE(a.actual_cost, 0),
+        -- Clamped to the column range: a month with little revenue and a full month
+        -- of usage gives margins far below -100%
+        CASE
+            WHEN COALESCE(sa.sales_revenue, 0) - COALESCE(sa.tax_amount, 0) > 0 THEN
+                GREATEST(-999999.9999, LEAST(999999.9999,
+                    (COALESCE(sa.sales_revenue, 0) - COALESCE(sa.tax_amount, 0) - COALESCE(a.actual_cost, 0))
+                    / (COALESCE(sa.sales_revenue, 0) - COALESCE(sa.tax_amount, 0)) * 100))
+            ELSE 0
+        END,
+        sa.store_id IS NOT NULL
+    FROM stores s
+    LEFT JOIN sales sa ON sa.store_id = s.store_id
+    LEFT JOIN actual a ON a.store_id = s.store_id
+    LEFT JOIN theoretical t ON t.store_id = s.store_id
+    LEFT JOIN discounts d ON d.store_id = s.store_id
+    WHERE s.store_id IS NOT NULL;
+
+    GET DIAGNOSTICS refreshed = ROW_COUNT;
+    RETURN refreshed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ========================================
+-- PRICE VALIDITY RANGES AND AS-OF LOOKUPS
+-- ========================================
+
+-- Recompute valid_to for the (material, store) pairs a statement touched.
+-- The UPDATE below fires the update trigger again; the depth check ends it there.
+CREATE OR REPLACE FUNCTION refresh_material_price_validity()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF pg_trigger_depth() > 1 THEN
+        RETURN NULL;
+    END IF;
+
+    UPDATE material_price_history h
+    SET valid_to = ranges.valid_to
+    FROM (
+        SELECT p.id,
+               LEAD(p.valid_from) OVER (PARTITION BY p.material_id, p.store_id ORDER BY p.valid_from) AS valid_to
+        FROM material_price_history p
+        WHERE (p.material_id, p.store_id) IN (SELECT material_id, store_id FROM changed_rows)
+    ) ranges
+    WHERE h.id = ranges.id
+        AND h.valid_to IS DISTINCT FROM ranges.valid_to;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recompute valid_to for the (dish, store) pairs a statement touched.
+CREATE OR REPLACE FUNCTION refresh_dish_price_validity()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF pg_trigger_depth() > 1 THEN
+        RETURN NULL;
+    END IF;
+
+    UPDATE dish_price_history h
+    SET valid_to = ranges.valid_to
+    FROM (
+        SELECT p.id,
+               LEAD(p.valid_from) OVER (PARTITION BY p.dish_id, p.store_id ORDER BY p.valid_from) AS valid_to
+        FROM dish_price_history p
+        WHERE (p.dish_id, p.store_id) IN (SELECT dish_id, store_id FROM changed_rows)
+    ) ranges
+    WHERE h.id = ranges.id
+        AND h.valid_to IS DISTINCT FROM ranges.valid_to;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables allow one event per trigger, hence three triggers per table
+CREATE TRIGGER trigger_material_price_validity_insert AFTER INSERT ON material_price_history
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_material_price_validity();
+CREATE TRIGGER trigger_material_price_validity_update AFTER UPDATE ON material_price_history
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_material_price_validity();
+CREATE TRIGGER trigger_material_price_validity_delete AFTER DELETE ON material_price_history
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_material_price_validity();
+
+CREATE TRIGGER trigger_dish_price_validity_insert AFTER INSERT ON dish_price_history
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_dish_price_validity();
+CREATE TRIGGER trigger_dish_price_validity_update AFTER UPDATE ON dish_price_history
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_dish_price_validity();
+CREATE TRIGGER trigger_dish_price_validity_delete AFTER DELETE ON dish_price_history
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_dish_price_validity();
+
+-- Price of every (material, store) in effect on p_date. Plain SQL so the planner
+-- inlines it into the calling query as a range join on idx_material_price_asof.
+CREATE OR REPLACE FUNCTION material_price_as_of(p_date DATE)
+RETURNS TABLE (material_id INTEGER, store_id INTEGER, price NUMERIC) AS $$
+    SELECT h.material_id, h.store_id, h.price
+    FROM material_price_history h
+    WHERE h.valid_from <= p_date
+        AND (h.valid_to IS NULL OR h.valid_to > p_date)
+$$ LANGUAGE sql STABLE;
+
+-- Price of every (dish, store) in effect on p_date.
+CREATE OR REPLACE FUNCTION dish_price_as_of(p_date DATE)
+RETURNS TABLE (dish_id INTEGER, store_id INTEGER, price NUMERIC) AS $$
+    SELECT h.dish_id, h.store_id, h.price
+    FROM dish_price_history h
+    WHERE h.valid_from <= p_date
+        AND (h.valid_to IS NULL OR h.valid_to > p_date)
+$$ LANGUAGE sql STABLE;
+
 -- ========================================
 -- TRIGGERS FOR UPDATED_AT
 -- ========================================
@@ -6,6 +6,7 @@
 -- ========================================
 
 -- Drop monthly performance tables related to dishes
+DROP TABLE IF EXISTS store_month_pnl CASCADE;
 DROP TABLE IF EXISTS monthly_combo_dish_sale CASCADE;
 DROP TABLE IF EXISTS material_monthly_usage CASCADE;
 DROP TABLE IF EXISTS dish_monthly_sale CASCADE;
@@ -220,6 +221,24 @@ CREATE TABLE material_monthly_usage (
     UNIQUE(material_id, store_id, month, year)
 );
 
+-- 门店月度损益汇总表 (Materialized Store Monthly P&L)
+CREATE TABLE store_month_pnl (
+    store_id INTEGER REFERENCES store(id), -- 外键：门店
+    year INTEGER NOT NULL CHECK (year >= 2020), -- 年份
+    month INTEGER NOT NULL CHECK (month >= 1 AND month <= 12), -- 月份 (1-12)
+    month_start DATE NOT NULL, -- 月份第一天 (用于跨月范围查询)
+    sales_revenue NUMERIC(16, 4) DEFAULT 0, -- 菜品销售额 (销售数量 - 退菜数量) × 当月价格
+    tax_amount NUMERIC(16, 4) DEFAULT 0, -- 税额
+    revenue NUMERIC(16, 4) DEFAULT 0, -- 不含税收入 (sales_revenue - tax_amount)
+    discount NUMERIC(16, 2) DEFAULT 0, -- 整月优惠总额 (daily_report.discount_total)
+    theoretical_cost NUMERIC(16, 4) DEFAULT 0, -- 理论物料成本 (BOM × 销售数量, 仅成本类物料)
+    actual_cost NUMERIC(16, 4) DEFAULT 0, -- 实际物料成本 (material_monthly_usage, 仅成本类物料)
+    gross_margin NUMERIC(10, 4) DEFAULT 0, -- 毛利率 (%) = (revenue - actual_cost) / revenue × 100
+    has_sales BOOLEAN NOT NULL DEFAULT FALSE, -- 本月是否有菜品销售记录
+    refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (store_id, year, month)
+);
+
 -- ========================================
 -- STEP 3: CREATE INDEXES
 -- ========================================
@@ -279,6 +298,8 @@ CREATE INDEX idx_monthly_combo_dish_sale_store_date ON monthly_combo_dish_sale(s
 CREATE INDEX idx_material_monthly_usage_material_store_date ON material_monthly_usage(material_id, store_id, year, month);
 CREATE INDEX idx_material_monthly_usage_store_date ON material_monthly_usage(store_id, year, month);
 
+CREATE INDEX idx_store_month_pnl_month_start ON store_month_pnl(month_start);
+
 -- ========================================
 -- STEP 4: CREATE TRIGGERS
 -- ========================================
@@ -337,8 +358,10 @@ END;
 $$ LANGUAGE plpgsql;
 
 -- Trigger to enforce store consistency on dish_material
-CREATE TRIGGER trigger_dish_material_store_consistency
-    BEFORE INSERT OR UPDATE ON dish_material
+-- (deferrable so bulk loads can check at commit with SET CONSTRAINTS ... DEFERRED)
+CREATE CONSTRAINT TRIGGER trigger_dish_material_store_consistency
+    AFTER INSERT OR UPDATE ON dish_material
+    DEFERRABLE INITIALLY IMMEDIATE
     FOR EACH ROW
     EXECUTE FUNCTION validate_dish_material_store_consistency();
 
@@ -17,6 +17,7 @@ from openpyxl.utils import get_column_letter
 # Import our centralized utilities
 from .excel_utils import suppress_excel_warnings, safe_read_excel
 from .config import STORE_NAME_MAPPING, DEFAULT_DATE_FORMAT
+from .worksheet_writer import SheetWriter
 
 
 class BaseWorksheetGenerator(ABC):
@@ -84,6 +85,22 @@ class BaseWorksheetGenerator(ABC):
         for i, width in enumerate(widths, 1):
             ws.column_dimensions[get_column_letter(i)].width = width
     
+    def create_sheet_writer(self, workbook, title: str, index: Optional[int] = None) -> SheetWriter:
+        """
+        Create a worksheet and return a row-at-a-time writer for it.
+        On a write-only workbook (create_report_workbook(streaming=True)) the
+        rows are streamed to disk as they are appended.
+        
+        Args:
+            workbook: Normal or write-only openpyxl workbook
+            title: Worksheet title
+            index: Optional sheet position
+            
+        Returns:
+            SheetWriter for the new worksheet
+        """
+        return SheetWriter(workbook.create_sheet(title, index))
+    
     def apply_header_style(self, cell):
         """Apply standard header styling to a cell."""
         cell.fill = self.header_fill
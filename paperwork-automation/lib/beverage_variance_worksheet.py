@@ -14,6 +14,8 @@ from pathlib import Path
 # Add parent directory to path for imports
 sys.path.append(str(Path(__file__).parent.parent))
 
+from utils.database import get_schema_capabilities
+
 
 class BeverageVarianceGenerator:
     """Generator for beverage variance detail worksheet"""
@@ -285,20 +287,7 @@ class BeverageVarianceGenerator:
 
     def check_unit_conversion_rate_column_exists(self):
         """Check if unit_conversion_rate column exists in dish_material table"""
-        try:
-            with self.db_manager.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT column_name 
-                    FROM information_schema.columns 
-                    WHERE table_name = 'dish_material' 
-                    AND column_name = 'unit_conversion_rate'
-                """)
-                result = cursor.fetchone()
-                return result is not None
-        except Exception as e:
-            print(f"Error checking unit_conversion_rate column: {e}")
-            return False
+        return get_schema_capabilities(self.db_manager).has_column('dish_material', 'unit_conversion_rate')
 
     def get_beverage_variance_data(self, year: int, month: int):
         """Get detailed beverage variance data matching material variance analysis structure"""
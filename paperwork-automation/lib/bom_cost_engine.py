@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Bill-of-materials cost engine for theoretical material usage (理论用量).
+
+Theoretical usage of a material is the net sales of every dish using it times
+standard_quantity * loss_rate / unit_conversion_rate from dish_material. The
+engine loads dish_material once per month as a sparse dish x material matrix
+(one coefficient per recipe line) and the month's regular and combo net sales
+as vectors over the same dishes. Usage, cost and per-dish cost attribution
+are sparse matrix-vector products done with numpy.bincount, so every report
+computing theoretical usage gets the same numbers from one place.
+
+Missing recipe values follow the dish_material column defaults: a NULL
+standard_quantity counts as 0, a NULL loss_rate as 1.0 and a NULL or zero
+unit_conversion_rate as 1.0.
+"""
+
+from typing import Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.database import get_schema_capabilities
+
+SALES_KINDS = ('regular', 'combo', 'total')
+
+
+class BomCostEngine:
+    """
+    One month of dish_material recipes and dish sales for one or more stores.
+
+    Dishes are (dish_id, store_id) pairs and materials (material_id, store_id)
+    pairs, so several stores share one block-diagonal matrix. Combo sales are
+    counted against the dish whose recipe they use (bom_dish_id, see
+    resolve_combo_dishes).
+    """
+
+    BOM_COLUMNS = [
+        'dish_id', 'material_id', 'store_id', 'standard_quantity', 'loss_rate', 'unit_conversion_rate',
+        'dish_name', 'dish_full_code', 'dish_short_code', 'dish_size', 'dish_spec',
+        'material_number', 'material_name', 'material_description', 'material_unit', 'store_name'
+    ]
+    SALES_COLUMNS = ['dish_id', 'store_id', 'net_sales']
+    COMBO_COLUMNS = [
+        'combo_id', 'combo_name', 'dish_id', 'store_id', 'sale_amount',
+        'dish_name', 'dish_full_code', 'dish_short_code', 'dish_size'
+    ]
+
+    def __init__(self, bom: pd.DataFrame, sales: Optional[pd.DataFrame] = None,
+                 combo_sales: Optional[pd.DataFrame] = None):
+        """
+        Args:
+            bom: dish_material rows with dish_id, material_id, store_id,
+                standard_quantity, loss_rate and unit_conversion_rate (other
+                descriptive columns are kept on the lines frame)
+            sales: Regular sales with dish_id, store_id and net_sales
+            combo_sales: Combo dish sales with dish_id, store_id, sale_amount
+                and optionally bom_dish_id (defaults to dish_id)
+        """
+        lines = pd.DataFrame(bom).reset_index(drop=True)
+        for column in ('dish_id', 'material_id', 'store_id'):
+            if column not in lines:
+                lines[column] = pd.Series(dtype='int64')
+        lines['standard_quantity'] = self._numeric(lines, 'standard_quantity', 0.0)
+        lines['loss_rate'] = self._numeric(lines, 'loss_rate', 1.0)
+        conversion = self._numeric(lines, 'unit_conversion_rate', 1.0)
+        lines['unit_conversion_rate'] = conversion.where(conversion != 0, 1.0)
+        lines['per_unit'] = lines['standard_quantity'] * lines['loss_rate'] / lines['unit_conversion_rate']
+
+        sales = self._sales_frame(sales, ['dish_id', 'store_id', 'net_sales'])
+        combo = self._sales_frame(combo_sales, ['dish_id', 'store_id', 'sale_amount'])
+        if 'bom_dish_id' not in combo:
+            combo['bom_dish_id'] = combo['dish_id']
+        combo['bom_dish_id'] = combo['bom_dish_id'].fillna(combo['dish_id']).astype('int64')
+
+        dish_keys = pd.concat([
+            lines[['dish_id', 'store_id']],
+            sales[['dish_id', 'store_id']],
+            combo[['bom_dish_id', 'store_id']].rename(columns={'bom_dish_id': 'dish_id'}),
+        ]).astype('int64').drop_duplicates()
+        self.dishes = pd.MultiIndex.from_frame(dish_keys)
+        self.materials = pd.MultiIndex.from_frame(
+            lines[['material_id', 'store_id']].astype('int64').drop_duplicates())
+
+        self._line_dish = self._positions(self.dishes, lines, 'dish_id')
+        self._line_material = self._positions(self.materials, lines, 'material_id')
+        self._per_unit = lines['per_unit'].to_numpy(dtype='float64')
+
+        self.regular = np.bincount(
+            self._positions(self.dishes, sales, 'dish_id'),
+            weights=sales['net_sales'].to_numpy(dtype='float64'), minlength=len(self.dishes))
+        self.combo = np.bincount(
+            self._positions(self.dishes, combo, 'bom_dish_id'),
+            weights=combo['sale_amount'].to_numpy(dtype='float64'), minlength=len(self.dishes))
+
+        self.lines = lines
+        self.combo_sales = combo
+
+    @staticmethod
+    def _numeric(frame: pd.DataFrame, column: str, default: float) -> pd.Series:
+        if column not in frame:
+            return pd.Series(default, index=frame.index, dtype='float64')
+        return pd.to_numeric(frame[column], errors='coerce').astype('float64').fillna(default)
+
+    @staticmethod
+    def _sales_frame(frame: Optional[pd.DataFrame], columns) -> pd.DataFrame:
+        frame = pd.DataFrame(frame if frame is not None else None).reset_index(drop=True)
+        for column in columns:
+            if column not in frame:
+                frame[column] = pd.Series(dtype='float64')
+        amount = columns[-1]
+        frame[amount] = pd.to_numeric(frame[amount], errors='coerce').fillna(0.0)
+        return frame
+
+    @staticmethod
+    def _positions(index: pd.MultiIndex, frame: pd.DataFrame, id_column: str) -> np.ndarray:
+        keys = pd.MultiIndex.from_arrays([frame[id_column].astype('int64'), frame['store_id'].astype('int64')])
+        return index.get_indexer(keys)
+
+    @classmethod
+    def fetch(cls, cursor, year: int, month: int, store_ids=None, active_only: bool = False,
+              has_conversion_rate: bool = True) -> 'BomCostEngine':
+        """
+        Load recipes and one month of sales with an open cursor (three queries).
+
+        Args:
+            cursor: Open database cursor (dict rows)
+            year: Sales year
+            month: Sales month
+            store_ids: Only these stores (all stores when None)
+            active_only: Only active dishes and materials
+            has_conversion_rate: Whether dish_material has unit_conversion_rate
+        """
+        conversion_sql = "dm.unit_conversion_rate" if has_conversion_rate else "1.0"
+        store_params = (list(store_ids),) if store_ids is not None else ()
+
+        def store_filter(column):
+            return f"AND {column} = ANY(%s)" if store_ids is not None else ""
+
+        cursor.execute(f"""
+            SELECT
+                dm.dish_id,
+                dm.material_id,
+                dm.store_id,
+                dm.standard_quantity,
+                dm.loss_rate,
+                {conversion_sql} as unit_conversion_rate,
+                d.name as dish_name,
+                d.full_code as dish_full_code,
+                d.short_code as dish_short_code,
+                d.size as dish_size,
+                d.specification as dish_spec,
+                m.material_number,
+                m.name as material_name,
+                m.description as material_description,
+                m.unit as material_unit,
+                s.name as store_name
+            FROM dish_material dm
+            JOIN dish d ON d.id = dm.dish_id
+            JOIN material m ON m.id = dm.material_id AND m.store_id = dm.store_id
+            LEFT JOIN store s ON s.id = dm.store_id
+            WHERE TRUE
+                {"AND d.is_active = TRUE AND m.is_active = TRUE" if active_only else ""}
+                {store_filter('dm.store_id')}
+        """, store_params)
+        bom = pd.DataFrame([dict(row) for row in cursor.fetchall()], columns=cls.BOM_COLUMNS)
+
+        cursor.execute(f"""
+            SELECT
+                dms.dish_id,
+                dms.store_id,
+                SUM(COALESCE(dms.sale_amount, 0) - COALESCE(dms.return_amount, 0)) as net_sales
+            FROM dish_monthly_sale dms
+            JOIN dish d ON d.id = dms.dish_id
+            WHERE dms.year = %s AND dms.month = %s
+                {"AND d.is_active = TRUE" if active_only else ""}
+                {store_filter('dms.store_id')}
+            GROUP BY dms.dish_id, dms.store_id
+        """, (year, month) + store_params)
+        sales = pd.DataFrame([dict(row) for row in cursor.fetchall()], columns=cls.SALES_COLUMNS)
+
+        cursor.execute(f"""
+            SELECT
+                mcds.combo_id,
+                c.name as combo_name,
+                mcds.dish_id,
+                mcds.store_id,
+                COALESCE(mcds.sale_amount, 0) as sale_amount,
+                d.name as dish_name,
+                d.full_code as dish_full_code,
+                d.short_code as dish_short_code,
+                d.size as dish_size
+            FROM monthly_combo_dish_sale mcds
+            JOIN dish d ON d.id = mcds.dish_id
+            LEFT JOIN combo c ON c.id = mcds.combo_id
+            WHERE mcds.year = %s AND mcds.month = %s
+                {"AND d.is_active = TRUE" if active_only else ""}
+                {store_filter('mcds.store_id')}
+        """, (year, month) + store_params)
+        combo_sales = pd.DataFrame([dict(row) for row in cursor.fetchall()], columns=cls.COMBO_COLUMNS)
+
+        return cls(bom, sales, cls.resolve_combo_dishes(combo_sales, bom))
+
+    @classmethod
+    def load(cls, db_manager, year: int, month: int, store_ids=None,
+             active_only: bool = False) -> 'BomCostEngine':
+        """Load recipes and one month of sales on a pooled connection (see fetch)"""
+        has_conversion_rate = get_schema_capabilities(db_manager).has_column(
+            'dish_material', 'unit_conversion_rate')
+        with db_manager.get_connection() as conn:
+            return cls.fetch(conn.cursor(), year, month, store_ids, active_only, has_conversion_rate)
+
+    @staticmethod
+    def resolve_combo_dishes(combo_sales: pd.DataFrame, bom: pd.DataFrame) -> pd.DataFrame:
+        """
+        Add bom_dish_id, the dish whose recipe a combo dish sale uses.
+
+        A dish with a recipe and the same full_code is used: the same size
+        (so its own recipe) when the combo dish has a short code, else the
+        size with the smallest standard_quantity, which may be a variant
+        other than the combo dish itself. Combo dishes without a short code
+        and no full_code match fall back to the first 6 digits of the code.
+        Sales that still have no recipe keep their own dish_id and use no
+        material.
+        """
+        combo = pd.DataFrame(combo_sales).reset_index(drop=True)
+        if combo.empty or bom is None or len(bom) == 0:
+            combo['bom_dish_id'] = combo['dish_id'] if 'dish_id' in combo else pd.Series(dtype='int64')
+            return combo
+
+        recipes = pd.DataFrame(bom).groupby(['dish_id', 'store_id'], as_index=False).agg(
+            full_code=('dish_full_code', 'first'), size=('dish_size', 'first'),
+            min_quantity=('standard_quantity', 'min'))
+        recipes['size'] = recipes['size'].fillna('')
+        recipes['code6'] = recipes['full_code'].astype(str).str[:6]
+        recipes['min_quantity'] = pd.to_numeric(recipes['min_quantity'], errors='coerce')
+
+        combo['bom_dish_id'] = combo['dish_id']
+        no_short_code = combo['dish_short_code'].fillna('').astype(str).str.strip() == ''
+        own = pd.MultiIndex.from_frame(recipes[['dish_id', 'store_id']])
+        has_own = pd.MultiIndex.from_frame(combo[['dish_id', 'store_id']]).isin(own) & ~no_short_code
+        pending = combo.loc[~has_own, ['dish_id', 'store_id', 'dish_full_code', 'dish_short_code', 'dish_size']].copy()
+        pending['row'] = pending.index
+        pending['no_short_code'] = no_short_code[~has_own]
+        pending['size'] = pending['dish_size'].fillna('')
+        pending['code6'] = pending['dish_full_code'].astype(str).str[:6]
+
+        def pick(candidates, by_quantity):
+            if candidates.empty:
+                return candidates
+            candidates = candidates.assign(order=np.where(
+                by_quantity(candidates), candidates['min_quantity'], np.nan))
+            candidates = candidates.sort_values(['row', 'order', 'dish_id_r'], na_position='last')
+            return candidates.drop_duplicates('row')
+
+        by_code = pending.merge(recipes, left_on=['store_id', 'dish_full_code'],
+                                right_on=['store_id', 'full_code'], suffixes=('', '_r'))
+        by_code = by_code[by_code['no_short_code'] | (by_code['size'] == by_code['size_r'])]
+        chosen = pick(by_code, lambda c: c['no_short_code'])
+
+        fallback = pending[pending['no_short_code'] & ~pending['row'].isin(chosen['row'])]
+        by_prefix = fallback.merge(recipes, on=['store_id', 'code6'], suffixes=('', '_r'))
+        chosen = pd.concat([chosen, pick(by_prefix, lambda c: c['no_short_code'])])
+
+        combo.loc[chosen['row'].to_numpy(), 'bom_dish_id'] = chosen['dish_id_r'].to_numpy()
+        combo['bom_dish_id'] = combo['bom_dish_id'].astype('int64')
+        return combo
+
+    def sales_vector(self, sales: str = 'total') -> np.ndarray:
+        """Net sales per dish (aligned with self.dishes): 'regular', 'combo' or 'total'"""
+        if sales not in SALES_KINDS:
+            raise ValueError(f"Unknown sales kind: {sales}")
+        if sales == 'regular':
+            return self.regular
+        if sales == 'combo':
+            return self.combo
+        return self.regular + self.combo
+
+    def line_usage(self, sales: str = 'total') -> np.ndarray:
+        """Theoretical usage of each recipe line (aligned with self.lines)"""
+        return self._per_unit * self.sales_vector(sales)[self._line_dish]
+
+    def material_vector(self, values: Mapping[Tuple[int, int], float]) -> np.ndarray:
+        """Values keyed by (material_id, store_id) aligned with self.materials (missing = 0)"""
+        if not values:
+            return np.zeros(len(self.materials))
+        series = pd.Series(list(values.values()), index=pd.MultiIndex.from_tuples(list(values)), dtype='float64')
+        return series.reindex(self.materials).fillna(0.0).to_numpy()
+
+    def material_usage(self) -> pd.DataFrame:
+        """Regular, combo and total theoretical usage per (material_id, store_id)"""
+        count = len(self.materials)
+        regular = np.bincount(self._line_material, weights=self.line_usage('regular'), minlength=count)
+        combo = np.bincount(self._line_material, weights=self.line_usage('combo'), minlength=count)
+        return pd.DataFrame({'regular_usage': regular, 'combo_usage': combo,
+                             'theoretical_usage': regular + combo}, index=self.materials)
+
+    def dish_cost(self, prices: Mapping[Tuple[int, int], float], sales: str = 'total') -> pd.Series:
+        """
+        Theoretical material cost per (dish_id, store_id).
+
+        Materials missing from prices cost nothing, so passing only some
+        materials' prices restricts the cost to them.
+        """
+        weights = self.line_usage(sales) * self.material_vector(prices)[self._line_material]
+        return pd.Series(np.bincount(self._line_dish, weights=weights, minlength=len(self.dishes)),
+                         index=self.dishes)
+
+    def attribute(self, amounts: Mapping[Tuple[int, int], float], sales: str = 'total') -> pd.Series:
+        """
+        Split per-material amounts (e.g. actual usage cost) over dishes by
+        their share of the material's total theoretical usage.
+
+        Returns the part attributed to the chosen sales per (dish_id, store_id);
+        materials without theoretical usage are not attributed.
+        """
+        total = self.material_usage()['theoretical_usage'].to_numpy()
+        share = np.divide(self.material_vector(amounts), total,
+                          out=np.zeros_like(total), where=total > 0)
+        weights = self.line_usage(sales) * share[self._line_material]
+        return pd.Series(np.bincount(self._line_dish, weights=weights, minlength=len(self.dishes)),
+                         index=self.dishes)
+
+    def lines_frame(self) -> pd.DataFrame:
+        """Recipe lines with each dish's regular/combo/net sales and usage"""
+        frame = self.lines.copy()
+        frame['regular_sales'] = self.regular[self._line_dish]
+        frame['combo_sales'] = self.combo[self._line_dish]
+        frame['net_sales'] = frame['regular_sales'] + frame['combo_sales']
+        frame['regular_usage'] = self.line_usage('regular')
+        frame['combo_usage'] = self.line_usage('combo')
+        frame['usage'] = frame['regular_usage'] + frame['combo_usage']
+        return frame
+
+    def combo_lines(self) -> pd.DataFrame:
+        """Each combo dish sale joined to the recipe lines of its bom_dish_id, with usage"""
+        recipe_columns = ['dish_id', 'store_id', 'material_id', 'standard_quantity', 'loss_rate',
+                          'unit_conversion_rate', 'per_unit']
+        recipe_columns += [c for c in ('material_number', 'material_name', 'material_description',
+                                       'material_unit') if c in self.lines]
+        recipes = self.lines[recipe_columns].rename(columns={'dish_id': 'bom_dish_id'})
+        frame = self.combo_sales.merge(recipes, on=['bom_dish_id', 'store_id'])
+        frame['usage'] = frame['sale_amount'] * frame['per_unit']
+        return frame
+
+
+__all__ = ['BomCostEngine']
@@ -89,6 +89,8 @@ DATABASE_CONFIG = {
 DATABASE_TIMEOUT: int = 30
 QUERY_TIMEOUT: int = 60
 CONNECTION_POOL_SIZE: int = 5
+CONNECTION_MAX_LIFETIME: int = 1800  # seconds before a pooled connection is recycled
+CONNECTION_HEALTH_CHECK_AFTER: int = 30  # idle seconds before a pooled connection is pinged
 
 # Batch processing settings
 DEFAULT_BATCH_SIZE: int = 1000
@@ -348,6 +350,7 @@ __all__ = [
     
     # Database configuration
     'DATABASE_CONFIG', 'DATABASE_TIMEOUT', 'QUERY_TIMEOUT', 'CONNECTION_POOL_SIZE',
+    'CONNECTION_MAX_LIFETIME', 'CONNECTION_HEALTH_CHECK_AFTER',
     'DEFAULT_BATCH_SIZE', 'EXCEL_CHUNK_SIZE',
     
     # Excel configuration
@@ -4,8 +4,14 @@ Data extraction functions for processing Excel files and generating SQL or inser
 Consolidates logic from insert-data.py and extract-time-segments.py into reusable functions.
 """
 
-from utils.database import get_database_manager
+from utils.database import get_shared_database_manager
+from lib.config import STORE_NAME_MAPPING, TIME_SEGMENTS
+from lib.excel_utils import read_workbook_sheets, read_workbook_sheet
+from lib.database_utils import StoreMonthPnl
+from lib.database_queries import invalidate_report_caches
+import numpy as np
 import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
 import os
 import sys
 import warnings
@@ -30,6 +36,25 @@ if sys.platform.startswith('win'):
 # Suppress pandas warnings
 warnings.filterwarnings('ignore')
 
+# Store ID mapping
+STORE_IDS = dict(STORE_NAME_MAPPING)
+
+# Time segment ID mapping (08:00-13:59 -> 1 ... 22:00-(次)07:59 -> 4)
+TIME_SEGMENT_IDS = {label: index for index, label in enumerate(TIME_SEGMENTS, start=1)}
+
+# Cell types that convert to float without going through safe_float_conversion
+NUMERIC_CELL_TYPES = (int, float, np.int64, np.float64)
+
+# Time segment columns summed into daily totals
+TIME_SEGMENT_SUM_COLUMNS = {
+    'tables_served': '营业桌数',
+    'tables_served_validated': '营业桌数(考核)',
+    'revenue_tax_not_included': '营业收入(不含税)',
+    'takeout_tables': '营业桌数(考核)(外卖)',
+    'customers': '就餐人数',
+    'discount_total': '优惠总金额(不含税)',
+}
+
 
 def validate_excel_file(input_file):
     """
@@ -50,10 +75,9 @@ def validate_excel_file(input_file):
             validation_warnings.append(
                 f"WARNING: Unexpected file extension: {os.path.splitext(input_file)[1]}")
 
-        # Try to read Excel file and get sheet names
+        # Parse every sheet once; validation and extraction reuse the cached sheets
         try:
-            excel_file = pd.ExcelFile(input_file)
-            sheet_names = excel_file.sheet_names
+            sheet_names = list(read_workbook_sheets(input_file))
         except Exception as e:
             validation_warnings.append(
                 f"ERROR: Cannot read Excel file: {str(e)}")
@@ -91,30 +115,28 @@ def validate_excel_file(input_file):
 
         # Validate the appropriate sheet based on what we found (silently)
         if '营业基础表' in sheet_names:
-            daily_warnings = validate_daily_sheet(excel_file, '营业基础表')
+            daily_warnings = validate_daily_sheet(input_file, '营业基础表')
             # Only add critical errors
             critical_warnings = [w for w in daily_warnings if "ERROR" in w]
             validation_warnings.extend(critical_warnings)
         elif sheet_names and ('日报' in sheet_names[0] and '不含税' in sheet_names[0]):
-            daily_warnings = validate_daily_sheet(excel_file, sheet_names[0])
+            daily_warnings = validate_daily_sheet(input_file, sheet_names[0])
             # Only add critical errors
             critical_warnings = [w for w in daily_warnings if "ERROR" in w]
             validation_warnings.extend(critical_warnings)
 
         if '分时段基础表' in sheet_names:
-            time_warnings = validate_time_segment_sheet(excel_file, '分时段基础表')
+            time_warnings = validate_time_segment_sheet(input_file, '分时段基础表')
             # Only add critical errors
             critical_warnings = [w for w in time_warnings if "ERROR" in w]
             validation_warnings.extend(critical_warnings)
         elif sheet_names and ('分时段' in sheet_names[0] and '不含税' in sheet_names[0]):
             time_warnings = validate_time_segment_sheet(
-                excel_file, sheet_names[0])
+                input_file, sheet_names[0])
             # Only add critical errors
             critical_warnings = [w for w in time_warnings if "ERROR" in w]
             validation_warnings.extend(critical_warnings)
 
-        excel_file.close()
-
     except Exception as e:
         validation_warnings.append(
             f"ERROR: Unexpected error during validation: {str(e)}")
@@ -128,7 +150,7 @@ def validate_daily_sheet(excel_file, sheet_name='营业基础表'):
     warnings_list = []
 
     try:
-        df = pd.read_excel(excel_file, sheet_name=sheet_name)
+        df = read_workbook_sheet(excel_file, sheet_name)
 
         # Expected columns for daily reports - be more flexible
         expected_columns = [
@@ -177,7 +199,7 @@ def validate_time_segment_sheet(excel_file, sheet_name='分时段基础表'):
     warnings_list = []
 
     try:
-        df = pd.read_excel(excel_file, sheet_name=sheet_name)
+        df = read_workbook_sheet(excel_file, sheet_name)
 
         # Expected columns for time segments - be more flexible
         expected_columns = [
@@ -317,143 +339,145 @@ def safe_float_conversion(value):
         return None
 
 
-def transform_daily_report_data(df):
-    """Transform Excel data from 营业基础表 sheet or aggregate time segment data into daily format."""
-    # Store ID mapping
-    store_ids = {
-        '加拿大一店': 1,
-        '加拿大二店': 2,
-        '加拿大三店': 3,
-        '加拿大四店': 4,
-        '加拿大五店': 5,
-        '加拿大六店': 6,
-        '加拿大七店': 7,
-        "加拿大八店": 8
-    }
+def format_report_date(value):
+    """Convert a YYYYMMDD cell (int, float or string) to YYYY-MM-DD, or None if invalid."""
+    try:
+        # Convert to string and remove any decimal
+        date_str = str(int(value))
+        year = int(date_str[:4])
+        month = int(date_str[4:6])
+        day = int(date_str[6:8])
+        return f"{year:04d}-{month:02d}-{day:02d}"
+    except (ValueError, TypeError):
+        return None
 
-    # Check if this is time segment data (has '分时段' column)
-    if '分时段' in df.columns:
-        print("📊 Detected time segment data - aggregating into daily totals...")
-        return aggregate_time_segment_to_daily(df, store_ids)
 
-    # Original daily report processing
-    transformed_data = []
+def _map_distinct(series, func):
+    """Apply a scalar converter once per distinct value of a column (NaN maps to None)."""
+    codes, uniques = pd.factorize(series)
+    converted = np.array([None] + [func(value) for value in uniques], dtype=object)
+    return pd.Series(converted[codes + 1], index=series.index)
 
-    for _, row in df.iterrows():
-        store_name = row['门店名称']
 
-        if store_name not in store_ids:
-            continue
+def to_float_column(series):
+    """Column-wide safe_float_conversion: float Series with NaN where a cell is blank, '-' or not numeric."""
+    if is_numeric_dtype(series) and not is_bool_dtype(series):
+        return pd.to_numeric(series, errors='coerce').astype(float)
 
-        # Convert date from YYYYMMDD format to YYYY-MM-DD
-        date_int = row['日期']
-        try:
-            # Convert to string and remove any decimal
-            date_str = str(int(date_int))
-            year = int(date_str[:4])
-            month = int(date_str[4:6])
-            day = int(date_str[6:8])
-            formatted_date = f"{year:04d}-{month:02d}-{day:02d}"
-        except (ValueError, TypeError):
-            # Skip rows with invalid date format silently
-            continue
-
-        # Map the data according to database schema using safe float conversion
-        daily_data = {
-            'store_id': store_ids[store_name],
-            'date': formatted_date,
-            'is_holiday': row['节假日'] == '节假日',  # True if holiday, False if 工作日
-            'tables_served': safe_float_conversion(row['营业桌数']),
-            'tables_served_validated': safe_float_conversion(row['营业桌数(考核)']),
-            'turnover_rate': safe_float_conversion(row['翻台率(考核)']),
-            'revenue_tax_not_included': safe_float_conversion(row['营业收入(不含税)']),
-            'takeout_tables': safe_float_conversion(row['营业桌数(考核)(外卖)']),
-            'customers': safe_float_conversion(row['就餐人数']),
-            'discount_total': safe_float_conversion(row['优惠总金额(不含税)']),
-            # Takeout revenue from daily store report (replaces separate takeout_report folder)
-            'takeout_revenue': safe_float_conversion(row.get('营业收入(外卖)(不含税)', 0))
-        }
-
-        transformed_data.append(daily_data)
+    # Mixed text/number columns (e.g. '-' placeholders): numeric cells convert
+    # directly, other cells go through the scalar converter once per distinct
+    # value so results match it exactly
+    is_number = series.map(type).isin(NUMERIC_CELL_TYPES)
+    values = pd.to_numeric(series.where(is_number), errors='coerce').astype(float)
+    other = ~is_number & series.notna()
+    if other.any():
+        values[other] = pd.to_numeric(
+            _map_distinct(series[other], safe_float_conversion), errors='coerce')
+    return values
 
-    return transformed_data
 
+def _known_store_rows(df, store_ids):
+    """Rows for known stores with a valid 日期, re-indexed, plus store_id and date columns."""
+    if df.empty:
+        return df.iloc[0:0]
 
-def aggregate_time_segment_to_daily(df, store_ids):
-    """Aggregate time segment data into daily totals for each store."""
-    # Group by store and date to aggregate time segments
-    daily_aggregated = {}
+    store_id = df['门店名称'].map(store_ids).to_numpy()
+    known = pd.notna(store_id)
+    rows = df[known]
+    if rows.empty:
+        return rows
 
-    for _, row in df.iterrows():
-        store_name = row['门店名称']
+    # Skip rows with invalid date format silently
+    dates = _map_distinct(rows['日期'], format_report_date).to_numpy()
+    valid = pd.notna(dates)
+    return rows[valid].reset_index(drop=True).assign(
+        store_id=store_id[known][valid].astype(int),
+        date=dates[valid]
+    )
 
-        if store_name not in store_ids:
-            continue
 
-        # Convert date from YYYYMMDD format to YYYY-MM-DD
-        date_int = row['日期']
-        try:
-            date_str = str(int(date_int))
-            year = int(date_str[:4])
-            month = int(date_str[4:6])
-            day = int(date_str[6:8])
-            formatted_date = f"{year:04d}-{month:02d}-{day:02d}"
-        except (ValueError, TypeError):
-            continue
-
-        # Create unique key for store-date combination
-        key = (store_ids[store_name], formatted_date)
-
-        if key not in daily_aggregated:
-            daily_aggregated[key] = {
-                'store_id': store_ids[store_name],
-                'date': formatted_date,
-                'is_holiday': row['节假日'] == '节假日',
-                'tables_served': 0,
-                'tables_served_validated': 0,
-                'revenue_tax_not_included': 0,
-                'takeout_tables': 0,
-                'customers': 0,
-                'discount_total': 0,
-                # Store available seats for turnover calculation
-                'available_seats': safe_float_conversion(row['所有餐位数']) or 53
-            }
-
-        # Aggregate numeric values (sum most fields)
-        daily_aggregated[key]['tables_served'] += safe_float_conversion(
-            row['营业桌数']) or 0
-        daily_aggregated[key]['tables_served_validated'] += safe_float_conversion(
-            row['营业桌数(考核)']) or 0
-        daily_aggregated[key]['revenue_tax_not_included'] += safe_float_conversion(
-            row['营业收入(不含税)']) or 0
-        daily_aggregated[key]['takeout_tables'] += safe_float_conversion(
-            row['营业桌数(考核)(外卖)']) or 0
-        daily_aggregated[key]['customers'] += safe_float_conversion(
-            row['就餐人数']) or 0
-        daily_aggregated[key]['discount_total'] += safe_float_conversion(
-            row['优惠总金额(不含税)']) or 0
-
-    # Convert to list and calculate correct turnover rates
-    transformed_data = []
-    for key, data in daily_aggregated.items():
-        # Calculate turnover rate correctly: Total tables / Available seats
-        available_seats = data['available_seats']
-        total_tables_validated = data['tables_served_validated']
-
-        if available_seats > 0:
-            data['turnover_rate'] = total_tables_validated / available_seats
-        else:
-            data['turnover_rate'] = 0
+def _to_records(frame):
+    """DataFrame to list of dicts with NaN as None and native Python scalars."""
+    columns = list(frame.columns)
+    values = [frame[column].astype(object).where(frame[column].notna(), None).tolist()
+              for column in columns]
+    return [dict(zip(columns, row)) for row in zip(*values)]
 
-        # Remove helper field
-        del data['available_seats']
 
-        transformed_data.append(data)
+def transform_daily_report_data(df):
+    """Transform Excel data from 营业基础表 sheet or aggregate time segment data into daily format."""
+    # Check if this is time segment data (has '分时段' column)
+    if '分时段' in df.columns:
+        print("📊 Detected time segment data - aggregating into daily totals...")
+        return aggregate_time_segment_to_daily(df, STORE_IDS)
+
+    # Original daily report processing
+    rows = _known_store_rows(df, STORE_IDS)
+    if rows.empty:
+        return []
+
+    if '营业收入(外卖)(不含税)' in rows.columns:
+        takeout_revenue = to_float_column(rows['营业收入(外卖)(不含税)'])
+    else:
+        takeout_revenue = 0.0
+
+    # Map the data according to database schema using safe float conversion
+    daily_data = pd.DataFrame({
+        'store_id': rows['store_id'],
+        'date': rows['date'],
+        'is_holiday': rows['节假日'] == '节假日',  # True if holiday, False if 工作日
+        'tables_served': to_float_column(rows['营业桌数']),
+        'tables_served_validated': to_float_column(rows['营业桌数(考核)']),
+        'turnover_rate': to_float_column(rows['翻台率(考核)']),
+        'revenue_tax_not_included': to_float_column(rows['营业收入(不含税)']),
+        'takeout_tables': to_float_column(rows['营业桌数(考核)(外卖)']),
+        'customers': to_float_column(rows['就餐人数']),
+        'discount_total': to_float_column(rows['优惠总金额(不含税)']),
+        # Takeout revenue from daily store report (replaces separate takeout_report folder)
+        'takeout_revenue': takeout_revenue
+    })
+
+    return _to_records(daily_data)
+
 
-        # Debug output for first few records
-        if len(transformed_data) <= 3:
-            print(
-                f"   🔄 Aggregated {data['store_id']} on {data['date']}: {data['tables_served_validated']:.1f} tables, {data['turnover_rate']:.3f} turnover")
+def aggregate_time_segment_to_daily(df, store_ids):
+    """Aggregate time segment data into daily totals for each store."""
+    rows = _known_store_rows(df, store_ids)
+    if rows.empty:
+        print("✅ Aggregated 0 daily records from time segment data")
+        return []
+
+    # Aggregate numeric values (sum most fields) per store-date, keeping
+    # the order in which each store-date first appears
+    keys = [rows['store_id'], rows['date']]
+    summed = pd.DataFrame({
+        name: to_float_column(rows[column]).fillna(0)
+        for name, column in TIME_SEGMENT_SUM_COLUMNS.items()
+    }).groupby(keys, sort=False).sum()
+
+    # Holiday flag and available seats come from the first segment of each day
+    first_rows = rows.drop_duplicates(['store_id', 'date'])
+    available_seats = to_float_column(first_rows['所有餐位数']).fillna(0).replace(0, 53)
+
+    daily_data = pd.DataFrame({
+        'store_id': first_rows['store_id'].to_numpy(),
+        'date': first_rows['date'].to_numpy(),
+        'is_holiday': (first_rows['节假日'] == '节假日').to_numpy(),
+    })
+    for name in TIME_SEGMENT_SUM_COLUMNS:
+        daily_data[name] = summed[name].to_numpy()
+
+    # Calculate turnover rate correctly: Total tables / Available seats
+    seats = available_seats.to_numpy()
+    daily_data['turnover_rate'] = np.where(
+        seats > 0, daily_data['tables_served_validated'].to_numpy() / np.where(seats > 0, seats, 1), 0.0)
+
+    transformed_data = _to_records(daily_data)
+
+    # Debug output for first few records
+    for data in transformed_data[:3]:
+        print(
+            f"   🔄 Aggregated {data['store_id']} on {data['date']}: {data['tables_served_validated']:.1f} tables, {data['turnover_rate']:.3f} turnover")
 
     print(
         f"✅ Aggregated {len(transformed_data)} daily records from time segment data")
@@ -462,66 +486,28 @@ def aggregate_time_segment_to_daily(df, store_ids):
 
 def transform_time_segment_data(df):
     """Transform Excel data from 分时段基础表 sheet into the format needed for database insertion."""
-    # Store ID mapping
-    store_ids = {
-        '加拿大一店': 1,
-        '加拿大二店': 2,
-        '加拿大三店': 3,
-        '加拿大四店': 4,
-        '加拿大五店': 5,
-        '加拿大六店': 6,
-        '加拿大七店': 7,
-        "加拿大八店": 8
-    }
-
-    # Time segment ID mapping
-    time_segment_ids = {
-        '08:00-13:59': 1,
-        '14:00-16:59': 2,
-        '17:00-21:59': 3,
-        '22:00-(次)07:59': 4
-    }
-
-    transformed_data = []
-
-    # Process ALL rows in the dataframe (all dates and time segments)
-    for _, row in df.iterrows():
-        store_name = row['门店名称']
-        time_segment_label = row['分时段']
+    if df.empty:
+        return []
 
-        if store_name not in store_ids:
-            continue
+    # Skip unknown time segments silently (e.g., '-' or empty values)
+    df = df[df['分时段'].isin(TIME_SEGMENT_IDS.keys())]
 
-        if time_segment_label not in time_segment_ids:
-            # Skip unknown time segments silently (e.g., '-' or empty values)
-            continue
+    # Process ALL rows in the dataframe (all dates and time segments)
+    rows = _known_store_rows(df, STORE_IDS)
+    if rows.empty:
+        return []
 
-        # Convert date from YYYYMMDD format to YYYY-MM-DD
-        date_int = row['日期']
-        try:
-            # Convert to string and remove any decimal
-            date_str = str(int(date_int))
-            year = int(date_str[:4])
-            month = int(date_str[4:6])
-            day = int(date_str[6:8])
-            formatted_date = f"{year:04d}-{month:02d}-{day:02d}"
-        except (ValueError, TypeError):
-            # Skip rows with invalid date format silently
-            continue
-
-        # Map the data according to database schema using safe float conversion
-        time_segment_data = {
-            'store_id': store_ids[store_name],
-            'date': formatted_date,
-            'time_segment_id': time_segment_ids[time_segment_label],
-            'is_holiday': row['节假日'] == '节假日',  # True if holiday, False if 工作日
-            'tables_served_validated': safe_float_conversion(row['营业桌数(考核)']),
-            'turnover_rate': safe_float_conversion(row['翻台率(考核)'])
-        }
-
-        transformed_data.append(time_segment_data)
+    # Map the data according to database schema using safe float conversion
+    time_segment_data = pd.DataFrame({
+        'store_id': rows['store_id'],
+        'date': rows['date'],
+        'time_segment_id': rows['分时段'].map(TIME_SEGMENT_IDS).astype(int),
+        'is_holiday': rows['节假日'] == '节假日',  # True if holiday, False if 工作日
+        'tables_served_validated': to_float_column(rows['营业桌数(考核)']),
+        'turnover_rate': to_float_column(rows['翻台率(考核)'])
+    })
 
-    return transformed_data
+    return _to_records(time_segment_data)
 
 
 def generate_upsert_sql(data, table_name, columns):
@@ -592,9 +578,10 @@ def generate_upsert_sql(data, table_name, columns):
 def extract_daily_reports(input_file, output_file=None, debug=False, direct_db=False, is_test=False):
     """Extract daily reports from Excel file and either generate SQL or insert to database."""
     try:
-        # Determine which sheet to use
-        excel_file = pd.ExcelFile(input_file)
-        sheet_names = excel_file.sheet_names
+        # Determine which sheet to use (served from the parsed-workbook cache
+        # when the file was already validated in this run)
+        sheets = read_workbook_sheets(input_file)
+        sheet_names = list(sheets)
 
         # Try traditional sheet name first
         if '营业基础表' in sheet_names:
@@ -609,9 +596,7 @@ def extract_daily_reports(input_file, output_file=None, debug=False, direct_db=F
             print("ERROR: No suitable sheet found for daily reports")
             return False
 
-        # Read Excel file from the determined sheet
-        df = pd.read_excel(input_file, sheet_name=sheet_name)
-        excel_file.close()
+        df = sheets[sheet_name]
 
         # Transform data
         transformed_data = transform_daily_report_data(df)
@@ -665,9 +650,10 @@ def extract_daily_reports(input_file, output_file=None, debug=False, direct_db=F
 def extract_time_segments(input_file, output_file=None, debug=False, direct_db=False, is_test=False):
     """Extract time segment data from Excel file and either generate SQL or insert to database."""
     try:
-        # Determine which sheet to use
-        excel_file = pd.ExcelFile(input_file)
-        sheet_names = excel_file.sheet_names
+        # Determine which sheet to use (served from the parsed-workbook cache
+        # when the file was already validated in this run)
+        sheets = read_workbook_sheets(input_file)
+        sheet_names = list(sheets)
 
         # Try traditional sheet name first
         if '分时段基础表' in sheet_names:
@@ -682,9 +668,7 @@ def extract_time_segments(input_file, output_file=None, debug=False, direct_db=F
             print("ERROR: No suitable sheet found for time segments")
             return False
 
-        # Read Excel file from the determined sheet
-        df = pd.read_excel(input_file, sheet_name=sheet_name)
-        excel_file.close()
+        df = sheets[sheet_name]
 
         # Transform data
         transformed_data = transform_time_segment_data(df)
@@ -832,7 +816,7 @@ def save_takeout_revenue(data, db_manager):
 def insert_daily_data_to_database(data, is_test=False):
     """Insert daily report data directly to database with override capability"""
     try:
-        db_manager = get_database_manager(is_test=is_test)
+        db_manager = get_shared_database_manager(is_test=is_test)
 
         # Test connection first
         if not db_manager.test_connection():
@@ -907,6 +891,16 @@ def insert_daily_data_to_database(data, is_test=False):
                     print("\n📦 Saving takeout revenue...")
                     save_takeout_revenue(data, db_manager)
 
+                # Keep the monthly P&L discount totals in step with daily_report.
+                # The daily data is already committed, so a failed refresh is not a failed insert.
+                try:
+                    StoreMonthPnl.refresh_months(
+                        db_manager, {tuple(int(part) for part in str(record['date']).split('-')[:2])
+                                     for record in data})
+                except Exception as e:
+                    print(f"WARNING: store_month_pnl refresh failed - {e}")
+                invalidate_report_caches()
+
                 return True
 
     except Exception as e:
@@ -917,7 +911,7 @@ def insert_daily_data_to_database(data, is_test=False):
 def insert_time_data_to_database(data, is_test=False):
     """Insert time segment data directly to database with override capability"""
     try:
-        db_manager = get_database_manager(is_test=is_test)
+        db_manager = get_shared_database_manager(is_test=is_test)
 
         # Test connection first
         if not db_manager.test_connection():
@@ -975,6 +969,7 @@ def insert_time_data_to_database(data, is_test=False):
                 print(f"✅ Time segment processing completed:")
                 print(f"   📈 New records inserted: {inserted_count}")
                 print(f"   🔄 Existing records updated: {updated_count}")
+                invalidate_report_caches()
 
                 return True
 
@@ -5,9 +5,14 @@ All database interactions should go through this module.
 """
 
 from utils.database import DatabaseManager
+import copy
+import functools
 import sys
-from datetime import datetime, timedelta
+import threading
+import weakref
+from datetime import date, datetime, timedelta
 from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple, Union
 
 # Add parent directory to path for imports
 sys.path.append(str(Path(__file__).parent.parent))
@@ -16,23 +21,202 @@ sys.path.append(str(Path(__file__).parent.parent))
 from configs.store_config import STORE_MANAGERS, STORE_SEATING_CAPACITY
 
 
+DateRange = Tuple[date, date]
+
+
+class ReportPeriods:
+    """
+    Half-open [start, end) date ranges for every period a report compares.
+
+    Queries bind a range as ``date >= %s AND date < %s`` instead of
+    EXTRACT(YEAR/MONTH/DAY FROM date) so PostgreSQL can use the
+    (store_id, date) indexes rather than scanning every row ever loaded.
+
+    MTD ranges keep the target day-of-month and are clamped to the end of
+    their month, so day 31 against a 30-day month (or Feb 29 against a
+    non-leap year) covers the whole shorter month, exactly like the old
+    ``EXTRACT(DAY FROM date) <= day`` filters did.
+    """
+
+    def __init__(self, target_date: Union[str, date, datetime]):
+        if isinstance(target_date, str):
+            target_date = datetime.strptime(target_date, '%Y-%m-%d')
+        if isinstance(target_date, datetime):
+            target_date = target_date.date()
+
+        self.target_date = target_date
+        self.year = target_date.year
+        self.month = target_date.month
+        self.day = target_date.day
+
+        self.prev_month_year, self.prev_month = self.shift_month(
+            self.year, self.month, -1)
+        self.prev_year = self.year - 1
+
+    @staticmethod
+    def shift_month(year: int, month: int, months: int) -> Tuple[int, int]:
+        """Return (year, month) moved by the given number of months"""
+        index = year * 12 + (month - 1) + months
+        return index // 12, index % 12 + 1
+
+    @classmethod
+    def month_range(cls, year: int, month: int) -> DateRange:
+        """Full calendar month: [first day, first day of next month)"""
+        next_year, next_month = cls.shift_month(year, month, 1)
+        return date(year, month, 1), date(next_year, next_month, 1)
+
+    @classmethod
+    def mtd_range(cls, year: int, month: int, day: int) -> DateRange:
+        """Days 1..day of a month, clamped to the month's last day"""
+        start, month_end = cls.month_range(year, month)
+        return start, min(start + timedelta(days=day), month_end)
+
+    @property
+    def month_start(self) -> date:
+        """First day of the target month (store_monthly_target.month key)"""
+        return date(self.year, self.month, 1)
+
+    @property
+    def target_day(self) -> DateRange:
+        return self.target_date, self.target_date + timedelta(days=1)
+
+    @property
+    def current_mtd(self) -> DateRange:
+        return self.mtd_range(self.year, self.month, self.day)
+
+    @property
+    def prev_month_mtd(self) -> DateRange:
+        return self.mtd_range(self.prev_month_year, self.prev_month, self.day)
+
+    @property
+    def prev_year_mtd(self) -> DateRange:
+        return self.mtd_range(self.prev_year, self.month, self.day)
+
+    @property
+    def current_month(self) -> DateRange:
+        return self.month_range(self.year, self.month)
+
+    @property
+    def prev_month_full(self) -> DateRange:
+        return self.month_range(self.prev_month_year, self.prev_month)
+
+    @property
+    def prev_year_month(self) -> DateRange:
+        return self.month_range(self.prev_year, self.month)
+
+
+# Every live ReportDataCache, so extraction can invalidate them after writing
+_report_caches = weakref.WeakSet()
+
+
+class ReportDataCache:
+    """
+    Memoized ReportDataProvider results for a single report run.
+
+    Results are keyed by query method and arguments, so each distinct query
+    reaches PostgreSQL once per report no matter how many worksheet
+    generators ask for it. Callers always get a deep copy, so a generator
+    that edits its data cannot change what the next generator sees.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._results: Dict[Tuple, Any] = {}
+        self._lock = threading.Lock()
+        _report_caches.add(self)
+
+    def get(self, key: Tuple, load: Callable[[], Any]):
+        """Return the cached result for key, running load() on a miss"""
+        with self._lock:
+            found = key in self._results
+            if found:
+                self.hits += 1
+                result = self._results[key]
+            else:
+                self.misses += 1
+
+        if not found:
+            # An exception from load() propagates and nothing is stored
+            result = load()
+            with self._lock:
+                self._results[key] = result
+
+        return copy.deepcopy(result)
+
+    def invalidate(self):
+        """Drop every cached result (the hit/miss counters are kept)"""
+        with self._lock:
+            self._results.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._results)}
+
+    def log_stats(self):
+        """Print hit/miss counters for the current run"""
+        stats = self.stats()
+        print(f"Report query cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['entries']} cached results)")
+
+
+def invalidate_report_caches():
+    """Clear all live report caches; call after writing report source tables"""
+    for cache in list(_report_caches):
+        cache.invalidate()
+
+
+# Error paths counted per thread, so fallback results are never cached
+_query_state = threading.local()
+
+
+class _QueryFailed(Exception):
+    """Carries a query method's fallback result past the cache"""
+
+    def __init__(self, result):
+        super().__init__()
+        self.result = result
+
+
+def _query_failed():
+    """Call from a query method's error path before returning its fallback result"""
+    _query_state.failures = getattr(_query_state, 'failures', 0) + 1
+
+
+def _cached_query(method):
+    """Serve a ReportDataProvider query from the provider's cache, if it has one"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.cache is None:
+            return method(self, *args, **kwargs)
+
+        def load():
+            failures = getattr(_query_state, 'failures', 0)
+            result = method(self, *args, **kwargs)
+            if getattr(_query_state, 'failures', 0) != failures:
+                raise _QueryFailed(result)
+            return result
+
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        try:
+            return self.cache.get(key, load)
+        except _QueryFailed as failed:
+            return failed.result
+    return wrapper
+
+
 class ReportDataProvider:
     """Centralized data provider for all report generation"""
 
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, cache: Optional[ReportDataCache] = None):
         self.db_manager = db_manager
+        self.cache = cache
 
+    @_cached_query
     def get_all_report_data(self, target_date: str):
         """Get all required data in a single comprehensive query to reduce database load"""
-        target_dt = datetime.strptime(target_date, '%Y-%m-%d')
-        year, month, day = target_dt.year, target_dt.month, target_dt.day
-
-        # Calculate date ranges
-        prev_year = year - 1
-        if month == 1:
-            prev_month_year, prev_month = year - 1, 12
-        else:
-            prev_month_year, prev_month = year, month - 1
+        periods = ReportPeriods(target_date)
 
         sql = """
         SELECT 
@@ -54,47 +238,32 @@ class ReportDataProvider:
             -- Categorize data by period (order matters - specific conditions first)
             CASE 
                 WHEN dr.date = %s THEN 'target_day'
-                WHEN EXTRACT(YEAR FROM dr.date) = %s 
-                     AND EXTRACT(MONTH FROM dr.date) = %s
-                     AND EXTRACT(DAY FROM dr.date) <= %s THEN 'current_year_mtd'
-                WHEN EXTRACT(YEAR FROM dr.date) = %s 
-                     AND EXTRACT(MONTH FROM dr.date) = %s
-                     AND EXTRACT(DAY FROM dr.date) <= %s THEN 'prev_month_mtd'
-                WHEN EXTRACT(YEAR FROM dr.date) = %s 
-                     AND EXTRACT(MONTH FROM dr.date) = %s
-                     AND EXTRACT(DAY FROM dr.date) <= %s THEN 'prev_year_mtd'
-                WHEN EXTRACT(YEAR FROM dr.date) = %s 
-                     AND EXTRACT(MONTH FROM dr.date) = %s THEN 'current_month'
-                WHEN EXTRACT(YEAR FROM dr.date) = %s 
-                     AND EXTRACT(MONTH FROM dr.date) = %s THEN 'prev_month'
+                WHEN dr.date >= %s AND dr.date < %s THEN 'current_year_mtd'
+                WHEN dr.date >= %s AND dr.date < %s THEN 'prev_month_mtd'
+                WHEN dr.date >= %s AND dr.date < %s THEN 'prev_year_mtd'
+                WHEN dr.date >= %s AND dr.date < %s THEN 'current_month'
+                WHEN dr.date >= %s AND dr.date < %s THEN 'prev_month'
                 ELSE 'other'
             END as period_type
         FROM daily_report dr
         JOIN store s ON dr.store_id = s.id
         LEFT JOIN store_monthly_target smt ON s.id = smt.store_id 
-            AND EXTRACT(YEAR FROM smt.month) = %s 
-            AND EXTRACT(MONTH FROM smt.month) = %s
+            AND smt.month >= %s AND smt.month < %s
         WHERE (
             -- Target day
             dr.date = %s
             OR
             -- Current month
-            (EXTRACT(YEAR FROM dr.date) = %s 
-             AND EXTRACT(MONTH FROM dr.date) = %s)
+            (dr.date >= %s AND dr.date < %s)
             OR
             -- Previous month
-            (EXTRACT(YEAR FROM dr.date) = %s 
-             AND EXTRACT(MONTH FROM dr.date) = %s)
+            (dr.date >= %s AND dr.date < %s)
             OR
             -- Previous month MTD (for comparison)
-            (EXTRACT(YEAR FROM dr.date) = %s 
-             AND EXTRACT(MONTH FROM dr.date) = %s
-             AND EXTRACT(DAY FROM dr.date) <= %s)
+            (dr.date >= %s AND dr.date < %s)
             OR
             -- Previous year same period (for yearly comparison)
-            (EXTRACT(YEAR FROM dr.date) = %s 
-             AND EXTRACT(MONTH FROM dr.date) = %s
-             AND EXTRACT(DAY FROM dr.date) <= %s)
+            (dr.date >= %s AND dr.date < %s)
         )
         ORDER BY s.id, dr.date
         """
@@ -104,20 +273,21 @@ class ReportDataProvider:
                 cursor = conn.cursor()
                 cursor.execute(sql, (
                     target_date,  # target_day comparison
-                    year, month, day,  # current_year_mtd
-                    prev_month_year, prev_month, day,  # prev_month_mtd
-                    prev_year, month, day,  # prev_year_mtd
-                    year, month,  # current_month
-                    prev_month_year, prev_month,  # prev_month
-                    year, month,  # JOIN condition for monthly targets
+                    *periods.current_mtd,  # current_year_mtd
+                    *periods.prev_month_mtd,  # prev_month_mtd
+                    *periods.prev_year_mtd,  # prev_year_mtd
+                    *periods.current_month,  # current_month
+                    *periods.prev_month_full,  # prev_month
+                    *periods.current_month,  # JOIN condition for monthly targets
                     target_date,  # WHERE target day
-                    year, month,  # WHERE current month
-                    prev_month_year, prev_month,  # WHERE prev month
-                    prev_month_year, prev_month, day,  # WHERE prev month MTD
-                    prev_year, month, day  # WHERE prev year
+                    *periods.current_month,  # WHERE current month
+                    *periods.prev_month_full,  # WHERE prev month
+                    *periods.prev_month_mtd,  # WHERE prev month MTD
+                    *periods.prev_year_mtd  # WHERE prev year
                 ))
                 return cursor.fetchall()
         except Exception as e:
+            _query_failed()
             print(f"❌ Error fetching comprehensive data: {e}")
             return []
 
@@ -339,6 +509,7 @@ class ReportDataProvider:
 
         return processed_data
 
+    @_cached_query
     def get_time_segment_data(self, target_date: str):
         """Get time segment data from store_time_report table"""
         from datetime import datetime, timedelta
@@ -350,6 +521,7 @@ class ReportDataProvider:
         target_day = target_dt.day
 
         prev_year = current_year - 1
+        periods = ReportPeriods(target_dt)
 
         # Helper function to find same weekday from previous year
         def find_same_weekday_previous_year(target_dt):
@@ -411,8 +583,7 @@ class ReportDataProvider:
             AND str_prev_weekday.date = %s
         LEFT JOIN store_monthly_time_target smtt ON s.id = smtt.store_id 
             AND ts.id = smtt.time_segment_id
-            AND EXTRACT(YEAR FROM smtt.month) = %s 
-            AND EXTRACT(MONTH FROM smtt.month) = %s
+            AND smtt.month >= %s AND smtt.month < %s
         WHERE s.id BETWEEN 1 AND 8
         ORDER BY s.id, ts.id
         """
@@ -423,7 +594,7 @@ class ReportDataProvider:
                 target_date,  # Current year target date
                 prev_year_target_date,  # Previous year same date
                 prev_year_same_weekday_date,  # Previous year same weekday date
-                current_year, current_month  # Target data
+                *periods.current_month  # Target data
             ))
 
             # Get MTD aggregates separately to avoid Cartesian products
@@ -434,14 +605,12 @@ class ReportDataProvider:
                 AVG(turnover_rate) as mtd_avg_turnover,
                 SUM(tables_served_validated) as mtd_total_tables
             FROM store_time_report 
-            WHERE EXTRACT(YEAR FROM date) = %s 
-                AND EXTRACT(MONTH FROM date) = %s
-                AND EXTRACT(DAY FROM date) <= %s
+            WHERE date >= %s AND date < %s
             GROUP BY store_id, time_segment_id
             """
 
             mtd_results = self.db_manager.fetch_all(
-                mtd_sql, (current_year, current_month, target_day))
+                mtd_sql, periods.current_mtd)
 
             # Get previous year MTD aggregates (up to target day)
             prev_full_month_sql = """
@@ -450,14 +619,12 @@ class ReportDataProvider:
                 time_segment_id,
                 AVG(turnover_rate) as prev_full_month_avg_turnover
             FROM store_time_report 
-            WHERE EXTRACT(YEAR FROM date) = %s 
-                AND EXTRACT(MONTH FROM date) = %s
-                AND EXTRACT(DAY FROM date) <= %s
+            WHERE date >= %s AND date < %s
             GROUP BY store_id, time_segment_id
             """
 
             prev_full_results = self.db_manager.fetch_all(
-                prev_full_month_sql, (prev_year, current_month, target_day))
+                prev_full_month_sql, periods.prev_year_mtd)
 
             # Get previous year MTD aggregates
             prev_mtd_sql = """
@@ -466,14 +633,12 @@ class ReportDataProvider:
                 time_segment_id,
                 SUM(tables_served_validated) as prev_mtd_total_tables
             FROM store_time_report 
-            WHERE EXTRACT(YEAR FROM date) = %s 
-                AND EXTRACT(MONTH FROM date) = %s
-                AND EXTRACT(DAY FROM date) <= %s
+            WHERE date >= %s AND date < %s
             GROUP BY store_id, time_segment_id
             """
 
             prev_mtd_results = self.db_manager.fetch_all(
-                prev_mtd_sql, (prev_year, current_month, target_day))
+                prev_mtd_sql, periods.prev_year_mtd)
 
             # Create lookup dictionaries for aggregated data
             mtd_lookup = {(row['store_id'], row['time_segment_id']): row for row in mtd_results}
@@ -550,9 +715,11 @@ class ReportDataProvider:
             return time_segment_data
 
         except Exception as e:
+            _query_failed()
             print(f"❌ Error getting time segment data: {e}")
             return {}
 
+    @_cached_query
     def get_daily_store_performance(self, target_date: str):
         """
         Get daily store performance data for tracking worksheet.
@@ -627,9 +794,11 @@ class ReportDataProvider:
             return performance_data
 
         except Exception as e:
+            _query_failed()
             print(f"❌ Error getting daily store performance data: {e}")
             return []
 
+    @_cached_query
     def get_weekly_store_performance(self, start_date: str, end_date: str):
         """
         Get weekly store performance data for tracking worksheet (7-day aggregation).
@@ -792,9 +961,11 @@ class ReportDataProvider:
             return performance_data
 
         except Exception as e:
+            _query_failed()
             print(f"❌ Error getting weekly store performance data: {e}")
             return []
 
+    @_cached_query
     def get_gross_margin_dish_price_data(self, target_date: str):
         """
         Get dish price data for gross margin analysis.
@@ -805,22 +976,11 @@ class ReportDataProvider:
         Returns:
             List of dish price data dictionaries
         """
-        from datetime import datetime
-
-        # Parse target date to get year and month
-        target_dt = datetime.strptime(target_date, '%Y-%m-%d')
-        current_year = target_dt.year
-        current_month = target_dt.month
-
-        # Calculate previous month and year
-        if current_month == 1:
-            prev_month = 12
-            prev_month_year = current_year - 1
-        else:
-            prev_month = current_month - 1
-            prev_month_year = current_year
-
-        prev_year = current_year - 1
+        # Parse target date into report periods
+        periods = ReportPeriods(target_date)
+        current_year, current_month = periods.year, periods.month
+        prev_month_year, prev_month = periods.prev_month_year, periods.prev_month
+        prev_year = periods.prev_year
 
         sql = """
         WITH dish_current_price AS (
@@ -829,8 +989,7 @@ class ReportDataProvider:
                 MIN(effective_date) as earliest_price_date
             FROM dish_price_history
             WHERE is_active = true
-                AND EXTRACT(YEAR FROM effective_date) = %s
-                AND EXTRACT(MONTH FROM effective_date) = %s
+                AND effective_date >= %s AND effective_date < %s
             GROUP BY dish_id, store_id, price
         ),
         dish_previous_price AS (
@@ -838,10 +997,7 @@ class ReportDataProvider:
                 dish_id, store_id, price
             FROM dish_price_history
             WHERE is_active = true
-                AND (
-                    EXTRACT(YEAR FROM effective_date) < %s
-                    OR (EXTRACT(YEAR FROM effective_date) = %s AND EXTRACT(MONTH FROM effective_date) < %s)
-                )
+                AND effective_date < %s
             ORDER BY dish_id, store_id, effective_date DESC
         ),
         dish_last_year_price AS (
@@ -850,7 +1006,7 @@ class ReportDataProvider:
                 dish_id, price, effective_date
             FROM dish_price_history
             WHERE is_active = true
-                AND effective_date <= %s
+                AND effective_date < %s
             ORDER BY dish_id, effective_date DESC
         ),
         -- Aggregate dish sales across all sales modes first
@@ -1034,8 +1190,7 @@ class ReportDataProvider:
         LEFT JOIN material_price_history mph ON m.id = mph.material_id
             AND s.id = mph.store_id
             AND mph.is_active = true
-            AND EXTRACT(YEAR FROM mph.effective_date) = %s
-            AND EXTRACT(MONTH FROM mph.effective_date) = %s
+            AND mph.effective_date >= %s AND mph.effective_date < %s
         LEFT JOIN dish_theoretical_usage dtu ON d.id = dtu.dish_id
             AND s.id = dtu.store_id
         LEFT JOIN dish_actual_usage dau ON d.id = dau.dish_id
@@ -1052,13 +1207,10 @@ class ReportDataProvider:
         """
 
         try:
-            # Calculate last year same period date
-            last_year_same_period = f"{prev_year}-{current_month:02d}-30"
-
             params = (
-                current_year, current_month,  # dish_current_price
-                prev_month_year, prev_month_year, prev_month,  # dish_previous_price
-                last_year_same_period,  # dish_last_year_price
+                *periods.current_month,  # dish_current_price
+                periods.prev_month_full[0],  # dish_previous_price
+                periods.prev_year_month[1],  # dish_last_year_price (through end of month)
                 current_year, current_month,  # aggregated_dish_sales
                 # dish_theoretical_usage (both regular and combo)
                 current_year, current_month,
@@ -1070,7 +1222,7 @@ class ReportDataProvider:
                 prev_month_year, prev_month,  # Previous month (for WHERE clause)
                 prev_year, current_month,     # Last year same month (for WHERE clause)
                 current_year, current_month,  # dish_combo_sales
-                current_year, current_month   # mph current
+                *periods.current_month  # mph current
             )
 
             results = self.db_manager.fetch_all(sql, params)
@@ -1078,11 +1230,13 @@ class ReportDataProvider:
             return results
 
         except Exception as e:
+            _query_failed()
             print(f"❌ Error getting gross margin dish price data: {e}")
             import traceback
             traceback.print_exc()
             return []
 
+    @_cached_query
     def get_gross_margin_material_cost_data(self, target_date: str):
         """
         Get material cost data for gross margin analysis.
@@ -1093,20 +1247,9 @@ class ReportDataProvider:
         Returns:
             List of material cost data dictionaries
         """
-        from datetime import datetime
-
-        # Parse target date
-        target_dt = datetime.strptime(target_date, '%Y-%m-%d')
-        current_year = target_dt.year
-        current_month = target_dt.month
-
-        # Calculate previous month
-        if current_month == 1:
-            prev_month = 12
-            prev_month_year = current_year - 1
-        else:
-            prev_month = current_month - 1
-            prev_month_year = current_year
+        # Parse target date into report periods
+        periods = ReportPeriods(target_date)
+        current_year, current_month = periods.year, periods.month
 
         sql = """
         WITH material_current_price AS (
@@ -1114,18 +1257,14 @@ class ReportDataProvider:
                 material_id, store_id, price
             FROM material_price_history
             WHERE is_active = true
-                AND EXTRACT(YEAR FROM effective_date) = %s
-                AND EXTRACT(MONTH FROM effective_date) = %s
+                AND effective_date >= %s AND effective_date < %s
         ),
         material_previous_price AS (
             SELECT DISTINCT ON (material_id, store_id)
                 material_id, store_id, price
             FROM material_price_history
             WHERE is_active = true
-                AND (
-                    EXTRACT(YEAR FROM effective_date) < %s
-                    OR (EXTRACT(YEAR FROM effective_date) = %s AND EXTRACT(MONTH FROM effective_date) < %s)
-                )
+                AND effective_date < %s
             ORDER BY material_id, store_id, effective_date DESC
         )
         SELECT 
@@ -1168,17 +1307,19 @@ class ReportDataProvider:
 
         try:
             results = self.db_manager.fetch_all(sql, (
-                current_year, current_month,  # material_current_price
-                prev_month_year, prev_month_year, prev_month,  # material_previous_price
+                *periods.current_month,  # material_current_price
+                periods.prev_month_full[0],  # material_previous_price
                 current_year, current_month   # mmu current
             ))
 
             return results
 
         except Exception as e:
+            _query_failed()
             print(f"❌ Error getting gross margin material cost data: {e}")
             return []
 
+    @_cached_query
     def get_store_gross_profit_data(self, target_date: str):
         """
         Get store gross profit data for all stores comparison.
@@ -1189,20 +1330,9 @@ class ReportDataProvider:
         Returns:
             List of store gross profit data dictionaries
         """
-        from datetime import datetime
-
-        # Parse target date to get year and month
-        target_dt = datetime.strptime(target_date, '%Y-%m-%d')
-        current_year = target_dt.year
-        current_month = target_dt.month
-
-        # Calculate previous month and year
-        if current_month == 1:
-            prev_month = 12
-            prev_month_year = current_year - 1
-        else:
-            prev_month = current_month - 1
-            prev_month_year = current_year
+        # Parse target date into report periods
+        periods = ReportPeriods(target_date)
+        current_year, current_month = periods.year, periods.month
 
         sql = """
         SELECT 
@@ -1226,16 +1356,8 @@ class ReportDataProvider:
                 mmu.store_id,
                 SUM(mmu.material_used * COALESCE(mph.price, 0)) as current_cost
             FROM material_monthly_usage mmu
-            LEFT JOIN LATERAL (
-                SELECT price 
-                FROM material_price_history 
-                WHERE material_id = mmu.material_id 
-                    AND store_id = mmu.store_id 
-                    AND is_active = true
-                    AND effective_date <= (date_trunc('month', make_date(%s, %s, 1)) + interval '1 month - 1 day')::date
-                ORDER BY effective_date DESC
-                LIMIT 1
-            ) mph ON true
+            LEFT JOIN material_price_as_of(make_date(%s, %s, 1)) mph
+                ON mph.material_id = mmu.material_id AND mph.store_id = mmu.store_id
             WHERE mmu.year = %s AND mmu.month = %s
             GROUP BY mmu.store_id
         ) cc ON s.id = cc.store_id
@@ -1244,8 +1366,7 @@ class ReportDataProvider:
                 store_id,
                 SUM(revenue_tax_not_included) as previous_revenue
             FROM daily_report
-            WHERE EXTRACT(YEAR FROM date) = %s 
-                AND EXTRACT(MONTH FROM date) = %s
+            WHERE date >= %s AND date < %s
             GROUP BY store_id
         ) pr ON s.id = pr.store_id
         LEFT JOIN (
@@ -1254,8 +1375,7 @@ class ReportDataProvider:
                 -- Estimate previous month cost using previous month revenue * 65% (typical restaurant cost ratio)
                 ROUND(SUM(revenue_tax_not_included) * 0.65, 2) as previous_cost
             FROM daily_report
-            WHERE EXTRACT(YEAR FROM date) = %s 
-                AND EXTRACT(MONTH FROM date) = %s
+            WHERE date >= %s AND date < %s
             GROUP BY store_id
         ) pc ON s.id = pc.store_id
         WHERE s.id BETWEEN 1 AND 7
@@ -1287,16 +1407,8 @@ class ReportDataProvider:
                 mmu.store_id,
                 SUM(mmu.material_used * COALESCE(mph.price, 0)) as current_cost
             FROM material_monthly_usage mmu
-            LEFT JOIN LATERAL (
-                SELECT price 
-                FROM material_price_history 
-                WHERE material_id = mmu.material_id 
-                    AND store_id = mmu.store_id 
-                    AND is_active = true
-                    AND effective_date <= (date_trunc('month', make_date(%s, %s, 1)) + interval '1 month - 1 day')::date
-                ORDER BY effective_date DESC
-                LIMIT 1
-            ) mph ON true
+            LEFT JOIN material_price_as_of(make_date(%s, %s, 1)) mph
+                ON mph.material_id = mmu.material_id AND mph.store_id = mmu.store_id
             WHERE mmu.year = %s AND mmu.month = %s
             GROUP BY mmu.store_id
             """
@@ -1309,11 +1421,10 @@ class ReportDataProvider:
                 store_id,
                 SUM(revenue_tax_not_included) as previous_revenue
             FROM daily_report
-            WHERE EXTRACT(YEAR FROM date) = %s 
-                AND EXTRACT(MONTH FROM date) = %s
+            WHERE date >= %s AND date < %s
             GROUP BY store_id
             """
-            previous_revenue_data = self.db_manager.fetch_all(previous_revenue_sql, (prev_month_year, prev_month))
+            previous_revenue_data = self.db_manager.fetch_all(previous_revenue_sql, periods.prev_month_full)
             previous_revenue_dict = {row['store_id']: row['previous_revenue'] for row in previous_revenue_data}
             
             # 5. Get previous cost (estimated)
@@ -1322,11 +1433,10 @@ class ReportDataProvider:
                 store_id,
                 ROUND(SUM(revenue_tax_not_included) * 0.65, 2) as previous_cost
             FROM daily_report
-            WHERE EXTRACT(YEAR FROM date) = %s 
-                AND EXTRACT(MONTH FROM date) = %s
+            WHERE date >= %s AND date < %s
             GROUP BY store_id
             """
-            previous_cost_data = self.db_manager.fetch_all(previous_cost_sql, (prev_month_year, prev_month))
+            previous_cost_data = self.db_manager.fetch_all(previous_cost_sql, periods.prev_month_full)
             previous_cost_dict = {row['store_id']: row['previous_cost'] for row in previous_cost_data}
             
             # Combine all data
@@ -1349,9 +1459,11 @@ class ReportDataProvider:
             return data
 
         except Exception as e:
+            _query_failed()
             print(f"❌ Error getting store gross profit data: {e}")
             return []
 
+    @_cached_query
     def get_gross_margin_discount_data(self, target_date: str):
         """
         Get discount data for gross margin analysis.
@@ -1362,12 +1474,7 @@ class ReportDataProvider:
         Returns:
             List of discount data dictionaries
         """
-        from datetime import datetime
-
-        # Parse target date
-        target_dt = datetime.strptime(target_date, '%Y-%m-%d')
-        current_year = target_dt.year
-        current_month = target_dt.month
+        periods = ReportPeriods(target_date)
 
         sql = """
         SELECT 
@@ -1383,8 +1490,7 @@ class ReportDataProvider:
             COUNT(*) as days_with_discount
         FROM store s
         LEFT JOIN daily_report dr ON s.id = dr.store_id
-            AND EXTRACT(YEAR FROM dr.date) = %s
-            AND EXTRACT(MONTH FROM dr.date) = %s
+            AND dr.date >= %s AND dr.date < %s
         WHERE s.id BETWEEN 1 AND 8
         GROUP BY s.id, s.name
         ORDER BY s.id
@@ -1392,13 +1498,15 @@ class ReportDataProvider:
 
         try:
             results = self.db_manager.fetch_all(
-                sql, (current_year, current_month))
+                sql, periods.current_month)
             return results
 
         except Exception as e:
+            _query_failed()
             print(f"❌ Error getting gross margin discount data: {e}")
             return []
 
+    @_cached_query
     def get_time_segment_mtd_data(self, target_date: str):
         """
         Get MTD time segment data for challenge calculations.
@@ -1412,14 +1520,8 @@ class ReportDataProvider:
             - prev_* fields: Previous year MTD data (same day range)
             - prev_month_* fields: Previous year FULL month data (for daily average calculation)
         """
-        from datetime import datetime
-
-        # Parse target date
-        target_dt = datetime.strptime(target_date, '%Y-%m-%d')
-        current_year = target_dt.year
-        current_month = target_dt.month
-        target_day = target_dt.day
-        prev_year = current_year - 1
+        # Parse target date into report periods
+        periods = ReportPeriods(target_date)
 
         # Query to get MTD time segment data for current and previous year
         # Also get full month data for previous year (for daily average calculation)
@@ -1432,9 +1534,7 @@ class ReportDataProvider:
                 SUM(tables_served_validated) as total_tables,
                 COUNT(*) as days_count
             FROM store_time_report
-            WHERE EXTRACT(YEAR FROM date) = %s
-                AND EXTRACT(MONTH FROM date) = %s
-                AND EXTRACT(DAY FROM date) <= %s
+            WHERE date >= %s AND date < %s
             GROUP BY store_id, time_segment_id
         ),
         prev_year_mtd AS (
@@ -1445,9 +1545,7 @@ class ReportDataProvider:
                 SUM(tables_served_validated) as total_tables,
                 COUNT(*) as days_count
             FROM store_time_report
-            WHERE EXTRACT(YEAR FROM date) = %s
-                AND EXTRACT(MONTH FROM date) = %s
-                AND EXTRACT(DAY FROM date) <= %s
+            WHERE date >= %s AND date < %s
             GROUP BY store_id, time_segment_id
         ),
         prev_year_full_month AS (
@@ -1458,8 +1556,7 @@ class ReportDataProvider:
                 SUM(tables_served_validated) as total_tables,
                 COUNT(*) as days_count
             FROM store_time_report
-            WHERE EXTRACT(YEAR FROM date) = %s
-                AND EXTRACT(MONTH FROM date) = %s
+            WHERE date >= %s AND date < %s
             GROUP BY store_id, time_segment_id
         )
         SELECT
@@ -1487,9 +1584,9 @@ class ReportDataProvider:
 
         try:
             results = self.db_manager.fetch_all(sql, (
-                current_year, current_month, target_day,  # current_mtd
-                prev_year, current_month, target_day,     # prev_year_mtd
-                prev_year, current_month                  # prev_year_full_month
+                *periods.current_mtd,  # current_mtd
+                *periods.prev_year_mtd,  # prev_year_mtd
+                *periods.prev_year_month  # prev_year_full_month
             ))
 
             # Organize by store_id
@@ -1520,11 +1617,13 @@ class ReportDataProvider:
             return store_data
 
         except Exception as e:
+            _query_failed()
             print(f"❌ Error getting time segment MTD data: {e}")
             import traceback
             traceback.print_exc()
             return {}
 
+    @_cached_query
     def get_profit_mtd_data(self, target_date: str):
         """
         Get MTD profit/revenue data for challenge calculations.
@@ -1543,17 +1642,12 @@ class ReportDataProvider:
             - prev_year_days: Number of days with data in prev year month
             - prev_year_month_days: Total days in previous year same month
         """
-        from datetime import datetime
         import calendar
 
-        target_dt = datetime.strptime(target_date, '%Y-%m-%d')
-        current_year = target_dt.year
-        current_month = target_dt.month
-        target_day = target_dt.day
-        prev_year = current_year - 1
+        periods = ReportPeriods(target_date)
 
         # Get days in previous year same month
-        prev_year_month_days = calendar.monthrange(prev_year, current_month)[1]
+        prev_year_month_days = calendar.monthrange(periods.prev_year, periods.month)[1]
 
         sql = """
         WITH current_mtd AS (
@@ -1562,9 +1656,7 @@ class ReportDataProvider:
                 SUM(revenue_tax_not_included) as total_amount,
                 COUNT(*) as days_count
             FROM daily_report
-            WHERE EXTRACT(YEAR FROM date) = %s
-                AND EXTRACT(MONTH FROM date) = %s
-                AND EXTRACT(DAY FROM date) <= %s
+            WHERE date >= %s AND date < %s
             GROUP BY store_id
         ),
         prev_year_mtd AS (
@@ -1573,9 +1665,7 @@ class ReportDataProvider:
                 SUM(revenue_tax_not_included) as total_amount,
                 COUNT(*) as days_count
             FROM daily_report
-            WHERE EXTRACT(YEAR FROM date) = %s
-                AND EXTRACT(MONTH FROM date) = %s
-                AND EXTRACT(DAY FROM date) <= %s
+            WHERE date >= %s AND date < %s
             GROUP BY store_id
         ),
         prev_year_month AS (
@@ -1584,8 +1674,7 @@ class ReportDataProvider:
                 SUM(revenue_tax_not_included) as total_amount,
                 COUNT(*) as days_count
             FROM daily_report
-            WHERE EXTRACT(YEAR FROM date) = %s
-                AND EXTRACT(MONTH FROM date) = %s
+            WHERE date >= %s AND date < %s
             GROUP BY store_id
         )
         SELECT
@@ -1607,9 +1696,9 @@ class ReportDataProvider:
 
         try:
             results = self.db_manager.fetch_all(sql, (
-                current_year, current_month, target_day,  # current_mtd
-                prev_year, current_month, target_day,     # prev_year_mtd
-                prev_year, current_month                   # prev_year_month
+                *periods.current_mtd,  # current_mtd
+                *periods.prev_year_mtd,  # prev_year_mtd
+                *periods.prev_year_month  # prev_year_month
             ))
 
             store_data = {}
@@ -1629,11 +1718,13 @@ class ReportDataProvider:
             return store_data
 
         except Exception as e:
+            _query_failed()
             print(f"❌ Error getting profit MTD data: {e}")
             import traceback
             traceback.print_exc()
             return {}
 
+    @_cached_query
     def get_takeout_mtd_data(self, target_date: str):
         """
         Get MTD takeout revenue data for challenge calculations.
@@ -1652,17 +1743,12 @@ class ReportDataProvider:
             - prev_year_days: Number of days with data in prev year month
             - prev_year_month_days: Total days in previous year same month
         """
-        from datetime import datetime
         import calendar
 
-        target_dt = datetime.strptime(target_date, '%Y-%m-%d')
-        current_year = target_dt.year
-        current_month = target_dt.month
-        target_day = target_dt.day
-        prev_year = current_year - 1
+        periods = ReportPeriods(target_date)
 
         # Get days in previous year same month
-        prev_year_month_days = calendar.monthrange(prev_year, current_month)[1]
+        prev_year_month_days = calendar.monthrange(periods.prev_year, periods.month)[1]
 
         sql = """
         WITH current_mtd AS (
@@ -1671,9 +1757,7 @@ class ReportDataProvider:
                 SUM(amount) as total_amount,
                 COUNT(*) as days_count
             FROM daily_takeout_revenue
-            WHERE EXTRACT(YEAR FROM date) = %s
-                AND EXTRACT(MONTH FROM date) = %s
-                AND EXTRACT(DAY FROM date) <= %s
+            WHERE date >= %s AND date < %s
             GROUP BY store_id
         ),
         prev_year_mtd AS (
@@ -1682,9 +1766,7 @@ class ReportDataProvider:
                 SUM(amount) as total_amount,
                 COUNT(*) as days_count
             FROM daily_takeout_revenue
-            WHERE EXTRACT(YEAR FROM date) = %s
-                AND EXTRACT(MONTH FROM date) = %s
-                AND EXTRACT(DAY FROM date) <= %s
+            WHERE date >= %s AND date < %s
             GROUP BY store_id
         ),
         prev_year_month AS (
@@ -1693,8 +1775,7 @@ class ReportDataProvider:
                 SUM(amount) as total_amount,
                 COUNT(*) as days_count
             FROM daily_takeout_revenue
-            WHERE EXTRACT(YEAR FROM date) = %s
-                AND EXTRACT(MONTH FROM date) = %s
+            WHERE date >= %s AND date < %s
             GROUP BY store_id
         )
         SELECT
@@ -1716,9 +1797,9 @@ class ReportDataProvider:
 
         try:
             results = self.db_manager.fetch_all(sql, (
-                current_year, current_month, target_day,  # current_mtd
-                prev_year, current_month, target_day,     # prev_year_mtd
-                prev_year, current_month                   # prev_year_month
+                *periods.current_mtd,  # current_mtd
+                *periods.prev_year_mtd,  # prev_year_mtd
+                *periods.prev_year_month  # prev_year_month
             ))
 
             store_data = {}
@@ -1738,6 +1819,7 @@ class ReportDataProvider:
             return store_data
 
         except Exception as e:
+            _query_failed()
             print(f"❌ Error getting takeout MTD data: {e}")
             import traceback
             traceback.print_exc()
@@ -4,7 +4,11 @@ Enhanced database utilities for Haidilao paperwork automation.
 Consolidates common database operation patterns from 50+ files.
 """
 
+import hashlib
+import io
 import logging
+import os
+from pathlib import Path
 from typing import Dict, List, Optional, Any, Tuple
 from contextlib import contextmanager
 import pandas as pd
@@ -31,6 +35,8 @@ class DatabaseOperations:
         """
         self.db_manager = database_manager
         self.logger = logging.getLogger(self.__class__.__name__)
+        self.dimensions = DimensionCache()
+        self.lookup_cache: Dict[Tuple, Any] = {}
     
     @contextmanager
     def get_connection(self):
@@ -185,6 +191,10 @@ class DatabaseOperations:
         """
         Common lookup pattern with creation if not exists.
         
+        Lookups by the key columns of a DimensionCache table load that table's
+        IDs once; any other lookup is remembered per instance, so repeated
+        values never query the database again.
+        
         Args:
             table: Target table name
             lookup_data: Data to look up / create
@@ -193,42 +203,67 @@ class DatabaseOperations:
         Returns:
             Value from return_column or None if failed
         """
-        # First try to find existing record
-        where_clause = ' AND '.join([f"{k} = %s" for k in lookup_data.keys()])
-        select_sql = f"SELECT {return_column} FROM {table} WHERE {where_clause}"
+        cache_key = (table, return_column, tuple(sorted(lookup_data.items())))
+        if cache_key in self.lookup_cache:
+            return self.lookup_cache[cache_key]
+        
+        key_columns = DimensionCache.TABLES.get(table)
+        use_dimensions = (return_column == 'id' and key_columns is not None
+                          and set(key_columns) == set(lookup_data))
         
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute(select_sql, list(lookup_data.values()))
-                result = cursor.fetchone()
-                
-                if result:
-                    return result[0]
-                
-                # Record doesn't exist, create it
-                columns = list(lookup_data.keys())
-                placeholders = ', '.join(['%s'] * len(columns))
-                
-                insert_sql = f"""
-                INSERT INTO {table} ({', '.join(columns)})
-                VALUES ({placeholders})
-                RETURNING {return_column}
-                """
                 
-                cursor.execute(insert_sql, list(lookup_data.values()))
-                result = cursor.fetchone()
-                conn.commit()
+                if use_dimensions:
+                    key = DimensionCache._key(tuple(lookup_data[col] for col in key_columns))
+                    ids, created = self.dimensions.get_or_create(cursor, table, [key])
+                    if created:
+                        conn.commit()
+                        self.logger.debug(f"Created new {table} record with id={ids.get(key)}")
+                    value = ids.get(key)
+                else:
+                    value = self._select_or_insert(cursor, table, lookup_data, return_column)
+                    conn.commit()
                 
-                if result:
-                    self.logger.debug(f"Created new {table} record with {return_column}={result[0]}")
-                    return result[0]
+                if value is not None:
+                    self.lookup_cache[cache_key] = value
+                return value
                 
         except Exception as e:
             self.logger.error(f"Failed get_or_create for {table}: {e}")
         
         return None
     
+    def _select_or_insert(self, cursor, table: str, lookup_data: Dict[str, Any],
+                          return_column: str) -> Optional[Any]:
+        """Find a record by lookup_data, creating it if it does not exist."""
+        where_clause = ' AND '.join([f"{k} = %s" for k in lookup_data.keys()])
+        cursor.execute(f"SELECT {return_column} FROM {table} WHERE {where_clause}",
+                       list(lookup_data.values()))
+        result = cursor.fetchone()
+        
+        if result:
+            return result[0]
+        
+        # Record doesn't exist, create it
+        columns = list(lookup_data.keys())
+        placeholders = ', '.join(['%s'] * len(columns))
+        
+        insert_sql = f"""
+        INSERT INTO {table} ({', '.join(columns)})
+        VALUES ({placeholders})
+        RETURNING {return_column}
+        """
+        
+        cursor.execute(insert_sql, list(lookup_data.values()))
+        result = cursor.fetchone()
+        
+        if result:
+            self.logger.debug(f"Created new {table} record with {return_column}={result[0]}")
+            return result[0]
+        return None
+    
     def execute_query_to_dataframe(
         self, 
         query: str, 
@@ -446,8 +481,574 @@ class CommonQueries:
         """
 
 
+class StagingLoader:
+    """
+    Set-based loading helpers: COPY a DataFrame into a temp table, then apply
+    it to the target tables with single INSERT ... SELECT statements.
+    Replaces per-row SELECT + INSERT round trips in the extraction scripts.
+    """
+
+    NULL_MARKER = '\\N'
+    INTEGER_TYPES = ('integer', 'int', 'bigint', 'smallint')
+
+    @staticmethod
+    def copy_to_temp_table(cursor, df: pd.DataFrame, table_name: str,
+                           column_types: Dict[str, str]) -> int:
+        """
+        Create a temp table and COPY the given DataFrame columns into it.
+
+        The table lives until the end of the current transaction, so callers
+        should stage and upsert on the same connection before committing.
+
+        Args:
+            cursor: Open database cursor
+            df: Source data (only the columns in column_types are staged)
+            table_name: Name of the temp table to create
+            column_types: Ordered mapping of column name -> PostgreSQL type
+
+        Returns:
+            Number of rows staged
+        """
+        columns_sql = ', '.join(f"{col} {sql_type}" for col, sql_type in column_types.items())
+        cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+        cursor.execute(f"CREATE TEMP TABLE {table_name} ({columns_sql}) ON COMMIT DROP")
+
+        if df.empty:
+            return 0
+
+        staged = df[list(column_types)].copy()
+        for col, sql_type in column_types.items():
+            if sql_type.lower() in StagingLoader.INTEGER_TYPES:
+                staged[col] = pd.to_numeric(staged[col], errors='coerce').astype('Int64')
+
+        buffer = io.StringIO()
+        staged.to_csv(buffer, index=False, header=False, na_rep=StagingLoader.NULL_MARKER)
+        buffer.seek(0)
+
+        cursor.copy_expert(
+            f"COPY {table_name} ({', '.join(column_types)}) FROM STDIN "
+            f"WITH (FORMAT csv, NULL '{StagingLoader.NULL_MARKER}')",
+            buffer
+        )
+        return len(staged)
+
+    @staticmethod
+    def execute_upsert(cursor, sql: str, params: Optional[Tuple] = None) -> Tuple[int, int]:
+        """
+        Run an INSERT ... ON CONFLICT DO UPDATE ending in
+        ``RETURNING (xmax = 0) AS inserted`` and split the affected rows
+        into inserted and updated counts.
+
+        Returns:
+            Tuple of (inserted, updated)
+        """
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        inserted = sum(1 for row in rows if (row['inserted'] if isinstance(row, dict) else row[0]))
+        return inserted, len(rows) - inserted
+
+
+class DimensionCache:
+    """
+    In-memory keys of the small dimension tables (stores, dish and material
+    types, dishes, materials), loaded with one query per table the first
+    time an extractor asks for it.
+
+    get_or_create() inserts every missing key in one statement and keeps the
+    new IDs, so later lookups in the same run see the rows it created. Rows
+    an extractor creates with its own statements are registered with add(),
+    or picked up by reloading the table after invalidate(). After a
+    rollback, invalidate the tables the transaction wrote to.
+
+    Keys are the key column values in TABLES order: a tuple for two-column
+    keys, a plain value otherwise. Dish sizes are keyed as '' when NULL.
+    """
+
+    TABLES = {
+        'store': ('name',),
+        'dish_type': ('name',),
+        'dish_child_type': ('dish_type_id', 'name'),
+        'material_type': ('name',),
+        'material_child_type': ('material_type_id', 'name'),
+        'dish': ('full_code', 'size'),
+        'material': ('store_id', 'material_number'),
+    }
+    BLANK_AS_EMPTY = {('dish', 'size')}
+
+    def __init__(self):
+        self._ids: Dict[str, Dict[Any, int]] = {}
+
+    @classmethod
+    def key_columns(cls, table: str) -> Tuple[str, ...]:
+        if table not in cls.TABLES:
+            raise ValueError(f"Unknown dimension table: {table}")
+        return cls.TABLES[table]
+
+    @staticmethod
+    def _row_values(row) -> Tuple:
+        return tuple(row.values()) if isinstance(row, dict) else tuple(row)
+
+    @staticmethod
+    def _key(values: Tuple):
+        return values[0] if len(values) == 1 else tuple(values)
+
+    @staticmethod
+    def _plain(value):
+        """numpy scalars (e.g. IDs taken from a DataFrame) as Python values"""
+        return value.item() if hasattr(value, 'item') else value
+
+    def _load(self, cursor, table: str) -> Dict[Any, int]:
+        if table in self._ids:
+            return self._ids[table]
+
+        selected = ', '.join(
+            f"COALESCE({col}, '') AS {col}" if (table, col) in self.BLANK_AS_EMPTY else col
+            for col in self.key_columns(table))
+        cursor.execute(f"SELECT id, {selected} FROM {table} ORDER BY id")
+
+        # Lowest ID wins when a key is not unique (e.g. NULL and '' dish sizes)
+        ids = {}
+        for row in cursor.fetchall():
+            values = self._row_values(row)
+            ids.setdefault(self._key(values[1:]), values[0])
+        self._ids[table] = ids
+        return ids
+
+    def get(self, cursor, table: str, key) -> Optional[int]:
+        """ID for one key, or None when the table has no such row."""
+        return self._load(cursor, table).get(key)
+
+    def get_many(self, cursor, table: str, keys) -> Dict[Any, int]:
+        """IDs for the keys that exist."""
+        ids = self._load(cursor, table)
+        return {key: ids[key] for key in keys if key in ids}
+
+    def add(self, table: str, key, row_id: int):
+        """Register a row created outside get_or_create()."""
+        self.key_columns(table)
+        if table in self._ids:
+            self._ids[table][key] = row_id
+
+    def invalidate(self, table: Optional[str] = None):
+        """Drop one table's keys (or all) so the next lookup reloads them."""
+        if table is None:
+            self._ids.clear()
+        else:
+            self._ids.pop(table, None)
+
+    def get_or_create(self, cursor, table: str, keys, defaults: Optional[Dict[str, Any]] = None,
+                      values: Optional[Dict[Any, Dict[str, Any]]] = None) -> Tuple[Dict[Any, int], int]:
+        """
+        IDs for every key, inserting the missing ones in one statement.
+
+        Args:
+            cursor: Open database cursor (the caller commits)
+            table: Dimension table name (see TABLES)
+            keys: Keys to resolve; None and duplicates are ignored
+            defaults: Extra columns set on every created row (e.g. is_active)
+            values: Extra columns for the created row of individual keys
+
+        Returns:
+            Tuple of ({key: id}, number of rows created)
+        """
+        columns = self.key_columns(table)
+        ids = self._load(cursor, table)
+        keys = list(dict.fromkeys(key for key in keys if key is not None))
+        missing = [key for key in keys if key not in ids]
+
+        created = 0
+        if missing:
+            defaults = defaults or {}
+            values = values or {}
+            extra = list(dict.fromkeys(
+                list(defaults) + [col for key in missing for col in values.get(key, {})]))
+            params = []
+            for key in missing:
+                row = {**defaults, **values.get(key, {})}
+                key_values = tuple(key) if len(columns) > 1 else (key,)
+                params.extend(self._plain(value) for value in key_values + tuple(row.get(col) for col in extra))
+
+            placeholder = '(' + ', '.join(['%s'] * (len(columns) + len(extra))) + ')'
+            cursor.execute(f"""
+                INSERT INTO {table} ({', '.join(columns + tuple(extra))})
+                VALUES {', '.join([placeholder] * len(missing))}
+                ON CONFLICT DO NOTHING
+                RETURNING id, {', '.join(columns)}
+            """, params)
+            for row in cursor.fetchall():
+                row_values = self._row_values(row)
+                ids[self._key(row_values[1:])] = row_values[0]
+                created += 1
+
+            # Keys another session inserted meanwhile were skipped by ON CONFLICT
+            if any(key not in ids for key in missing):
+                self.invalidate(table)
+                ids = self._load(cursor, table)
+
+        return {key: ids[key] for key in keys if key in ids}, created
+
+
+class StoreMonthPnl:
+    """
+    Access to the materialized store_month_pnl table: one row per
+    (store_id, year, month) with revenue, discount, theoretical and actual
+    material cost and gross margin. Extraction scripts refresh the months
+    they load; report sheets read month ranges instead of re-joining the
+    monthly sales, usage and price history tables.
+    """
+
+    NUMERIC_COLUMNS = (
+        'sales_revenue', 'tax_amount', 'revenue', 'discount',
+        'theoretical_cost', 'actual_cost', 'gross_margin'
+    )
+
+    @staticmethod
+    def refresh(db_manager, year: int, month: int) -> int:
+        """
+        Rebuild one month of store_month_pnl.
+
+        Errors are logged and re-raised: the loaded data is already committed,
+        but the reports would show a stale month until it is refreshed again.
+
+        Returns:
+            Number of store rows written
+        """
+        try:
+            with db_manager.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT refresh_store_month_pnl(%s, %s) AS refreshed", (year, month))
+                row = cursor.fetchone()
+                conn.commit()
+        except Exception as e:
+            logging.getLogger(__name__).error(
+                f"Could not refresh store_month_pnl for {year}-{month:02d}: {e}")
+            raise
+
+        refreshed = (row['refreshed'] if isinstance(row, dict) else row[0]) if row else 0
+        logging.getLogger(__name__).info(
+            f"Refreshed store_month_pnl for {year}-{month:02d}: {refreshed} stores")
+        return refreshed or 0
+
+    @staticmethod
+    def refresh_months(db_manager, months) -> int:
+        """Refresh each distinct (year, month) in months; returns total rows written"""
+        return sum(StoreMonthPnl.refresh(db_manager, year, month)
+                   for year, month in sorted(set(months)))
+
+    @staticmethod
+    def fetch(db_manager, start: Tuple[int, int], end: Optional[Tuple[int, int]] = None,
+              store_ids: Optional[List[int]] = None, sales_only: bool = False) -> List[Dict[str, Any]]:
+        """
+        Read store monthly P&L rows for an inclusive (year, month) range.
+
+        Args:
+            db_manager: Database manager instance
+            start: First (year, month)
+            end: Last (year, month); defaults to start
+            store_ids: Only these stores (all stores when None)
+            sales_only: Only store months that have dish sales
+
+        Returns:
+            List of row dicts ordered by store_id, year, month; numeric
+            columns are floats
+        """
+        end = end or start
+        conditions = ["month_start >= %s", "month_start <= %s"]
+        params: List[Any] = [datetime(start[0], start[1], 1).date(), datetime(end[0], end[1], 1).date()]
+        if store_ids is not None:
+            conditions.append("store_id = ANY(%s)")
+            params.append(list(store_ids))
+        if sales_only:
+            conditions.append("has_sales")
+
+        query = f"""
+            SELECT store_id, year, month, has_sales, {', '.join(StoreMonthPnl.NUMERIC_COLUMNS)}
+            FROM store_month_pnl
+            WHERE {' AND '.join(conditions)}
+            ORDER BY store_id, year, month
+        """
+
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, tuple(params))
+            rows = cursor.fetchall()
+
+        results = []
+        for row in rows:
+            record = dict(row)
+            for column in StoreMonthPnl.NUMERIC_COLUMNS:
+                record[column] = float(record[column]) if record[column] else 0
+            results.append(record)
+        return results
+
+
+class IngestionLedger:
+    """
+    Record of the source files an extractor has loaded, kept in the
+    ingestion_ledger table. A file is unchanged when its size and mtime match
+    the ledger entry for the same source and target month; when only the mtime
+    differs (a copy or re-download) the SHA-256 of the content decides.
+
+    Ledger failures are logged rather than raised and never cause a skip, so a
+    missing table only costs a full re-load.
+    """
+
+    HASH_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, db_manager, force: bool = False):
+        """
+        Args:
+            db_manager: Database manager instance
+            force: Treat every file as changed (re-load everything)
+        """
+        self.db_manager = db_manager
+        self.force = force
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._hashes: Dict[Tuple[str, int, float], str] = {}
+
+    @staticmethod
+    def file_key(file_path) -> str:
+        """Ledger key of a file: its resolved absolute path"""
+        return str(Path(file_path).resolve())
+
+    def content_hash(self, file_path) -> str:
+        """SHA-256 of the file content, cached per (path, size, mtime)"""
+        stat = os.stat(file_path)
+        key = (self.file_key(file_path), stat.st_size, stat.st_mtime)
+        if key not in self._hashes:
+            digest = hashlib.sha256()
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(self.HASH_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            self._hashes[key] = digest.hexdigest()
+        return self._hashes[key]
+
+    def is_unchanged(self, source: str, file_path, year: int, month: int) -> bool:
+        """
+        Whether file_path was already ingested by source for year-month with
+        the same content. Always False when forced.
+        """
+        if self.force:
+            return False
+
+        file_key = self.file_key(file_path)
+        try:
+            stat = os.stat(file_path)
+            with self.db_manager.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT file_size, file_mtime, content_hash
+                    FROM ingestion_ledger
+                    WHERE source = %s AND file_path = %s
+                    AND target_year = %s AND target_month = %s
+                """, (source, file_key, year, month))
+                entry = cursor.fetchone()
+                if not entry:
+                    return False
+
+                if entry['file_size'] != stat.st_size:
+                    return False
+                if entry['file_mtime'] == stat.st_mtime:
+                    return True
+                if entry['content_hash'] != self.content_hash(file_path):
+                    return False
+
+                # Same content under a new mtime: remember it to skip hashing next time
+                cursor.execute("""
+                    UPDATE ingestion_ledger SET file_mtime = %s
+                    WHERE source = %s AND file_path = %s
+                    AND target_year = %s AND target_month = %s
+                """, (stat.st_mtime, source, file_key, year, month))
+                conn.commit()
+                return True
+        except Exception as e:
+            self.logger.warning(f"Could not check ingestion ledger for {file_path}: {e}")
+            return False
+
+    def all_unchanged(self, source: str, file_paths, year: int, month: int) -> bool:
+        """Whether every file in file_paths is unchanged (False for no files)"""
+        file_paths = list(file_paths)
+        return bool(file_paths) and all(
+            self.is_unchanged(source, file_path, year, month) for file_path in file_paths)
+
+    def record(self, source: str, file_path, year: int, month: int,
+               rows_read: int = 0, rows_written: int = 0) -> bool:
+        """
+        Record a successful load of file_path by source for year-month.
+
+        Returns:
+            True if the ledger entry was written
+        """
+        try:
+            stat = os.stat(file_path)
+            content_hash = self.content_hash(file_path)
+            with self.db_manager.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO ingestion_ledger (
+                        source, file_path, file_size, file_mtime, content_hash,
+                        target_year, target_month, rows_read, rows_written
+                    )
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (source, file_path, target_year, target_month) DO UPDATE SET
+                        file_size = EXCLUDED.file_size,
+                        file_mtime = EXCLUDED.file_mtime,
+                        content_hash = EXCLUDED.content_hash,
+                        rows_read = EXCLUDED.rows_read,
+                        rows_written = EXCLUDED.rows_written,
+                        ingested_at = CURRENT_TIMESTAMP
+                """, (source, self.file_key(file_path), stat.st_size, stat.st_mtime, content_hash,
+                      year, month, rows_read, rows_written))
+                conn.commit()
+            return True
+        except Exception as e:
+            self.logger.warning(f"Could not record {file_path} in ingestion ledger: {e}")
+            return False
+
+
+class PriceAsOfIndex:
+    """
+    In-memory price history for bulk "price as of date" lookups.
+
+    Holds one row per (item, store, effective month) from material_price_history
+    or dish_price_history, with valid_from as the first day of the effective
+    month. Report code that already has its usage or sales rows in memory
+    resolves every row's price with one pd.merge_asof instead of one query or
+    LATERAL subquery per row. Matches material_price_as_of / dish_price_as_of
+    in SQL: the price in effect on a date is the latest one whose valid_from
+    is on or before it, active or not.
+    """
+
+    TABLES = {
+        'material': ('material_price_history', 'material_id'),
+        'dish': ('dish_price_history', 'dish_id'),
+    }
+
+    def __init__(self, prices: pd.DataFrame, kind: str = 'material'):
+        """
+        Args:
+            prices: Rows with the key column, store_id, effective_year,
+                effective_month and price
+            kind: 'material' or 'dish'
+        """
+        if kind not in self.TABLES:
+            raise ValueError(f"Unknown price kind: {kind}")
+        self.kind = kind
+        self.key_column = self.TABLES[kind][1]
+
+        columns = [self.key_column, 'store_id', 'valid_from', 'price']
+        if prices is None or len(prices) == 0:
+            self.prices = pd.DataFrame({
+                self.key_column: pd.Series(dtype='int64'),
+                'store_id': pd.Series(dtype='int64'),
+                'valid_from': pd.Series(dtype='datetime64[ns]'),
+                'price': pd.Series(dtype='float64'),
+            })
+            return
+
+        frame = pd.DataFrame(prices)
+        frame['valid_from'] = pd.to_datetime(pd.DataFrame({
+            'year': frame['effective_year'], 'month': frame['effective_month'], 'day': 1
+        })).astype('datetime64[ns]')
+        frame[self.key_column] = frame[self.key_column].astype('int64')
+        frame['store_id'] = frame['store_id'].astype('int64')
+        frame['price'] = pd.to_numeric(frame['price'], errors='coerce').astype('float64')
+        self.prices = frame[columns].sort_values('valid_from', kind='stable').reset_index(drop=True)
+
+    @classmethod
+    def fetch(cls, cursor, kind: str = 'material', until: Optional[Tuple[int, int]] = None,
+              pairs: Optional[List[Tuple[int, int]]] = None) -> 'PriceAsOfIndex':
+        """
+        Read price history with an open cursor.
+
+        Args:
+            cursor: Open database cursor (dict rows)
+            kind: 'material' or 'dish'
+            until: Only prices effective in or before this (year, month)
+            pairs: Only these (item_id, store_id) pairs (all when None)
+        """
+        if kind not in cls.TABLES:
+            raise ValueError(f"Unknown price kind: {kind}")
+        table, key_column = cls.TABLES[kind]
+
+        conditions = []
+        params: List[Any] = []
+        if until is not None:
+            conditions.append("(effective_year, effective_month) <= (%s, %s)")
+            params.extend(until)
+        if pairs is not None:
+            conditions.append(f"({key_column}, store_id) = ANY(%s)")
+            params.append(list(pairs))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        cursor.execute(f"""
+            SELECT {key_column}, store_id, effective_year, effective_month, price
+            FROM {table}
+            {where}
+        """, tuple(params))
+        return cls(pd.DataFrame([dict(row) for row in cursor.fetchall()]), kind)
+
+    @classmethod
+    def load(cls, db_manager, kind: str = 'material', until: Optional[Tuple[int, int]] = None,
+             pairs: Optional[List[Tuple[int, int]]] = None) -> 'PriceAsOfIndex':
+        """Read price history on a pooled connection (see fetch)"""
+        with db_manager.get_connection() as conn:
+            return cls.fetch(conn.cursor(), kind, until, pairs)
+
+    def resolve(self, rows: pd.DataFrame, as_of=None, date_column: Optional[str] = None,
+                price_column: str = 'price') -> pd.DataFrame:
+        """
+        Add the price in effect for each row.
+
+        Args:
+            rows: Rows with the key column and store_id
+            as_of: Date every row is priced at (used when date_column is None)
+            date_column: Column holding each row's own pricing date
+            price_column: Name of the added price column (NaN when no price
+                was effective yet)
+
+        Returns:
+            Copy of rows, in the original order and index, with price_column
+        """
+        left = rows.copy()
+        left['_row'] = range(len(left))
+        left['_as_of'] = pd.to_datetime(left[date_column]) if date_column else pd.Timestamp(as_of)
+        left['_as_of'] = left['_as_of'].astype('datetime64[ns]')
+        left['_key'] = left[self.key_column].astype('int64')
+        left['_store'] = left['store_id'].astype('int64')
+
+        right = self.prices.rename(columns={
+            self.key_column: '_key', 'store_id': '_store', 'valid_from': '_valid_from',
+            'price': '_price'})
+        merged = pd.merge_asof(
+            left.sort_values('_as_of', kind='stable'), right,
+            left_on='_as_of', right_on='_valid_from', by=['_key', '_store'],
+            direction='backward')
+
+        merged = merged.sort_values('_row')
+        merged[price_column] = merged.pop('_price')
+        merged = merged.drop(columns=['_row', '_as_of', '_key', '_store', '_valid_from'])
+        merged.index = rows.index
+        return merged
+
+    def lookup(self, pairs, as_of) -> Dict[Tuple[int, int], float]:
+        """Price in effect on as_of for each (item_id, store_id); pairs without one are omitted"""
+        pairs = list(pairs)
+        if not pairs:
+            return {}
+        rows = pd.DataFrame(pairs, columns=[self.key_column, 'store_id'])
+        resolved = self.resolve(rows, as_of=as_of).dropna(subset=['price'])
+        return {(int(key), int(store)): float(price) for key, store, price in zip(
+            resolved[self.key_column], resolved['store_id'], resolved['price'])}
+
+
 # Export database utilities
 __all__ = [
     'DatabaseOperations',
-    'CommonQueries'
-]
\ No newline at end of file
+    'CommonQueries',
+    'StagingLoader',
+    'DimensionCache',
+    'StoreMonthPnl',
+    'IngestionLedger',
+    'PriceAsOfIndex'
+]
@@ -6,7 +6,11 @@ Consolidates common patterns from 20+ files to eliminate duplication.
 
 import pandas as pd
 import warnings
-from typing import Dict, Optional, Any, Union
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, Optional, Any, Union, List, Tuple
 from pathlib import Path
 import logging
 
@@ -112,6 +116,299 @@ def safe_read_excel(
         raise ValueError(f"Failed to read Excel file: {e}")
 
 
+# Parsed sheets kept in memory, keyed by (path, mtime, size, sheet, dtype, options)
+WORKBOOK_CACHE_SIZE = 64
+_SHEET_CACHE: "OrderedDict[Tuple, pd.DataFrame]" = OrderedDict()
+_SHEET_NAMES_CACHE: Dict[Tuple, List[str]] = {}
+
+# Set to a directory to also keep parsed sheets on disk as Parquet (needs pyarrow)
+EXCEL_CACHE_DIR_ENV = 'EXCEL_CACHE_DIR'
+
+
+def _excel_engine(file_path: Path) -> Optional[str]:
+    """Pick the pandas engine from the file extension (None lets pandas decide)"""
+    file_ext = file_path.suffix.lower()
+    if file_ext == '.xls':
+        return 'xlrd'
+    if file_ext in ['.xlsx', '.xlsm']:
+        return 'openpyxl'
+    return None
+
+
+def _file_signature(file_path: Path) -> Tuple[str, int, int]:
+    """Identify a file version by resolved path, modification time and size"""
+    stat = file_path.stat()
+    return str(file_path.resolve()), stat.st_mtime_ns, stat.st_size
+
+
+def _options_key(dtype_spec: Optional[Dict[str, Any]], kwargs: Dict[str, Any]) -> Tuple:
+    """Hashable key for the dtype spec and read_excel options"""
+    dtype_key = tuple(sorted((str(k), repr(v)) for k, v in (dtype_spec or {}).items()))
+    kwargs_key = tuple(sorted((k, repr(v)) for k, v in kwargs.items()))
+    return dtype_key, kwargs_key
+
+
+def _disk_cache_path(cache_dir: Path, key: Tuple, suffix: str = '.parquet') -> Path:
+    """Cache file for one sheet (Parquet) or one workbook's sheet names (JSON)"""
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+    return cache_dir / f"{digest}{suffix}"
+
+
+def _load_names_from_disk(cache_dir: Optional[Path], signature: Tuple) -> Optional[List[str]]:
+    """Load cached sheet names for a file version, or None if not cached"""
+    if cache_dir is None:
+        return None
+    names_file = _disk_cache_path(cache_dir, signature, '.json')
+    try:
+        return json.loads(names_file.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+
+def _save_names_to_disk(cache_dir: Optional[Path], signature: Tuple, sheet_names: List[str]):
+    """Store the sheet names of a file version on disk"""
+    if cache_dir is None:
+        return
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        names_file = _disk_cache_path(cache_dir, signature, '.json')
+        names_file.write_text(json.dumps(sheet_names, ensure_ascii=False), encoding='utf-8')
+    except OSError as e:
+        logging.debug(f"Not caching sheet names on disk: {e}")
+
+
+def _load_from_disk(cache_dir: Optional[Path], key: Tuple) -> Optional[pd.DataFrame]:
+    """Load a cached sheet from disk, or None if missing or unreadable"""
+    if cache_dir is None:
+        return None
+    cache_file = _disk_cache_path(cache_dir, key)
+    if not cache_file.exists():
+        return None
+    try:
+        return pd.read_parquet(cache_file)
+    except Exception as e:
+        logging.debug(f"Ignoring unreadable Excel cache file {cache_file}: {e}")
+        return None
+
+
+def _save_to_disk(cache_dir: Optional[Path], key: Tuple, df: pd.DataFrame):
+    """
+    Store a parsed sheet on disk.
+
+    Sheets that do not survive a Parquet round trip unchanged (mixed-type
+    object columns, non-string headers) or a missing Parquet engine simply
+    leave the sheet uncached on disk.
+    """
+    if cache_dir is None:
+        return
+    cache_file = _disk_cache_path(cache_dir, key)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(cache_file)
+        if not pd.read_parquet(cache_file).equals(df):
+            cache_file.unlink()
+    except Exception as e:
+        logging.debug(f"Not caching sheet {key[3]} on disk: {e}")
+        if cache_file.exists():
+            cache_file.unlink()
+
+
+def _remember(key: Tuple, df: pd.DataFrame):
+    """Add a parsed sheet to the in-memory cache, evicting the oldest entries"""
+    _SHEET_CACHE[key] = df
+    _SHEET_CACHE.move_to_end(key)
+    while len(_SHEET_CACHE) > WORKBOOK_CACHE_SIZE:
+        _SHEET_CACHE.popitem(last=False)
+
+
+def clear_workbook_cache():
+    """Drop all in-memory parsed sheets (the on-disk cache is left alone)"""
+    _SHEET_CACHE.clear()
+    _SHEET_NAMES_CACHE.clear()
+
+
+def get_workbook_sheet_names(file_path: Union[str, Path]) -> List[str]:
+    """
+    Get sheet names in workbook order, cached per file version.
+
+    Args:
+        file_path: Path to Excel file
+
+    Returns:
+        List of sheet names
+
+    Raises:
+        FileNotFoundError: If Excel file doesn't exist
+    """
+    suppress_excel_warnings()
+
+    file_path = Path(file_path)
+    if not file_path.exists():
+        raise FileNotFoundError(f"Excel file not found: {file_path}")
+
+    signature = _file_signature(file_path)
+    if signature not in _SHEET_NAMES_CACHE:
+        with pd.ExcelFile(file_path, engine=_excel_engine(file_path)) as excel_file:
+            _SHEET_NAMES_CACHE[signature] = list(excel_file.sheet_names)
+    return list(_SHEET_NAMES_CACHE[signature])
+
+
+def read_workbook_sheets(
+    file_path: Union[str, Path],
+    sheet_names: Optional[List[str]] = None,
+    dtype_spec: Optional[Dict[str, Any]] = None,
+    cache_dir: Optional[Union[str, Path]] = None,
+    **kwargs
+) -> Dict[str, pd.DataFrame]:
+    """
+    Read several sheets of a workbook, parsing the file at most once.
+
+    Parsed sheets are cached by (path, mtime, size, sheet, dtype, options), so
+    repeated validation, extraction and re-runs in the same process skip the
+    openpyxl parse. With cache_dir (or the EXCEL_CACHE_DIR environment
+    variable) set, sheets are also kept on disk as Parquet across runs.
+    Callers get their own copy of every DataFrame and may modify it.
+
+    Args:
+        file_path: Path to Excel file
+        sheet_names: Sheets to read (None for every sheet in workbook order)
+        dtype_spec: Column dtype specifications (critical for material numbers)
+        cache_dir: Optional directory for the on-disk sheet cache
+        **kwargs: Additional pandas.read_excel arguments
+
+    Returns:
+        Dictionary mapping sheet name to DataFrame, in the requested order
+
+    Raises:
+        FileNotFoundError: If Excel file doesn't exist
+        ValueError: If a sheet is not found or the file cannot be parsed
+    """
+    suppress_excel_warnings()
+
+    file_path = Path(file_path)
+    if not file_path.exists():
+        raise FileNotFoundError(f"Excel file not found: {file_path}")
+
+    cache_dir = cache_dir or os.getenv(EXCEL_CACHE_DIR_ENV)
+    cache_dir = Path(cache_dir) if cache_dir else None
+
+    signature = _file_signature(file_path)
+    options = _options_key(dtype_spec, kwargs)
+
+    if sheet_names is None:
+        sheet_names = _SHEET_NAMES_CACHE.get(signature) or _load_names_from_disk(cache_dir, signature)
+
+    sheets = {}
+    if sheet_names is None:
+        # Sheet names unknown yet: one pass over the whole workbook gives both
+        missing = None
+    else:
+        missing = []
+        for sheet in sheet_names:
+            key = signature + (sheet,) + options
+            df = _SHEET_CACHE.get(key)
+            if df is None:
+                df = _load_from_disk(cache_dir, key)
+            if df is None:
+                missing.append(sheet)
+            else:
+                _remember(key, df)
+                sheets[sheet] = df
+
+    if missing is None or missing:
+        read_options = {'dtype': dtype_spec or {}}
+        engine = _excel_engine(file_path)
+        if engine:
+            read_options['engine'] = engine
+        read_options.update(kwargs)
+
+        logging.info(f"Parsing {file_path.name}, sheets: {', '.join(missing) if missing else 'all'}")
+        try:
+            parsed = pd.read_excel(file_path, sheet_name=missing, **read_options)
+        except Exception as e:
+            logging.error(f"Failed to read Excel file {file_path}: {e}")
+            raise ValueError(f"Failed to read Excel file: {e}")
+
+        if missing is None:
+            sheet_names = list(parsed)
+            _SHEET_NAMES_CACHE[signature] = list(sheet_names)
+            _save_names_to_disk(cache_dir, signature, sheet_names)
+
+        for sheet, df in parsed.items():
+            key = signature + (sheet,) + options
+            _remember(key, df)
+            _save_to_disk(cache_dir, key, df)
+            sheets[sheet] = df
+
+    return {sheet: sheets[sheet].copy() for sheet in sheet_names}
+
+
+def read_workbook_sheet(
+    file_path: Union[str, Path, pd.ExcelFile],
+    sheet_name: str,
+    dtype_spec: Optional[Dict[str, Any]] = None,
+    **kwargs
+) -> pd.DataFrame:
+    """
+    Read one sheet through the parsed-workbook cache.
+
+    An already open pd.ExcelFile is parsed directly and not cached.
+
+    Args:
+        file_path: Path to Excel file (or an open pd.ExcelFile)
+        sheet_name: Sheet to read
+        dtype_spec: Column dtype specifications
+        **kwargs: Additional read_workbook_sheets arguments
+
+    Returns:
+        DataFrame for the sheet
+    """
+    if isinstance(file_path, pd.ExcelFile):
+        return pd.read_excel(file_path, sheet_name=sheet_name, dtype=dtype_spec, **kwargs)
+    return read_workbook_sheets(file_path, [sheet_name], dtype_spec, **kwargs)[sheet_name]
+
+
+def read_first_sheet_cached(
+    file_path: Union[str, Path],
+    dtype_spec: Optional[Dict[str, Any]] = None,
+    **kwargs
+) -> pd.DataFrame:
+    """
+    Read the first sheet of a workbook through the parsed-workbook cache.
+
+    Drop-in for safe_read_excel(file_path, dtype_spec=...) when several steps
+    of one process read the same file (e.g. the monthly material export read
+    by the material, material usage and inventory extractors). SAP exports
+    that are really UTF-16 TSV files are read by safe_read_excel uncached.
+
+    Args:
+        file_path: Path to Excel file
+        dtype_spec: Column dtype specifications (critical for material numbers)
+        **kwargs: Additional pandas.read_excel arguments
+
+    Returns:
+        DataFrame for the first sheet (the caller's own copy)
+
+    Raises:
+        FileNotFoundError: If Excel file doesn't exist
+        ValueError: If the file cannot be parsed
+    """
+    file_path = Path(file_path)
+    if not file_path.exists():
+        raise FileNotFoundError(f"Excel file not found: {file_path}")
+
+    with open(file_path, 'rb') as f:
+        if f.read(2) == b'\xff\xfe':  # UTF-16 LE BOM
+            return safe_read_excel(file_path, dtype_spec=dtype_spec, **kwargs)
+
+    try:
+        first_sheet = get_workbook_sheet_names(file_path)[0]
+    except Exception as e:
+        logging.error(f"Failed to read Excel file {file_path}: {e}")
+        raise ValueError(f"Failed to read Excel file: {e}")
+    return read_workbook_sheet(file_path, first_sheet, dtype_spec, **kwargs)
+
+
 def clean_dish_code(code: Any) -> Optional[str]:
     """
     Standardized dish code cleaning (remove .0 suffix from pandas float conversion and leading zeros).
@@ -340,6 +637,11 @@ __all__ = [
     'get_material_reading_dtype',
     'get_dish_reading_dtype',
     'safe_get_sheet_names',
+    'get_workbook_sheet_names',
+    'read_workbook_sheets',
+    'read_workbook_sheet',
+    'read_first_sheet_cached',
+    'clear_workbook_cache',
     'detect_sheet_structure',
     'COMMON_SHEET_PATTERNS',
     'standardize_column_names'
@@ -10,6 +10,8 @@ from typing import Dict, List, Optional, Tuple, Set
 from pathlib import Path
 from datetime import datetime
 
+from lib.database_utils import DimensionCache, StagingLoader, StoreMonthPnl
+
 logger = logging.getLogger(__name__)
 
 
@@ -116,41 +118,30 @@ class DataCleaner:
 class DishTypeExtractor:
     """Handles dish type and child type extraction"""
     
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, dimensions: Optional[DimensionCache] = None):
         self.db_manager = db_manager
+        self.dimensions = dimensions or DimensionCache()
     
     def extract_dish_types(self, df: pd.DataFrame) -> int:
         """Extract and insert dish types"""
         try:
             with self.db_manager.get_connection() as conn:
                 cursor = conn.cursor()
-                count = 0
                 
                 # Get unique dish types
-                dish_types = set()
+                dish_types = []
                 if '大类名称' in df.columns:
-                    for dish_type in df['大类名称'].dropna().unique():
-                        if pd.notna(dish_type) and str(dish_type).strip():
-                            dish_types.add(str(dish_type).strip())
+                    names = df['大类名称'].dropna().astype(str).str.strip()
+                    dish_types = names[names != ''].unique().tolist()
                 
-                # Insert dish types
-                for dish_type in dish_types:
-                    try:
-                        cursor.execute("""
-                            INSERT INTO dish_type (name)
-                            VALUES (%s)
-                            ON CONFLICT (name) DO NOTHING
-                        """, (dish_type,))
-                        count += cursor.rowcount
-                    except Exception as e:
-                        logger.debug(f"Error inserting dish type {dish_type}: {e}")
-                        continue
+                _, count = self.dimensions.get_or_create(cursor, 'dish_type', dish_types)
                 
                 conn.commit()
                 return count
                 
         except Exception as e:
             logger.error(f"Error processing dish types: {e}")
+            self.dimensions.invalidate('dish_type')
             return 0
     
     def extract_dish_child_types(self, df: pd.DataFrame) -> int:
@@ -158,45 +149,40 @@ class DishTypeExtractor:
         try:
             with self.db_manager.get_connection() as conn:
                 cursor = conn.cursor()
-                count = 0
                 
                 # Get unique parent-child type combinations
-                type_combinations = set()
+                type_combinations = []
                 if '大类名称' in df.columns and '子类名称' in df.columns:
-                    for _, row in df.iterrows():
-                        if (pd.notna(row['大类名称']) and pd.notna(row['子类名称'])):
-                            parent_type = str(row['大类名称']).strip()
-                            child_type = str(row['子类名称']).strip()
-                            if parent_type and child_type:
-                                type_combinations.add((parent_type, child_type))
+                    pairs = df[['大类名称', '子类名称']].dropna()
+                    pairs = pd.DataFrame({'parent': pairs['大类名称'].astype(str).str.strip(),
+                                          'child': pairs['子类名称'].astype(str).str.strip()})
+                    pairs = pairs[(pairs['parent'] != '') & (pairs['child'] != '')].drop_duplicates()
+                    type_combinations = list(zip(pairs['parent'], pairs['child']))
                 
-                # Insert child types
-                for parent_type, child_type in type_combinations:
-                    try:
-                        cursor.execute("""
-                            INSERT INTO dish_child_type (name, dish_type_id)
-                            VALUES (%s, (SELECT id FROM dish_type WHERE name = %s))
-                            ON CONFLICT (name, dish_type_id) DO NOTHING
-                        """, (child_type, parent_type))
-                        count += cursor.rowcount
-                    except Exception as e:
-                        logger.debug(f"Error inserting dish child type: {e}")
-                        continue
+                # Child types whose parent type does not exist are skipped
+                parent_ids = self.dimensions.get_many(
+                    cursor, 'dish_type', {parent for parent, _ in type_combinations})
+                _, count = self.dimensions.get_or_create(cursor, 'dish_child_type', [
+                    (parent_ids[parent], child) for parent, child in type_combinations
+                    if parent in parent_ids
+                ])
                 
                 conn.commit()
                 return count
                 
         except Exception as e:
             logger.error(f"Error processing dish child types: {e}")
+            self.dimensions.invalidate('dish_child_type')
             return 0
 
 
 class DishExtractor:
     """Handles store-specific dish extraction"""
     
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, dimensions: Optional[DimensionCache] = None):
         self.db_manager = db_manager
         self.data_cleaner = DataCleaner()
+        self.dimensions = dimensions or DimensionCache()
     
     def extract_dishes_batch(self, df: pd.DataFrame, dish_name_col: str, dish_code_col: str, 
                            store_mapping: Dict[str, int], batch_size: int = 20) -> int:
@@ -223,6 +209,8 @@ class DishExtractor:
                     logger.error(f"Error processing dish batch: {e}")
                     continue
             
+            # Price and sales lookups reload the dishes inserted above
+            self.dimensions.invalidate('dish')
             return total_count
             
         except Exception as e:
@@ -279,14 +267,10 @@ class DishExtractor:
             return None
         
         try:
-            cursor.execute("""
-                SELECT dct.id FROM dish_child_type dct
-                JOIN dish_type dt ON dct.dish_type_id = dt.id
-                WHERE dt.name = %s AND dct.name = %s
-            """, (str(row['大类名称']).strip(), str(row['子类名称']).strip()))
-            
-            result = cursor.fetchone()
-            return result['id'] if result else None
+            type_id = self.dimensions.get(cursor, 'dish_type', str(row['大类名称']).strip())
+            if type_id is None:
+                return None
+            return self.dimensions.get(cursor, 'dish_child_type', (type_id, str(row['子类名称']).strip()))
             
         except Exception:
             return None
@@ -311,9 +295,10 @@ class DishExtractor:
 class PriceHistoryExtractor:
     """Handles store-specific price history extraction"""
     
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, dimensions: Optional[DimensionCache] = None):
         self.db_manager = db_manager
         self.data_cleaner = DataCleaner()
+        self.dimensions = dimensions or DimensionCache()
     
     def extract_price_history_batch(self, df: pd.DataFrame, dish_name_col: str, dish_code_col: str,
                                   target_date: str, store_mapping: Dict[str, int], 
@@ -382,18 +367,11 @@ class PriceHistoryExtractor:
             
             size = row.get('规格', '') if pd.notna(row.get('规格')) else ''
             
-            # Get dish ID (store-specific)
-            cursor.execute("""
-                SELECT id FROM dish 
-                WHERE full_code = %s AND size = %s AND store_id = %s
-            """, (full_code, size, store_id))
-            
-            result = cursor.fetchone()
-            if not result:
+            # Dishes are shared by all stores
+            dish_id = self.dimensions.get(cursor, 'dish', (full_code, size))
+            if not dish_id:
                 return 0
             
-            dish_id = result['id']
-            
             # Insert price history
             cursor.execute("""
                 INSERT INTO dish_price_history (
@@ -415,9 +393,10 @@ class PriceHistoryExtractor:
 class MonthlySalesExtractor:
     """Handles monthly sales data extraction"""
     
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, dimensions: Optional[DimensionCache] = None):
         self.db_manager = db_manager
         self.data_cleaner = DataCleaner()
+        self.dimensions = dimensions or DimensionCache()
     
     def extract_monthly_sales_batch(self, df: pd.DataFrame, dish_name_col: str, dish_code_col: str,
                                   target_date: str, store_mapping: Dict[str, int],
@@ -509,18 +488,11 @@ class MonthlySalesExtractor:
     def _process_single_sales(self, cursor, sales_record: Dict, year: int, month: int) -> int:
         """Process a single aggregated sales record"""
         try:
-            # Get dish ID (store-specific)
-            cursor.execute("""
-                SELECT id FROM dish 
-                WHERE full_code = %s AND size = %s AND store_id = %s
-            """, (sales_record['full_code'], sales_record['size'], sales_record['store_id']))
-            
-            result = cursor.fetchone()
-            if not result:
+            # Dishes are shared by all stores
+            dish_id = self.dimensions.get(cursor, 'dish', (sales_record['full_code'], sales_record['size']))
+            if not dish_id:
                 return 0
             
-            dish_id = result['id']
-            
             # Insert monthly sales
             cursor.execute("""
                 INSERT INTO dish_monthly_sale (
@@ -540,19 +512,186 @@ class MonthlySalesExtractor:
             return 0
 
 
+class BulkDishLoader:
+    """
+    Set-based dish, price history and monthly sales loader.
+
+    Stages the cleaned DataFrame once with COPY, resolves child type and dish
+    IDs with joins and applies one INSERT ... SELECT ... ON CONFLICT per target
+    table, all on a single connection. Produces the same rows as DishExtractor,
+    PriceHistoryExtractor and MonthlySalesExtractor.
+    """
+
+    STAGING_TABLE = 'stg_dish_extraction'
+    STAGING_COLUMNS = {
+        'row_no': 'integer',
+        'full_code': 'varchar',
+        'size': 'varchar',
+        'name': 'varchar',
+        'dish_type': 'varchar',
+        'dish_child_type': 'varchar',
+        'store_id': 'integer',
+        'price': 'numeric',
+        'quantity': 'numeric',
+    }
+
+    PRICE_COLUMNS = ['单价', '菜品单价', '价格']
+    QUANTITY_COLUMNS = ['数量', '销售数量', '销量']
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.data_cleaner = DataCleaner()
+
+    def prepare_staging_frame(self, df: pd.DataFrame, dish_name_col: str, dish_code_col: str,
+                              store_mapping: Dict[str, int]) -> pd.DataFrame:
+        """Clean the source rows into the staging layout (one row per valid dish code)"""
+        staged = pd.DataFrame(index=df.index)
+        staged['row_no'] = range(len(df))
+        staged['full_code'] = df[dish_code_col].map(self.data_cleaner.clean_dish_code)
+        staged['size'] = df['规格'].where(df['规格'].notna(), '') if '规格' in df.columns else ''
+        staged['name'] = df[dish_name_col].astype(str).str.strip()
+
+        if '大类名称' in df.columns and '子类名称' in df.columns:
+            has_types = df['大类名称'].notna() & df['子类名称'].notna()
+            staged['dish_type'] = df['大类名称'].astype(str).str.strip().where(has_types)
+            staged['dish_child_type'] = df['子类名称'].astype(str).str.strip().where(has_types)
+        else:
+            staged['dish_type'] = None
+            staged['dish_child_type'] = None
+
+        if '门店名称' in df.columns:
+            staged['store_id'] = df['门店名称'].astype(str).str.strip().map(store_mapping)
+        else:
+            staged['store_id'] = None
+
+        staged['price'] = self._first_numeric(df, self.PRICE_COLUMNS)
+        staged['quantity'] = self._first_numeric(df, self.QUANTITY_COLUMNS).fillna(0)
+
+        return staged[staged['full_code'].notna()]
+
+    @staticmethod
+    def _first_numeric(df: pd.DataFrame, columns: List[str]) -> pd.Series:
+        """First value across the candidate columns that converts to a number"""
+        present = [col for col in columns if col in df.columns]
+        if not present:
+            return pd.Series(float('nan'), index=df.index)
+        numeric = df[present].apply(pd.to_numeric, errors='coerce')
+        return numeric.bfill(axis=1).iloc[:, 0]
+
+    def load(self, df: pd.DataFrame, dish_name_col: str, dish_code_col: str,
+             target_date: str, store_mapping: Dict[str, int]) -> Dict[str, Dict[str, int]]:
+        """
+        Load dishes, price history and monthly sales in one transaction.
+
+        Returns:
+            Dict keyed by 'dishes', 'price_history' and 'monthly_sales', each
+            holding {'inserted': n, 'updated': n}
+        """
+        target_dt = datetime.strptime(target_date, '%Y-%m-%d')
+        staged = self.prepare_staging_frame(df, dish_name_col, dish_code_col, store_mapping)
+        all_store_ids = sorted(set(store_mapping.values()))
+
+        results = {}
+        with self.db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                row_count = StagingLoader.copy_to_temp_table(
+                    cursor, staged, self.STAGING_TABLE, self.STAGING_COLUMNS)
+                logger.info(f"Staged {row_count} dish rows")
+
+                results['dishes'] = self._upsert_dishes(cursor, all_store_ids)
+                results['price_history'] = self._upsert_price_history(cursor, target_date)
+                results['monthly_sales'] = self._upsert_monthly_sales(
+                    cursor, target_dt.year, target_dt.month)
+
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        for table, counts in results.items():
+            logger.info(f"Bulk {table}: {counts['inserted']} inserted, {counts['updated']} updated")
+        return results
+
+    def _upsert_dishes(self, cursor, all_store_ids: List[int]) -> Dict[str, int]:
+        """Rows without a store are created for every store, as in DishExtractor"""
+        inserted, updated = StagingLoader.execute_upsert(cursor, f"""
+            INSERT INTO dish (full_code, size, name, dish_child_type_id, store_id)
+            SELECT DISTINCT ON (s.full_code, s.size, st.store_id)
+                s.full_code, s.size, s.name, dct.id, st.store_id
+            FROM {self.STAGING_TABLE} s
+            JOIN unnest(%s::int[]) AS st(store_id)
+                ON s.store_id IS NULL OR s.store_id = st.store_id
+            LEFT JOIN dish_type dt ON dt.name = s.dish_type
+            LEFT JOIN dish_child_type dct
+                ON dct.dish_type_id = dt.id AND dct.name = s.dish_child_type
+            ORDER BY s.full_code, s.size, st.store_id, s.row_no DESC
+            ON CONFLICT (full_code, size, store_id) DO UPDATE SET
+                name = EXCLUDED.name,
+                dish_child_type_id = EXCLUDED.dish_child_type_id,
+                updated_at = CURRENT_TIMESTAMP
+            RETURNING (xmax = 0) AS inserted
+        """, (all_store_ids,))
+        return {'inserted': inserted, 'updated': updated}
+
+    def _upsert_price_history(self, cursor, target_date: str) -> Dict[str, int]:
+        inserted, updated = StagingLoader.execute_upsert(cursor, f"""
+            INSERT INTO dish_price_history (
+                dish_id, store_id, price, effective_date, is_active
+            )
+            SELECT DISTINCT ON (d.id, s.store_id)
+                d.id, s.store_id, s.price, %s::date, true
+            FROM {self.STAGING_TABLE} s
+            JOIN dish d
+                ON d.full_code = s.full_code AND d.size = s.size AND d.store_id = s.store_id
+            WHERE s.price > 0
+            ORDER BY d.id, s.store_id, s.row_no DESC
+            ON CONFLICT (dish_id, store_id, effective_date) DO UPDATE SET
+                price = EXCLUDED.price,
+                is_active = true
+            RETURNING (xmax = 0) AS inserted
+        """, (target_date,))
+        return {'inserted': inserted, 'updated': updated}
+
+    def _upsert_monthly_sales(self, cursor, year: int, month: int) -> Dict[str, int]:
+        inserted, updated = StagingLoader.execute_upsert(cursor, f"""
+            INSERT INTO dish_monthly_sale (
+                dish_id, store_id, year, month, sale_amount, sales_mode
+            )
+            SELECT d.id, agg.store_id, %s, %s, agg.total_quantity, 'dine-in'
+            FROM (
+                SELECT full_code, size, store_id, SUM(quantity) AS total_quantity
+                FROM {self.STAGING_TABLE}
+                WHERE store_id IS NOT NULL
+                GROUP BY full_code, size, store_id
+            ) agg
+            JOIN dish d
+                ON d.full_code = agg.full_code AND d.size = agg.size
+                AND d.store_id = agg.store_id
+            ON CONFLICT (dish_id, store_id, year, month) DO UPDATE SET
+                sale_amount = EXCLUDED.sale_amount,
+                updated_at = CURRENT_TIMESTAMP
+            RETURNING (xmax = 0) AS inserted
+        """, (year, month))
+        return {'inserted': inserted, 'updated': updated}
+
+
 class ExtractionOrchestrator:
     """Orchestrates the complete extraction process"""
     
-    def __init__(self, db_manager, debug: bool = False):
+    def __init__(self, db_manager, debug: bool = False, bulk: bool = True):
         self.db_manager = db_manager
         self.debug = debug
+        self.bulk = bulk
         
-        # Initialize extractors
+        # Initialize extractors (sharing one dimension cache for types and dish IDs)
         self.data_cleaner = DataCleaner()
-        self.dish_type_extractor = DishTypeExtractor(db_manager)
-        self.dish_extractor = DishExtractor(db_manager)
-        self.price_extractor = PriceHistoryExtractor(db_manager)
-        self.sales_extractor = MonthlySalesExtractor(db_manager)
+        self.dimensions = DimensionCache()
+        self.dish_type_extractor = DishTypeExtractor(db_manager, self.dimensions)
+        self.dish_extractor = DishExtractor(db_manager, self.dimensions)
+        self.price_extractor = PriceHistoryExtractor(db_manager, self.dimensions)
+        self.sales_extractor = MonthlySalesExtractor(db_manager, self.dimensions)
+        self.bulk_loader = BulkDishLoader(db_manager)
     
     def extract_dishes_complete(self, file_path: Path, target_date: str) -> Tuple[int, int, int, int, int]:
         """Complete dish extraction process (types, dishes, prices, sales)"""
@@ -585,17 +724,28 @@ class ExtractionOrchestrator:
             dish_child_type_count = self.dish_type_extractor.extract_dish_child_types(df_clean)
             logger.info(f"Processed {dish_child_type_count} dish child types")
             
-            dish_count = self.dish_extractor.extract_dishes_batch(df_clean, dish_name_col, dish_code_col, store_mapping)
-            logger.info(f"Processed {dish_count} dishes")
+            if self.bulk:
+                bulk_results = self.bulk_loader.load(
+                    df_clean, dish_name_col, dish_code_col, target_date, store_mapping)
+                dish_count, price_history_count, monthly_sales_count = (
+                    sum(bulk_results[table].values())
+                    for table in ('dishes', 'price_history', 'monthly_sales'))
+            else:
+                dish_count = self.dish_extractor.extract_dishes_batch(
+                    df_clean, dish_name_col, dish_code_col, store_mapping)
+                price_history_count = self.price_extractor.extract_price_history_batch(
+                    df_clean, dish_name_col, dish_code_col, target_date, store_mapping)
+                monthly_sales_count = self.sales_extractor.extract_monthly_sales_batch(
+                    df_clean, dish_name_col, dish_code_col, target_date, store_mapping)
             
-            price_history_count = self.price_extractor.extract_price_history_batch(
-                df_clean, dish_name_col, dish_code_col, target_date, store_mapping)
+            logger.info(f"Processed {dish_count} dishes")
             logger.info(f"Processed {price_history_count} price history records")
-            
-            monthly_sales_count = self.sales_extractor.extract_monthly_sales_batch(
-                df_clean, dish_name_col, dish_code_col, target_date, store_mapping)
             logger.info(f"Processed {monthly_sales_count} monthly sales records")
             
+            # Rebuild the month's store P&L summary from the new prices and sales
+            period = datetime.strptime(target_date, '%Y-%m-%d')
+            StoreMonthPnl.refresh(self.db_manager, period.year, period.month)
+            
             return dish_type_count, dish_child_type_count, dish_count, price_history_count, monthly_sales_count
             
         except Exception as e:
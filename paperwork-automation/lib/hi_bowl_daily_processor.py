@@ -7,6 +7,7 @@ for the overseas business reporting template.
 import os
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
 import shutil
@@ -22,13 +23,80 @@ from lib.config import EXCEL_FORMATS
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# The order header ('订单编号' etc.) is within the first rows of every day-sheet
+HEADER_SCAN_ROWS = 5
+HEADER_MARKERS = ('订单编号', '订单税前实收金额')
+
+
+def find_header_rows(input_file: str) -> Dict[str, Optional[int]]:
+    """
+    Find the order header row of every sheet without parsing the sheets.
+
+    Opens the workbook once in read-only mode and only reads the first
+    HEADER_SCAN_ROWS rows of each sheet.
+
+    Returns:
+        Dictionary mapping sheet name (workbook order) to the 0-based header
+        row, or None when no header was found
+    """
+    header_rows = {}
+    wb = openpyxl.load_workbook(input_file, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            header_rows[ws.title] = None
+            for idx, row in enumerate(ws.iter_rows(max_row=HEADER_SCAN_ROWS, values_only=True)):
+                if any(marker in str(val) for val in row if val is not None for marker in HEADER_MARKERS):
+                    header_rows[ws.title] = idx
+                    break
+    finally:
+        wb.close()
+    return header_rows
+
+
+def read_order_sheet(input_file: str, sheet_name: str, header_row: int) -> pd.DataFrame:
+    """
+    Parse one day-sheet of orders, starting at its header row.
+
+    Module-level so it can run in a worker process.
+    """
+    suppress_excel_warnings()
+    df = safe_read_excel(input_file, sheet_name=sheet_name, skiprows=header_row)
+
+    # Handle duplicate column names by making them unique
+    cols = df.columns.tolist()
+    new_cols = []
+    col_counts = {}
+    for col in cols:
+        if col in col_counts:
+            col_counts[col] += 1
+            new_cols.append(f"{col}_{col_counts[col]}")
+        else:
+            col_counts[col] = 0
+            new_cols.append(col)
+    df.columns = new_cols
+    return df
+
 
 class HiBowlDailyProcessor:
     """Process Hi-Bowl daily reports and generate output"""
 
-    def __init__(self):
-        """Initialize the processor"""
+    # Time segments by order close hour: name -> (start hour, end hour)
+    TIME_SEGMENTS = {
+        '08:00-13:59': (8, 14),
+        '14:00-16:59': (14, 17),
+        '17:00-21:59': (17, 22),
+        '22:00-07:59': (22, 8)  # Overnight segment
+    }
+
+    def __init__(self, workers: Optional[int] = None):
+        """
+        Initialize the processor
+
+        Args:
+            workers: Processes used to parse day-sheets (default: CPU count, 1 parses in-process)
+        """
         suppress_excel_warnings()
+        self.workers = workers or os.cpu_count() or 1
         # Use a more visible blue color with full opacity
         self.blue_fill = PatternFill(
             start_color="FF5B9BD5", end_color="FF5B9BD5", fill_type="solid")
@@ -103,70 +171,59 @@ class HiBowlDailyProcessor:
     def _read_daily_data(self, input_file: str) -> Optional[Tuple[pd.DataFrame, int]]:
         """Read and consolidate daily data from all sheets
 
+        Header rows are found with one read-only pass over the first rows of
+        each sheet, then every day-sheet is parsed once, in parallel when
+        there are several.
+
         Returns:
             Tuple of (DataFrame, sheet_count) or None if error
         """
         try:
-            # Read all sheets
-            xl_file = pd.ExcelFile(input_file)
-            all_data = []
-            valid_sheet_count = 0
-
-            for sheet_name in xl_file.sheet_names:
+            # Find each sheet's header row (contains '订单编号') and date
+            day_sheets = []
+            for sheet_name, header_row in find_header_rows(input_file).items():
                 logger.info(f"Reading sheet: {sheet_name}")
 
-                # Read raw data to find header
-                df_raw = safe_read_excel(
-                    input_file, sheet_name=sheet_name, header=None)
-
-                # Find header row (contains '开台时间')
-                header_row = None
-                for idx in range(min(5, len(df_raw))):
-                    row = df_raw.iloc[idx]
-                    # Look for the actual headers like '订单编号' etc
-                    if any('订单编号' in str(val) or '订单税前实收金额' in str(val) for val in row if pd.notna(val)):
-                        header_row = idx
-                        break
-
                 if header_row is None:
                     logger.warning(
                         f"Could not find header in sheet {sheet_name}")
                     continue
 
-                # Read with proper header
-                df = safe_read_excel(
-                    input_file, sheet_name=sheet_name, skiprows=header_row)
-
-                # Handle duplicate column names by making them unique
-                cols = df.columns.tolist()
-                new_cols = []
-                col_counts = {}
-                for col in cols:
-                    if col in col_counts:
-                        col_counts[col] += 1
-                        new_cols.append(f"{col}_{col_counts[col]}")
-                    else:
-                        col_counts[col] = 0
-                        new_cols.append(col)
-                df.columns = new_cols
-
                 # Extract date from sheet name
                 try:
                     date = pd.to_datetime(sheet_name)
-                    df['date'] = date
                 except:
                     logger.warning(
                         f"Could not parse date from sheet name: {sheet_name}")
                     continue
 
-                # Don't clean column names yet - we'll do it after combining
-                all_data.append(df)
-                valid_sheet_count += 1
+                day_sheets.append((date, sheet_name, header_row))
 
-            if not all_data:
+            if not day_sheets:
                 logger.error("No valid data found in any sheet")
                 return None
 
+            # Parse the sheets, then combine them in date order
+            day_sheets.sort(key=lambda day_sheet: day_sheet[0])
+            workers = min(self.workers, len(day_sheets))
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    frames = list(executor.map(
+                        read_order_sheet,
+                        [input_file] * len(day_sheets),
+                        [sheet_name for _, sheet_name, _ in day_sheets],
+                        [header_row for _, _, header_row in day_sheets]))
+            else:
+                frames = [read_order_sheet(input_file, sheet_name, header_row)
+                          for _, sheet_name, header_row in day_sheets]
+
+            # Don't clean column names yet - we'll do it after combining
+            all_data = []
+            for (date, _, _), df in zip(day_sheets, frames):
+                df['date'] = date
+                all_data.append(df)
+            valid_sheet_count = len(all_data)
+
             # Combine all data
             combined_df = pd.concat(all_data, ignore_index=True)
 
@@ -259,7 +316,7 @@ class HiBowlDailyProcessor:
         for col in monetary_columns:
             if col in df.columns:
                 # Remove $ sign and convert to float
-                df[col] = df[col].apply(self._parse_money)
+                df[col] = self._parse_money(df[col])
 
         # Ensure numeric columns
         numeric_columns = ['guest_count', 'table_count']
@@ -269,17 +326,61 @@ class HiBowlDailyProcessor:
 
         return df
 
-    def _parse_money(self, value) -> float:
-        """Parse money string to float"""
-        if pd.isna(value):
-            return 0.0
-        if isinstance(value, (int, float)):
-            return float(value)
-        # Remove $ and convert
-        try:
-            return float(str(value).replace('$', '').replace(',', ''))
-        except:
-            return 0.0
+    @staticmethod
+    def _parse_money(values: pd.Series) -> pd.Series:
+        """Parse a column of money strings (e.g. '$1,234.50') to float; blanks and junk become 0
+
+        Strings are cleaned once per distinct value and mapped back by code,
+        since order exports repeat the same amounts many times.
+        """
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            return values.astype(float).fillna(0.0)
+        codes, uniques = pd.factorize(values)
+        text = pd.Series(uniques, dtype=object).astype(str).str.replace(r'[$,]', '', regex=True).str.strip()
+        parsed = pd.to_numeric(text, errors='coerce').fillna(0.0).to_numpy(dtype=float)
+        # Missing values have code -1
+        return pd.Series(np.where(codes >= 0, parsed[codes], 0.0), index=values.index)
+
+    def _daily_totals(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Per-day totals behind the summary, from one groupby over the orders.
+
+        Revenue, tax and order counts are split by the time segment of the
+        order's close time. Refunded orders count for revenue and guests but
+        not for orders.
+        """
+        close_hour = pd.to_datetime(df['完结时间'], errors='coerce').dt.hour
+        if 'refund_order' in df.columns:
+            non_refund = df['refund_order'].isna() | (df['refund_order'] == '')
+        else:
+            non_refund = pd.Series(True, index=df.index)
+        tax = df['tax'] if 'tax' in df.columns else pd.Series(0.0, index=df.index)
+
+        columns = {
+            'date': df['date'],
+            'discount_amount': df['discount_amount'],
+            'tips': df['tips'],
+            'guest_count': df['guest_count'],
+            'revenue_before_tax': df['revenue_before_tax'],
+            'tax': tax,
+            'orders': non_refund,
+            'refunded_orders': ~non_refund,
+        }
+        for segment_name, (start_hour, end_hour) in self.TIME_SEGMENTS.items():
+            if start_hour < end_hour:
+                # Normal case (same day)
+                segment_mask = (close_hour >= start_hour) & (close_hour < end_hour)
+            else:
+                # Overnight case (22:00-07:59)
+                segment_mask = (close_hour >= start_hour) | (close_hour < end_hour)
+            columns[f'revenue_with_tax_{segment_name}'] = df['revenue_before_tax'].where(segment_mask, 0.0)
+            columns[f'tax_{segment_name}'] = tax.where(segment_mask, 0.0)
+            columns[f'orders_{segment_name}'] = segment_mask & non_refund
+
+        # Every total is a sum, so one cythonized groupby-sum over the named columns
+        daily = pd.DataFrame(columns).groupby('date').sum()
+        daily['is_weekday'] = daily.index.weekday < 5  # 0-4 are Monday-Friday
+        return daily
 
     def _calculate_summary(self, df: pd.DataFrame, target_month: str = None, sheet_count: int = 0) -> Dict:
         """Calculate summary statistics from daily data"""
@@ -292,135 +393,68 @@ class HiBowlDailyProcessor:
         if target_month:
             target_year = int(target_month[:4])
             target_mon = int(target_month[4:6])
-            df = df[df['date'].dt.year == target_year]
-            df = df[df['date'].dt.month == target_mon]
+            df = df[(df['date'].dt.year == target_year) & (df['date'].dt.month == target_mon)]
 
         if len(df) == 0:
             logger.warning("No data for target month")
             return summary
 
-        # Convert time strings to datetime for time segment analysis
-        # Parse open time and close time
-        df['open_datetime'] = pd.to_datetime(df['开台时间'], errors='coerce')
-        df['close_datetime'] = pd.to_datetime(df['完结时间'], errors='coerce')
-
-        # Basic statistics - removed revenue calculations as they're not needed
+        daily = self._daily_totals(df)
+        weekday = daily[daily['is_weekday']]
+        weekend = daily[~daily['is_weekday']]
 
         # Calculate discount amounts (they come as negative values in the data)
         # Only use 折扣金额（合计） for the total discount amount
-        discount_total = abs(df['discount_amount'].sum())
+        discount_total = abs(daily['discount_amount'].sum())
         summary['total_discount_with_tax'] = discount_total * 1.13
         # Assuming the discount amount includes 13% tax (GST + QST in Quebec)
         summary['total_discount_without_tax'] = discount_total 
 
-        summary['total_tips'] = df['tips'].sum()
-
-        # Operating days
-        summary['actual_operating_days'] = df['date'].nunique()
+        summary['total_tips'] = daily['tips'].sum()
 
-        # Weekday/Weekend split (Monday-Friday as weekday, Saturday-Sunday as weekend/holiday)
-        df['weekday'] = df['date'].dt.weekday
-        weekday_mask = df['weekday'] < 5  # 0-4 are Monday-Friday
+        # Operating days, split into weekdays and weekends/holidays (节假日天数)
+        summary['actual_operating_days'] = len(daily)
+        summary['weekday_days'] = len(weekday)
+        summary['weekend_days'] = len(weekend)
 
-        summary['weekday_days'] = df[weekday_mask]['date'].nunique()
-        summary['weekend_days'] = df[~weekday_mask]['date'].nunique()  # 节假日天数
-
-        # Guest and order counts
-        # Check if refund_order column exists
-        if 'refund_order' in df.columns:
-            # Create a mask for non-refunded orders (refund_order is null or empty)
-            non_refund_mask = df['refund_order'].isna() | (df['refund_order'] == '')
-            
-            # Count refunded orders for logging
-            refunded_count = len(df[~non_refund_mask])
-            if refunded_count > 0:
-                logger.info(f"Excluding {refunded_count} refunded orders from order counts")
-            
-            # Filter out refunded orders
-            df_non_refund = df[non_refund_mask]
-            df_non_refund_weekday = df[non_refund_mask & weekday_mask]
-            df_non_refund_weekend = df[non_refund_mask & ~weekday_mask]
-        else:
-            # If no refund column, use all data
+        if 'refund_order' not in df.columns:
             logger.warning("No refund_order column found, including all orders in counts")
-            df_non_refund = df
-            df_non_refund_weekday = df[weekday_mask]
-            df_non_refund_weekend = df[~weekday_mask]
-            
+        refunded_count = int(daily['refunded_orders'].sum())
+        if refunded_count > 0:
+            logger.info(f"Excluding {refunded_count} refunded orders from order counts")
+
         # Calculate guest counts (include all orders, even refunded ones for guest tracking)
-        summary['total_guests'] = int(df['guest_count'].sum())
-        summary['weekday_guests'] = int(df[weekday_mask]['guest_count'].sum())
-        summary['weekend_guests'] = int(df[~weekday_mask]['guest_count'].sum())
+        summary['total_guests'] = int(daily['guest_count'].sum())
+        summary['weekday_guests'] = int(weekday['guest_count'].sum())
+        summary['weekend_guests'] = int(weekend['guest_count'].sum())
 
         # Calculate order counts (exclude refunded orders)
-        summary['total_orders'] = len(df_non_refund)
-        summary['weekday_orders'] = len(df_non_refund_weekday)
-        summary['weekend_orders'] = len(df_non_refund_weekend)
-
-        # Time segment analysis (for Singapore/Malaysia)
-        # Define time segments
-        time_segments = {
-            '08:00-13:59': (8, 14),
-            '14:00-16:59': (14, 17),
-            '17:00-21:59': (17, 22),
-            '22:00-07:59': (22, 8)  # Overnight segment
-        }
-
-        # Get hour from close time (do this ONCE outside the loop)
-        df['close_hour'] = df['close_datetime'].dt.hour
+        summary['total_orders'] = int(daily['orders'].sum())
+        summary['weekday_orders'] = int(weekday['orders'].sum())
+        summary['weekend_orders'] = int(weekend['orders'].sum())
 
         # Log revenue calculation method
         logger.info("Calculating revenue by deducting 订单税金Tax from 订单税前实收金额Totals")
         
         # Log overall totals for verification (including refunded orders as they have negative amounts)
-        total_revenue_with_tax = df['revenue_before_tax'].sum()
-        total_tax = df['tax'].sum() if 'tax' in df.columns else 0
+        total_revenue_with_tax = daily['revenue_before_tax'].sum()
+        total_tax = daily['tax'].sum()
         total_revenue_without_tax = total_revenue_with_tax - total_tax
         logger.info(f"Total revenue with tax (including refunds): ${total_revenue_with_tax:.2f}, Total tax: ${total_tax:.2f}, Total revenue without tax: ${total_revenue_without_tax:.2f}")
 
-        # Initialize segment totals for verification
+        # Revenue (before tax, refunds included) and orders by time segment (for Singapore/Malaysia)
         segment_revenue_total = 0
-        segment_tax_total = 0
-        
-        # Calculate revenue and orders by time segment
-        for segment_name, (start_hour, end_hour) in time_segments.items():
-
-            if start_hour < end_hour:
-                # Normal case (same day)
-                segment_mask = (df['close_hour'] >= start_hour) & (
-                    df['close_hour'] < end_hour)
-            else:
-                # Overnight case (22:00-07:59)
-                segment_mask = (df['close_hour'] >= start_hour) | (
-                    df['close_hour'] < 8)
-
-            # Calculate revenue for this segment (before tax only)
-            # Include refunded orders as they already have negative amounts
-            revenue_mask = segment_mask
-                
-            # Always calculate by deducting actual tax from revenue_before_tax
-            segment_revenue_with_tax = df[revenue_mask]['revenue_before_tax'].sum()
-            segment_tax = df[revenue_mask]['tax'].sum() if 'tax' in df.columns else 0
+        for segment_name in self.TIME_SEGMENTS:
+            segment_revenue_with_tax = daily[f'revenue_with_tax_{segment_name}'].sum()
+            segment_tax = daily[f'tax_{segment_name}'].sum()
             segment_revenue = segment_revenue_with_tax - segment_tax
-            
-            # Add to totals for verification
             segment_revenue_total += segment_revenue
-            segment_tax_total += segment_tax
-            
-            # Log for debugging - changed to INFO level for visibility
+
             if segment_revenue_with_tax > 0:
                 logger.info(f"Segment {segment_name}: Revenue with tax: ${segment_revenue_with_tax:.2f}, Tax: ${segment_tax:.2f}, Revenue without tax: ${segment_revenue:.2f}")
-            
-            # Calculate orders excluding refunded ones
-            if 'refund_order' in df.columns:
-                non_refund_segment_mask = segment_mask & (df['refund_order'].isna() | (df['refund_order'] == ''))
-                segment_orders = len(df[non_refund_segment_mask])
-            else:
-                segment_orders = len(df[segment_mask])
 
-            # Store in summary
             summary[f'revenue_{segment_name}'] = segment_revenue
-            summary[f'orders_{segment_name}'] = segment_orders
+            summary[f'orders_{segment_name}'] = int(daily[f'orders_{segment_name}'].sum())
             
         # Log segment totals vs overall totals
         logger.info(f"Sum of all segments - Revenue without tax: ${segment_revenue_total:.2f}")
@@ -433,8 +467,7 @@ class HiBowlDailyProcessor:
             summary['period'] = target_month[2:6]  # e.g., '2507' for July 2025
         else:
             # Get from first date
-            first_date = df['date'].min()
-            summary['period'] = first_date.strftime('%y%m')
+            summary['period'] = daily.index.min().strftime('%y%m')
 
         logger.info(f"Calculated summary for period {summary['period']}")
         logger.info(
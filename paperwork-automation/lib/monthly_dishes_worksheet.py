@@ -5,9 +5,14 @@ Displays comprehensive dish-material relationship data from the database.
 """
 
 from datetime import datetime
-from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
-from typing import List, Dict
+from typing import List, Dict, Tuple
+
+from utils.database import get_schema_capabilities
+
+from .bom_cost_engine import BomCostEngine
+from .database_utils import PriceAsOfIndex
+from .worksheet_writer import THIN_BORDER, shared_alignment, shared_font, solid_fill
 
 
 class MonthlyDishesWorksheetGenerator:
@@ -31,7 +36,7 @@ class MonthlyDishesWorksheetGenerator:
         if not dish_data:
             # Create empty worksheet with message
             ws['A1'] = "无可用数据 - No Data Available"
-            ws['A1'].font = Font(bold=True, size=14)
+            ws['A1'].font = shared_font(bold=True, size=14)
             return ws
 
         # Set column widths for readability
@@ -46,11 +51,10 @@ class MonthlyDishesWorksheetGenerator:
         # Title section
         ws.merge_cells(f'A{current_row}:T{current_row}')
         ws[f'A{current_row}'] = f"海底捞菜品用料月报 - {target_dt.strftime('%Y年%m月')}"
-        ws[f'A{current_row}'].font = Font(bold=True, size=16, color="FFFFFF")
-        ws[f'A{current_row}'].alignment = Alignment(
+        ws[f'A{current_row}'].font = shared_font(bold=True, size=16, color="FFFFFF")
+        ws[f'A{current_row}'].alignment = shared_alignment(
             horizontal='center', vertical='center')
-        ws[f'A{current_row}'].fill = PatternFill(
-            start_color="C41E3A", end_color="C41E3A", fill_type="solid")
+        ws[f'A{current_row}'].fill = solid_fill("C41E3A")
         current_row += 2
 
         # Summary section
@@ -79,7 +83,7 @@ class MonthlyDishesWorksheetGenerator:
             # Create empty worksheet with message
             ws = wb.create_sheet("物料用量差异分析")
             ws['A1'] = "无可用数据 - No Variance Data Available"
-            ws['A1'].font = Font(bold=True, size=14)
+            ws['A1'].font = shared_font(bold=True, size=14)
             return ws
 
         # Group variance data by store
@@ -116,11 +120,10 @@ class MonthlyDishesWorksheetGenerator:
         # Title section (now extends to P column for 16 columns)
         ws.merge_cells(f'A{current_row}:P{current_row}')
         ws[f'A{current_row}'] = f"物料用量差异分析 - {store_name} - {target_dt.strftime('%Y年%m月')}"
-        ws[f'A{current_row}'].font = Font(bold=True, size=16, color="FFFFFF")
-        ws[f'A{current_row}'].alignment = Alignment(
+        ws[f'A{current_row}'].font = shared_font(bold=True, size=16, color="FFFFFF")
+        ws[f'A{current_row}'].alignment = shared_alignment(
             horizontal='center', vertical='center')
-        ws[f'A{current_row}'].fill = PatternFill(
-            start_color="C41E3A", end_color="C41E3A", fill_type="solid")
+        ws[f'A{current_row}'].fill = solid_fill("C41E3A")
         current_row += 2
 
         # Summary section for this store
@@ -165,9 +168,8 @@ class MonthlyDishesWorksheetGenerator:
         # Create summary section
         ws.merge_cells(f'A{current_row}:D{current_row}')
         ws[f'A{current_row}'] = f"{store_name} - 差异分析概览"
-        ws[f'A{current_row}'].font = Font(bold=True, size=12)
-        ws[f'A{current_row}'].fill = PatternFill(
-            start_color="E6F3FF", end_color="E6F3FF", fill_type="solid")
+        ws[f'A{current_row}'].font = shared_font(bold=True, size=12)
+        ws[f'A{current_row}'].fill = solid_fill("E6F3FF")
         current_row += 1
 
         summary_data = [
@@ -190,7 +192,7 @@ class MonthlyDishesWorksheetGenerator:
 
             cell_label = ws.cell(row=row, column=col, value=label)
             cell_value = ws.cell(row=row, column=col+1, value=value)
-            cell_label.font = Font(bold=True)
+            cell_label.font = shared_font(bold=True)
 
             # Color code summary metrics
             if i >= 5:  # Usage metrics
@@ -198,10 +200,8 @@ class MonthlyDishesWorksheetGenerator:
                 # Overall variance (now index 10)
                 if i == 10 and abs(overall_variance_percent) > 5:
                     fill_color = "FFE6E6" if overall_variance_percent > 0 else "FFF0E6"
-                cell_label.fill = PatternFill(
-                    start_color=fill_color, end_color=fill_color, fill_type="solid")
-                cell_value.fill = PatternFill(
-                    start_color=fill_color, end_color=fill_color, fill_type="solid")
+                cell_label.fill = solid_fill(fill_color)
+                cell_value.fill = solid_fill(fill_color)
 
         current_row += 3
         return current_row + 1
@@ -326,9 +326,8 @@ class MonthlyDishesWorksheetGenerator:
         # Create summary section
         ws.merge_cells(f'A{current_row}:D{current_row}')
         ws[f'A{current_row}'] = "数据统计概览"
-        ws[f'A{current_row}'].font = Font(bold=True, size=12)
-        ws[f'A{current_row}'].fill = PatternFill(
-            start_color="E6F3FF", end_color="E6F3FF", fill_type="solid")
+        ws[f'A{current_row}'].font = shared_font(bold=True, size=12)
+        ws[f'A{current_row}'].fill = solid_fill("E6F3FF")
         current_row += 1
 
         summary_data = [
@@ -348,15 +347,13 @@ class MonthlyDishesWorksheetGenerator:
             row = current_row + (i // 2)
             col = 1 if i % 2 == 0 else 3
 
-            ws.cell(row=row, column=col, value=label).font = Font(bold=True)
+            ws.cell(row=row, column=col, value=label).font = shared_font(bold=True)
             ws.cell(row=row, column=col+1, value=value)
 
             # Highlight performance metrics in a different color
             if i >= 6:  # Performance metrics start from index 6
-                ws.cell(row=row, column=col).fill = PatternFill(
-                    start_color="E8F5E8", end_color="E8F5E8", fill_type="solid")
-                ws.cell(row=row, column=col+1).fill = PatternFill(
-                    start_color="E8F5E8", end_color="E8F5E8", fill_type="solid")
+                ws.cell(row=row, column=col).fill = solid_fill("E8F5E8")
+                ws.cell(row=row, column=col+1).fill = solid_fill("E8F5E8")
 
         current_row += 3
         return current_row + 1
@@ -376,10 +373,9 @@ class MonthlyDishesWorksheetGenerator:
 
         for col, header in enumerate(headers, 1):
             cell = ws.cell(row=current_row, column=col, value=header)
-            cell.font = Font(bold=True, size=10, color="FFFFFF")
-            cell.fill = PatternFill(
-                start_color="4472C4", end_color="4472C4", fill_type="solid")
-            cell.alignment = Alignment(horizontal='center', vertical='center')
+            cell.font = shared_font(bold=True, size=10, color="FFFFFF")
+            cell.fill = solid_fill("4472C4")
+            cell.alignment = shared_alignment(horizontal='center', vertical='center')
         current_row += 1
 
         # Group data by dish to handle dishes with multiple materials
@@ -452,8 +448,7 @@ class MonthlyDishesWorksheetGenerator:
 
             # Highlight dishes without materials
             if not has_material:
-                cell.fill = PatternFill(
-                    start_color="FFF2CC", end_color="FFF2CC", fill_type="solid")
+                cell.fill = solid_fill("FFF2CC")
 
             # Format numeric columns
             # Serving size, standard quantity, price, monthly performance data
@@ -470,19 +465,11 @@ class MonthlyDishesWorksheetGenerator:
             # Center align certain columns
             # Serial, short code, size, unit, material unit, currency, count, performance metrics
             if col in [1, 4, 8, 9, 15, 17, 19, 20, 21, 22, 23, 24, 25]:
-                cell.alignment = Alignment(horizontal='center')
+                cell.alignment = shared_alignment(horizontal='center')
 
     def apply_common_formatting(self, ws, max_row):
         """Apply common formatting to the worksheet"""
 
-        # Add borders to data section
-        thin_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-
         # Find where data section starts (after summary)
         data_start_row = 1
         for row in range(1, max_row + 1):
@@ -494,11 +481,11 @@ class MonthlyDishesWorksheetGenerator:
         for row in range(data_start_row, max_row + 1):
             for col in range(1, 26):  # Updated to 25 columns (removed 2 stock columns)
                 cell = ws.cell(row=row, column=col)
-                cell.border = thin_border
+                cell.border = THIN_BORDER
 
                 # Wrap text for long content columns
                 if col in [6, 7, 12, 13, 25]:  # Name columns and remarks
-                    cell.alignment = Alignment(wrap_text=True, vertical='top')
+                    cell.alignment = shared_alignment(wrap_text=True, vertical='top')
 
         # Freeze panes at data header
         if data_start_row > 1:
@@ -510,150 +497,63 @@ class MonthlyDishesWorksheetGenerator:
 
     def check_unit_conversion_rate_column_exists(self, db_manager):
         """Check if unit_conversion_rate column exists in dish_material table"""
-        try:
-            with db_manager.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT column_name 
-                    FROM information_schema.columns 
-                    WHERE table_name = 'dish_material' 
-                    AND column_name = 'unit_conversion_rate'
-                """)
-                result = cursor.fetchone()
-                return result is not None
-        except Exception as e:
-            print(f"Error checking unit_conversion_rate column: {e}")
-            return False
-
-    def get_dish_usage_details(self, data_provider, material_id: int, store_id: int, year: int, month: int):
-        """Get detailed dish usage information for a specific material and store"""
-        try:
-            with data_provider.db_manager.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Check if unit_conversion_rate column exists
-                has_conversion_rate = self.check_unit_conversion_rate_column_exists(data_provider.db_manager)
-                
-                # Get detailed dish sales and material usage information
-                if has_conversion_rate:
-                    calculation_sql = """
-                        dm.standard_quantity * COALESCE(dm.loss_rate, 1.0) / COALESCE(dm.unit_conversion_rate, 1.0) as material_per_dish
-                    """
-                else:
-                    calculation_sql = """
-                        dm.standard_quantity * COALESCE(dm.loss_rate, 1.0) as material_per_dish
-                    """
-                
-                cursor.execute(f"""
-                    WITH aggregated_dish_sales AS (
-                        SELECT 
-                            dish_id,
-                            store_id,
-                            SUM(COALESCE(sale_amount, 0)) as total_sale_amount,
-                            SUM(COALESCE(return_amount, 0)) as total_return_amount
-                        FROM dish_monthly_sale
-                        WHERE year = %s AND month = %s AND store_id = %s
-                        GROUP BY dish_id, store_id
-                    ),
-                    dish_net_sales AS (
-                        SELECT 
-                            dish_id,
-                            store_id,
-                            (total_sale_amount - total_return_amount) as net_sales
-                        FROM aggregated_dish_sales
-                    )
-                    SELECT 
-                        d.name as dish_name,
-                        d.specification as dish_spec,
-                        dns.net_sales,
-                        COALESCE(dm.standard_quantity, 0) as material_quantity,
-                        COALESCE(dm.loss_rate, 1.0) as loss_rate,
-                        COALESCE(dm.unit_conversion_rate, 1.0) as unit_conversion_rate,
-                        {calculation_sql},
-                        m.unit as material_unit,
-                        (dns.net_sales * {calculation_sql.replace('as material_per_dish', '')}) as total_material_used
-                    FROM dish_net_sales dns
-                    INNER JOIN dish d ON dns.dish_id = d.id AND d.store_id = dns.store_id
-                    INNER JOIN dish_material dm ON d.id = dm.dish_id AND d.store_id = dm.store_id
-                    INNER JOIN material m ON dm.material_id = m.id AND dm.store_id = m.store_id
-                    WHERE dm.material_id = %s AND m.store_id = %s
-                        AND dns.net_sales > 0
-                        AND dns.store_id = %s
-                    ORDER BY dns.net_sales DESC
-                """, (year, month, store_id, material_id, store_id, store_id))
-                
-                regular_usage_details = cursor.fetchall()
-                
-                # Get combo usage from monthly_combo_dish_sale table (same as in variance calculation)
-                if has_conversion_rate:
-                    combo_calculation_sql = "SUM(cds.net_sales * COALESCE(dm.standard_quantity, 0) * COALESCE(dm.loss_rate, 1.0) / COALESCE(dm.unit_conversion_rate, 1.0))"
-                else:
-                    combo_calculation_sql = "SUM(cds.net_sales * COALESCE(dm.standard_quantity, 0) * COALESCE(dm.loss_rate, 1.0))"
-                
-                cursor.execute(f"""
-                    WITH combo_dish_sales AS (
-                        SELECT 
-                            d.id as dish_id,
-                            d.name as dish_name,
-                            mcds.store_id,
-                            COALESCE(mcds.sale_amount, 0) as net_sales
-                        FROM dish d
-                        LEFT JOIN monthly_combo_dish_sale mcds ON d.id = mcds.dish_id AND d.store_id = mcds.store_id
-                            AND mcds.year = %s AND mcds.month = %s AND mcds.store_id = %s
-                        WHERE d.is_active = TRUE AND mcds.store_id IS NOT NULL
-                    )
-                    SELECT 
-                        COALESCE({combo_calculation_sql}, 0) as combo_usage
-                    FROM material m
-                    LEFT JOIN dish_material dm ON m.id = dm.material_id AND m.store_id = dm.store_id
-                    LEFT JOIN combo_dish_sales cds ON dm.dish_id = cds.dish_id AND dm.store_id = cds.store_id
-                    WHERE m.id = %s AND m.store_id = %s
-                        AND cds.store_id IS NOT NULL
-                """, (year, month, store_id, material_id, store_id))
-                
-                combo_result = cursor.fetchone()
-                combo_usage = combo_result['combo_usage'] if combo_result and combo_result['combo_usage'] else 0
-                
-                # Format the usage details into a comprehensive string
-                if not regular_usage_details and combo_usage == 0:
-                    return "无使用记录"
-                
-                usage_lines = []
-                
-                # Add regular dish usage details
-                for detail in regular_usage_details:
-                    dish_name = detail['dish_name'] or '未知菜品'
-                    dish_spec = detail['dish_spec'] if detail['dish_spec'] else ''
-                    net_sales = detail['net_sales']
-                    material_quantity = detail['material_quantity']
-                    loss_rate = detail['loss_rate']
-                    unit_conversion = detail['unit_conversion_rate'] if has_conversion_rate else 1.0
-                    material_unit = detail['material_unit'] or ''
-                    total_material_used = detail['total_material_used']
-                    
-                    # Format dish name with specification
-                    full_dish_name = f"{dish_name} {dish_spec}".strip()
-                    
-                    # Create detailed usage line
-                    detail_line = (f"{full_dish_name} sale-{net_sales} "
-                                 f"出品分量(kg)-{material_quantity} "
-                                 f"损耗-{loss_rate} "
-                                 f"物料单位-{unit_conversion} "
-                                 f"materials_use-{total_material_used:.4f}")
-                    
-                    usage_lines.append(detail_line)
-                
-                # Add combo usage only if > 0
-                if combo_usage > 0:
-                    usage_lines.append(f"套餐 - {combo_usage:.4f}")
-                
-                return '\n'.join(usage_lines)
-                
-        except Exception as e:
-            print(f"Error getting dish usage details for material {material_id}: {e}")
-            import traceback
-            traceback.print_exc()
-            return "获取详情失败"
+        return get_schema_capabilities(db_manager).has_column('dish_material', 'unit_conversion_rate')
+
+    def get_dish_usage_rows(self, engine: BomCostEngine) -> Dict[Tuple[int, int], List[Dict]]:
+        """Get the dishes using each (material_id, store_id) pair, highest net sales first"""
+        lines = engine.lines_frame()
+        lines = lines[lines['regular_sales'] > 0].sort_values(
+            ['material_id', 'store_id', 'regular_sales'], ascending=[True, True, False], kind='stable')
+
+        usage_rows = {}
+        for row in lines.itertuples(index=False):
+            usage_rows.setdefault((int(row.material_id), int(row.store_id)), []).append({
+                'dish_name': row.dish_name,
+                'dish_spec': row.dish_spec,
+                'net_sales': row.regular_sales,
+                'material_quantity': row.standard_quantity,
+                'loss_rate': row.loss_rate,
+                'unit_conversion_rate': row.unit_conversion_rate,
+                'material_unit': row.material_unit,
+                'total_material_used': row.regular_usage,
+            })
+        return usage_rows
+
+    def format_dish_usage_details(self, usage_rows: List[Dict], combo_usage) -> str:
+        """Format the dish usage rows and combo usage of one material into the details cell text"""
+        if not usage_rows and combo_usage == 0:
+            return "无使用记录"
+
+        usage_lines = []
+
+        # Add regular dish usage details
+        for detail in usage_rows:
+            dish_name = detail['dish_name'] or '未知菜品'
+            dish_spec = detail['dish_spec'] if detail['dish_spec'] else ''
+            net_sales = detail['net_sales']
+            material_quantity = detail['material_quantity']
+            loss_rate = detail['loss_rate']
+            unit_conversion = detail['unit_conversion_rate']
+            material_unit = detail['material_unit'] or ''
+            total_material_used = detail['total_material_used']
+
+            # Format dish name with specification
+            full_dish_name = f"{dish_name} {dish_spec}".strip()
+
+            # Create detailed usage line
+            detail_line = (f"{full_dish_name} sale-{net_sales:g} "
+                           f"出品分量(kg)-{material_quantity:g} "
+                           f"损耗-{loss_rate:g} "
+                           f"物料单位-{unit_conversion:g} "
+                           f"materials_use-{total_material_used:.4f}")
+
+            usage_lines.append(detail_line)
+
+        # Add combo usage only if > 0
+        if combo_usage > 0:
+            usage_lines.append(f"套餐 - {combo_usage:.4f}")
+
+        return '\n'.join(usage_lines)
 
     def get_material_variance_data(self, data_provider, year: int, month: int):
         """Calculate material usage variance between theoretical and system record"""
@@ -671,16 +571,11 @@ class MonthlyDishesWorksheetGenerator:
             with data_provider.db_manager.get_connection() as conn:
                 cursor = conn.cursor()
 
-                # Get only materials that have dish_material records with standard_quantity (store-specific)
-                cursor.execute("""
-                    SELECT DISTINCT m.id as material_id, m.store_id
-                    FROM material m
-                    WHERE m.is_active = TRUE
-                    AND EXISTS (SELECT 1 FROM dish_material dm WHERE dm.material_id = m.id AND dm.store_id = m.store_id)
-                """, ())
-
-                all_materials = cursor.fetchall()
-                material_store_pairs = [(row['material_id'], row['store_id']) for row in all_materials]
+                # Recipes and regular/combo dish sales of active dishes and materials, all stores
+                engine = BomCostEngine.fetch(cursor, year, month, active_only=True,
+                                             has_conversion_rate=has_conversion_rate)
+                usage = engine.material_usage()
+                material_store_pairs = [(int(material_id), int(store_id)) for material_id, store_id in usage.index]
 
                 if not material_store_pairs:
                     print("⚠️  No materials found with dish-material relationships")
@@ -702,105 +597,27 @@ class MonthlyDishesWorksheetGenerator:
                         'material_price': 0
                     }]
 
-                # Choose SQL based on whether unit_conversion_rate column exists
-                if has_conversion_rate:
-                    calculation_sql = "SUM(ds.net_sales * COALESCE(dm.standard_quantity, 0) * COALESCE(dm.loss_rate, 1.0) / COALESCE(dm.unit_conversion_rate, 1.0)) as theoretical_total"
-                else:
-                    calculation_sql = "SUM(ds.net_sales * COALESCE(dm.standard_quantity, 0) * COALESCE(dm.loss_rate, 1.0)) as theoretical_total"
-
-                # Get regular theoretical usage (dish sales * standard_quantity * loss_rate / unit_conversion_rate) - Store-specific
-                regular_theoretical_sql = f"""
-                WITH aggregated_dish_sales AS (
-                    SELECT 
-                        dish_id,
-                        store_id,
-                        SUM(COALESCE(sale_amount, 0)) as total_sale_amount,
-                        SUM(COALESCE(return_amount, 0)) as total_return_amount
-                    FROM dish_monthly_sale
-                    WHERE year = %s AND month = %s
-                    GROUP BY dish_id, store_id
-                ),
-                dish_sales AS (
-                    SELECT 
-                        d.id as dish_id,
-                        d.name as dish_name,
-                        d.store_id,
-                        ads.store_id as sale_store_id,
-                        s.name as store_name,
-                        COALESCE(ads.total_sale_amount, 0) - COALESCE(ads.total_return_amount, 0) as net_sales
-                    FROM dish d
-                    LEFT JOIN aggregated_dish_sales ads ON d.id = ads.dish_id AND d.store_id = ads.store_id
-                    LEFT JOIN store s ON ads.store_id = s.id
-                    WHERE d.is_active = TRUE AND ads.store_id IS NOT NULL
-                ),
-                regular_theoretical_usage AS (
-                    SELECT 
-                        m.id as material_id,
-                        m.name as material_name,
-                        m.material_number,
-                        m.unit as material_unit,
-                        ds.sale_store_id as store_id,
-                        ds.store_name,
-                        {calculation_sql}
-                    FROM material m
-                    LEFT JOIN dish_material dm ON m.id = dm.material_id AND m.store_id = dm.store_id
-                    LEFT JOIN dish_sales ds ON dm.dish_id = ds.dish_id AND dm.store_id = ds.store_id
-                    WHERE m.is_active = TRUE AND ds.sale_store_id IS NOT NULL
-                        AND (m.id, m.store_id) = ANY(%s)
-                    GROUP BY m.id, m.name, m.material_number, m.unit, ds.sale_store_id, ds.store_name
-                )
-                SELECT * FROM regular_theoretical_usage
-                ORDER BY store_name, material_name
-                """
-
-                cursor.execute(regular_theoretical_sql,
-                               (year, month, material_store_pairs))
-                regular_theoretical_data = cursor.fetchall()
-
-                # Choose combo calculation SQL based on whether unit_conversion_rate column exists
-                if has_conversion_rate:
-                    combo_calculation_sql = "SUM(cds.net_sales * COALESCE(dm.standard_quantity, 0) * COALESCE(dm.loss_rate, 1.0) / COALESCE(dm.unit_conversion_rate, 1.0)) as combo_total"
-                else:
-                    combo_calculation_sql = "SUM(cds.net_sales * COALESCE(dm.standard_quantity, 0) * COALESCE(dm.loss_rate, 1.0)) as combo_total"
-
-                # Get combo usage (combo dish sales * standard_quantity * loss_rate / unit_conversion_rate) - Store-specific
-                combo_usage_sql = f"""
-                WITH combo_dish_sales AS (
-                    SELECT 
-                        d.id as dish_id,
-                        d.name as dish_name,
-                        d.store_id,
-                        mcds.store_id as sale_store_id,
-                        s.name as store_name,
-                        COALESCE(mcds.sale_amount, 0) as net_sales
-                    FROM dish d
-                    LEFT JOIN monthly_combo_dish_sale mcds ON d.id = mcds.dish_id AND d.store_id = mcds.store_id
-                        AND mcds.year = %s AND mcds.month = %s
-                    LEFT JOIN store s ON mcds.store_id = s.id
-                    WHERE d.is_active = TRUE AND mcds.store_id IS NOT NULL
-                ),
-                combo_theoretical_usage AS (
-                    SELECT 
-                        m.id as material_id,
-                        m.name as material_name,
-                        m.material_number,
-                        m.unit as material_unit,
-                        cds.sale_store_id as store_id,
-                        cds.store_name,
-                        {combo_calculation_sql}
-                    FROM material m
-                    LEFT JOIN dish_material dm ON m.id = dm.material_id AND m.store_id = dm.store_id
-                    LEFT JOIN combo_dish_sales cds ON dm.dish_id = cds.dish_id AND dm.store_id = cds.store_id
-                    WHERE m.is_active = TRUE AND cds.sale_store_id IS NOT NULL
-                        AND (m.id, m.store_id) = ANY(%s)
-                    GROUP BY m.id, m.name, m.material_number, m.unit, cds.sale_store_id, cds.store_name
-                )
-                SELECT * FROM combo_theoretical_usage
-                ORDER BY store_name, material_name
-                """
-
-                cursor.execute(combo_usage_sql, (year, month, material_store_pairs))
-                combo_usage_data = cursor.fetchall()
+                # Regular and combo theoretical usage (net sales * standard_quantity * loss_rate / unit_conversion_rate)
+                material_info = engine.lines.drop_duplicates(['material_id', 'store_id']).set_index(
+                    ['material_id', 'store_id'])
+                regular_theoretical_dict = {}
+                combo_usage_dict = {}
+                for (material_id, store_id), row in zip(material_store_pairs, usage.itertuples()):
+                    info = material_info.loc[(material_id, store_id)]
+                    material_row = {
+                        'material_id': material_id,
+                        'store_id': store_id,
+                        'store_name': info['store_name'],
+                        'material_name': info['material_name'],
+                        'material_number': info['material_number'],
+                        'material_unit': info['material_unit'],
+                    }
+                    if row.regular_usage != 0:
+                        regular_theoretical_dict[(material_id, store_id)] = dict(
+                            material_row, theoretical_total=row.regular_usage)
+                    if row.combo_usage != 0:
+                        combo_usage_dict[(material_id, store_id)] = dict(
+                            material_row, combo_total=row.combo_usage)
 
                 # Get system record (material_monthly_usage.material_used) - Store-specific
                 system_sql = """
@@ -849,51 +666,27 @@ class MonthlyDishesWorksheetGenerator:
                 cursor.execute(inventory_sql, (material_store_pairs, year, month))
                 inventory_data = cursor.fetchall()
 
-                # Get material prices for the target month - Store-specific
-                price_sql = """
-                SELECT 
-                    m.id as material_id,
-                    m.name as material_name,
-                    mph.store_id,
-                    s.name as store_name,
-                    COALESCE(mph.price, 0) as material_price
-                FROM material m
-                LEFT JOIN material_price_history mph ON m.id = mph.material_id AND m.store_id = mph.store_id
-                LEFT JOIN store s ON mph.store_id = s.id
-                WHERE m.is_active = TRUE 
-                    AND mph.is_active = true
-                    AND mph.effective_date <= (date_trunc('month', make_date(%s, %s, 1)) + interval '1 month - 1 day')::date
-                    AND (m.id, m.store_id) = ANY(%s)
-                ORDER BY s.name, m.id, mph.effective_date DESC
-                """
-                
-                cursor.execute(price_sql, (year, month, material_store_pairs))
-                price_data = cursor.fetchall()
+                # Material prices in effect for the target month - Store-specific
+                price_index = PriceAsOfIndex.fetch(
+                    cursor, 'material', until=(year, month), pairs=material_store_pairs)
+
+                # Dishes using each material, from the same recipe lines
+                dish_usage_rows = self.get_dish_usage_rows(engine)
 
                 # Combine all data
-                regular_theoretical_dict = {
-                    (row['material_id'], row['store_id']): row for row in regular_theoretical_data}
-                combo_usage_dict = {
-                    (row['material_id'], row['store_id']): row for row in combo_usage_data}
                 system_dict = {
                     (row['material_id'], row['store_id']): row for row in system_data}
                 inventory_dict = {
                     (row['material_id'], row['store_id']): row for row in inventory_data}
-                
-                # Create price dictionary - get latest price for each material-store combination
-                price_dict = {}
-                for row in price_data:
-                    key = (row['material_id'], row['store_id'])
-                    if key not in price_dict:  # Take first (latest) price due to ORDER BY
-                        price_dict[key] = row
 
                 # Create combined variance data
                 variance_data = []
 
                 # Get all unique material-store combinations
-                all_combinations = set()
-                for row in regular_theoretical_data + combo_usage_data + system_data + inventory_data:
+                all_combinations = set(regular_theoretical_dict) | set(combo_usage_dict)
+                for row in system_data + inventory_data:
                     all_combinations.add((row['material_id'], row['store_id']))
+                price_dict = price_index.lookup(all_combinations, datetime(year, month, 1))
 
                 for material_id, store_id in all_combinations:
                     regular_theoretical_row = regular_theoretical_dict.get(
@@ -903,7 +696,6 @@ class MonthlyDishesWorksheetGenerator:
                     system_row = system_dict.get((material_id, store_id), {})
                     inventory_row = inventory_dict.get(
                         (material_id, store_id), {})
-                    price_row = price_dict.get((material_id, store_id), {})
 
                     # Get material info from any available row
                     info_row = regular_theoretical_row or combo_usage_row or system_row or inventory_row
@@ -923,10 +715,10 @@ class MonthlyDishesWorksheetGenerator:
                     combo_usage = combo_usage_row.get('combo_total', 0) or 0
                     theoretical_usage = regular_theoretical_usage + \
                         combo_usage  # Combined for variance calculation
-                    system_record = system_row.get('system_record', 0) or 0
-                    inventory_count = inventory_row.get(
-                        'inventory_count', 0) or 0
-                    material_price = price_row.get('material_price', 0) or 0
+                    system_record = float(system_row.get('system_record', 0) or 0)
+                    inventory_count = float(inventory_row.get(
+                        'inventory_count', 0) or 0)
+                    material_price = price_dict.get((material_id, store_id), 0)
 
                     # Calculate variance to match Excel formula: H - (G + I)
                     # This matches the Excel formula: =I{row}-(G{row}+H{row}) (will be updated with new column positions)
@@ -951,9 +743,9 @@ class MonthlyDishesWorksheetGenerator:
                         else:
                             variance_status = "少用"
 
-                    # Get dish usage details for this material and store
-                    dish_usage_details = self.get_dish_usage_details(
-                        data_provider, material_id, store_id, year, month)
+                    # Dish usage details for this material and store (combo usage matches the combo query)
+                    dish_usage_details = self.format_dish_usage_details(
+                        dish_usage_rows.get((material_id, store_id), []), combo_usage)
 
                     variance_data.append({
                         'material_id': material_id,
@@ -1008,9 +800,8 @@ class MonthlyDishesWorksheetGenerator:
         # Create summary section
         ws.merge_cells(f'A{current_row}:D{current_row}')
         ws[f'A{current_row}'] = "差异分析概览"
-        ws[f'A{current_row}'].font = Font(bold=True, size=12)
-        ws[f'A{current_row}'].fill = PatternFill(
-            start_color="E6F3FF", end_color="E6F3FF", fill_type="solid")
+        ws[f'A{current_row}'].font = shared_font(bold=True, size=12)
+        ws[f'A{current_row}'].fill = solid_fill("E6F3FF")
         current_row += 1
 
         summary_data = [
@@ -1033,7 +824,7 @@ class MonthlyDishesWorksheetGenerator:
 
             cell_label = ws.cell(row=row, column=col, value=label)
             cell_value = ws.cell(row=row, column=col+1, value=value)
-            cell_label.font = Font(bold=True)
+            cell_label.font = shared_font(bold=True)
 
             # Color code summary metrics
             if i >= 5:  # Usage metrics
@@ -1041,10 +832,8 @@ class MonthlyDishesWorksheetGenerator:
                 # Overall variance (now index 10)
                 if i == 10 and abs(overall_variance_percent) > 5:
                     fill_color = "FFE6E6" if overall_variance_percent > 0 else "FFF0E6"
-                cell_label.fill = PatternFill(
-                    start_color=fill_color, end_color=fill_color, fill_type="solid")
-                cell_value.fill = PatternFill(
-                    start_color=fill_color, end_color=fill_color, fill_type="solid")
+                cell_label.fill = solid_fill(fill_color)
+                cell_value.fill = solid_fill(fill_color)
 
         current_row += 3
         return current_row + 1
@@ -1062,10 +851,9 @@ class MonthlyDishesWorksheetGenerator:
 
         for col, header in enumerate(headers, 1):
             cell = ws.cell(row=current_row, column=col, value=header)
-            cell.font = Font(bold=True, size=10, color="FFFFFF")
-            cell.fill = PatternFill(
-                start_color="4472C4", end_color="4472C4", fill_type="solid")
-            cell.alignment = Alignment(horizontal='center', vertical='center')
+            cell.font = shared_font(bold=True, size=10, color="FFFFFF")
+            cell.fill = solid_fill("4472C4")
+            cell.alignment = shared_alignment(horizontal='center', vertical='center')
         current_row += 1
 
         # Data rows
@@ -1094,11 +882,11 @@ class MonthlyDishesWorksheetGenerator:
 
                 # Center align certain columns
                 if col in [1, 2, 5]:  # Serial, store, unit
-                    cell.alignment = Alignment(horizontal='center')
+                    cell.alignment = shared_alignment(horizontal='center')
                     
                 # Text wrap for dish usage details
                 if col == 6:  # 使用菜品详情
-                    cell.alignment = Alignment(wrap_text=True, vertical='top')
+                    cell.alignment = shared_alignment(wrap_text=True, vertical='top')
 
             # K: 减去盘点用量 (System Record - Inventory Count) - Excel formula: = I - J
             system_minus_inventory_formula = f"=I{current_row}-J{current_row}"
@@ -1118,12 +906,12 @@ class MonthlyDishesWorksheetGenerator:
             rate_cell = ws.cell(row=current_row, column=13, value=rate_formula)
             # Fixed percentage format with exactly 2 decimal places
             rate_cell.number_format = '0.00"%"'
-            rate_cell.alignment = Alignment(horizontal='center')
+            rate_cell.alignment = shared_alignment(horizontal='center')
 
             # N: 状态 (Status)
             status_cell = ws.cell(row=current_row, column=14,
                                   value=data['variance_status'])
-            status_cell.alignment = Alignment(horizontal='center')
+            status_cell.alignment = shared_alignment(horizontal='center')
 
             # O: 本月总消费金额 (Total money spent this month)
             # Formula: (理论用量 + 套餐用量 + 系统记录) × 物料单价
@@ -1142,8 +930,7 @@ class MonthlyDishesWorksheetGenerator:
             if data['variance_status'] in ['超量', '少用']:
                 # Red for 超量 (excess), Green for 少用 (under-usage)
                 fill_color = "FFE6E6" if data['variance_status'] == '超量' else "E8F5E8"
-                row_fill = PatternFill(
-                    start_color=fill_color, end_color=fill_color, fill_type="solid")
+                row_fill = solid_fill(fill_color)
 
                 # Apply fill to all cells in this row (now 16 columns)
                 for col in range(1, 17):
@@ -1155,14 +942,6 @@ class MonthlyDishesWorksheetGenerator:
 
     def apply_variance_formatting(self, ws, max_row):
         """Apply formatting to variance worksheet"""
-        # Add borders to data section
-        thin_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-
         # Find data section start
         data_start_row = 1
         for row in range(1, max_row + 1):
@@ -1175,7 +954,7 @@ class MonthlyDishesWorksheetGenerator:
             # 14 columns for variance data (removed 包装规格, added 2 cost columns)
             for col in range(1, 15):
                 cell = ws.cell(row=row, column=col)
-                cell.border = thin_border
+                cell.border = THIN_BORDER
 
         # Freeze panes at data header
         if data_start_row > 1:
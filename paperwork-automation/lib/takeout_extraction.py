@@ -36,7 +36,7 @@ from pathlib import Path
 from datetime import datetime
 from typing import List, Dict, Optional
 
-from utils.database import get_database_manager
+from utils.database import get_shared_database_manager
 from lib.config import STORE_NAME_MAPPING
 
 # Configure logging
@@ -198,7 +198,7 @@ def insert_takeout_data_to_database(data: List[Dict], is_test: bool = False) ->
         Success status
     """
     try:
-        db_manager = get_database_manager(is_test=is_test)
+        db_manager = get_shared_database_manager(is_test=is_test)
 
         if not db_manager.test_connection():
             logger.error("Database connection failed")
@@ -256,7 +256,7 @@ def get_takeout_summary(is_test: bool = False) -> Dict:
         Dictionary with summary statistics
     """
     try:
-        db_manager = get_database_manager(is_test=is_test)
+        db_manager = get_shared_database_manager(is_test=is_test)
 
         with db_manager.get_connection() as conn:
             with conn.cursor() as cursor:
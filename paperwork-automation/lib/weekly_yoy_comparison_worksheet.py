@@ -26,6 +26,7 @@ from datetime import datetime, timedelta
 from openpyxl import Workbook
 from openpyxl.worksheet.worksheet import Worksheet
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from .worksheet_writer import SheetWriter, cell_style, shared_font, solid_fill
 
 # Import centralized configurations
 from configs.store_config import STORE_SEATING_CAPACITY, STORE_MANAGERS, REGIONAL_MANAGER
@@ -875,8 +876,11 @@ class WeeklyYoYComparisonWorksheetGenerator:
         Generate detailed daily data worksheet for verification.
 
         Shows daily turnover rate and tables for both current and previous year.
+        Rows are emitted in order through a SheetWriter, so the sheet also
+        works on a streaming (write-only) workbook.
         """
         ws = workbook.create_sheet("每日详细数据")
+        writer = SheetWriter(ws)
 
         # Parse dates
         target_dt = datetime.strptime(target_date, '%Y-%m-%d')
@@ -888,30 +892,25 @@ class WeeklyYoYComparisonWorksheetGenerator:
         daily_data = self._get_daily_detail_data(start_dt, target_dt)
 
         if not daily_data:
-            ws.cell(row=1, column=1, value="无数据")
+            writer.append(["无数据"])
             return ws
 
-        # Generate headers
-        current_row = 1
+        # Column widths and freeze panes go before the first row
+        writer.set_column_widths({'A': 12, 'B': 10, 'C': 12, 'D': 12, 'E': 12, 'F': 10, 'G': 10, 'H': 10})
+        writer.freeze_panes("C4")
 
         # Title
-        title_cell = ws.cell(row=current_row, column=1, value=f"每日详细数据 ({start_dt.strftime('%Y-%m-%d')} 至 {target_dt.strftime('%Y-%m-%d')})")
-        title_cell.font = Font(bold=True, size=14)
-        ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=8)
-        current_row += 2
+        title_row = writer.append(
+            [f"每日详细数据 ({start_dt.strftime('%Y-%m-%d')} 至 {target_dt.strftime('%Y-%m-%d')})"],
+            cell_style(font=shared_font(bold=True, size=14)))
+        writer.merge(title_row, 1, title_row, 8)
+        writer.skip_rows(1)
 
         # Column headers
         headers = ["门店", "日期", f"{prev_year}翻台率", f"{target_dt.year}翻台率", "翻台率差距",
                    f"{prev_year}桌数", f"{target_dt.year}桌数", "桌数差距"]
-
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=current_row, column=col, value=header)
-            cell.font = self.header_font
-            cell.fill = self.header_fill
-            cell.alignment = self.center_alignment
-            cell.border = self.thin_border
-
-        current_row += 1
+        writer.append(headers, cell_style(font=self.header_font, fill=self.header_fill,
+                                          alignment=self.center_alignment, border=self.thin_border))
 
         # Store name mapping
         store_names = {
@@ -919,9 +918,19 @@ class WeeklyYoYComparisonWorksheetGenerator:
             5: '加拿大五店', 6: '加拿大六店', 7: '加拿大七店', 8: '加拿大八店'
         }
 
+        # Shared cell styles
+        text_style = cell_style(border=self.thin_border)
+        turnover_style = cell_style(border=self.thin_border, number_format='0.00')
+        tables_style = cell_style(border=self.thin_border, number_format='0')
+        separator_style = cell_style(fill=solid_fill(self.SEPARATOR_COLOR))
+
+        def gap_style(gap, number_format):
+            fill = self.green_fill if gap >= 0 else self.red_fill
+            return cell_style(border=self.thin_border, fill=fill, number_format=number_format)
+
         # Write data rows
         current_store = None
-        store_start_row = current_row
+        store_start_row = writer.row
 
         for row_data in daily_data:
             store_id = row_data['store_id']
@@ -930,79 +939,36 @@ class WeeklyYoYComparisonWorksheetGenerator:
             # Add separator between stores
             if current_store is not None and store_id != current_store:
                 # Merge store name cells for previous store
-                if current_row - 1 > store_start_row:
-                    ws.merge_cells(start_row=store_start_row, start_column=1,
-                                   end_row=current_row - 1, end_column=1)
+                if writer.row - 1 > store_start_row:
+                    writer.merge(store_start_row, 1, writer.row - 1, 1)
 
                 # Add separator row
-                for col in range(1, 9):
-                    cell = ws.cell(row=current_row, column=col, value="")
-                    cell.fill = PatternFill(start_color="333333", end_color="333333", fill_type="solid")
-                ws.row_dimensions[current_row].height = 4
-                current_row += 1
-                store_start_row = current_row
+                writer.append([""] * 8, separator_style, height=4)
+                store_start_row = writer.row
 
+            # Store name only on the first row of the store (merged later)
+            is_first_store_row = store_id != current_store
             current_store = store_id
 
-            # Store name (will be merged later)
-            ws.cell(row=current_row, column=1, value=store_name).border = self.thin_border
-
-            # Date
-            date_str = f"{row_data['month']}月{row_data['day']}日"
-            ws.cell(row=current_row, column=2, value=date_str).border = self.thin_border
-
-            # Previous year turnover
             prev_turnover = row_data.get('prev_turnover', 0) or 0
-            cell = ws.cell(row=current_row, column=3, value=prev_turnover)
-            cell.number_format = '0.00'
-            cell.border = self.thin_border
-
-            # Current year turnover
             curr_turnover = row_data.get('curr_turnover', 0) or 0
-            cell = ws.cell(row=current_row, column=4, value=curr_turnover)
-            cell.number_format = '0.00'
-            cell.border = self.thin_border
-
-            # Turnover gap
             turnover_gap = curr_turnover - prev_turnover
-            cell = ws.cell(row=current_row, column=5, value=turnover_gap)
-            cell.number_format = '+0.00;-0.00;0.00'
-            cell.border = self.thin_border
-            cell.fill = self.green_fill if turnover_gap >= 0 else self.red_fill
-
-            # Previous year tables
             prev_tables = row_data.get('prev_tables', 0) or 0
-            cell = ws.cell(row=current_row, column=6, value=prev_tables)
-            cell.number_format = '0'
-            cell.border = self.thin_border
-
-            # Current year tables
             curr_tables = row_data.get('curr_tables', 0) or 0
-            cell = ws.cell(row=current_row, column=7, value=curr_tables)
-            cell.number_format = '0'
-            cell.border = self.thin_border
-
-            # Tables gap
             tables_gap = curr_tables - prev_tables
-            cell = ws.cell(row=current_row, column=8, value=tables_gap)
-            cell.number_format = '+0;-0;0'
-            cell.border = self.thin_border
-            cell.fill = self.green_fill if tables_gap >= 0 else self.red_fill
 
-            current_row += 1
+            writer.append(
+                [store_name if is_first_store_row else None,
+                 f"{row_data['month']}月{row_data['day']}日",
+                 prev_turnover, curr_turnover, turnover_gap,
+                 prev_tables, curr_tables, tables_gap],
+                [text_style, text_style,
+                 turnover_style, turnover_style, gap_style(turnover_gap, '+0.00;-0.00;0.00'),
+                 tables_style, tables_style, gap_style(tables_gap, '+0;-0;0')])
 
         # Merge last store's name cells
-        if current_row - 1 > store_start_row:
-            ws.merge_cells(start_row=store_start_row, start_column=1,
-                           end_row=current_row - 1, end_column=1)
-
-        # Apply column widths
-        widths = {'A': 12, 'B': 10, 'C': 12, 'D': 12, 'E': 12, 'F': 10, 'G': 10, 'H': 10}
-        for col, width in widths.items():
-            ws.column_dimensions[col].width = width
-
-        # Freeze panes
-        ws.freeze_panes = "C4"
+        if writer.row - 1 > store_start_row:
+            writer.merge(store_start_row, 1, writer.row - 1, 1)
 
         return ws
 
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Row-at-a-time worksheet writer with shared, interned openpyxl styles.
+
+Generators emit rows in order through a SheetWriter. On a normal workbook the
+rows become ordinary cells; on a write-only workbook (create_report_workbook(
+streaming=True)) each row is streamed to disk as soon as it is appended, so
+memory stays flat no matter how many styled cells a sheet has. Both backends
+produce the same cells, styles, merges, column widths and row heights.
+"""
+
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Sequence, Union
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.worksheet.merge import MergedCellRange
+
+
+# Shared style objects. openpyxl styles are immutable, so one instance can be
+# assigned to any number of cells instead of building a new one per cell.
+THIN_BORDER = Border(
+    left=Side(style='thin'),
+    right=Side(style='thin'),
+    top=Side(style='thin'),
+    bottom=Side(style='thin')
+)
+
+
+@lru_cache(maxsize=None)
+def shared_font(**kwargs) -> Font:
+    """Return the shared Font for these arguments (e.g. bold=True, size=10)."""
+    return Font(**kwargs)
+
+
+@lru_cache(maxsize=None)
+def shared_alignment(**kwargs) -> Alignment:
+    """Return the shared Alignment for these arguments."""
+    return Alignment(**kwargs)
+
+
+@lru_cache(maxsize=None)
+def solid_fill(color: str) -> PatternFill:
+    """Return the shared solid PatternFill for a hex color such as 'F5F5F5'."""
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+
+class CellStyle(NamedTuple):
+    """Style applied to one cell. Unset attributes keep the openpyxl default."""
+    font: Optional[Font] = None
+    fill: Optional[PatternFill] = None
+    border: Optional[Border] = None
+    alignment: Optional[Alignment] = None
+    number_format: Optional[str] = None
+
+
+@lru_cache(maxsize=None)
+def cell_style(font: Optional[Font] = None, fill: Optional[PatternFill] = None,
+               border: Optional[Border] = None, alignment: Optional[Alignment] = None,
+               number_format: Optional[str] = None) -> CellStyle:
+    """Return the shared CellStyle for this combination of style objects."""
+    return CellStyle(font, fill, border, alignment, number_format)
+
+
+def _apply_style(cell, style: CellStyle):
+    """Copy the set attributes of a CellStyle onto a cell."""
+    if style.font is not None:
+        cell.font = style.font
+    if style.fill is not None:
+        cell.fill = style.fill
+    if style.border is not None:
+        cell.border = style.border
+    if style.alignment is not None:
+        cell.alignment = style.alignment
+    if style.number_format is not None:
+        cell.number_format = style.number_format
+
+
+def create_report_workbook(streaming: bool = False) -> Workbook:
+    """
+    Create an empty report workbook without the default sheet.
+
+    Args:
+        streaming: Use openpyxl write-only mode. Every sheet of the workbook
+            must then be written through a SheetWriter, in row order.
+    """
+    if streaming:
+        return Workbook(write_only=True)
+
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    return workbook
+
+
+def is_streaming_workbook(workbook) -> bool:
+    """True if the workbook was created in openpyxl write-only mode."""
+    return bool(getattr(workbook, 'write_only', False))
+
+
+RowStyles = Union[None, CellStyle, Sequence[Optional[CellStyle]]]
+
+
+class SheetWriter:
+    """
+    Append-only writer for one worksheet.
+
+    Rows are written strictly in order starting at row 1. Column widths and
+    freeze panes must be set before the first row is appended, because a
+    streamed sheet writes them ahead of its rows. Merges may be added at any
+    time before the workbook is saved.
+    """
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.streaming = not hasattr(worksheet, 'cell')
+        self.row = 1
+
+    def append(self, values: Sequence, styles: RowStyles = None,
+               height: Optional[float] = None) -> int:
+        """
+        Write the next row and return its row number.
+
+        Args:
+            values: Cell values from column A. None leaves a cell empty, but
+                it is still written when it has a style.
+            styles: One CellStyle for every cell, or one entry per column
+                (None for an unstyled cell).
+            height: Optional row height
+        """
+        row = self.row
+        if height is not None:
+            self.worksheet.row_dimensions[row].height = height
+
+        if styles is None or isinstance(styles, CellStyle):
+            styles = [styles] * len(values)
+
+        if self.streaming:
+            cells = []
+            for value, style in zip(values, styles):
+                if style is None:
+                    cells.append(value)
+                    continue
+                cell = WriteOnlyCell(self.worksheet, value=value)
+                _apply_style(cell, style)
+                cells.append(cell)
+            self.worksheet.append(cells)
+        else:
+            for column, (value, style) in enumerate(zip(values, styles), 1):
+                if value is None and style is None:
+                    continue
+                cell = self.worksheet.cell(row=row, column=column)
+                if value is not None:
+                    cell.value = value
+                if style is not None:
+                    _apply_style(cell, style)
+
+        self.row += 1
+        return row
+
+    def skip_rows(self, count: int = 1):
+        """Leave the next `count` rows empty."""
+        for _ in range(count):
+            if self.streaming:
+                self.worksheet.append([])
+            self.row += 1
+
+    def merge(self, start_row: int, start_column: int, end_row: int, end_column: int):
+        """
+        Merge a cell range. Ranges must not overlap.
+
+        Unlike ws.merge_cells, the range is added without scanning the
+        existing ranges (quadratic on sheets with thousands of merges) and
+        without rebuilding borders from the top-left cell: the cells inside
+        keep exactly the styles they were written with, on both backends.
+        """
+        cell_range = CellRange(min_col=start_column, min_row=start_row,
+                               max_col=end_column, max_row=end_row)
+        if not self.streaming:
+            cell_range = MergedCellRange(self.worksheet, cell_range.coord)
+        self.worksheet.merged_cells.ranges.add(cell_range)
+
+    def set_column_widths(self, widths: Union[List[float], Dict[str, float]]):
+        """Set column widths from a list (starting at column A) or a letter -> width dict."""
+        if not isinstance(widths, dict):
+            widths = {get_column_letter(i): width for i, width in enumerate(widths, 1)}
+        for letter, width in widths.items():
+            self.worksheet.column_dimensions[letter].width = width
+
+    def freeze_panes(self, cell_reference: str):
+        """Freeze rows above and columns left of a cell such as 'C4'."""
+        self.worksheet.freeze_panes = cell_reference
+
+
+__all__ = [
+    'THIN_BORDER',
+    'shared_font',
+    'shared_alignment',
+    'solid_fill',
+    'CellStyle',
+    'cell_style',
+    'create_report_workbook',
+    'is_streaming_workbook',
+    'SheetWriter'
+]
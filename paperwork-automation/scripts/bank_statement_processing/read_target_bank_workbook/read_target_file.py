@@ -12,6 +12,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../.
 from configs.bank_statement.banks import BankBrands
 from configs.bank_statement.processing_sheet import BankWorkSheet, BanWorkSheetToFormattedName
 from type.bank_processing import BankRecord
+from lib.excel_utils import get_workbook_sheet_names, read_workbook_sheets
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -391,22 +392,20 @@ def read_all_worksheet(current_date: datetime) -> Dict[str, List[BankRecord]]:
     results = {}
     
     try:
-        # Read all sheets
-        xls = pd.ExcelFile(file_path)
-        logger.info(f"Processing {len(xls.sheet_names)} sheets from {os.path.basename(file_path)}")
-        
-        for sheet_name in xls.sheet_names:
-            # Skip if not in mapping
+        # Parse every known bank sheet in one pass over the workbook
+        sheet_names = get_workbook_sheet_names(file_path)
+        logger.info(f"Processing {len(sheet_names)} sheets from {os.path.basename(file_path)}")
+
+        for sheet_name in sheet_names:
             if sheet_name not in BankWorkSheet:
                 logger.warning(f"Unknown sheet: {sheet_name}")
-                continue
-            
+        sheets = read_workbook_sheets(
+            file_path, [name for name in sheet_names if name in BankWorkSheet])
+
+        for sheet_name, df in sheets.items():
             bank_brand = BankWorkSheet[sheet_name]
             logger.info(f"Processing sheet: {sheet_name} ({bank_brand.name})")
             
-            # Read the sheet
-            df = pd.read_excel(file_path, sheet_name=sheet_name)
-            
             # Process based on bank type
             if bank_brand == BankBrands.BMO:
                 records = read_bmo_worksheet(df, sheet_name)
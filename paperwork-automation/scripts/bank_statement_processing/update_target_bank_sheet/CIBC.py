@@ -1,99 +1,16 @@
 import sys
 import os
-from typing import List, Dict
+from typing import List
 import logging
 from datetime import datetime
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
 
 from type.bank_processing import BankRecord
-from configs.bank_statement.bank_transaction_rules import BANK_TRANSACTION_RULES
+from scripts.bank_statement_processing.update_target_bank_sheet.transaction_classification import match_transaction_rules
 
 logger = logging.getLogger(__name__)
 
-def match_transaction_rules(record: BankRecord) -> Dict:
-    """
-    Match a bank record against transaction rules to get classification data.
-    
-    Args:
-        record: BankRecord to match
-        
-    Returns:
-        Dictionary with classification data or default values
-    """
-    # Determine transaction type (credit or debit)
-    transaction_type = 'credit' if record.credit > 0 else 'debit' if record.debit > 0 else None
-    
-    # Use full description for matching, fallback to short description
-    description = record.full_desctiption or record.short_desctiption or ""
-    
-    # Use the absolute amount for matching
-    amount = abs(record.credit) if record.credit > 0 else abs(record.debit)
-    
-    # Try to match against each rule
-    for rule, classification in BANK_TRANSACTION_RULES:
-        if rule.matches(description, amount, transaction_type):
-            # Process the classification result
-            result = {}
-            
-            # Always copy 品名 and 付款详情
-            result["品名"] = classification.get("品名", "待确认")
-            result["付款详情"] = classification.get("付款详情", "")
-            
-            # For the confirmation fields, set "待确认" if True, use string value if string, empty string otherwise
-            doc_number = classification.get("单据号", False)
-            if doc_number == True:
-                result["单据号"] = "待确认"
-            elif isinstance(doc_number, str):
-                result["单据号"] = doc_number
-            else:
-                result["单据号"] = ""
-
-            attachment = classification.get("附件", False)
-            if attachment == True:
-                result["附件"] = "待确认"
-            elif isinstance(attachment, str):
-                result["附件"] = attachment
-            else:
-                result["附件"] = ""
-
-            offline_payment = classification.get("是否登记线下付款表", False)
-            if offline_payment == True:
-                result["是否登记线下付款表"] = "待确认"
-            elif isinstance(offline_payment, str):
-                result["是否登记线下付款表"] = offline_payment
-            else:
-                result["是否登记线下付款表"] = ""
-
-            check_usage = classification.get("是否登记支票使用表", False)
-            if check_usage == True:
-                result["是否登记支票使用表"] = "待确认"
-            elif isinstance(check_usage, str):
-                result["是否登记支票使用表"] = check_usage
-            else:
-                result["是否登记支票使用表"] = ""
-
-            note = classification.get("备注", False)
-            if note == True:
-                result["备注"] = "待确认"
-            elif isinstance(note, str):
-                result["备注"] = note
-            else:
-                result["备注"] = ""
-
-            return result
-    
-    # Default if no rule matches - only 品名 is marked as pending
-    return {
-        "品名": "待确认",
-        "付款详情": "",
-        "单据号": "",
-        "附件": "",
-        "是否登记线下付款表": "",
-        "是否登记支票使用表": "",
-        "备注": ""
-    }
-
 def append_cibc_records_to_worksheet(wb, sheet_name: str, new_records: List[BankRecord]):
     """
     Append new CIBC records to a worksheet.
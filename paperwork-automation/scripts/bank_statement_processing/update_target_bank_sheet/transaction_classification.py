@@ -0,0 +1,33 @@
+import sys
+import os
+from typing import Dict
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+
+from type.bank_processing import BankRecord
+from configs.bank_statement.bank_transaction_rules import classify_transaction
+
+
+def match_transaction_rules(record: BankRecord) -> Dict:
+    """
+    Match a bank record against transaction rules to get classification data.
+
+    Shared by the BMO, CIBC and RBC sheet writers; rules are evaluated by the
+    compiled classifier in bank_transaction_rules (first match wins).
+
+    Args:
+        record: BankRecord to match
+
+    Returns:
+        Dictionary with classification data or default values
+    """
+    # Determine transaction type (credit or debit)
+    transaction_type = 'credit' if record.credit > 0 else 'debit' if record.debit > 0 else None
+
+    # Use full description for matching, fallback to short description
+    description = record.full_desctiption or record.short_desctiption or ""
+
+    # Use the absolute amount for matching
+    amount = abs(record.credit) if record.credit > 0 else abs(record.debit)
+
+    return classify_transaction(description, amount, transaction_type)
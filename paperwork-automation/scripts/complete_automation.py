@@ -7,7 +7,6 @@ Handles entire process: QBI scraping → data processing → database insertion
 import sys
 import os
 import argparse
-import subprocess
 import shutil
 from pathlib import Path
 from datetime import datetime
@@ -21,7 +20,9 @@ sys.path.insert(0, str(project_root))
 load_dotenv()
 
 from scripts.qbi_scraper_cli import scrape_qbi_data
+from scripts.generate_database_report import DatabaseReportGenerator
 from lib.qbi_scraper import QBIScraperError
+from lib.data_extraction import extract_daily_reports, extract_time_segments
 
 class AutomationWorkflowError(Exception):
     """Custom exception for automation workflow errors"""
@@ -104,7 +105,7 @@ class CompleteAutomationWorkflow:
     
     def step_2_process_data(self, mode: str = "enhanced") -> bool:
         """
-        Step 2: Process scraped data using extract-all.py
+        Step 2: Process scraped data (same extraction as scripts/extract_all.py)
         
         Args:
             mode: Processing mode (enhanced, all, daily, time)
@@ -118,35 +119,41 @@ class CompleteAutomationWorkflow:
         if not self.scraped_file:
             raise AutomationWorkflowError("Step 2 failed: No scraped file available")
         
+        # Which extractions each mode runs (same modes as scripts/extract_all.py)
+        mode_steps = {
+            'enhanced': (True, True),
+            'all': (True, True),
+            'daily': (True, False),
+            'time': (False, True)
+        }
+        
+        if mode not in mode_steps:
+            raise AutomationWorkflowError(f"Step 2 (Data Processing) failed: Invalid processing mode: {mode}")
+        run_daily, run_time = mode_steps[mode]
+        
         try:
-            # Determine command based on mode
-            mode_commands = {
-                'enhanced': f'python3 scripts/extract_all.py "{self.scraped_file}" --enhanced --direct-db',
-                'all': f'python3 scripts/extract_all.py "{self.scraped_file}" --direct-db',
-                'daily': f'python3 scripts/extract_all.py "{self.scraped_file}" --daily-only --direct-db',
-                'time': f'python3 scripts/extract_all.py "{self.scraped_file}" --time-only --direct-db'
-            }
-            
-            if mode not in mode_commands:
-                raise AutomationWorkflowError(f"Invalid processing mode: {mode}")
-            
-            command = mode_commands[mode]
-            print(f"🖥️  Running: {command}")
-            
             # Change to project root for processing
             original_cwd = os.getcwd()
             os.chdir(project_root)
             
-            # Run processing command
-            result = subprocess.run(command, shell=True, capture_output=True, text=True)
+            # Run extraction in this process, inserting directly to the database
+            success = True
+            if run_daily:
+                print("📊 Processing daily store report data...")
+                if not extract_daily_reports(input_file=str(self.scraped_file), direct_db=True):
+                    print("❌ Failed to process daily data")
+                    success = False
+            if run_time:
+                print("⏰ Processing time segment report data...")
+                if not extract_time_segments(input_file=str(self.scraped_file), direct_db=True):
+                    print("❌ Failed to process time segment data")
+                    success = False
             
-            if result.returncode == 0:
+            if success:
                 print("✅ Step 2 Complete: Data processing successful")
                 self.database_inserted = True
                 return True
             else:
-                print(f"❌ Processing command failed with exit code {result.returncode}")
-                print(f"Error output: {result.stderr}")
                 raise AutomationWorkflowError("Data processing failed")
                 
         except Exception as e:
@@ -173,25 +180,15 @@ class CompleteAutomationWorkflow:
             original_cwd = os.getcwd()
             os.chdir(project_root)
             
-            # Run report generation
-            command = f'python3 scripts/generate_database_report.py --target-date {self.target_date}'
-            print(f"🖥️  Running: {command}")
-            
-            result = subprocess.run(command, shell=True, capture_output=True, text=True)
+            # Run report generation in this process
+            output_path = DatabaseReportGenerator(self.target_date).generate_report()
             
-            if result.returncode == 0:
-                # Find generated report file
-                report_files = list(self.output_dir.glob(f"database_report_*.xlsx"))
-                if report_files:
-                    # Get the most recent report file
-                    self.report_generated = str(max(report_files, key=os.path.getctime))
-                    print(f"✅ Step 3 Complete: Report generated at {self.report_generated}")
-                    return self.report_generated
-                else:
-                    raise AutomationWorkflowError("Report file not found after generation")
+            if output_path:
+                self.report_generated = str(Path(output_path).resolve())
+                print(f"✅ Step 3 Complete: Report generated at {self.report_generated}")
+                return self.report_generated
             else:
-                print(f"❌ Report generation failed with exit code {result.returncode}")
-                print(f"Error output: {result.stderr}")
+                print("❌ Report generation failed")
                 raise AutomationWorkflowError("Report generation failed")
                 
         except Exception as e:
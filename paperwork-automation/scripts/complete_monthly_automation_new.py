@@ -19,7 +19,8 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from utils.database import DatabaseManager, DatabaseConfig
-from scripts.extract_combo_monthly_sales import extract_combo_data_from_excel, insert_to_database as insert_combo_to_database
+from lib.database_utils import IngestionLedger
+from scripts.dish_material.extract_data.extract_combo_sales_to_database import ComboSalesExtractor
 import logging
 import pandas as pd
 from datetime import datetime
@@ -53,11 +54,19 @@ logger = logging.getLogger(__name__)
 class MonthlyAutomationProcessor:
     """Complete monthly automation data processor."""
 
-    def __init__(self, is_test: bool = False):
-        """Initialize the processor."""
+    def __init__(self, is_test: bool = False, force: bool = False):
+        """
+        Initialize the processor.
+
+        Args:
+            is_test: Use the test database
+            force: Re-load input files even if the ingestion ledger shows them unchanged
+        """
         self.config = DatabaseConfig(is_test=is_test)
-        self.db_manager = DatabaseManager(self.config)
+        self.db_manager = DatabaseManager(self.config, pooled=True)
         self.input_folder = Path("Input/monthly_report")
+        self.ledger = IngestionLedger(self.db_manager, force=force)
+        self.target_date = None
         
         # Initialize store mapping
         self.store_mapping = self.get_store_mapping()
@@ -77,6 +86,7 @@ class MonthlyAutomationProcessor:
             'monthly_material_report': 0,
             'monthly_beverage_report': 0,
             'gross_margin_report': 0,
+            'skipped_files': [],
             'errors': []
         }
 
@@ -88,6 +98,23 @@ class MonthlyAutomationProcessor:
         else:
             logger.info(f"Processed {category}: {count}")
 
+    def target_year_month(self) -> Tuple[int, int]:
+        """Year and month of the target date (current month if not set)."""
+        if self.target_date:
+            target_dt = datetime.strptime(self.target_date, '%Y-%m-%d')
+        else:
+            target_dt = datetime.now()
+        return target_dt.year, target_dt.month
+
+    def skip_if_unchanged(self, source: str, file_paths: List[Path]) -> bool:
+        """Whether every file was already ingested for the target month; logs the skip."""
+        if not self.ledger.all_unchanged(source, file_paths, *self.target_year_month()):
+            return False
+        for file_path in file_paths:
+            logger.info(f"SKIP: {file_path.name} unchanged since last {source} load (use --force to reload)")
+            self.results['skipped_files'].append(f"{source}: {file_path.name}")
+        return True
+
     def get_store_mapping(self) -> Dict[str, int]:
         """Get store name to ID mapping."""
         store_mapping = {}
@@ -105,6 +132,9 @@ class MonthlyAutomationProcessor:
     def extract_dish_types_and_dishes(self, file_path: Path) -> bool:
         """Extract dish types, child types, dishes from monthly dish sales."""
         logger.info(f"DISH: Extracting dish data from: {file_path.name}")
+        if self.skip_if_unchanged('dish_sales', [file_path]):
+            return True
+        errors_before = len(self.results['errors'])
 
         try:
             # Read the Excel file - use the summary sheet which contains monthly aggregated data
@@ -328,6 +358,11 @@ class MonthlyAutomationProcessor:
 
                 safe_log(
                     logger.info, "SUCCESS: Dish extraction completed successfully")
+
+                # Rows that failed must be retried on the next run
+                if len(self.results['errors']) == errors_before:
+                    self.ledger.record('dish_sales', file_path, *self.target_year_month(), rows_read=len(df),
+                                       rows_written=dish_count + price_history_count + monthly_sales_count)
                 return True
 
         except Exception as e:
@@ -447,24 +482,20 @@ class MonthlyAutomationProcessor:
             combo_file = combo_files[0]
             logger.info(f"Processing combo file: {combo_file.name}")
 
-            # Extract combo data using the correct extraction logic
-            combo_data = extract_combo_data_from_excel(
-                str(combo_file), quiet=True)
+            # Extract and load combos and their dish sales in one pass
+            stats = ComboSalesExtractor(self.db_manager).extract_combo_sales_for_month(
+                *self.target_year_month(), input_file=str(combo_file))
 
-            if not combo_data["combos"] and not combo_data["combo_dish_sales"]:
+            if not stats.get('rows_processed'):
                 logger.warning("No combo data extracted")
                 return False
 
-            # Insert to database
-            success = insert_combo_to_database(
-                combo_data, is_test=self.config.is_test)
+            self.log_result('combos', stats['combos_created'] + stats['combos_validated'],
+                            "Extracted combos")
+            self.log_result('combo_dish_sales', stats['sales_created'] + stats['sales_updated'],
+                            "Extracted combo dish sales")
 
-            self.log_result('combos', len(
-                combo_data["combos"]), "Extracted combos")
-            self.log_result('combo_dish_sales', len(
-                combo_data["combo_dish_sales"]), "Extracted combo dish sales")
-
-            return success
+            return stats['errors'] == 0
 
         except Exception as e:
             logger.error(f"Error extracting combo data: {e}")
@@ -582,6 +613,13 @@ class MonthlyAutomationProcessor:
         logger.info(
             f"MATERIAL: Batch extracting material detail from store subfolders: {material_folder}")
 
+        # The batch script loads the whole folder, so it is skipped only when no store file changed
+        detail_files = sorted(
+            f for f in material_folder.glob("*/*")
+            if f.suffix.lower() in ('.xls', '.xlsx') and not f.name.startswith("~$"))
+        if self.skip_if_unchanged('material_detail', detail_files):
+            return True
+
         try:
             import subprocess
             import sys
@@ -636,6 +674,8 @@ class MonthlyAutomationProcessor:
                 self.log_result('material_price_history', prices_count,
                                 f"Extracted material prices from {stores_count} stores")
 
+                for detail_file in detail_files:
+                    self.ledger.record('material_detail', detail_file, *self.target_year_month())
                 return True
             else:
                 # Check if this is just a "materials not found" issue
@@ -711,6 +751,8 @@ class MonthlyAutomationProcessor:
 
                     # Process first Excel file found
                     excel_file = excel_files[0]
+                    if self.skip_if_unchanged('inventory', [excel_file]):
+                        continue
                     logger.info(f"Reading inventory file: {excel_file.name}")
 
                     # Read Excel file with automatic engine detection
@@ -730,6 +772,7 @@ class MonthlyAutomationProcessor:
                     with self.db_manager.get_connection() as conn:
                         cursor = conn.cursor()
                         successful_rows = 0
+                        failed_rows = 0
 
                         for _, row in df.iterrows():
                             try:
@@ -812,12 +855,18 @@ class MonthlyAutomationProcessor:
                                     f"Error processing inventory row for store {store_id}: {e}")
                                 # Rollback and start new transaction
                                 conn.rollback()
+                                failed_rows += 1
                                 continue
 
                         conn.commit()
                         logger.info(
                             f"Successfully processed {successful_rows} inventory records for store {store_id}")
 
+                    # A rollback discards earlier rows too, so only clean loads are recorded
+                    if failed_rows == 0:
+                        self.ledger.record('inventory', excel_file, *self.target_year_month(),
+                                           rows_read=len(df), rows_written=successful_rows)
+
                 except Exception as e:
                     logger.error(
                         f"Error processing store {store_folder.name}: {e}")
@@ -844,6 +893,8 @@ class MonthlyAutomationProcessor:
         """Extract dish-material relationships from calculated dish material usage."""
         logger.info(
             f"RELATION: Extracting dish-material relationships from: {file_path.name}")
+        if self.skip_if_unchanged('dish_material', [file_path]):
+            return True
 
         try:
             # Check if this is the new combined format or the old format
@@ -866,6 +917,7 @@ class MonthlyAutomationProcessor:
                 cursor = conn.cursor()
 
                 dish_material_count = 0
+                failed_rows = 0
 
                 for _, row in df.iterrows():
                     try:
@@ -978,16 +1030,18 @@ class MonthlyAutomationProcessor:
                         
                         # Store-specific processing using input file store_id
                         
+                        # Dishes are shared across stores; the store comes from the material.
+                        # A savepoint keeps one failed row from aborting the rest of the load.
+                        cursor.execute("SAVEPOINT dish_material_row")
                         try:
                             if dish_size:
                                 # Match by full_code AND size for the specific store from input
                                 cursor.execute("""
                                     INSERT INTO dish_material (dish_id, material_id, standard_quantity, loss_rate, unit_conversion_rate, store_id)
-                                    SELECT d.id, m.id, %s, %s, %s, d.store_id
+                                    SELECT d.id, m.id, %s, %s, %s, m.store_id
                                     FROM dish d, material m
                                     WHERE d.full_code = %s 
                                     AND d.size = %s
-                                    AND d.store_id = %s
                                     AND m.material_number = %s
                                     AND m.store_id = %s
                                     ON CONFLICT (dish_id, material_id, store_id) DO UPDATE SET
@@ -995,16 +1049,15 @@ class MonthlyAutomationProcessor:
                                         loss_rate = EXCLUDED.loss_rate,
                                         unit_conversion_rate = EXCLUDED.unit_conversion_rate,
                                         updated_at = CURRENT_TIMESTAMP
-                                """, (standard_qty, loss_rate, unit_conversion_rate, full_code, dish_size, input_store_id, material_number, input_store_id))
+                                """, (standard_qty, loss_rate, unit_conversion_rate, full_code, dish_size, material_number, input_store_id))
                             else:
                                 # Match by full_code only when no size specified for the specific store from input
                                 cursor.execute("""
                                     INSERT INTO dish_material (dish_id, material_id, standard_quantity, loss_rate, unit_conversion_rate, store_id)
-                                    SELECT d.id, m.id, %s, %s, %s, d.store_id
+                                    SELECT d.id, m.id, %s, %s, %s, m.store_id
                                     FROM dish d, material m
                                     WHERE d.full_code = %s 
                                     AND d.size IS NULL
-                                    AND d.store_id = %s
                                     AND m.material_number = %s
                                     AND m.store_id = %s
                                     ON CONFLICT (dish_id, material_id, store_id) DO UPDATE SET
@@ -1012,14 +1065,15 @@ class MonthlyAutomationProcessor:
                                         loss_rate = EXCLUDED.loss_rate,
                                         unit_conversion_rate = EXCLUDED.unit_conversion_rate,
                                         updated_at = CURRENT_TIMESTAMP
-                                """, (standard_qty, loss_rate, unit_conversion_rate, full_code, input_store_id, material_number, input_store_id))
+                                """, (standard_qty, loss_rate, unit_conversion_rate, full_code, material_number, input_store_id))
 
                             dish_material_count += cursor.rowcount
-                            
-                            # Count successful insertions
+                            cursor.execute("RELEASE SAVEPOINT dish_material_row")
 
                         except Exception as e:
                             logger.error(f"Error inserting dish-material for store {input_store_id}: {e}")
+                            cursor.execute("ROLLBACK TO SAVEPOINT dish_material_row")
+                            failed_rows += 1
                             continue
 
                         # Debug logging removed for production
@@ -1027,6 +1081,7 @@ class MonthlyAutomationProcessor:
                     except Exception as e:
                         logger.error(
                             f"Error processing dish-material relationship: {e}")
+                        failed_rows += 1
                         continue
 
                 # Commit the transaction to persist the dish-material relationships
@@ -1035,6 +1090,12 @@ class MonthlyAutomationProcessor:
                 self.log_result('dish_materials', dish_material_count,
                                 "Processed dish-material relationships")
 
+            # A file with failed rows is retried on the next run, so only clean loads are recorded
+            if failed_rows == 0:
+                self.ledger.record('dish_material', file_path, *self.target_year_month(),
+                                   rows_read=len(df), rows_written=dish_material_count)
+            else:
+                logger.warning(f"{failed_rows} dish-material rows failed; {file_path.name} will be reloaded")
             return True
 
         except Exception as e:
@@ -1511,6 +1572,9 @@ class MonthlyAutomationProcessor:
             f"SUCCESS: Inventory processing (System Record + Inventory Count): {self.results['inventory_counts']}")
         logger.info(
             f"SUCCESS: Dish-material relationships: {self.results['dish_materials']}")
+        if self.results['skipped_files']:
+            logger.info(
+                f"SKIPPED: Unchanged input files: {len(self.results['skipped_files'])}")
 
         # Report generation results
         material_report_count = self.results.get('monthly_material_report', 0)
@@ -1545,9 +1609,12 @@ def main():
                         default=datetime.now().strftime('%Y-%m-%d'))
     parser.add_argument('--inventory-count-date', type=str,
                         help='Inventory count date (YYYY-MM-DD). If not specified, uses target date.')
+    parser.add_argument('--force', action='store_true',
+                        help='Re-load input files that the ingestion ledger shows as unchanged '
+                             '(use after correcting master data)')
 
     args = parser.parse_args()
-    processor = MonthlyAutomationProcessor(is_test=args.test)
+    processor = MonthlyAutomationProcessor(is_test=args.test, force=args.force)
     success = processor.process_all(args.date, args.inventory_count_date)
 
     if success:
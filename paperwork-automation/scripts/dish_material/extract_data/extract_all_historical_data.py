@@ -3,21 +3,38 @@
 Extract all historical dish and material data from the history_files folder.
 
 This script automatically discovers and processes all available months in the
-history_files/monthly_report_inputs directory by calling run_all_extractions.py
-for each month, ensuring consistency with single-month processing.
+history_files/monthly_report_inputs directory by running the same extraction
+pipeline as run_all_extractions.py for each month, ensuring consistency with
+single-month processing. All months run in this process and share one
+database connection pool.
 
 It processes months in chronological order to ensure proper data dependencies.
+With --parallel, master data is loaded for every month first and the per-month
+fact loads then run across a process pool (see historical_backfill.py), with
+resumable per-(month, step) checkpoints.
 """
 
 import argparse
 import logging
 import sys
-import subprocess
 from pathlib import Path
 from typing import Dict, List, Tuple
 import re
 from datetime import datetime
 
+# Add project root to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
+
+from lib.config import CONNECTION_POOL_SIZE
+from utils.database import get_shared_database_manager
+from scripts.dish_material.extract_data.file_discovery import discover_all_files
+from scripts.dish_material.extract_data.extraction_pipeline import (
+    run_extraction_pipeline, get_database_statistics, print_database_statistics, print_step_timings
+)
+from scripts.dish_material.extract_data.historical_backfill import (
+    DEFAULT_CHECKPOINT_DIR, run_backfill, print_backfill_summary
+)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -62,13 +79,13 @@ def discover_available_months() -> List[Tuple[int, int]]:
 def run_extraction_for_month(year: int, month: int, test_db: bool = False, 
                             skip_options: List[str] = None) -> Dict[str, any]:
     """
-    Run the extraction for a specific month by calling run_all_extractions.py.
+    Run the extraction pipeline for a specific month.
     
     Args:
         year: Target year
         month: Target month
         test_db: Whether to use test database
-        skip_options: List of skip flags to pass (e.g., ['--skip-inventory'])
+        skip_options: List of run_all_extractions.py skip flags (e.g., ['--skip-inventory'])
         
     Returns:
         Dictionary with extraction results
@@ -78,51 +95,44 @@ def run_extraction_for_month(year: int, month: int, test_db: bool = False,
         'month': month,
         'success': False,
         'return_code': None,
-        'stdout': '',
-        'stderr': ''
+        'steps': [],
+        'database_statistics': None
     }
     
-    # Build the command
-    run_all_script = Path(__file__).parent / "run_all_extractions.py"
-    
-    cmd = [
-        sys.executable,
-        str(run_all_script),
-        '--year', str(year),
-        '--month', str(month)
-    ]
-    
-    if test_db:
-        cmd.append('--test')
-    
-    # Add skip options if provided
-    if skip_options:
-        cmd.extend(skip_options)
+    # '--skip-inventory' -> skip_inventory=True
+    skip_kwargs = {opt.lstrip('-').replace('-', '_'): True for opt in (skip_options or [])}
     
     logger.info(f"Running extraction for {year}-{month:02d}")
-    logger.debug(f"Command: {' '.join(cmd)}")
     
     try:
-        # Run the extraction script
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            cwd=Path(__file__).parent.parent.parent.parent  # Run from project root
+        # Same input files as run_all_extractions.py auto-discovery
+        discovered_files = discover_all_files(year, month)
+        
+        # Non-interactive: a failed required step ends the month
+        result = run_extraction_pipeline(
+            year,
+            month,
+            is_test=test_db,
+            dish_input=str(discovered_files['dish_sales']) if discovered_files.get('dish_sales') else None,
+            material_input=str(discovered_files['materials']) if discovered_files.get('materials') else None,
+            mapping_input=(str(discovered_files['dish_material_mapping'])
+                           if discovered_files.get('dish_material_mapping') else None),
+            has_inventory_files=bool(discovered_files.get('inventory')),
+            **skip_kwargs
         )
         
-        results['return_code'] = result.returncode
-        results['stdout'] = result.stdout
-        results['stderr'] = result.stderr
-        results['success'] = (result.returncode == 0)
+        results['success'] = result.success
+        results['return_code'] = 0 if result.success else 1
+        results['steps'] = result.steps
+        results['database_statistics'] = result.database_statistics
+        print_step_timings(result.steps)
         
         if results['success']:
             logger.info(f"  ✓ Successfully processed {year}-{month:02d}")
         else:
-            logger.error(f"  ✗ Failed to process {year}-{month:02d} (exit code: {result.returncode})")
-            if result.stderr:
-                logger.error(f"  Error output: {result.stderr[:500]}")  # First 500 chars of error
+            failed_steps = [step.name for step in result.steps if step.status == 'failed']
+            logger.error(f"  ✗ Failed to process {year}-{month:02d} "
+                         f"(failed steps: {', '.join(failed_steps) or 'none'})")
         
     except Exception as e:
         logger.error(f"Error running extraction for {year}-{month:02d}: {e}")
@@ -133,7 +143,10 @@ def run_extraction_for_month(year: int, month: int, test_db: bool = False,
 
 def extract_all_historical_data(start_year: int = None, start_month: int = None,
                                end_year: int = None, end_month: int = None,
-                               test_db: bool = False, skip_options: List[str] = None) -> Dict:
+                               test_db: bool = False, skip_options: List[str] = None,
+                               parallel: bool = False, workers: int = CONNECTION_POOL_SIZE,
+                               checkpoint_dir: Path = DEFAULT_CHECKPOINT_DIR,
+                               reset_checkpoints: bool = False) -> Dict:
     """
     Extract all historical data from the history_files folder.
     
@@ -143,7 +156,11 @@ def extract_all_historical_data(start_year: int = None, start_month: int = None,
         end_year: Optional end year
         end_month: Optional end month
         test_db: Whether to use test database
-        skip_options: List of skip flags to pass to run_all_extractions.py
+        skip_options: List of run_all_extractions.py skip flags
+        parallel: Load master data first, then the months' facts concurrently
+        workers: Worker processes (concurrent database writers) for parallel mode
+        checkpoint_dir: Checkpoint directory for parallel mode
+        reset_checkpoints: Ignore existing checkpoints in parallel mode
         
     Returns:
         Dictionary with overall extraction statistics
@@ -176,6 +193,20 @@ def extract_all_historical_data(start_year: int = None, start_month: int = None,
         'failed_months': []
     }
     
+    if parallel:
+        # '--skip-inventory' -> skip_inventory=True
+        skip_kwargs = {opt.lstrip('-').replace('-', '_'): True for opt in (skip_options or [])}
+        result = run_backfill(available_months, is_test=test_db, skip_options=skip_kwargs,
+                              workers=workers, checkpoint_dir=checkpoint_dir,
+                              reset_checkpoints=reset_checkpoints)
+        print_backfill_summary(result)
+        overall_stats['months_processed'] = len(available_months)
+        overall_stats['months_failed'] = len(result.failed_months)
+        overall_stats['months_successful'] = len(available_months) - len(result.failed_months)
+        overall_stats['month_results'] = result.records
+        overall_stats['failed_months'] = result.failed_months
+        return overall_stats
+    
     for year, month in available_months:
         logger.info(f"\n{'='*60}")
         logger.info(f"Processing {year}-{month:02d}")
@@ -188,19 +219,10 @@ def extract_all_historical_data(start_year: int = None, start_month: int = None,
         if month_result['success']:
             overall_stats['months_successful'] += 1
             
-            # Parse and display summary from stdout if available
-            if month_result['stdout']:
-                # Try to extract database statistics from the output
-                for line in month_result['stdout'].split('\n'):
-                    if 'Database Statistics:' in line:
-                        # Print the statistics section
-                        logger.info("  Database Statistics from extraction:")
-                        in_stats = True
-                        continue
-                    elif line.startswith('  ') and 'in_stats' in locals() and in_stats:
-                        logger.info(f"    {line.strip()}")
-                    elif line.startswith('=') and 'in_stats' in locals() and in_stats:
-                        break
+            if month_result['database_statistics']:
+                logger.info("  Database Statistics from extraction:")
+                for key, value in month_result['database_statistics'].items():
+                    logger.info(f"    {key.replace('_', ' ').title()}: {value:,}")
         else:
             overall_stats['months_failed'] += 1
             overall_stats['failed_months'].append(f"{year}-{month:02d}")
@@ -227,40 +249,9 @@ def print_summary(stats: Dict):
     
     # Get final database statistics if possible
     try:
-        # Add parent directories to path for imports
-        sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
-        from utils.database import DatabaseManager, DatabaseConfig
-        
         # Use the same database as specified in arguments
-        db_config = DatabaseConfig(is_test=stats.get('test_db', False))
-        db_manager = DatabaseManager(db_config)
-        
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Get counts
-            cursor.execute('SELECT COUNT(*) FROM dish')
-            dish_count = cursor.fetchone()['count']
-            
-            cursor.execute('SELECT COUNT(*) FROM dish WHERE broad_type IS NOT NULL')
-            dishes_with_broad_type = cursor.fetchone()['count']
-            
-            cursor.execute('SELECT COUNT(*) FROM material')
-            material_count = cursor.fetchone()['count']
-            
-            cursor.execute('SELECT COUNT(*) FROM dish_material')
-            mapping_count = cursor.fetchone()['count']
-            
-            cursor.execute('SELECT COUNT(*) FROM inventory_count')
-            inventory_count = cursor.fetchone()['count']
-            
-            print("\nFinal Database Statistics:")
-            print(f"  Dishes:                 {dish_count:,}")
-            print(f"  Dishes with Broad Type: {dishes_with_broad_type:,}")
-            print(f"  Materials:              {material_count:,}")
-            print(f"  Dish-Material Links:    {mapping_count:,}")
-            print(f"  Inventory Counts:       {inventory_count:,}")
-            
+        db_manager = get_shared_database_manager(is_test=stats.get('test_db', False))
+        print_database_statistics(get_database_statistics(db_manager), "Final Database Statistics")
     except Exception as e:
         logger.warning(f"Could not retrieve database statistics: {e}")
 
@@ -268,7 +259,7 @@ def print_summary(stats: Dict):
 def main():
     """Main entry point for the script."""
     parser = argparse.ArgumentParser(
-        description='Extract all historical dish and material data by calling run_all_extractions.py for each month'
+        description='Extract all historical dish and material data by running the extraction pipeline for each month'
     )
     parser.add_argument(
         '--start-year',
@@ -296,7 +287,7 @@ def main():
         help='Use test database'
     )
     
-    # Skip options to pass through to run_all_extractions.py
+    # Skip options applied to every month
     parser.add_argument(
         '--skip-dishes',
         action='store_true',
@@ -323,6 +314,30 @@ def main():
         help='Skip inventory extraction'
     )
     
+    # Parallel backfill
+    parser.add_argument(
+        '--parallel',
+        action='store_true',
+        help='Load master data for all months first, then month facts in parallel (resumable)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=CONNECTION_POOL_SIZE,
+        help=f'Worker processes / concurrent DB writers with --parallel (default: {CONNECTION_POOL_SIZE})'
+    )
+    parser.add_argument(
+        '--checkpoint-dir',
+        type=str,
+        default=str(DEFAULT_CHECKPOINT_DIR),
+        help='Checkpoint directory for --parallel'
+    )
+    parser.add_argument(
+        '--reset-checkpoints',
+        action='store_true',
+        help='Reload every month and step even if checkpointed (--parallel)'
+    )
+    
     args = parser.parse_args()
     
     # Validate month ranges
@@ -367,7 +382,11 @@ def main():
         end_year=args.end_year,
         end_month=args.end_month,
         test_db=args.test,
-        skip_options=skip_options
+        skip_options=skip_options,
+        parallel=args.parallel,
+        workers=args.workers,
+        checkpoint_dir=Path(args.checkpoint_dir),
+        reset_checkpoints=args.reset_checkpoints
     )
     
     stats['test_db'] = args.test  # Store for use in print_summary
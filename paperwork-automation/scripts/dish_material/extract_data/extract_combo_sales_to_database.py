@@ -9,11 +9,16 @@ Processing Steps:
 1. Create/update combo records
 2. Validate dishes exist in database
 3. Create combo-dish sales records in monthly_combo_dish_sale table
+
+Each step runs a fixed number of statements per file: combos and dishes are
+looked up once into dictionaries, and the sales are aggregated in pandas and
+upserted from a COPY-staged table.
 """
 
 import argparse
 import logging
 import sys
+import time
 from pathlib import Path
 from typing import Dict, List, Optional
 import pandas as pd
@@ -22,6 +27,7 @@ import pandas as pd
 sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
 
 from utils.database import DatabaseManager, DatabaseConfig
+from lib.database_utils import StagingLoader
 from lib.excel_utils import safe_read_excel, clean_dish_code
 from scripts.dish_material.extract_data.file_discovery import find_combo_sales_file
 from configs.dish_material.combo_sales_extraction import (
@@ -41,11 +47,16 @@ logger = logging.getLogger(__name__)
 class ComboSalesExtractor:
     """Extract combo sales from Excel files and store in database."""
 
+    COMBO_STAGING_TABLE = 'stg_combo'
+    SALES_STAGING_TABLE = 'stg_combo_dish_sale'
+
     def __init__(self, db_manager: DatabaseManager):
         """Initialize the combo sales extractor."""
         self.db_manager = db_manager
         self.combos_cache = {}  # Cache for combo lookups
-        self.dishes_cache = {}  # Cache for dish lookups
+        self.dishes_cache = {}  # Cache for dish lookups by code
+        self.dish_sizes_cache = {}  # Cache for dish lookups by (code, size)
+        self.phase_seconds = {}  # Duration of each step of the last extraction
 
     def extract_combo_sales_for_month(
         self,
@@ -88,11 +99,14 @@ class ComboSalesExtractor:
             'errors': 0
         }
 
+        self.phase_seconds = {}
+        started = time.perf_counter()
         try:
             logger.info(f"Reading file: {input_path}")
 
             # Read the Excel file
             df = self._read_and_process_excel(input_path, year, month)
+            self.phase_seconds['read'] = time.perf_counter() - started
             if df is None or df.empty:
                 logger.warning(f"No valid data in file: {input_path.name}")
                 return stats
@@ -105,17 +119,17 @@ class ComboSalesExtractor:
                 try:
                     # Step 1: Create/update combos
                     logger.info("Step 1: Creating/updating combos...")
-                    self._update_combos(conn, df, stats)
+                    self._timed('combos', self._update_combos, conn, df, stats)
 
                     # Step 2: Validate dishes exist
                     logger.info("Step 2: Validating dishes...")
-                    self._validate_dishes(conn, df, stats)
+                    self._timed('dishes', self._validate_dishes, conn, df, stats)
 
                     # Step 3: Create combo-dish sales records
                     logger.info("Step 3: Creating combo-dish sales...")
-                    self._create_combo_dish_sales(conn, df, year, month, stats)
+                    self._timed('sales', self._create_combo_dish_sales, conn, df, year, month, stats)
 
-                    conn.commit()
+                    self._timed('commit', conn.commit)
                     logger.info("All data committed successfully")
 
                 except Exception as e:
@@ -128,9 +142,20 @@ class ComboSalesExtractor:
             logger.error(f"Error reading {input_path}: {e}")
             stats['errors'] += 1
 
+        self.phase_seconds['total'] = time.perf_counter() - started
+        logger.info("Phase timings: " + ', '.join(
+            f"{phase} {seconds:.2f}s" for phase, seconds in self.phase_seconds.items()))
         logger.info(f"Extraction complete. Statistics: {stats}")
         return stats
 
+    def _timed(self, phase: str, step, *args):
+        """Run one step and record its duration in phase_seconds."""
+        started = time.perf_counter()
+        try:
+            return step(*args)
+        finally:
+            self.phase_seconds[phase] = time.perf_counter() - started
+
     def _read_and_process_excel(self, file_path: Path, year: int, month: int) -> Optional[pd.DataFrame]:
         """Read Excel file and normalize columns."""
         try:
@@ -204,56 +229,47 @@ class ComboSalesExtractor:
             logger.error("combo_code column is required")
             return
 
-        unique_combos = df[available_columns].drop_duplicates(subset=['combo_code'])
-
-        for _, combo_row in unique_combos.iterrows():
-            try:
-                combo_code = combo_row['combo_code']
-                if pd.isna(combo_code) or not combo_code:
-                    continue
-
-                # Check if combo exists
-                cursor.execute(
-                    "SELECT id FROM combo WHERE combo_code = %s",
-                    (combo_code,)
-                )
-                result = cursor.fetchone()
-
-                if result:
-                    combo_id = result['id']
-                    stats['combos_validated'] += 1
-                    
-                    # Optionally update combo name if different
-                    if 'combo_name' in combo_row and not pd.isna(combo_row['combo_name']):
-                        cursor.execute(
-                            "UPDATE combo SET name = %s WHERE id = %s",
-                            (combo_row['combo_name'], combo_id)
-                        )
-                else:
-                    # Create new combo
-                    combo_name = combo_row.get('combo_name', combo_code)
-                    if pd.isna(combo_name):
-                        combo_name = combo_code
-                    
-                    description = combo_row.get('combo_size', '')
-                    if pd.isna(description):
-                        description = ''
-                    
-                    cursor.execute(
-                        """INSERT INTO combo (combo_code, name, description, is_active)
-                           VALUES (%s, %s, %s, TRUE) RETURNING id""",
-                        (combo_code, combo_name, description)
-                    )
-                    combo_id = cursor.fetchone()['id']
-                    stats['combos_created'] += 1
-                    logger.debug(f"Created combo: {combo_code} - {combo_name}")
-
-                # Cache the combo ID
-                self.combos_cache[combo_code] = combo_id
-
-            except Exception as e:
-                logger.error(f"Error updating combo {combo_row.get('combo_code', 'UNKNOWN')}: {e}")
-                stats['errors'] += 1
+        combos = df[available_columns].copy()
+        combos = combos[combos['combo_code'].notna() & (combos['combo_code'].astype(str) != '')]
+        combos = combos.drop_duplicates(subset=['combo_code'])
+        if combos.empty:
+            return
+
+        blank = pd.Series(None, index=combos.index, dtype=object)
+        combos['combo_name'] = combos.get('combo_name', blank)
+        combos['description'] = combos.get('combo_size', blank).fillna('')
+
+        cursor.execute(
+            "SELECT id, combo_code FROM combo WHERE combo_code = ANY(%s)",
+            (combos['combo_code'].tolist(),)
+        )
+        self.combos_cache = {row['combo_code']: row['id'] for row in cursor.fetchall()}
+        stats['combos_validated'] += len(self.combos_cache)
+
+        StagingLoader.copy_to_temp_table(cursor, combos, self.COMBO_STAGING_TABLE, {
+            'combo_code': 'varchar',
+            'combo_name': 'varchar',
+            'description': 'varchar',
+        })
+
+        # Existing combos take the name from the file when it has one
+        cursor.execute(f"""
+            UPDATE combo c
+            SET name = s.combo_name
+            FROM {self.COMBO_STAGING_TABLE} s
+            WHERE c.combo_code = s.combo_code AND s.combo_name IS NOT NULL
+        """)
+
+        cursor.execute(f"""
+            INSERT INTO combo (combo_code, name, description, is_active)
+            SELECT s.combo_code, COALESCE(s.combo_name, s.combo_code), s.description, TRUE
+            FROM {self.COMBO_STAGING_TABLE} s
+            WHERE NOT EXISTS (SELECT 1 FROM combo c WHERE c.combo_code = s.combo_code)
+            RETURNING id, combo_code
+        """)
+        created = cursor.fetchall()
+        self.combos_cache.update({row['combo_code']: row['id'] for row in created})
+        stats['combos_created'] += len(created)
 
     def _validate_dishes(self, conn, df: pd.DataFrame, stats: Dict):
         """Step 2: Validate that dishes exist in database."""
@@ -263,128 +279,106 @@ class ComboSalesExtractor:
             logger.error("dish_code column is required")
             return
 
-        # Get unique dishes
-        dish_columns = ['dish_code', 'dish_name', 'dish_size']
-        available_columns = [col for col in dish_columns if col in df.columns]
-        
-        unique_dishes = df[available_columns].drop_duplicates(subset=['dish_code'])
-
-        for _, dish_row in unique_dishes.iterrows():
-            try:
-                dish_code = dish_row['dish_code']
-                if pd.isna(dish_code) or not dish_code:
-                    continue
-
-                # Check if dish exists
-                cursor.execute(
-                    "SELECT id FROM dish WHERE full_code = %s",
-                    (dish_code,)
-                )
-                result = cursor.fetchone()
-
-                if result:
-                    dish_id = result['id']
-                    stats['dishes_validated'] += 1
-                    self.dishes_cache[dish_code] = dish_id
-                else:
-                    # Log warning but don't create - dishes should come from dish extraction
-                    logger.warning(f"Dish not found: {dish_code} - {dish_row.get('dish_name', 'Unknown')}")
-                    stats['errors'] += 1
-
-            except Exception as e:
-                logger.error(f"Error validating dish {dish_row.get('dish_code', 'UNKNOWN')}: {e}")
-                stats['errors'] += 1
-
-    def _create_combo_dish_sales(self, conn, df: pd.DataFrame, year: int, month: int, stats: Dict):
-        """Step 3: Create combo-dish sales records."""
-        cursor = conn.cursor()
+        dish_codes = df['dish_code'].dropna()
+        dish_codes = dish_codes[dish_codes.astype(str) != ''].unique().tolist()
+        if not dish_codes:
+            return
 
-        # Group by combo, dish, and store
+        # Lowest ID first, so a code without a size match resolves like the old per-code lookup
+        cursor.execute(
+            """SELECT id, full_code, COALESCE(size, '') AS size
+               FROM dish WHERE full_code = ANY(%s) ORDER BY id""",
+            (dish_codes,)
+        )
+        for row in cursor.fetchall():
+            self.dishes_cache.setdefault(row['full_code'], row['id'])
+            self.dish_sizes_cache.setdefault((row['full_code'], row['size']), row['id'])
+
+        stats['dishes_validated'] += sum(1 for code in dish_codes if code in self.dishes_cache)
+        missing = [code for code in dish_codes if code not in self.dishes_cache]
+        if missing:
+            # Dishes should come from dish extraction, so they are not created here
+            names = (df[df['dish_code'].isin(missing)].drop_duplicates('dish_code')
+                     .set_index('dish_code').get('dish_name', pd.Series(dtype=object)))
+            sample = ', '.join(f"{code} - {names.get(code, 'Unknown')}" for code in missing[:10])
+            logger.warning(f"{len(missing)} dishes not found: {sample}")
+            stats['errors'] += len(missing)
+
+    def _sales_frame(self, df: pd.DataFrame) -> Optional[pd.DataFrame]:
+        """
+        Net quantity and tax per (combo, dish, store), with combo and dish IDs
+        resolved from the caches. A dish code matches its size first and the
+        code alone otherwise, so several file sizes can land on one dish row.
+        """
         grouping_cols = ['combo_code', 'dish_code', 'store_id']
         if not all(col in df.columns for col in grouping_cols):
             logger.error("Missing required columns for sales records")
-            return
+            return None
 
         # Aggregate quantities (sale - return = net) and tax
-        agg_dict = {}
         if 'net_quantity' in df.columns:
-            agg_dict['net_quantity'] = 'sum'
+            net_quantity = df['net_quantity']
         elif 'sale_quantity' in df.columns and 'return_quantity' in df.columns:
-            df['net_quantity'] = df['sale_quantity'] - df['return_quantity']
-            agg_dict['net_quantity'] = 'sum'
+            net_quantity = df['sale_quantity'] - df['return_quantity']
         else:
             logger.error("No quantity columns found")
+            return None
+
+        sales = pd.DataFrame({
+            'combo_code': df['combo_code'],
+            'dish_code': df['dish_code'],
+            'dish_size': df['dish_size'].fillna('').astype(str) if 'dish_size' in df.columns else '',
+            'store_id': df['store_id'],
+            'sale_amount': net_quantity.astype(float),
+            'tax_amount': df['tax'].astype(float) if 'tax' in df.columns else 0.0,
+        })
+        sales = sales.groupby(['combo_code', 'dish_code', 'dish_size', 'store_id'],
+                              as_index=False)[['sale_amount', 'tax_amount']].sum()
+
+        sales['combo_id'] = sales['combo_code'].map(self.combos_cache)
+        by_size = pd.Series([self.dish_sizes_cache.get(key) for key in zip(sales['dish_code'], sales['dish_size'])],
+                            index=sales.index, dtype=float)
+        sales['dish_id'] = by_size.fillna(sales['dish_code'].map(self.dishes_cache))
+
+        unresolved = sales['combo_id'].isna() | sales['dish_id'].isna()
+        if unresolved.any():
+            missing_combos = sales.loc[sales['combo_id'].isna(), 'combo_code'].unique()
+            missing_dishes = sales.loc[sales['dish_id'].isna(), 'dish_code'].unique()
+            logger.warning(f"Skipping {int(unresolved.sum())} sales rows: "
+                           f"combos not found {list(missing_combos[:10])}, dishes not found {list(missing_dishes[:10])}")
+
+        sales = sales[~unresolved].astype({'combo_id': int, 'dish_id': int, 'store_id': int})
+        return sales.groupby(['combo_id', 'dish_id', 'store_id'],
+                             as_index=False)[['sale_amount', 'tax_amount']].sum()
+
+    def _create_combo_dish_sales(self, conn, df: pd.DataFrame, year: int, month: int, stats: Dict):
+        """Step 3: Create combo-dish sales records."""
+        cursor = conn.cursor()
+
+        sales_data = self._sales_frame(df)
+        if sales_data is None or sales_data.empty:
             return
 
-        # Add tax aggregation if present
-        if 'tax' in df.columns:
-            agg_dict['tax'] = 'sum'
-
-        sales_data = df.groupby(grouping_cols).agg(agg_dict).reset_index()
-
-        for _, row in sales_data.iterrows():
-            try:
-                combo_code = row['combo_code']
-                dish_code = row['dish_code']
-                store_id = int(row['store_id'])
-                sale_amount = float(row['net_quantity'])
-                tax_amount = float(row.get('tax', 0))
-
-                # Get combo ID
-                combo_id = self.combos_cache.get(combo_code)
-                if not combo_id:
-                    logger.warning(f"Combo not found in cache: {combo_code}")
-                    continue
-
-                # Get dish ID
-                dish_id = self.dishes_cache.get(dish_code)
-                if not dish_id:
-                    # Try to look up in database
-                    cursor.execute(
-                        "SELECT id FROM dish WHERE full_code = %s",
-                        (dish_code,)
-                    )
-                    result = cursor.fetchone()
-                    if result:
-                        dish_id = result['id']
-                        self.dishes_cache[dish_code] = dish_id
-                    else:
-                        logger.warning(f"Dish not found: {dish_code}")
-                        continue
-
-                # Check if sales record exists
-                cursor.execute(
-                    """SELECT id FROM monthly_combo_dish_sale
-                       WHERE combo_id = %s AND dish_id = %s AND store_id = %s 
-                       AND month = %s AND year = %s""",
-                    (combo_id, dish_id, store_id, month, year)
-                )
-                result = cursor.fetchone()
-
-                if result:
-                    # Update existing record
-                    cursor.execute(
-                        """UPDATE monthly_combo_dish_sale
-                           SET sale_amount = %s, tax_amount = %s
-                           WHERE id = %s""",
-                        (sale_amount, tax_amount, result['id'])
-                    )
-                    stats['sales_updated'] += 1
-                else:
-                    # Create new record
-                    cursor.execute(
-                        """INSERT INTO monthly_combo_dish_sale
-                           (combo_id, dish_id, store_id, month, year, sale_amount, tax_amount)
-                           VALUES (%s, %s, %s, %s, %s, %s, %s)""",
-                        (combo_id, dish_id, store_id, month, year, sale_amount, tax_amount)
-                    )
-                    stats['sales_created'] += 1
-
-                logger.debug(f"Recorded sales: Combo {combo_code} -> Dish {dish_code} in store {store_id}: {sale_amount}")
-
-            except Exception as e:
-                logger.error(f"Error creating sales for combo {row.get('combo_code', 'UNKNOWN')}: {e}")
-                stats['errors'] += 1
+        StagingLoader.copy_to_temp_table(cursor, sales_data, self.SALES_STAGING_TABLE, {
+            'combo_id': 'integer',
+            'dish_id': 'integer',
+            'store_id': 'integer',
+            'sale_amount': 'numeric',
+            'tax_amount': 'numeric',
+        })
+
+        inserted, updated = StagingLoader.execute_upsert(cursor, f"""
+            INSERT INTO monthly_combo_dish_sale
+                (combo_id, dish_id, store_id, month, year, sale_amount, tax_amount)
+            SELECT s.combo_id, s.dish_id, s.store_id, %s, %s, s.sale_amount, s.tax_amount
+            FROM {self.SALES_STAGING_TABLE} s
+            ON CONFLICT (combo_id, dish_id, store_id, month, year) DO UPDATE SET
+                sale_amount = EXCLUDED.sale_amount,
+                tax_amount = EXCLUDED.tax_amount
+            RETURNING (xmax = 0) AS inserted
+        """, (month, year))
+        stats['sales_created'] += inserted
+        stats['sales_updated'] += updated
 
 
 def main():
@@ -452,6 +446,8 @@ def main():
     print(f"Sales Created:         {stats.get('sales_created', 0)}")
     print(f"Sales Updated:         {stats.get('sales_updated', 0)}")
     print(f"Errors:                {stats.get('errors', 0)}")
+    for phase, seconds in extractor.phase_seconds.items():
+        print(f"{phase.capitalize() + ' Time:':<23}{seconds:.2f}s")
     print("="*50)
 
     # Exit with error if there were any errors
@@ -6,10 +6,10 @@ This script processes the calculated dish material usage Excel files,
 extracting the relationship between dishes and materials including quantities.
 
 Processing Steps:
-1. Validate dishes exist in database (create if needed)
-2. Validate materials exist in database (create if needed)
-3. Create/update dish-material relationships with quantities
-4. Store serving sizes and waste percentages
+1. Validate dish types exist in database (create if needed)
+2. Validate dishes exist in database (create if needed, update serving sizes)
+3. Stage the mappings with COPY and resolve dish/material IDs with joins
+4. Report rows failing the store consistency check, upsert the rest in one statement
 """
 
 # Add parent directory to path for imports - MUST come before local imports
@@ -30,6 +30,7 @@ from configs.dish_material.dish_material_mapping import (
 )
 from lib.excel_utils import safe_read_excel, clean_dish_code
 from utils.database import DatabaseManager, DatabaseConfig
+from lib.database_utils import DimensionCache, StagingLoader, StoreMonthPnl
 from scripts.dish_material.extract_data.file_discovery import find_dish_material_mapping_file
 
 # Configure logging
@@ -43,13 +44,27 @@ logger = logging.getLogger(__name__)
 class DishMaterialExtractor:
     """Extract dish-material mappings from Excel files and store in database."""
 
-    def __init__(self, db_manager: DatabaseManager):
+    DISH_STAGING_TABLE = 'stg_mapping_dish'
+    MAPPING_STAGING_TABLE = 'stg_dish_material'
+    RESOLVED_TABLE = 'stg_dish_material_resolved'
+    ERROR_REPORT_COLUMNS = ['dish_code', 'dish_size', 'material_number', 'store_id', 'reason']
+    STORE_CONSISTENCY_TRIGGER = 'trigger_dish_material_store_consistency'
+    # row: check each upserted row as it is written
+    # deferred: check at commit (needs the constraint trigger from
+    #           migrations/add_deferrable_dish_material_trigger.sql)
+    # disabled: rely on the staged anti-join only (needs table ownership)
+    TRIGGER_MODES = ('row', 'deferred', 'disabled')
+
+    def __init__(self, db_manager: DatabaseManager, trigger_mode: str = 'row'):
         """Initialize the dish-material extractor."""
+        if trigger_mode not in self.TRIGGER_MODES:
+            raise ValueError(f"trigger_mode must be one of {self.TRIGGER_MODES}, got {trigger_mode!r}")
         self.db_manager = db_manager
-        self.dishes_cache = {}  # Cache for dish lookups
-        self.materials_cache = {}  # Cache for material lookups
+        self.trigger_mode = trigger_mode
         self.dish_types_cache = {}  # Cache for dish type lookups
         self.dish_child_types_cache = {}  # Cache for dish child type lookups
+        self.dimensions = DimensionCache()  # Dish type IDs, loaded once per run
+        self.error_report = pd.DataFrame(columns=self.ERROR_REPORT_COLUMNS)  # Rows skipped by the last load
 
     def extract_dish_material_mappings(
         self,
@@ -90,6 +105,7 @@ class DishMaterialExtractor:
             'materials_created': 0,
             'mappings_created': 0,
             'mappings_updated': 0,
+            'mappings_skipped': 0,
             'errors': 0
         }
 
@@ -115,12 +131,10 @@ class DishMaterialExtractor:
                     logger.info("Step 2: Validating dishes...")
                     self._validate_dishes(conn, df, stats)
 
-                    # Step 3: Skip material validation - materials are store-specific
-                    # and will be validated in the mapping step with proper store_id
-                    logger.info("Step 3: Skipping material validation (will validate with store_id in mapping step)")
-
+                    # Step 3: Materials are store-specific and resolved with their
+                    # store_id while staging the mappings
                     # Step 4: Create/update dish-material mappings
-                    logger.info("Step 4: Creating dish-material mappings...")
+                    logger.info("Steps 3-4: Staging and upserting dish-material mappings...")
                     self._create_dish_material_mappings(
                         conn, df, year, month, stats)
 
@@ -129,6 +143,7 @@ class DishMaterialExtractor:
 
                 except Exception as e:
                     conn.rollback()
+                    self.dimensions.invalidate()
                     logger.error(f"Error during processing, rolling back: {e}")
                     stats['errors'] += 1
                     raise
@@ -137,6 +152,12 @@ class DishMaterialExtractor:
             logger.error(f"Error reading {input_path}: {e}")
             stats['errors'] += 1
 
+        # Rebuild this month's store P&L summary from the freshly loaded data
+        try:
+            StoreMonthPnl.refresh(self.db_manager, year, month)
+        except Exception:
+            stats['errors'] += 1
+
         logger.info(f"Extraction complete. Statistics: {stats}")
         return stats
 
@@ -218,67 +239,30 @@ class DishMaterialExtractor:
             return
 
         # Get unique dish types, filtering out NaN values
-        df_filtered = df[df['dish_type_name'].notna()].copy()
+        df_filtered = df[df['dish_type_name'].notna()]
         if df_filtered.empty:
             return
 
-        unique_types = df_filtered[['dish_type_name',
-                                    'dish_child_type_name']].drop_duplicates()
+        type_names = df_filtered['dish_type_name'].astype(str)
+        type_ids, _ = self.dimensions.get_or_create(
+            cursor, 'dish_type', type_names.unique().tolist(), defaults={'is_active': True})
+        self.dish_types_cache.update(type_ids)
 
-        for _, row in unique_types.iterrows():
-            type_name = str(row['dish_type_name'])  # Ensure it's a string
-            child_type_name = row.get('dish_child_type_name')
-            if pd.isna(child_type_name):
-                child_type_name = None
+        # Check/create child types where present
+        if 'dish_child_type_name' not in df.columns:
+            return
 
-            try:
-                # Check/create main type
-                cursor.execute(
-                    "SELECT id FROM dish_type WHERE name = %s",
-                    (type_name,)
-                )
-                result = cursor.fetchone()
-
-                if not result:
-                    cursor.execute(
-                        """INSERT INTO dish_type (name, is_active) 
-                           VALUES (%s, TRUE) RETURNING id""",
-                        (type_name,)
-                    )
-                    type_id = cursor.fetchone()['id']
-                    logger.debug(f"Created dish type: {type_name}")
-                else:
-                    type_id = result['id']
-
-                self.dish_types_cache[type_name] = type_id
-
-                # Check/create child type if present
-                if child_type_name and not pd.isna(child_type_name):
-                    cursor.execute(
-                        """SELECT id FROM dish_child_type 
-                           WHERE name = %s AND dish_type_id = %s""",
-                        (child_type_name, type_id)
-                    )
-                    result = cursor.fetchone()
-
-                    if not result:
-                        cursor.execute(
-                            """INSERT INTO dish_child_type (name, dish_type_id, is_active)
-                               VALUES (%s, %s, TRUE) RETURNING id""",
-                            (child_type_name, type_id)
-                        )
-                        child_type_id = cursor.fetchone()['id']
-                        logger.debug(
-                            f"Created dish child type: {child_type_name}")
-                    else:
-                        child_type_id = result['id']
-
-                    self.dish_child_types_cache[(
-                        type_name, child_type_name)] = child_type_id
-
-            except Exception as e:
-                logger.error(f"Error validating dish type {type_name}: {e}")
-                stats['errors'] += 1
+        pairs = pd.DataFrame({'type_name': type_names,
+                              'child_type_name': df_filtered['dish_child_type_name']})
+        pairs = pairs[pairs['child_type_name'].notna()].drop_duplicates()
+        child_ids, _ = self.dimensions.get_or_create(
+            cursor, 'dish_child_type',
+            [(type_ids[type_name], child_name) for type_name, child_name in pairs.itertuples(index=False)],
+            defaults={'is_active': True})
+        for type_name, child_name in pairs.itertuples(index=False):
+            child_type_id = child_ids.get((type_ids[type_name], child_name))
+            if child_type_id:
+                self.dish_child_types_cache[(type_name, child_name)] = child_type_id
 
     def _validate_dishes(self, conn, df: pd.DataFrame, stats: Dict):
         """Step 2: Validate and create dishes if needed."""
@@ -293,307 +277,208 @@ class DishMaterialExtractor:
             logger.error("dish_code column is required")
             return
 
-        unique_dishes = df[available_columns].drop_duplicates(
-            subset=['dish_code', 'dish_size'] if 'dish_size' in available_columns else [
-                'dish_code']
-        )
-
-        for _, dish_row in unique_dishes.iterrows():
-            try:
-                dish_code = dish_row['dish_code']
-                if pd.isna(dish_code) or not dish_code:
-                    continue
-
-                dish_size = dish_row.get('dish_size', '')
-                if pd.isna(dish_size):
-                    dish_size = ''
-
-                # Check if dish exists
-                cursor.execute(
-                    """SELECT id FROM dish 
-                       WHERE full_code = %s AND COALESCE(size, '') = %s""",
-                    (dish_code, dish_size)
-                )
-                result = cursor.fetchone()
-
-                if result:
-                    dish_id = result['id']
-                    stats['dishes_validated'] += 1
-
-                    # Update serving size if provided
-                    if 'serving_size_kg' in dish_row and not pd.isna(dish_row['serving_size_kg']):
-                        cursor.execute(
-                            """UPDATE dish SET serving_size_kg = %s WHERE id = %s""",
-                            (float(dish_row['serving_size_kg']), dish_id)
-                        )
-                else:
-                    # Create new dish
-                    insert_columns = ['full_code', 'size', 'is_active']
-                    insert_values = [dish_code, dish_size, True]
-
-                    # Add dish name
-                    if 'dish_name' in dish_row and not pd.isna(dish_row['dish_name']):
-                        insert_columns.append('name')
-                        insert_values.append(dish_row['dish_name'])
-
-                    # Add short code
-                    if 'dish_short_code' in dish_row and not pd.isna(dish_row['dish_short_code']):
-                        insert_columns.append('short_code')
-                        insert_values.append(dish_row['dish_short_code'])
-
-                    # Add serving size
-                    if 'serving_size_kg' in dish_row and not pd.isna(dish_row['serving_size_kg']):
-                        insert_columns.append('serving_size_kg')
-                        insert_values.append(
-                            float(dish_row['serving_size_kg']))
-
-                    # Add dish child type if available
-                    if 'dish_type_name' in dish_row and 'dish_child_type_name' in dish_row:
-                        type_name = dish_row['dish_type_name']
-                        child_type_name = dish_row['dish_child_type_name']
-                        if not pd.isna(type_name) and not pd.isna(child_type_name):
-                            child_type_id = self.dish_child_types_cache.get(
-                                (type_name, child_type_name))
-                            if child_type_id:
-                                insert_columns.append('dish_child_type_id')
-                                insert_values.append(child_type_id)
-
-                    placeholders = ', '.join(['%s'] * len(insert_values))
-                    columns_str = ', '.join(insert_columns)
-
-                    cursor.execute(
-                        f"""INSERT INTO dish ({columns_str})
-                            VALUES ({placeholders}) RETURNING id""",
-                        insert_values
-                    )
-                    dish_id = cursor.fetchone()['id']
-                    stats['dishes_created'] += 1
-                    logger.debug(f"Created dish: {dish_code} (ID: {dish_id})")
-
-                # Cache the dish ID
-                self.dishes_cache[(dish_code, dish_size)] = dish_id
-
-            except Exception as e:
-                logger.error(
-                    f"Error validating dish {dish_row.get('dish_code', 'UNKNOWN')}: {e}")
-                stats['errors'] += 1
-
-    def _validate_materials(self, conn, df: pd.DataFrame, stats: Dict):
-        """Step 3: Validate and create materials if needed."""
-        cursor = conn.cursor()
-
-        if 'material_number' not in df.columns:
-            logger.error("material_number column is required")
+        dishes = df[available_columns].copy()
+        dishes = dishes[dishes['dish_code'].notna() & (dishes['dish_code'].astype(str) != '')]
+        blank = pd.Series(None, index=dishes.index, dtype=object)
+        dishes['dish_size'] = dishes.get('dish_size', blank).fillna('')
+        dishes = dishes.drop_duplicates(subset=['dish_code', 'dish_size'])
+        if dishes.empty:
             return
 
-        # Get unique materials
-        material_columns = ['material_number', 'material_description', 'unit']
-        available_columns = [
-            col for col in material_columns if col in df.columns]
-
-        unique_materials = df[available_columns].drop_duplicates(
-            subset=['material_number'])
-
-        for _, material_row in unique_materials.iterrows():
-            try:
-                material_number = str(material_row['material_number']).strip()
-                if pd.isna(material_number) or not material_number or material_number == 'nan':
-                    continue
-
-                # Remove leading zeros to match materials table
-                material_number = material_number.lstrip('0') or '0'
-
-                # Check if material exists for ANY store (we'll handle store-specific lookups later)
-                cursor.execute(
-                    "SELECT id, store_id FROM material WHERE material_number = %s",
-                    (material_number,)
-                )
-                result = cursor.fetchone()
-
-                if result:
-                    material_id = result['id']
-                    stats['materials_validated'] += 1
-                else:
-                    # Skip creating materials - they should already exist from material extraction
-                    # Materials without proper store_id and descriptions should not be created here
-                    logger.warning(f"Material {material_number} not found in database - skipping")
-                    stats['errors'] += 1
-                    continue
-
-                # Cache the material ID
-                self.materials_cache[material_number] = material_id
-
-            except Exception as e:
-                logger.error(
-                    f"Error validating material {material_row.get('material_number', 'UNKNOWN')}: {e}")
-                stats['errors'] += 1
-
-    def _create_dish_material_mappings(self, conn, df: pd.DataFrame, year: int, month: int, stats: Dict):
-        """Step 4: Create or update dish-material mappings."""
-        cursor = conn.cursor()
-        
-        # Track mappings per store for debugging
-        store_mapping_stats = {}
+        dishes['dish_child_type_id'] = [
+            self.dish_child_types_cache.get((type_name, child_type_name))
+            for type_name, child_type_name in zip(dishes.get('dish_type_name', blank),
+                                                  dishes.get('dish_child_type_name', blank))
+        ]
+        for col in ('dish_name', 'dish_short_code', 'serving_size_kg'):
+            if col not in dishes.columns:
+                dishes[col] = None
+
+        StagingLoader.copy_to_temp_table(cursor, dishes, self.DISH_STAGING_TABLE, {
+            'dish_code': 'varchar',
+            'dish_size': 'varchar',
+            'dish_name': 'varchar',
+            'dish_short_code': 'varchar',
+            'serving_size_kg': 'numeric',
+            'dish_child_type_id': 'integer',
+        })
+
+        # Existing dishes only take the serving size from the file
+        cursor.execute(f"""
+            UPDATE dish d
+            SET serving_size_kg = COALESCE(s.serving_size_kg, d.serving_size_kg)
+            FROM {self.DISH_STAGING_TABLE} s
+            WHERE d.full_code = s.dish_code AND COALESCE(d.size, '') = s.dish_size
+            RETURNING d.id
+        """)
+        stats['dishes_validated'] += len(cursor.fetchall())
+
+        cursor.execute(f"""
+            INSERT INTO dish (full_code, size, is_active, name, short_code,
+                              serving_size_kg, dish_child_type_id)
+            SELECT s.dish_code, s.dish_size, TRUE, s.dish_name, s.dish_short_code,
+                   s.serving_size_kg, s.dish_child_type_id
+            FROM {self.DISH_STAGING_TABLE} s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM dish d
+                WHERE d.full_code = s.dish_code AND COALESCE(d.size, '') = s.dish_size
+            )
+            RETURNING id
+        """)
+        stats['dishes_created'] += len(cursor.fetchall())
+
+    @staticmethod
+    def _mapping_frame(df: pd.DataFrame) -> Optional[pd.DataFrame]:
+        """
+        One row per (dish, size, material, store) with the quantities to store.
 
-        # Group by unique dish-material-store combinations
+        standard_quantity comes from 出品分量 and unit_conversion_rate from
+        物料单位 (0 or missing means 1). 损耗 above 2 is a percentage (10 ->
+        1.1); smaller non-zero values are already a loss rate.
+        """
         required_cols = ['dish_code', 'material_number', 'store_id']
         if not all(col in df.columns for col in required_cols):
             logger.error("Missing required columns for mappings")
-            return
+            return None
 
         # Add dish_size to grouping if available
         group_cols = ['dish_code', 'dish_size', 'material_number',
                       'store_id'] if 'dish_size' in df.columns else required_cols
 
-        # Aggregate data
-        agg_dict = {}
-        if 'serving_size_kg' in df.columns:
-            agg_dict['serving_size_kg'] = 'mean'  # Average if multiple entries
-        if 'waste_percentage' in df.columns:
-            agg_dict['waste_percentage'] = 'mean'
-        if 'material_unit' in df.columns:
-            agg_dict['material_unit'] = 'mean'
-
+        # Average if multiple entries
+        agg_dict = {col: 'mean' for col in ('serving_size_kg', 'waste_percentage', 'material_unit')
+                    if col in df.columns}
         if agg_dict:
             mapping_data = df.groupby(group_cols).agg(agg_dict).reset_index()
         else:
-            mapping_data = df[group_cols].drop_duplicates()
-
-        for _, row in mapping_data.iterrows():
-            try:
-                dish_code = row['dish_code']
-                dish_size = row.get('dish_size', '')
-                if pd.isna(dish_size):
-                    dish_size = ''
-
-                material_number = str(row['material_number']).strip()
-                # Remove leading zeros to match materials table
-                material_number = material_number.lstrip('0') or '0'
-                store_id = int(row['store_id'])
-
-                # Get dish ID
-                dish_id = self.dishes_cache.get((dish_code, dish_size))
-                if not dish_id:
-                    cursor.execute(
-                        """SELECT id FROM dish 
-                           WHERE full_code = %s AND COALESCE(size, '') = %s""",
-                        (dish_code, dish_size)
-                    )
-                    result = cursor.fetchone()
-                    if result:
-                        dish_id = result['id']
-                        self.dishes_cache[(dish_code, dish_size)] = dish_id
-                    else:
-                        logger.warning(
-                            f"Dish not found for mapping: {dish_code} (size: {dish_size})")
-                        continue
-
-                # Get material ID for this specific store
-                cache_key = (material_number, store_id)
-                material_id = self.materials_cache.get(cache_key)
-                if not material_id:
-                    cursor.execute(
-                        "SELECT id FROM material WHERE material_number = %s AND store_id = %s",
-                        (material_number, store_id)
-                    )
-                    result = cursor.fetchone()
-                    if result:
-                        material_id = result['id']
-                        self.materials_cache[cache_key] = material_id
-                    else:
-                        logger.warning(
-                            f"Material not found for mapping: {material_number} in store {store_id}")
-                        continue
-
-                # Prepare mapping data
-                # Use serving_size_kg (出品分量) as the standard quantity
-                standard_quantity = row.get('serving_size_kg', 1.0)
-                if pd.isna(standard_quantity) or standard_quantity == 0:
-                    standard_quantity = 1.0
-                
-                # Use material_unit (物料单位) as the unit conversion rate
-                unit_conversion_rate = row.get('material_unit', 1.0)
-                if pd.isna(unit_conversion_rate) or unit_conversion_rate == 0:
-                    unit_conversion_rate = 1.0
-
-                # Loss rate from waste_percentage (损耗)
-                # The waste_percentage should be converted to loss_rate
-                # If waste_percentage is already in decimal format (e.g., 1.1 for 10% loss), use it directly
-                # If it's in percentage format (e.g., 10 for 10%), convert it
-                loss_rate = 1.0
-                if 'waste_percentage' in row and not pd.isna(row['waste_percentage']):
-                    waste_val = float(row['waste_percentage'])
-                    # Only process non-zero values
-                    if waste_val != 0:
-                        # If the value is greater than 2, it's likely in percentage format (e.g., 10 for 10%)
-                        # Convert to decimal format (1.1 for 10% loss)
-                        if waste_val > 2:
-                            loss_rate = 1 + (waste_val / 100)
-                        else:
-                            # Already in decimal format (e.g., 1.1 for 10% loss)
-                            loss_rate = waste_val
-                        
-                        # Log the conversion for debugging
-                        if waste_val != loss_rate:
-                            logger.debug(f"Converted waste_percentage {waste_val} to loss_rate {loss_rate} for dish {dish_code}")
-
-                # Check if mapping exists
-                cursor.execute(
-                    """SELECT id FROM dish_material 
-                       WHERE dish_id = %s AND material_id = %s AND store_id = %s""",
-                    (dish_id, material_id, store_id)
+            mapping_data = df[group_cols].drop_duplicates().reset_index(drop=True)
+
+        if 'dish_size' not in mapping_data.columns:
+            mapping_data['dish_size'] = ''
+        mapping_data['dish_size'] = mapping_data['dish_size'].fillna('')
+        mapping_data['material_number'] = (
+            mapping_data['material_number'].astype(str).str.strip().str.lstrip('0').replace('', '0'))
+
+        def rate(col):
+            values = mapping_data[col] if col in mapping_data.columns else pd.Series(0.0, index=mapping_data.index)
+            return values.astype(float).fillna(0.0)
+
+        serving = rate('serving_size_kg')
+        mapping_data['standard_quantity'] = serving.where(serving != 0, 1.0)
+        unit = rate('material_unit')
+        mapping_data['unit_conversion_rate'] = unit.where(unit != 0, 1.0)
+        waste = rate('waste_percentage')
+        mapping_data['loss_rate'] = waste.where(waste <= 2, 1 + waste / 100).where(waste != 0, 1.0)
+
+        mapping_data.insert(0, 'row_no', range(len(mapping_data)))
+        return mapping_data
+
+    def _set_store_consistency_trigger(self, cursor, enabled: bool):
+        """Switch trigger_dish_material_store_consistency for the bulk upsert."""
+        if self.trigger_mode == 'deferred' and not enabled:
+            # Runs the per-row checks once at commit instead of inside the upsert
+            cursor.execute(f"SET CONSTRAINTS {self.STORE_CONSISTENCY_TRIGGER} DEFERRED")
+        elif self.trigger_mode == 'disabled':
+            # ALTER TABLE is transactional: a rollback also re-enables the trigger
+            action = 'ENABLE' if enabled else 'DISABLE'
+            cursor.execute(f"ALTER TABLE dish_material {action} TRIGGER {self.STORE_CONSISTENCY_TRIGGER}")
+
+    def _create_dish_material_mappings(self, conn, df: pd.DataFrame, year: int, month: int, stats: Dict):
+        """Step 4: Create or update dish-material mappings."""
+        cursor = conn.cursor()
+
+        mapping_data = self._mapping_frame(df)
+        if mapping_data is None or mapping_data.empty:
+            return
+
+        StagingLoader.copy_to_temp_table(cursor, mapping_data, self.MAPPING_STAGING_TABLE, {
+            'row_no': 'integer',
+            'dish_code': 'varchar',
+            'dish_size': 'varchar',
+            'material_number': 'varchar',
+            'store_id': 'integer',
+            'standard_quantity': 'numeric',
+            'loss_rate': 'numeric',
+            'unit_conversion_rate': 'numeric',
+        })
+
+        # Dishes are shared across stores; materials are looked up in the row's store
+        cursor.execute(f"DROP TABLE IF EXISTS {self.RESOLVED_TABLE}")
+        cursor.execute(f"""
+            CREATE TEMP TABLE {self.RESOLVED_TABLE} ON COMMIT DROP AS
+            SELECT s.*, d.id AS dish_id, m.id AS material_id
+            FROM {self.MAPPING_STAGING_TABLE} s
+            LEFT JOIN LATERAL (
+                SELECT id FROM dish
+                WHERE full_code = s.dish_code AND COALESCE(size, '') = s.dish_size
+                ORDER BY id
+                LIMIT 1
+            ) d ON TRUE
+            LEFT JOIN material m
+                ON m.material_number = s.material_number AND m.store_id = s.store_id
+        """)
+
+        # The store consistency trigger's rule as one anti-join: every row that
+        # would fail it, or has no dish, is reported instead of loaded
+        cursor.execute(f"""
+            SELECT r.dish_code, r.dish_size, r.material_number, r.store_id,
+                   CASE
+                       WHEN r.dish_id IS NULL THEN 'dish_not_found'
+                       WHEN EXISTS (SELECT 1 FROM material o WHERE o.material_number = r.material_number)
+                           THEN 'material_not_in_store'
+                       ELSE 'material_not_found'
+                   END AS reason
+            FROM {self.RESOLVED_TABLE} r
+            WHERE r.dish_id IS NULL
+                OR NOT EXISTS (
+                    SELECT 1 FROM material m
+                    WHERE m.id = r.material_id AND m.store_id = r.store_id
                 )
-                result = cursor.fetchone()
-
-                if result:
-                    # Update existing mapping
-                    cursor.execute(
-                        """UPDATE dish_material 
-                           SET standard_quantity = %s, loss_rate = %s, unit_conversion_rate = %s
-                           WHERE id = %s""",
-                        (standard_quantity, loss_rate, unit_conversion_rate, result['id'])
-                    )
-                    stats['mappings_updated'] += 1
-                    
-                    # Track per store
-                    if store_id not in store_mapping_stats:
-                        store_mapping_stats[store_id] = {'created': 0, 'updated': 0}
-                    store_mapping_stats[store_id]['updated'] += 1
-                    
-                    logger.debug(
-                        f"Updated mapping for dish {dish_code} to material {material_number} (store {store_id}): "
-                        f"standard_qty={standard_quantity}, loss_rate={loss_rate}, unit_conv={unit_conversion_rate}"
-                    )
-                else:
-                    # Create new mapping
-                    cursor.execute(
-                        """INSERT INTO dish_material 
-                           (dish_id, material_id, store_id, standard_quantity, loss_rate, unit_conversion_rate)
-                           VALUES (%s, %s, %s, %s, %s, %s)""",
-                        (dish_id, material_id, store_id, standard_quantity, loss_rate, unit_conversion_rate)
-                    )
-                    stats['mappings_created'] += 1
-                    
-                    # Track per store
-                    if store_id not in store_mapping_stats:
-                        store_mapping_stats[store_id] = {'created': 0, 'updated': 0}
-                    store_mapping_stats[store_id]['created'] += 1
-                    
-                    logger.debug(
-                        f"Created mapping for dish {dish_code} to material {material_number} (store {store_id}): "
-                        f"standard_qty={standard_quantity}, loss_rate={loss_rate}, unit_conv={unit_conversion_rate}"
-                    )
-
-            except Exception as e:
-                logger.error(
-                    f"Error creating mapping for dish {row.get('dish_code', 'UNKNOWN')}: {e}")
-                stats['errors'] += 1
-        
+            ORDER BY r.row_no
+        """)
+        self.error_report = pd.DataFrame(cursor.fetchall(), columns=self.ERROR_REPORT_COLUMNS)
+        stats['mappings_skipped'] += len(self.error_report)
+        if not self.error_report.empty:
+            counts = self.error_report['reason'].value_counts().to_dict()
+            sample = ', '.join(
+                f"{row.dish_code}/{row.material_number} (store {row.store_id}: {row.reason})"
+                for row in self.error_report.head(10).itertuples())
+            logger.warning(f"{len(self.error_report)} mappings skipped {counts}: {sample}")
+
+        # A dish/material pair listed twice for a store keeps its last row
+        self._set_store_consistency_trigger(cursor, enabled=False)
+        cursor.execute(f"""
+            INSERT INTO dish_material
+                (dish_id, material_id, store_id, standard_quantity, loss_rate, unit_conversion_rate)
+            SELECT DISTINCT ON (r.dish_id, r.material_id, r.store_id)
+                r.dish_id, r.material_id, r.store_id,
+                r.standard_quantity, r.loss_rate, r.unit_conversion_rate
+            FROM {self.RESOLVED_TABLE} r
+            WHERE r.dish_id IS NOT NULL AND r.material_id IS NOT NULL
+            ORDER BY r.dish_id, r.material_id, r.store_id, r.row_no DESC
+            ON CONFLICT (dish_id, material_id, store_id) DO UPDATE SET
+                standard_quantity = EXCLUDED.standard_quantity,
+                loss_rate = EXCLUDED.loss_rate,
+                unit_conversion_rate = EXCLUDED.unit_conversion_rate
+            RETURNING dish_material.store_id, (xmax = 0) AS inserted
+        """)
+        written = pd.DataFrame(cursor.fetchall(), columns=['store_id', 'inserted'])
+        self._set_store_consistency_trigger(cursor, enabled=True)
+
+        created = int(written['inserted'].astype(bool).sum())
+        stats['mappings_created'] += created
+        stats['mappings_updated'] += len(written) - created
+
         # Log summary per store
         logger.info("Mapping statistics per store:")
-        for store_id in sorted(store_mapping_stats.keys()):
-            store_stats = store_mapping_stats[store_id]
-            logger.info(f"  Store {store_id}: {store_stats['created']} created, {store_stats['updated']} updated")
+        per_store = written.assign(inserted=written['inserted'].astype(bool)).groupby('store_id')['inserted']
+        for store_id, inserted in per_store:
+            logger.info(f"  Store {store_id}: {int(inserted.sum())} created, {int((~inserted).sum())} updated")
+
+    def write_error_report(self, path: str):
+        """Save the rows the last load skipped as CSV."""
+        self.error_report.to_csv(path, index=False, encoding='utf-8-sig')
+        logger.info(f"Wrote {len(self.error_report)} skipped mappings to {path}")
 
 
 def main():
@@ -623,6 +508,17 @@ def main():
         action='store_true',
         help='Use test database'
     )
+    parser.add_argument(
+        '--trigger-mode',
+        choices=DishMaterialExtractor.TRIGGER_MODES,
+        default='row',
+        help='How the store consistency trigger runs during the bulk upsert (default: row)'
+    )
+    parser.add_argument(
+        '--error-report',
+        type=str,
+        help='Write skipped mappings (missing dish/material, wrong store) to this CSV file'
+    )
 
     args = parser.parse_args()
 
@@ -644,12 +540,14 @@ def main():
         f"Connected to {'test' if args.test else 'production'} database")
 
     # Create extractor and process files
-    extractor = DishMaterialExtractor(db_manager)
+    extractor = DishMaterialExtractor(db_manager, trigger_mode=args.trigger_mode)
     stats = extractor.extract_dish_material_mappings(
         args.year,
         args.month,
         args.input_file
     )
+    if args.error_report:
+        extractor.write_error_report(args.error_report)
 
     # Print summary
     print("\n" + "="*50)
@@ -662,6 +560,7 @@ def main():
     print(f"Materials Created:     {stats.get('materials_created', 0)}")
     print(f"Mappings Created:      {stats.get('mappings_created', 0)}")
     print(f"Mappings Updated:      {stats.get('mappings_updated', 0)}")
+    print(f"Mappings Skipped:      {stats.get('mappings_skipped', 0)}")
     print(f"Errors:                {stats.get('errors', 0)}")
     print("="*50)
 
@@ -23,6 +23,7 @@ import pandas as pd
 sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
 
 from utils.database import DatabaseManager, DatabaseConfig
+from lib.database_utils import DimensionCache, StoreMonthPnl
 from lib.excel_utils import safe_read_excel, clean_dish_code
 from configs.dish_material.dish_sales_extraction import (
     DISH_COLUMN_MAPPINGS,
@@ -48,13 +49,15 @@ class DishExtractor:
         self.db_manager = db_manager
         self.dish_types_cache = {}  # Cache for dish type lookups
         self.dish_child_types_cache = {}  # Cache for dish child type lookups
-        self.dishes_cache = {}  # Cache for dish lookups
+        self.dimensions = DimensionCache()  # Dish type and dish IDs, loaded once per run
 
     def extract_dishes_for_month(
         self,
         year: int,
         month: int,
-        input_dir: Optional[str] = None
+        input_dir: Optional[str] = None,
+        phase: str = 'all',
+        deactivate_old_prices: bool = True
     ) -> Dict[str, int]:
         """
         Extract dishes for a specific year and month.
@@ -63,6 +66,11 @@ class DishExtractor:
             year: Target year
             month: Target month (1-12)
             input_dir: Directory containing Excel files or path to a single Excel file (optional)
+            phase: 'all', 'master' (dish types and dishes only) or 'facts'
+                (prices, sales and P&L refresh; dishes must already exist)
+            deactivate_old_prices: Mark earlier months' prices inactive. A
+                parallel backfill turns this off and activates the latest
+                price per dish once all months are loaded.
 
         Returns:
             Dictionary with extraction statistics
@@ -178,31 +186,42 @@ class DishExtractor:
         # Process in steps
         with self.db_manager.get_connection() as conn:
             try:
-                # Step 1: Update dish_type and dish_child_type tables
-                logger.info("Step 1: Updating dish types...")
-                self._update_dish_types(conn, combined_df, stats)
+                if phase in ('all', 'master'):
+                    # Step 1: Update dish_type and dish_child_type tables
+                    logger.info("Step 1: Updating dish types...")
+                    self._update_dish_types(conn, combined_df, stats)
 
-                # Step 2: Update dish tables
-                logger.info("Step 2: Updating dishes...")
-                self._update_dishes(conn, combined_df, stats)
+                    # Step 2: Update dish tables
+                    logger.info("Step 2: Updating dishes...")
+                    self._update_dishes(conn, combined_df, stats)
 
-                # Step 3: Update dish price history
-                logger.info("Step 3: Updating dish prices...")
-                self._update_dish_prices(conn, combined_df, year, month, stats)
+                if phase in ('all', 'facts'):
+                    # Step 3: Update dish price history
+                    logger.info("Step 3: Updating dish prices...")
+                    self._update_dish_prices(conn, combined_df, year, month, stats,
+                                             deactivate_old_prices)
 
-                # Step 4: Update dish sales
-                logger.info("Step 4: Updating dish sales...")
-                self._update_dish_sales(conn, combined_df, year, month, stats)
+                    # Step 4: Update dish sales
+                    logger.info("Step 4: Updating dish sales...")
+                    self._update_dish_sales(conn, combined_df, year, month, stats)
 
                 conn.commit()
                 logger.info("All data committed successfully")
 
             except Exception as e:
                 conn.rollback()
+                self.dimensions.invalidate()
                 logger.error(f"Error during processing, rolling back: {e}")
                 stats['errors'] += 1
                 raise
 
+        # Rebuild this month's store P&L summary from the freshly loaded data
+        if phase != 'master':
+            try:
+                StoreMonthPnl.refresh(self.db_manager, year, month)
+            except Exception:
+                stats['errors'] += 1
+
         logger.info(f"Extraction complete. Statistics: {stats}")
         return stats
 
@@ -309,68 +328,30 @@ class DishExtractor:
         cursor = conn.cursor()
 
         # Get unique dish types
-        if 'dish_type_name' in df.columns:
-            unique_types = df['dish_type_name'].dropna().unique()
+        if 'dish_type_name' not in df.columns:
+            return
 
-            for type_name in unique_types:
-                try:
-                    # Check if type exists
-                    cursor.execute(
-                        "SELECT id FROM dish_type WHERE name = %s",
-                        (type_name,)
-                    )
-                    result = cursor.fetchone()
+        type_ids, created = self.dimensions.get_or_create(
+            cursor, 'dish_type', df['dish_type_name'].dropna().unique().tolist(),
+            defaults={'is_active': True})
+        stats['dish_types_created'] += created
+        self.dish_types_cache.update(type_ids)
 
-                    if not result:
-                        # Insert new type
-                        cursor.execute(
-                            """INSERT INTO dish_type (name, is_active) 
-                               VALUES (%s, TRUE) RETURNING id""",
-                            (type_name,)
-                        )
-                        type_id = cursor.fetchone()['id']
-                        stats['dish_types_created'] += 1
-                        logger.debug(
-                            f"Created dish type: {type_name} (ID: {type_id})")
-                    else:
-                        type_id = result['id']
-
-                    self.dish_types_cache[type_name] = type_id
-
-                    # Now handle child types for this parent type
-                    if 'dish_child_type_name' in df.columns:
-                        child_types = df[df['dish_type_name'] ==
-                                         type_name]['dish_child_type_name'].dropna().unique()
-
-                        for child_type_name in child_types:
-                            # Check if child type exists
-                            cursor.execute(
-                                """SELECT id FROM dish_child_type 
-                                   WHERE name = %s AND dish_type_id = %s""",
-                                (child_type_name, type_id)
-                            )
-                            result = cursor.fetchone()
-
-                            if not result:
-                                # Insert new child type
-                                cursor.execute(
-                                    """INSERT INTO dish_child_type (name, dish_type_id, is_active) 
-                                       VALUES (%s, %s, TRUE) RETURNING id""",
-                                    (child_type_name, type_id)
-                                )
-                                child_type_id = cursor.fetchone()['id']
-                                stats['dish_child_types_created'] += 1
-                                logger.debug(
-                                    f"Created dish child type: {child_type_name} (ID: {child_type_id})")
-                            else:
-                                child_type_id = result['id']
-
-                            self.dish_child_types_cache[(
-                                type_name, child_type_name)] = child_type_id
+        # Now handle child types for their parent types
+        if 'dish_child_type_name' not in df.columns:
+            return
 
-                except Exception as e:
-                    logger.error(f"Error updating dish type {type_name}: {e}")
-                    stats['errors'] += 1
+        pairs = df[['dish_type_name', 'dish_child_type_name']].dropna().drop_duplicates()
+        pairs = pairs[pairs['dish_type_name'].isin(type_ids)]
+        child_ids, created = self.dimensions.get_or_create(
+            cursor, 'dish_child_type',
+            [(type_ids[type_name], child_name) for type_name, child_name in pairs.itertuples(index=False)],
+            defaults={'is_active': True})
+        stats['dish_child_types_created'] += created
+        for type_name, child_name in pairs.itertuples(index=False):
+            child_type_id = child_ids.get((type_ids[type_name], child_name))
+            if child_type_id:
+                self.dish_child_types_cache[(type_name, child_name)] = child_type_id
 
     def _update_dishes(self, conn, df: pd.DataFrame, stats: Dict):
         """Step 2: Update dish tables."""
@@ -409,16 +390,10 @@ class DishExtractor:
                 if pd.isna(size):
                     size = ''
 
-                cursor.execute(
-                    """SELECT id FROM dish 
-                       WHERE full_code = %s AND COALESCE(size, '') = %s""",
-                    (full_code, size)
-                )
-                result = cursor.fetchone()
+                dish_id = self.dimensions.get(cursor, 'dish', (full_code, size))
 
-                if result:
+                if dish_id:
                     # Update existing dish
-                    dish_id = result['id']
                     update_fields = []
                     update_values = []
 
@@ -496,14 +471,15 @@ class DishExtractor:
                     logger.debug(f"Created dish: {full_code} (ID: {dish_id})")
 
                 # Cache the dish ID
-                self.dishes_cache[(full_code, size)] = dish_id
+                self.dimensions.add('dish', (full_code, size), dish_id)
 
             except Exception as e:
                 logger.error(
                     f"Error updating dish {dish_row.get('full_code', 'UNKNOWN')}: {e}")
                 stats['errors'] += 1
 
-    def _update_dish_prices(self, conn, df: pd.DataFrame, year: int, month: int, stats: Dict):
+    def _update_dish_prices(self, conn, df: pd.DataFrame, year: int, month: int, stats: Dict,
+                            deactivate_old_prices: bool = True):
         """Step 3: Update dish price history."""
         cursor = conn.cursor()
 
@@ -527,33 +503,23 @@ class DishExtractor:
                     size = ''
 
                 # Get dish ID from cache
-                dish_id = self.dishes_cache.get((full_code, size))
+                dish_id = self.dimensions.get(cursor, 'dish', (full_code, size))
                 if not dish_id:
-                    # Look up in database
-                    cursor.execute(
-                        """SELECT id FROM dish 
-                           WHERE full_code = %s AND COALESCE(size, '') = %s""",
-                        (full_code, size)
-                    )
-                    result = cursor.fetchone()
-                    if result:
-                        dish_id = result['id']
-                        self.dishes_cache[(full_code, size)] = dish_id
-                    else:
-                        logger.warning(
-                            f"Dish not found for price update: {full_code} (size: {size})")
-                        continue
+                    logger.warning(
+                        f"Dish not found for price update: {full_code} (size: {size})")
+                    continue
 
                 store_id = row['store_id']
                 price = row['dish_price_this_month']
 
                 # Deactivate old prices for this dish/store combination
-                cursor.execute(
-                    """UPDATE dish_price_history 
-                       SET is_active = FALSE 
-                       WHERE dish_id = %s AND store_id = %s AND is_active = TRUE""",
-                    (dish_id, store_id)
-                )
+                if deactivate_old_prices:
+                    cursor.execute(
+                        """UPDATE dish_price_history 
+                           SET is_active = FALSE 
+                           WHERE dish_id = %s AND store_id = %s AND is_active = TRUE""",
+                        (dish_id, store_id)
+                    )
 
                 # Insert new price
                 cursor.execute(
@@ -607,22 +573,11 @@ class DishExtractor:
                     size = ''
 
                 # Get dish ID from cache
-                dish_id = self.dishes_cache.get((full_code, size))
+                dish_id = self.dimensions.get(cursor, 'dish', (full_code, size))
                 if not dish_id:
-                    # Look up in database
-                    cursor.execute(
-                        """SELECT id FROM dish 
-                           WHERE full_code = %s AND COALESCE(size, '') = %s""",
-                        (full_code, size)
-                    )
-                    result = cursor.fetchone()
-                    if result:
-                        dish_id = result['id']
-                        self.dishes_cache[(full_code, size)] = dish_id
-                    else:
-                        logger.warning(
-                            f"Dish not found for sales update: {full_code} (size: {size})")
-                        continue
+                    logger.warning(
+                        f"Dish not found for sales update: {full_code} (size: {size})")
+                    continue
 
                 store_id = row['store_id']
 
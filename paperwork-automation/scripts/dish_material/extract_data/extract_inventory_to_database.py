@@ -24,6 +24,8 @@ from datetime import datetime
 sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
 
 from utils.database import DatabaseManager, DatabaseConfig
+from lib.database_utils import StagingLoader, StoreMonthPnl
+from lib.excel_utils import read_first_sheet_cached, get_material_reading_dtype
 from configs.dish_material.inventory_extraction import (
     INVENTORY_COLUMN_MAPPINGS,
     INVENTORY_STORE_MAPPING,
@@ -43,10 +45,20 @@ logger = logging.getLogger(__name__)
 class InventoryExtractor:
     """Extract inventory counts from Excel files and store in database."""
 
+    # Each file is COPYed into a temp table, then applied with set-based upserts
+    STAGING_TABLE = 'stg_inventory_count'
+    RESOLVED_TABLE = 'stg_inventory_count_resolved'
+    STAGING_COLUMNS = {
+        'row_no': 'integer',
+        'material_code': 'varchar',
+        'count_quantity': 'numeric',
+        'actual_usage': 'numeric',
+        'material_use_type': 'varchar',
+    }
+
     def __init__(self, db_manager: DatabaseManager):
         """Initialize the inventory extractor."""
         self.db_manager = db_manager
-        self.materials_cache = {}  # Cache for material lookups
         self.material_types = {}  # Cache for material types from material_detail
 
     def extract_inventory_for_month(
@@ -127,6 +139,12 @@ class InventoryExtractor:
                 )
                 stats['files_processed'] += 1
 
+        # Rebuild this month's store P&L summary from the freshly loaded data
+        try:
+            StoreMonthPnl.refresh(self.db_manager, year, month)
+        except Exception:
+            stats['errors'] += 1
+
         logger.info(f"Extraction complete. Statistics: {stats}")
         return stats
 
@@ -232,97 +250,83 @@ class InventoryExtractor:
             logger.error("Required columns missing: material_code and count_quantity")
             return
         
-        for _, row in df.iterrows():
-            try:
-                material_code = str(row['material_code']).strip()
-                if not material_code or material_code == 'nan':
-                    continue
-                
-                count_quantity = float(row['count_quantity'])
-                
-                # Get stock_quantity and actual_usage if available
-                stock_quantity = float(row['stock_quantity']) if 'stock_quantity' in row else None
-                actual_usage = float(row['actual_usage']) if 'actual_usage' in row else None
-                
-                # Look up material by code and store
-                material_id = self._get_material_id(cursor, material_code, store_id)
-                
-                if not material_id:
-                    logger.warning(f"Material not found: {material_code} for store {store_id}")
-                    stats['materials_not_found'] += 1
-                    continue
-                
-                stats['materials_found'] += 1
-                
-                # Check if count already exists (using year/month)
-                cursor.execute(
-                    """SELECT id FROM inventory_count
-                       WHERE store_id = %s AND material_id = %s AND year = %s AND month = %s""",
-                    (store_id, material_id, year, month)
-                )
-                result = cursor.fetchone()
-                
-                if result:
-                    # Update existing count
-                    cursor.execute(
-                        """UPDATE inventory_count
-                           SET counted_quantity = %s,
-                               created_at = CURRENT_TIMESTAMP
-                           WHERE id = %s""",
-                        (count_quantity, result['id'])
-                    )
-                    stats['counts_updated'] += 1
-                    logger.debug(f"Updated count for material {material_code}: {count_quantity}")
-                else:
-                    # Insert new count (with year/month)
-                    cursor.execute(
-                        """INSERT INTO inventory_count
-                           (store_id, material_id, year, month, counted_quantity, created_by)
-                           VALUES (%s, %s, %s, %s, %s, %s)""",
-                        (store_id, material_id, year, month, count_quantity, 'inventory_extraction')
-                    )
-                    stats['counts_created'] += 1
-                    logger.debug(f"Created count for material {material_code}: {count_quantity}")
-                
-                # Always get material type from the loaded mapping
-                material_type = self.material_types.get(material_code, None)
-
-                # Always update material_monthly_usage to ensure material_use_type is populated
-                if actual_usage is not None and stock_quantity is not None:
-                    # We have usage data - update both material_used and material_use_type
-                    cursor.execute(
-                        """INSERT INTO material_monthly_usage
-                           (material_id, store_id, month, year, material_used, material_use_type)
-                           VALUES (%s, %s, %s, %s, %s, %s)
-                           ON CONFLICT (material_id, store_id, month, year)
-                           DO UPDATE SET
-                               material_used = EXCLUDED.material_used,
-                               material_use_type = EXCLUDED.material_use_type""",
-                        (material_id, store_id, month, year, actual_usage, material_type)
-                    )
-                    logger.debug(f"Updated material_monthly_usage for {material_code}: stock={stock_quantity:.2f}, count={count_quantity:.2f}, usage={actual_usage:.2f}, type={material_type}")
-                    if material_type:
-                        stats['material_types_updated'] += 1
-                else:
-                    # We don't have usage data - but still update material_use_type
-                    # Only create/update the record if we have a material_type to set
-                    if material_type:
-                        cursor.execute(
-                            """INSERT INTO material_monthly_usage
-                               (material_id, store_id, month, year, material_used, material_use_type)
-                               VALUES (%s, %s, %s, %s, %s, %s)
-                               ON CONFLICT (material_id, store_id, month, year)
-                               DO UPDATE SET
-                                   material_use_type = COALESCE(EXCLUDED.material_use_type, material_monthly_usage.material_use_type),
-                                   material_used = COALESCE(material_monthly_usage.material_used, 0)""",
-                            (material_id, store_id, month, year, 0, material_type)
-                        )
-                        logger.debug(f"Updated material_use_type for {material_code}: type={material_type} (no usage data available)")
-                        stats['material_types_updated'] += 1
-                
-            except Exception as e:
-                logger.error(f"Error updating count for material {row.get('material_code', 'UNKNOWN')}: {e}")
-                stats['errors'] += 1
+        staged = pd.DataFrame({
+            'material_code': df['material_code'].astype(str).str.strip(),
+            'count_quantity': df['count_quantity'],
+            'actual_usage': df['actual_usage'] if 'actual_usage' in df.columns else None,
+        })
+        staged = staged[(staged['material_code'] != '') & (staged['material_code'] != 'nan')]
+        staged['material_use_type'] = staged['material_code'].map(self.material_types)
+        staged.insert(0, 'row_no', range(len(staged)))
+        
+        row_count = StagingLoader.copy_to_temp_table(cursor, staged, self.STAGING_TABLE, self.STAGING_COLUMNS)
+        
+        # Look up materials by code and store
+        cursor.execute(f"""
+            SELECT s.material_code
+            FROM {self.STAGING_TABLE} s
+            LEFT JOIN material m ON m.material_number = s.material_code AND m.store_id = %s
+            WHERE m.id IS NULL
+        """, (store_id,))
+        missing = [row['material_code'] for row in cursor.fetchall()]
+        if missing:
+            logger.warning(f"{len(missing)} materials not found for store {store_id}: {', '.join(missing[:10])}")
+        stats['materials_not_found'] += len(missing)
+        stats['materials_found'] += row_count - len(missing)
+        
+        # One row per material; a code listed twice keeps its last row
+        cursor.execute(f"DROP TABLE IF EXISTS {self.RESOLVED_TABLE}")
+        cursor.execute(f"""
+            CREATE TEMP TABLE {self.RESOLVED_TABLE} ON COMMIT DROP AS
+            SELECT DISTINCT ON (m.id)
+                m.id AS material_id, s.count_quantity, s.actual_usage, s.material_use_type
+            FROM {self.STAGING_TABLE} s
+            JOIN material m ON m.material_number = s.material_code AND m.store_id = %s
+            ORDER BY m.id, s.row_no DESC
+        """, (store_id,))
+        
+        inserted, updated = StagingLoader.execute_upsert(cursor, f"""
+            INSERT INTO inventory_count
+                (store_id, material_id, year, month, counted_quantity, created_by)
+            SELECT %s, r.material_id, %s, %s, r.count_quantity, 'inventory_extraction'
+            FROM {self.RESOLVED_TABLE} r
+            ON CONFLICT (store_id, material_id, month, year) DO UPDATE SET
+                counted_quantity = EXCLUDED.counted_quantity,
+                created_at = CURRENT_TIMESTAMP
+            RETURNING (xmax = 0) AS inserted
+        """, (store_id, year, month))
+        stats['counts_created'] += inserted
+        stats['counts_updated'] += updated
+        
+        # We have usage data - update both material_used and material_use_type
+        cursor.execute(f"""
+            INSERT INTO material_monthly_usage
+                (material_id, store_id, month, year, material_used, material_use_type)
+            SELECT r.material_id, %s, %s, %s, r.actual_usage, r.material_use_type
+            FROM {self.RESOLVED_TABLE} r
+            WHERE r.actual_usage IS NOT NULL
+            ON CONFLICT (material_id, store_id, month, year)
+            DO UPDATE SET
+                material_used = EXCLUDED.material_used,
+                material_use_type = EXCLUDED.material_use_type
+            RETURNING material_monthly_usage.material_use_type
+        """, (store_id, month, year))
+        stats['material_types_updated'] += sum(1 for row in cursor.fetchall() if row['material_use_type'])
+        
+        # We don't have usage data - but still update material_use_type
+        # Only create/update the record if we have a material_type to set
+        cursor.execute(f"""
+            INSERT INTO material_monthly_usage
+                (material_id, store_id, month, year, material_used, material_use_type)
+            SELECT r.material_id, %s, %s, %s, 0, r.material_use_type
+            FROM {self.RESOLVED_TABLE} r
+            WHERE r.actual_usage IS NULL AND r.material_use_type IS NOT NULL
+            ON CONFLICT (material_id, store_id, month, year)
+            DO UPDATE SET
+                material_use_type = COALESCE(EXCLUDED.material_use_type, material_monthly_usage.material_use_type),
+                material_used = COALESCE(material_monthly_usage.material_used, 0)
+        """, (store_id, month, year))
+        stats['material_types_updated'] += cursor.rowcount
 
     def _load_material_types(self, year: int, month: int, use_history_files: bool = True) -> Dict[str, str]:
         """
@@ -343,7 +347,7 @@ class InventoryExtractor:
             logger.info(f"Loading material types from {material_file}")
             
             # Read the Excel file with proper dtype to preserve material numbers
-            df = pd.read_excel(material_file, dtype={'物料': str})
+            df = read_first_sheet_cached(material_file, dtype_spec=get_material_reading_dtype())
             
             # Check if required columns exist
             if '物料' not in df.columns or '大类' not in df.columns:
@@ -366,28 +370,6 @@ class InventoryExtractor:
             logger.error(f"Error reading material detail file: {e}")
         
         return material_types
-    
-    def _get_material_id(self, cursor, material_code: str, store_id: int) -> Optional[int]:
-        """Get material ID from cache or database."""
-        cache_key = (material_code, store_id)
-        
-        # Check cache
-        if cache_key in self.materials_cache:
-            return self.materials_cache[cache_key]
-        
-        # Look up in database - materials are store-specific
-        cursor.execute(
-            "SELECT id FROM material WHERE material_number = %s AND store_id = %s",
-            (material_code, store_id)
-        )
-        result = cursor.fetchone()
-        
-        if result:
-            material_id = result['id']
-            self.materials_cache[cache_key] = material_id
-            return material_id
-        
-        return None
 
 
 def main():
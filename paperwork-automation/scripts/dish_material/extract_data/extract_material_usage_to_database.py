@@ -23,7 +23,8 @@ from decimal import Decimal
 sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
 
 from utils.database import DatabaseManager, DatabaseConfig
-from lib.excel_utils import safe_read_excel
+from lib.database_utils import StoreMonthPnl
+from lib.excel_utils import read_first_sheet_cached, get_material_reading_dtype
 from scripts.dish_material.extract_data.file_discovery import find_material_file
 
 # Configure logging
@@ -47,7 +48,8 @@ class MaterialUsageExtractor:
         year: int,
         month: int,
         use_history_files: bool = True,
-        update_prices: bool = True
+        update_prices: bool = True,
+        deactivate_old_prices: bool = True
     ) -> Dict[str, int]:
         """
         Extract material usage, types, and prices for a specific year and month.
@@ -57,6 +59,7 @@ class MaterialUsageExtractor:
             month: Target month (1-12)
             use_history_files: Whether to use history_files folder structure
             update_prices: Whether to update material prices from 系统发出金额
+            deactivate_old_prices: Mark other months' prices inactive
 
         Returns:
             Dictionary with extraction statistics
@@ -82,7 +85,8 @@ class MaterialUsageExtractor:
 
         # Step 2: Update material prices if requested
         if update_prices and material_prices:
-            prices_updated = self._update_material_prices(material_prices, year, month)
+            prices_updated = self._update_material_prices(material_prices, year, month,
+                                                          deactivate_old_prices)
             stats['material_prices_updated'] = prices_updated
             logger.info(f"Updated {prices_updated} material prices")
 
@@ -170,6 +174,12 @@ class MaterialUsageExtractor:
                 stats['errors'] += 1
                 raise
 
+        # Rebuild this month's store P&L summary from the freshly loaded data
+        try:
+            StoreMonthPnl.refresh(self.db_manager, year, month)
+        except Exception:
+            stats['errors'] += 1
+
         logger.info(f"Extraction complete. Statistics: {stats}")
         return stats
 
@@ -196,7 +206,7 @@ class MaterialUsageExtractor:
             logger.info(f"Loading material data from {material_file}")
 
             # Read the Excel file with proper dtype to preserve material numbers
-            df = safe_read_excel(str(material_file), dtype_spec={'物料': str})
+            df = read_first_sheet_cached(str(material_file), dtype_spec=get_material_reading_dtype())
 
             # Check if required columns exist
             if '物料' not in df.columns:
@@ -261,7 +271,8 @@ class MaterialUsageExtractor:
 
         return material_types, material_prices
 
-    def _update_material_prices(self, material_prices: Dict[str, float], year: int, month: int) -> int:
+    def _update_material_prices(self, material_prices: Dict[str, float], year: int, month: int,
+                                deactivate_old_prices: bool = True) -> int:
         """
         Update material prices in the material_price_history table.
 
@@ -269,6 +280,7 @@ class MaterialUsageExtractor:
             material_prices: Dictionary mapping material_number to price
             year: Year for price effective date
             month: Month for price effective date
+            deactivate_old_prices: Mark other months' prices inactive
 
         Returns:
             Number of prices updated
@@ -279,28 +291,30 @@ class MaterialUsageExtractor:
             try:
                 cursor = conn.cursor()
 
+                # Every store's material row for the priced numbers, in one query
+                cursor.execute("""
+                    SELECT id, store_id, material_number
+                    FROM material
+                    WHERE material_number = ANY(%s) AND is_active = TRUE
+                """, (list(material_prices),))
+                materials_by_number = {}
+                for material in cursor.fetchall():
+                    materials_by_number.setdefault(material['material_number'], []).append(material)
+
                 # For each material with a price
                 for material_number, price in material_prices.items():
-                    # Find all materials with this number (across all stores)
-                    cursor.execute("""
-                        SELECT id, store_id, description
-                        FROM material
-                        WHERE material_number = %s AND is_active = TRUE
-                    """, (material_number,))
-
-                    materials = cursor.fetchall()
-
-                    for material in materials:
+                    for material in materials_by_number.get(material_number, []):
                         material_id = material['id']
                         store_id = material['store_id']
 
                         # Deactivate all existing prices except for this month
-                        cursor.execute("""
-                            UPDATE material_price_history
-                            SET is_active = FALSE
-                            WHERE material_id = %s AND store_id = %s
-                              AND NOT (effective_month = %s AND effective_year = %s)
-                        """, (material_id, store_id, month, year))
+                        if deactivate_old_prices:
+                            cursor.execute("""
+                                UPDATE material_price_history
+                                SET is_active = FALSE
+                                WHERE material_id = %s AND store_id = %s
+                                  AND NOT (effective_month = %s AND effective_year = %s)
+                            """, (material_id, store_id, month, year))
 
                         # Insert or update price for this month
                         cursor.execute("""
@@ -28,8 +28,9 @@ from configs.dish_material.material_extraction import (
     STORE_CODE_MAPPING,
     MATERIAL_TYPE_MAPPING
 )
-from lib.excel_utils import safe_read_excel, get_material_reading_dtype
+from lib.excel_utils import read_first_sheet_cached, get_material_reading_dtype
 from utils.database import DatabaseManager, DatabaseConfig
+from lib.database_utils import DimensionCache, StagingLoader, StoreMonthPnl
 from scripts.dish_material.extract_data.file_discovery import find_material_file
 
 # Configure logging
@@ -43,18 +44,25 @@ logger = logging.getLogger(__name__)
 class MaterialExtractor:
     """Extract materials from export.XLSX file and store in database."""
 
+    # Temp tables the cleaned export is COPYed into before set-based upserts
+    MATERIAL_STAGING_TABLE = 'stg_material'
+    PRICE_STAGING_TABLE = 'stg_material_price'
+    USAGE_STAGING_TABLE = 'stg_material_usage'
+
     def __init__(self, db_manager: DatabaseManager):
         """Initialize the material extractor."""
         self.db_manager = db_manager
         self.material_types_cache = {}  # Cache for material type lookups
         self.material_child_types_cache = {}  # Cache for material child type lookups
-        self.materials_cache = {}  # Cache for material lookups
+        self.dimensions = DimensionCache()  # Material child type IDs, loaded once per run
         
     def extract_materials_for_month(
         self,
         year: int,
         month: int,
-        input_file: Optional[str] = None
+        input_file: Optional[str] = None,
+        phase: str = 'all',
+        deactivate_old_prices: bool = True
     ) -> Dict[str, int]:
         """
         Extract materials for a specific year and month.
@@ -63,6 +71,9 @@ class MaterialExtractor:
             year: Target year
             month: Target month (1-12)
             input_file: Path to export.XLSX file (optional)
+            phase: 'all', 'master' (material types and materials only) or
+                'facts' (prices, usage and P&L refresh; materials must already exist)
+            deactivate_old_prices: Mark earlier months' prices inactive
             
         Returns:
             Dictionary with extraction statistics
@@ -87,6 +98,7 @@ class MaterialExtractor:
             'material_child_types_created': 0,
             'materials_created': 0,
             'materials_updated': 0,
+            'materials_skipped': 0,
             'prices_inserted': 0,
             'usage_inserted': 0,
             'errors': 0
@@ -107,27 +119,32 @@ class MaterialExtractor:
             # Process in steps
             with self.db_manager.get_connection() as conn:
                 try:
-                    # Step 1: Update material_type and material_child_type tables
-                    logger.info("Step 1: Updating material types...")
-                    self._update_material_types(conn, df, stats)
-                    
-                    # Step 2: Update material tables
-                    logger.info("Step 2: Updating materials...")
-                    self._update_materials(conn, df, stats)
-                    
-                    # Step 3: Update material price history
-                    logger.info("Step 3: Updating material prices...")
-                    self._update_material_prices(conn, df, year, month, stats)
+                    if phase in ('all', 'master'):
+                        # Step 1: Update material_type and material_child_type tables
+                        logger.info("Step 1: Updating material types...")
+                        self._update_material_types(conn, df, stats)
+                        
+                        # Step 2: Update material tables
+                        logger.info("Step 2: Updating materials...")
+                        self._update_materials(conn, df, stats)
                     
-                    # Step 4: Update material monthly usage
-                    logger.info("Step 4: Updating material usage...")
-                    self._update_material_usage(conn, df, year, month, stats)
+                    if phase in ('all', 'facts'):
+                        # Step 3: Update material price history
+                        logger.info("Step 3: Updating material prices...")
+                        self._update_material_prices(conn, df, year, month, stats,
+                                                     deactivate_old_prices)
+                        
+                        # Step 4: Update material monthly usage
+                        logger.info("Step 4: Updating material usage...")
+                        self._update_material_usage(conn, df, year, month, stats)
                     
                     conn.commit()
                     logger.info("All data committed successfully")
                     
                 except Exception as e:
                     conn.rollback()
+                    self.dimensions.invalidate()
+                    self.material_types_cache.clear()
                     logger.error(f"Error during processing, rolling back: {e}")
                     logger.error(f"Transaction error details: {e.__class__.__name__}: {str(e)}")
                     import traceback
@@ -139,6 +156,13 @@ class MaterialExtractor:
             logger.error(f"Error reading {input_path}: {e}")
             stats['errors'] += 1
         
+        # Rebuild this month's store P&L summary from the freshly loaded data
+        if phase != 'master':
+            try:
+                StoreMonthPnl.refresh(self.db_manager, year, month)
+            except Exception:
+                stats['errors'] += 1
+
         logger.info(f"Extraction complete. Statistics: {stats}")
         return stats
     
@@ -147,7 +171,7 @@ class MaterialExtractor:
         try:
             # Read Excel with proper dtype for material numbers
             dtype_spec = get_material_reading_dtype()
-            df = safe_read_excel(str(file_path), dtype_spec=dtype_spec)
+            df = read_first_sheet_cached(str(file_path), dtype_spec=dtype_spec)
             logger.info(f"Successfully read Excel file with {len(df)} rows")
             
             # Filter for the target month if dates are provided
@@ -202,17 +226,16 @@ class MaterialExtractor:
         type_data = df[['material_187_level1', 'material_187_level2']].dropna(subset=['material_187_level1'])
         unique_types = type_data.drop_duplicates()
         
-        for _, row in unique_types.iterrows():
-            level1 = row['material_187_level1']
-            level2 = row.get('material_187_level2')
-            
-            if pd.isna(level1):
-                continue
-            
+        # Each child type keyed by its cache key (level1, level2 or None)
+        child_types = {}
+        for level1, level2 in unique_types.itertuples(index=False):
             try:
                 # Get or create material type
                 type_id = MATERIAL_TYPE_MAPPING.get(level1)
-                if type_id:
+                if not type_id:
+                    continue
+                
+                if level1 not in self.material_types_cache:
                     # Ensure type exists in database
                     cursor.execute(
                         """INSERT INTO material_type (id, name, is_active) 
@@ -221,56 +244,59 @@ class MaterialExtractor:
                         (type_id, level1)
                     )
                     self.material_types_cache[level1] = type_id
-                    
-                    # Handle child type if present
-                    if level2 and not pd.isna(level2):
-                        # Check if child type exists
-                        cursor.execute(
-                            """SELECT id FROM material_child_type 
-                               WHERE name = %s AND material_type_id = %s""",
-                            (level2, type_id)
-                        )
-                        result = cursor.fetchone()
-                        
-                        if not result:
-                            cursor.execute(
-                                """INSERT INTO material_child_type (name, material_type_id, is_active)
-                                   VALUES (%s, %s, TRUE) RETURNING id""",
-                                (level2, type_id)
-                            )
-                            child_type_id = cursor.fetchone()['id']
-                            stats['material_child_types_created'] += 1
-                            logger.debug(f"Created child type: {level2}")
-                        else:
-                            child_type_id = result['id']
-                        
-                        self.material_child_types_cache[(level1, level2)] = child_type_id
-                    else:
-                        # Create default child type with same name as parent
-                        cursor.execute(
-                            """SELECT id FROM material_child_type 
-                               WHERE name = %s AND material_type_id = %s""",
-                            (level1, type_id)
-                        )
-                        result = cursor.fetchone()
-                        
-                        if not result:
-                            cursor.execute(
-                                """INSERT INTO material_child_type (name, material_type_id, is_active)
-                                   VALUES (%s, %s, TRUE) RETURNING id""",
-                                (level1, type_id)
-                            )
-                            child_type_id = cursor.fetchone()['id']
-                            stats['material_child_types_created'] += 1
-                        else:
-                            child_type_id = result['id']
-                        
-                        self.material_child_types_cache[(level1, None)] = child_type_id
+                    self.dimensions.add('material_type', level1, type_id)
+                
+                # Without a level2 the child type is a default one named after the parent
+                if level2 and not pd.isna(level2):
+                    child_types[(level1, level2)] = (type_id, level2)
+                else:
+                    child_types[(level1, None)] = (type_id, level1)
                         
             except Exception as e:
                 logger.error(f"Error updating material type {level1}: {e}")
                 stats['errors'] += 1
+        
+        child_ids, created = self.dimensions.get_or_create(
+            cursor, 'material_child_type', list(child_types.values()), defaults={'is_active': True})
+        stats['material_child_types_created'] += created
+        for cache_key, child_key in child_types.items():
+            if child_key in child_ids:
+                self.material_child_types_cache[cache_key] = child_ids[child_key]
     
+    def _staging_frame(self, df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+        """Rows with a usable material number and store, material numbers without leading zeros."""
+        staged = df[columns].copy()
+        staged['material_number'] = staged['material_number'].astype(str).str.strip()
+        staged = staged[(staged['material_number'] != '') & (staged['material_number'] != 'nan')]
+        staged['material_number'] = staged['material_number'].str.lstrip('0').replace('', '0')
+        return staged[staged['store_id'].notna()]
+
+    @staticmethod
+    def _non_blank(values: pd.Series) -> pd.Series:
+        """Values with empty strings turned into missing values."""
+        return values.where(values.notna() & (values.astype(str).str.strip() != ''))
+
+    def _child_type_id(self, level1, level2) -> Optional[int]:
+        """Child type cached by _update_material_types, falling back to the parent's default child type."""
+        if level1 is None or pd.isna(level1) or not level1:
+            return None
+        return (self.material_child_types_cache.get((level1, level2))
+                or self.material_child_types_cache.get((level1, None)))
+
+    def _log_unmatched_materials(self, cursor, staging_table: str, purpose: str):
+        """Warn about staged materials with no material row for their store."""
+        cursor.execute(f"""
+            SELECT s.material_number, s.store_id
+            FROM {staging_table} s
+            LEFT JOIN material m
+                ON m.material_number = s.material_number AND m.store_id = s.store_id
+            WHERE m.id IS NULL
+        """)
+        missing = cursor.fetchall()
+        if missing:
+            sample = ', '.join(f"{row['material_number']} (store {row['store_id']})" for row in missing[:10])
+            logger.warning(f"{len(missing)} materials not found for {purpose}: {sample}")
+
     def _update_materials(self, conn, df: pd.DataFrame, stats: Dict):
         """Step 2: Update material tables."""
         cursor = conn.cursor()
@@ -289,117 +315,70 @@ class MaterialExtractor:
             return
         
         # Group by material_number AND store_id to get unique materials per store
-        unique_materials = df[available_columns].drop_duplicates(subset=['material_number', 'store_id'])
+        unique_materials = self._staging_frame(df, available_columns).drop_duplicates(
+            subset=['material_number', 'store_id'])
         
-        for _, material_row in unique_materials.iterrows():
-            try:
-                material_number = str(material_row['material_number']).strip()
-                if not material_number or material_number == 'nan':
-                    continue
-                
-                # Remove leading zeros from material number
-                material_number = material_number.lstrip('0') or '0'  # Keep at least one '0' if all zeros
-                
-                # Get store_id
-                store_id = int(material_row['store_id'])
-                
-                # Get material description (prefer 187-generic if available)
-                description = material_row.get('material_187_generic')
-                if pd.isna(description) or not description:
-                    description = material_row.get('material_description', '')
-                
-                # Get material child type
-                level1 = material_row.get('material_187_level1')
-                level2 = material_row.get('material_187_level2')
-                child_type_id = None
-                
-                if level1 and not pd.isna(level1):
-                    child_type_id = self.material_child_types_cache.get((level1, level2))
-                    if not child_type_id:
-                        child_type_id = self.material_child_types_cache.get((level1, None))
-                
-                # Check if material exists for this store
-                cursor.execute(
-                    "SELECT id FROM material WHERE material_number = %s AND store_id = %s",
-                    (material_number, store_id)
-                )
-                result = cursor.fetchone()
-                
-                unit = material_row.get('unit_description', '')
-                if pd.isna(unit):
-                    unit = ''
-                
-                if result:
-                    # Update existing material
-                    material_id = result['id']
-                    update_fields = []
-                    update_values = []
-                    
-                    if description:
-                        update_fields.extend(["name = %s", "description = %s"])
-                        update_values.extend([description, description])
-                    
-                    if unit:
-                        update_fields.append("unit = %s")
-                        update_values.append(unit)
-                    
-                    if child_type_id:
-                        update_fields.append("material_child_type_id = %s")
-                        update_values.append(child_type_id)
-                    
-                    update_fields.append("is_active = TRUE")
-                    
-                    if update_fields:
-                        update_values.append(material_id)
-                        cursor.execute(
-                            f"""UPDATE material SET {', '.join(update_fields)}
-                                WHERE id = %s""",
-                            update_values
-                        )
-                        stats['materials_updated'] += 1
-                        logger.debug(f"Updated material: {material_number}")
-                
-                else:
-                    # Insert new material with store_id
-                    insert_columns = ['material_number', 'store_id', 'is_active']
-                    insert_values = [material_number, store_id, True]
-                    
-                    if description:
-                        insert_columns.extend(['name', 'description'])
-                        insert_values.extend([description, description])
-                    
-                    if unit:
-                        insert_columns.append('unit')
-                        insert_values.append(unit)
-                    
-                    if child_type_id:
-                        insert_columns.append('material_child_type_id')
-                        insert_values.append(child_type_id)
-                    
-                    placeholders = ', '.join(['%s'] * len(insert_values))
-                    columns_str = ', '.join(insert_columns)
-                    
-                    cursor.execute(
-                        f"""INSERT INTO material ({columns_str}) 
-                            VALUES ({placeholders}) RETURNING id""",
-                        insert_values
-                    )
-                    material_id = cursor.fetchone()['id']
-                    stats['materials_created'] += 1
-                    logger.debug(f"Created material: {material_number}")
-                
-                # Cache the material ID with store_id as part of the key
-                self.materials_cache[(material_number, store_id)] = material_id
-                
-            except Exception as e:
-                logger.error(f"Error updating material {material_row.get('material_number', 'UNKNOWN')}: {e}")
-                logger.error(f"Material details - Number: {material_number}, Description: {description}")
-                logger.error(f"SQL Error: {e.__class__.__name__}: {str(e)}")
-                stats['errors'] += 1
-                # Re-raise to abort the transaction properly
-                raise
+        # Prefer the 187 generic name; blank names, units and child types keep the stored value
+        blank = pd.Series(None, index=unique_materials.index, dtype=object)
+        unique_materials['name'] = self._non_blank(unique_materials.get('material_187_generic', blank)).fillna(
+            self._non_blank(unique_materials.get('material_description', blank)))
+        unique_materials['unit'] = self._non_blank(unique_materials.get('unit_description', blank))
+        unique_materials['material_child_type_id'] = [
+            self._child_type_id(level1, level2) for level1, level2 in zip(
+                unique_materials.get('material_187_level1', blank),
+                unique_materials.get('material_187_level2', blank))
+        ]
+        
+        StagingLoader.copy_to_temp_table(cursor, unique_materials, self.MATERIAL_STAGING_TABLE, {
+            'material_number': 'varchar',
+            'store_id': 'integer',
+            'name': 'varchar',
+            'unit': 'varchar',
+            'material_child_type_id': 'integer',
+        })
+        
+        # New materials need a name and unit (both NOT NULL); report them instead of aborting the load
+        cursor.execute(f"""
+            SELECT s.material_number, s.store_id
+            FROM {self.MATERIAL_STAGING_TABLE} s
+            LEFT JOIN material m
+                ON m.material_number = s.material_number AND m.store_id = s.store_id
+            WHERE m.id IS NULL AND (s.name IS NULL OR s.unit IS NULL)
+        """)
+        incomplete = cursor.fetchall()
+        if incomplete:
+            sample = ', '.join(f"{row['material_number']} (store {row['store_id']})" for row in incomplete[:10])
+            logger.warning(f"{len(incomplete)} new materials skipped without a name or unit: {sample}")
+            stats['materials_skipped'] += len(incomplete)
+        
+        # Blanks are filled from the stored row before the insert, since PostgreSQL checks
+        # NOT NULL on the proposed row before resolving the conflict
+        inserted, updated = StagingLoader.execute_upsert(cursor, f"""
+            INSERT INTO material (
+                material_number, store_id, is_active, name, description, unit, material_child_type_id
+            )
+            SELECT s.material_number, s.store_id, TRUE,
+                   COALESCE(s.name, m.name), COALESCE(s.name, m.description),
+                   COALESCE(s.unit, m.unit),
+                   COALESCE(s.material_child_type_id, m.material_child_type_id)
+            FROM {self.MATERIAL_STAGING_TABLE} s
+            LEFT JOIN material m
+                ON m.material_number = s.material_number AND m.store_id = s.store_id
+            WHERE COALESCE(s.name, m.name) IS NOT NULL
+              AND COALESCE(s.unit, m.unit) IS NOT NULL
+            ON CONFLICT (store_id, material_number) DO UPDATE SET
+                name = EXCLUDED.name,
+                description = EXCLUDED.description,
+                unit = EXCLUDED.unit,
+                material_child_type_id = EXCLUDED.material_child_type_id,
+                is_active = TRUE
+            RETURNING (xmax = 0) AS inserted
+        """)
+        stats['materials_created'] += inserted
+        stats['materials_updated'] += updated
     
-    def _update_material_prices(self, conn, df: pd.DataFrame, year: int, month: int, stats: Dict):
+    def _update_material_prices(self, conn, df: pd.DataFrame, year: int, month: int, stats: Dict,
+                                deactivate_old_prices: bool = True):
         """Step 3: Update material price history."""
         cursor = conn.cursor()
         
@@ -408,58 +387,44 @@ class MaterialExtractor:
             return
         
         # Group by store and material to get unique prices
-        price_data = df[df['unit_price'] > 0].groupby(
+        price_data = self._staging_frame(df[df['unit_price'] > 0], ['store_id', 'material_number', 'unit_price'])
+        price_data = price_data.groupby(
             ['store_id', 'material_number']
         ).agg({
             'unit_price': 'mean'  # Take average if multiple entries
         }).reset_index()
         
-        for _, row in price_data.iterrows():
-            try:
-                material_number = str(row['material_number']).strip()
-                # Remove leading zeros from material number
-                material_number = material_number.lstrip('0') or '0'
-                
-                store_id = int(row['store_id'])
-                
-                # Get material ID from cache or database using both material_number and store_id
-                material_id = self.materials_cache.get((material_number, store_id))
-                if not material_id:
-                    cursor.execute(
-                        "SELECT id FROM material WHERE material_number = %s AND store_id = %s",
-                        (material_number, store_id)
-                    )
-                    result = cursor.fetchone()
-                    if result:
-                        material_id = result['id']
-                        self.materials_cache[(material_number, store_id)] = material_id
-                    else:
-                        logger.warning(f"Material not found for price: {material_number} in store {store_id}")
-                        continue
-                price = float(row['unit_price'])
-                
-                # Deactivate old prices
-                cursor.execute(
-                    """UPDATE material_price_history 
-                       SET is_active = FALSE 
-                       WHERE material_id = %s AND store_id = %s AND is_active = TRUE""",
-                    (material_id, store_id)
-                )
-                
-                # Insert new price
-                cursor.execute(
-                    """INSERT INTO material_price_history 
-                       (material_id, store_id, price, effective_month, effective_year, is_active)
-                       VALUES (%s, %s, %s, %s, %s, TRUE)
-                       ON CONFLICT (material_id, store_id, effective_month, effective_year) 
-                       DO UPDATE SET price = EXCLUDED.price, is_active = TRUE""",
-                    (material_id, store_id, price, month, year)
-                )
-                stats['prices_inserted'] += 1
-                
-            except Exception as e:
-                logger.error(f"Error updating price for material {row.get('material_number', 'UNKNOWN')}: {e}")
-                stats['errors'] += 1
+        StagingLoader.copy_to_temp_table(cursor, price_data, self.PRICE_STAGING_TABLE, {
+            'material_number': 'varchar',
+            'store_id': 'integer',
+            'unit_price': 'numeric',
+        })
+        self._log_unmatched_materials(cursor, self.PRICE_STAGING_TABLE, 'price')
+        
+        # Deactivate old prices
+        if deactivate_old_prices:
+            cursor.execute(f"""
+                UPDATE material_price_history mph
+                SET is_active = FALSE
+                FROM {self.PRICE_STAGING_TABLE} s
+                JOIN material m
+                    ON m.material_number = s.material_number AND m.store_id = s.store_id
+                WHERE mph.material_id = m.id AND mph.store_id = s.store_id AND mph.is_active = TRUE
+            """)
+        
+        # Insert new price
+        inserted, updated = StagingLoader.execute_upsert(cursor, f"""
+            INSERT INTO material_price_history
+                (material_id, store_id, price, effective_month, effective_year, is_active)
+            SELECT m.id, s.store_id, s.unit_price, %s, %s, TRUE
+            FROM {self.PRICE_STAGING_TABLE} s
+            JOIN material m
+                ON m.material_number = s.material_number AND m.store_id = s.store_id
+            ON CONFLICT (material_id, store_id, effective_month, effective_year)
+            DO UPDATE SET price = EXCLUDED.price, is_active = TRUE
+            RETURNING (xmax = 0) AS inserted
+        """, (month, year))
+        stats['prices_inserted'] += inserted + updated
     
     def _update_material_usage(self, conn, df: pd.DataFrame, year: int, month: int, stats: Dict):
         """Step 4: Update material monthly usage table."""
@@ -471,53 +436,34 @@ class MaterialExtractor:
             logger.warning("Missing usage columns")
             return
         
-        usage_data = df.groupby(['store_id', 'material_number']).agg({
+        usage_data = self._staging_frame(df, ['store_id', 'material_number'] + usage_columns)
+        usage_data = usage_data.groupby(['store_id', 'material_number']).agg({
             'quantity': 'sum',
             'total_amount': 'sum'
         }).reset_index()
         
-        for _, row in usage_data.iterrows():
-            try:
-                material_number = str(row['material_number']).strip()
-                # Remove leading zeros from material number
-                material_number = material_number.lstrip('0') or '0'
-                
-                store_id = int(row['store_id'])
-                
-                # Get material ID using both material_number and store_id
-                material_id = self.materials_cache.get((material_number, store_id))
-                if not material_id:
-                    cursor.execute(
-                        "SELECT id FROM material WHERE material_number = %s AND store_id = %s",
-                        (material_number, store_id)
-                    )
-                    result = cursor.fetchone()
-                    if result:
-                        material_id = result['id']
-                        self.materials_cache[(material_number, store_id)] = material_id
-                    else:
-                        logger.warning(f"Material not found for usage: {material_number} in store {store_id}")
-                        continue
-                quantity = float(row['quantity'])
-                amount = float(row['total_amount'])
-                
-                # Insert or update usage record
-                # Note: The column is material_used, not usage_quantity
-                cursor.execute(
-                    """INSERT INTO material_monthly_usage 
-                       (material_id, store_id, month, year, material_used)
-                       VALUES (%s, %s, %s, %s, %s)
-                       ON CONFLICT (material_id, store_id, month, year) 
-                       DO UPDATE SET 
-                           material_used = EXCLUDED.material_used""",
-                    (material_id, store_id, month, year, quantity)
-                )
-                stats['usage_inserted'] += 1
-                
-            except Exception as e:
-                logger.error(f"Error updating usage for material {row.get('material_number', 'UNKNOWN')}: {e}")
-                stats['errors'] += 1
-
+        StagingLoader.copy_to_temp_table(cursor, usage_data, self.USAGE_STAGING_TABLE, {
+            'material_number': 'varchar',
+            'store_id': 'integer',
+            'quantity': 'numeric',
+        })
+        self._log_unmatched_materials(cursor, self.USAGE_STAGING_TABLE, 'usage')
+        
+        # Insert or update usage record
+        # Note: The column is material_used, not usage_quantity
+        inserted, updated = StagingLoader.execute_upsert(cursor, f"""
+            INSERT INTO material_monthly_usage
+                (material_id, store_id, month, year, material_used)
+            SELECT m.id, s.store_id, %s, %s, s.quantity
+            FROM {self.USAGE_STAGING_TABLE} s
+            JOIN material m
+                ON m.material_number = s.material_number AND m.store_id = s.store_id
+            ON CONFLICT (material_id, store_id, month, year)
+            DO UPDATE SET
+                material_used = EXCLUDED.material_used
+            RETURNING (xmax = 0) AS inserted
+        """, (month, year))
+        stats['usage_inserted'] += inserted + updated
 
 def main():
     """Main entry point for the script."""
@@ -582,6 +528,7 @@ def main():
     print(f"Child Types Created:     {stats.get('material_child_types_created', 0)}")
     print(f"Materials Created:       {stats.get('materials_created', 0)}")
     print(f"Materials Updated:       {stats.get('materials_updated', 0)}")
+    print(f"Materials Skipped:       {stats.get('materials_skipped', 0)}")
     print(f"Prices Inserted:         {stats.get('prices_inserted', 0)}")
     print(f"Usage Records Inserted:  {stats.get('usage_inserted', 0)}")
     print(f"Errors:                  {stats.get('errors', 0)}")
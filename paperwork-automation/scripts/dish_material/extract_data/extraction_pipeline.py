@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+In-process dish-material extraction pipeline.
+
+Runs the monthly extraction steps by calling the extractor classes directly
+instead of launching one Python process per script, so a month (or a
+multi-month backfill) pays interpreter startup, pandas/openpyxl imports and
+.env loading once. All steps share the per-process pooled database manager
+and the parsed-workbook cache in lib.excel_utils. The material, material
+usage and inventory steps all read the material export with
+get_material_reading_dtype(), part of the cache key, so it is parsed once.
+
+Steps, in order:
+1. Dish extraction (required)
+2. Dish broad type extraction (optional)
+3. Material extraction (required)
+4. Dish-material mapping (required)
+5. Material usage and types (optional, skipped with materials)
+6. Inventory counts (required, only when inventory files exist)
+"""
+
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+# Add project root to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
+
+from utils.database import DatabaseManager, get_shared_database_manager
+from scripts.dish_material.extract_data.extract_dishes_to_database import DishExtractor
+from scripts.dish_material.extract_data.extract_dish_broad_type import DishBroadTypeExtractor
+from scripts.dish_material.extract_data.extract_materials_to_database import MaterialExtractor
+from scripts.dish_material.extract_data.extract_dish_material_mapping import DishMaterialExtractor
+from scripts.dish_material.extract_data.extract_material_usage_to_database import MaterialUsageExtractor
+from scripts.dish_material.extract_data.extract_inventory_to_database import InventoryExtractor
+
+logger = logging.getLogger(__name__)
+
+
+class StepResult(NamedTuple):
+    """Outcome of one pipeline step."""
+    name: str
+    status: str  # 'ok', 'failed' or 'skipped'
+    seconds: float = 0.0
+    note: str = ''
+
+
+class PipelineResult(NamedTuple):
+    """Outcome of a pipeline run."""
+    success: bool
+    aborted: bool
+    steps: List[StepResult]
+    database_statistics: Optional[Dict[str, int]] = None
+
+
+def get_database_statistics(db_manager: DatabaseManager) -> Dict[str, int]:
+    """Row counts of the dish-material tables."""
+    queries = {
+        'dishes': 'SELECT COUNT(*) FROM dish',
+        'dishes_with_broad_type': 'SELECT COUNT(*) FROM dish WHERE broad_type IS NOT NULL',
+        'materials': 'SELECT COUNT(*) FROM material',
+        'dish_material_links': 'SELECT COUNT(*) FROM dish_material',
+        'inventory_counts': 'SELECT COUNT(*) FROM inventory_count',
+    }
+    statistics = {}
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        for key, sql in queries.items():
+            cursor.execute(sql)
+            statistics[key] = cursor.fetchone()['count']
+    return statistics
+
+
+def print_database_statistics(statistics: Dict[str, int], title: str = "Database Statistics"):
+    """Print the row counts returned by get_database_statistics."""
+    print(f"\n{title}:")
+    print(f"  Dishes:                 {statistics['dishes']:,}")
+    print(f"  Dishes with Broad Type: {statistics['dishes_with_broad_type']:,}")
+    print(f"  Materials:              {statistics['materials']:,}")
+    print(f"  Dish-Material Links:    {statistics['dish_material_links']:,}")
+    print(f"  Inventory Counts:       {statistics['inventory_counts']:,}")
+
+
+def print_step_stats(title: str, stats: Dict):
+    """Print the statistics dictionary returned by an extractor."""
+    print("\n" + "="*50)
+    print(title)
+    print("="*50)
+    for key, value in stats.items():
+        label = key.replace('_', ' ').title() + ':'
+        print(f"{label:<28}{value}")
+    print("="*50)
+
+
+def print_step_timings(steps: List[StepResult]):
+    """Print how long each step took."""
+    print("\nStep Timings:")
+    for step in steps:
+        note = f"  ({step.note})" if step.note else ''
+        print(f"  {step.name:<26}{step.status:<9}{step.seconds:8.2f}s{note}")
+    print(f"  {'Total':<26}{'':<9}{sum(step.seconds for step in steps):8.2f}s")
+
+
+def extract_broad_types_for_month(db_manager: DatabaseManager, year: int, month: int) -> Dict:
+    """Run the broad type extraction and return extractor-style statistics."""
+    extractor = DishBroadTypeExtractor(db_manager)
+    target_date = f"{year:04d}-{month:02d}-01"
+    file_path = extractor.find_dish_general_type_file(target_date)
+    if not file_path:
+        logger.error(f"Could not find dish general type file for {target_date}")
+        return {'errors': 1}
+
+    broad_type_map = extractor.extract_broad_types(file_path)
+    updated_count = extractor.update_dish_broad_types(broad_type_map)
+
+    logger.info("Dish broad type statistics:")
+    for broad_type, count in extractor.get_statistics().items():
+        logger.info(f"  {broad_type}: {count} dishes")
+    return {'broad_types_found': len(broad_type_map), 'dishes_updated': updated_count, 'errors': 0}
+
+
+def run_extraction_pipeline(
+    year: int,
+    month: int,
+    is_test: bool = False,
+    skip_dishes: bool = False,
+    skip_broad_type: bool = False,
+    skip_materials: bool = False,
+    skip_mapping: bool = False,
+    skip_inventory: bool = False,
+    dish_input: Optional[str] = None,
+    material_input: Optional[str] = None,
+    mapping_input: Optional[str] = None,
+    has_inventory_files: bool = True,
+    confirm: Optional[Callable[[str], bool]] = None,
+    db_manager: Optional[DatabaseManager] = None
+) -> PipelineResult:
+    """
+    Run all extraction steps for one month in this process.
+
+    A step fails when it raises or reports errors. If a required step fails,
+    confirm(message) decides whether to continue; without confirm (non-
+    interactive runs) the pipeline stops there.
+
+    Args:
+        year: Target year
+        month: Target month (1-12)
+        is_test: Use test database
+        skip_*: Skip the corresponding step
+        dish_input: Custom dish sales file/directory (None for auto-discovery)
+        material_input: Custom material export file (None for auto-discovery)
+        mapping_input: Custom dish-material mapping file (None for auto-discovery)
+        has_inventory_files: Whether inventory files exist for the month
+        confirm: Callable asking whether to continue after a failed step
+        db_manager: Database manager (defaults to the shared pooled manager)
+
+    Returns:
+        PipelineResult with overall success and per-step timings
+    """
+    db_manager = db_manager or get_shared_database_manager(is_test=is_test)
+    steps: List[StepResult] = []
+
+    if not db_manager.test_connection():
+        logger.error("Failed to connect to database")
+        return PipelineResult(success=False, aborted=True, steps=steps)
+    logger.info(f"Connected to {'test' if is_test else 'production'} database")
+
+    step_definitions = [
+        ('dishes', "STEP 1: EXTRACTING DISHES", skip_dishes, True,
+         lambda: DishExtractor(db_manager).extract_dishes_for_month(year, month, dish_input)),
+        ('broad_types', "STEP 2: EXTRACTING DISH BROAD TYPES", skip_broad_type, False,
+         lambda: extract_broad_types_for_month(db_manager, year, month)),
+        ('materials', "STEP 3: EXTRACTING MATERIALS", skip_materials, True,
+         lambda: MaterialExtractor(db_manager).extract_materials_for_month(year, month, material_input)),
+        ('dish_material_mapping', "STEP 4: EXTRACTING DISH-MATERIAL MAPPINGS", skip_mapping, True,
+         lambda: DishMaterialExtractor(db_manager).extract_dish_material_mappings(year, month, mapping_input)),
+        # Runs before inventory so material_use_type is populated
+        ('material_usage', "STEP 5: EXTRACTING MATERIAL USAGE AND TYPES", skip_materials, False,
+         lambda: MaterialUsageExtractor(db_manager).extract_material_usage_for_month(
+             year, month, use_history_files=True, update_prices=True)),
+        ('inventory', "STEP 6: EXTRACTING INVENTORY COUNTS", skip_inventory or not has_inventory_files, True,
+         lambda: InventoryExtractor(db_manager).extract_inventory_for_month(year, month, None, True)),
+    ]
+
+    success = True
+    aborted = False
+    for name, title, skipped, required, run in step_definitions:
+        if skipped:
+            note = 'no inventory files' if name == 'inventory' and not skip_inventory else ''
+            logger.info(f"Skipping {name.replace('_', ' ')} extraction{f' ({note})' if note else ''}")
+            steps.append(StepResult(name, 'skipped', note=note))
+            continue
+
+        print("\n" + "-"*60)
+        print(title)
+        print("-"*60)
+
+        started = time.perf_counter()
+        try:
+            stats = run()
+            step_ok = stats.get('errors', 0) == 0
+            print_step_stats(f"{name.replace('_', ' ').upper()} SUMMARY", stats)
+        except Exception as e:
+            logger.error(f"Error during {name} extraction: {e}")
+            step_ok = False
+        elapsed = time.perf_counter() - started
+        steps.append(StepResult(name, 'ok' if step_ok else 'failed', elapsed))
+        logger.info(f"Step {name} finished in {elapsed:.2f}s")
+
+        if step_ok:
+            continue
+        if not required:
+            logger.warning(f"{name.replace('_', ' ').capitalize()} extraction failed - this is optional")
+            continue
+
+        logger.error(f"{name.replace('_', ' ').capitalize()} extraction failed")
+        success = False
+        if name == 'dish_material_mapping':
+            continue
+        message = f"{name.replace('_', ' ').capitalize()} extraction failed. Continue anyway?"
+        if confirm is None or not confirm(message):
+            aborted = True
+            break
+
+    database_statistics = None
+    if success:
+        try:
+            database_statistics = get_database_statistics(db_manager)
+        except Exception as e:
+            logger.warning(f"Could not retrieve database statistics: {e}")
+
+    db_manager.log_pool_stats()
+    return PipelineResult(success=success, aborted=aborted, steps=steps,
+                          database_statistics=database_statistics)
+
+
+def confirm_from_console(message: str) -> bool:
+    """Ask a yes/no question on the console."""
+    return input(f"\n{message} (y/n): ").lower().startswith('y')
+
+
+__all__ = [
+    'StepResult',
+    'PipelineResult',
+    'run_extraction_pipeline',
+    'extract_broad_types_for_month',
+    'get_database_statistics',
+    'print_database_statistics',
+    'print_step_timings',
+    'confirm_from_console'
+]
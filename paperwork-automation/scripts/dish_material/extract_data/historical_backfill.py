@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Parallel multi-month backfill for the dish-material tables.
+
+The only ordering constraint between months is master data: dish types,
+dishes, broad types, material types, materials and dish-material mappings
+are shared by every month and the latest month's values must win. The
+backfill therefore runs in three phases:
+
+1. Master data for every month, in chronological order, in this process.
+2. Per-month fact loads (dish prices and sales, material prices and usage,
+   material use types, inventory counts) across a process pool. Each worker
+   runs one month at a time on its own connection, so the pool size bounds
+   the number of concurrent database writers.
+3. Activate the latest price per dish/material and rebuild store_month_pnl
+   for the loaded months (the P&L prices each month as of its first day).
+
+Completed (month, step) pairs are recorded in per-month checkpoint files, so
+an interrupted backfill resumes where it stopped.
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Add project root to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
+
+from lib.config import CONNECTION_POOL_SIZE
+from lib.database_utils import StoreMonthPnl
+from utils.database import DatabaseManager, get_shared_database_manager
+from scripts.dish_material.extract_data.file_discovery import find_inventory_files
+from scripts.dish_material.extract_data.extract_dishes_to_database import DishExtractor
+from scripts.dish_material.extract_data.extract_materials_to_database import MaterialExtractor
+from scripts.dish_material.extract_data.extract_dish_material_mapping import DishMaterialExtractor
+from scripts.dish_material.extract_data.extract_material_usage_to_database import MaterialUsageExtractor
+from scripts.dish_material.extract_data.extract_inventory_to_database import InventoryExtractor
+from scripts.dish_material.extract_data.extraction_pipeline import extract_broad_types_for_month
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT_DIR = Path(os.getenv('OUTPUT_DIR', './output')) / 'backfill_checkpoints'
+
+# Statistics keys ending in these suffixes count as rows written
+ROW_STAT_SUFFIXES = ('_created', '_updated', '_inserted', '_set')
+
+MASTER_STEPS = ['dish_master', 'broad_types', 'material_master', 'dish_material_mapping']
+FACT_STEPS = ['dish_facts', 'material_facts', 'material_usage', 'inventory']
+
+# Step -> skip option that disables it
+STEP_SKIP_OPTIONS = {
+    'dish_master': 'skip_dishes',
+    'broad_types': 'skip_broad_type',
+    'material_master': 'skip_materials',
+    'dish_material_mapping': 'skip_mapping',
+    'dish_facts': 'skip_dishes',
+    'material_facts': 'skip_materials',
+    'material_usage': 'skip_materials',
+    'inventory': 'skip_inventory',
+}
+
+# Steps whose failure does not fail the month (same as the monthly pipeline)
+OPTIONAL_STEPS = {'broad_types', 'material_usage'}
+
+
+class StepRecord(NamedTuple):
+    """Outcome of one (month, step)."""
+    year: int
+    month: int
+    step: str
+    status: str  # 'ok', 'failed', 'skipped' or 'resumed'
+    rows: int = 0
+    seconds: float = 0.0
+
+
+def count_rows(stats: Dict) -> int:
+    """Rows written according to an extractor statistics dictionary."""
+    return sum(value for key, value in stats.items()
+               if key.endswith(ROW_STAT_SUFFIXES) and isinstance(value, int))
+
+
+class BackfillCheckpoint:
+    """
+    Completed (month, step) pairs, one JSON file per month.
+
+    Each month file is only written by the process that owns the month at
+    the time (the scheduler for master steps, one worker for fact steps), so
+    no locking is needed.
+    """
+
+    def __init__(self, directory: Path, is_test: bool = False):
+        self.directory = Path(directory) / ('test' if is_test else 'production')
+
+    def _path(self, year: int, month: int) -> Path:
+        return self.directory / f"{year:04d}-{month:02d}.json"
+
+    def load(self, year: int, month: int) -> Dict[str, Dict]:
+        """Completed steps of a month: step -> {'rows', 'seconds', 'completed_at'}."""
+        path = self._path(year, month)
+        if not path.exists():
+            return {}
+        try:
+            return json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint {path}: {e}")
+            return {}
+
+    def is_done(self, year: int, month: int, step: str) -> bool:
+        return step in self.load(year, month)
+
+    def mark_done(self, year: int, month: int, step: str, rows: int, seconds: float):
+        """Record a completed step (written atomically)."""
+        completed = self.load(year, month)
+        completed[step] = {
+            'rows': rows,
+            'seconds': round(seconds, 3),
+            'completed_at': datetime.now().isoformat(timespec='seconds')
+        }
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(year, month)
+        temp_path = path.with_suffix('.tmp')
+        temp_path.write_text(json.dumps(completed, ensure_ascii=False, indent=2), encoding='utf-8')
+        os.replace(temp_path, path)
+
+    def clear(self):
+        """Forget every completed step."""
+        if self.directory.exists():
+            for path in self.directory.glob('*.json'):
+                path.unlink()
+
+
+def _run_step(db_manager: DatabaseManager, year: int, month: int, step: str) -> Dict:
+    """Run one backfill step and return the extractor statistics."""
+    if step == 'dish_master':
+        return DishExtractor(db_manager).extract_dishes_for_month(year, month, phase='master')
+    if step == 'broad_types':
+        return extract_broad_types_for_month(db_manager, year, month)
+    if step == 'material_master':
+        return MaterialExtractor(db_manager).extract_materials_for_month(year, month, phase='master')
+    if step == 'dish_material_mapping':
+        return DishMaterialExtractor(db_manager).extract_dish_material_mappings(year, month)
+    if step == 'dish_facts':
+        return DishExtractor(db_manager).extract_dishes_for_month(
+            year, month, phase='facts', deactivate_old_prices=False)
+    if step == 'material_facts':
+        return MaterialExtractor(db_manager).extract_materials_for_month(
+            year, month, phase='facts', deactivate_old_prices=False)
+    if step == 'material_usage':
+        return MaterialUsageExtractor(db_manager).extract_material_usage_for_month(
+            year, month, use_history_files=True, update_prices=True, deactivate_old_prices=False)
+    if step == 'inventory':
+        if not find_inventory_files(year, month, use_history=True):
+            return {'files_processed': 0, 'errors': 0}
+        return InventoryExtractor(db_manager).extract_inventory_for_month(year, month, None, True)
+    raise ValueError(f"Unknown backfill step: {step}")
+
+
+def run_month_steps(year: int, month: int, steps: List[str], is_test: bool,
+                    skip_options: Dict[str, bool], checkpoint: BackfillCheckpoint,
+                    db_manager: Optional[DatabaseManager] = None) -> List[StepRecord]:
+    """
+    Run the given steps for one month, skipping checkpointed ones.
+
+    A failed required step stops the month's remaining steps.
+    """
+    db_manager = db_manager or get_shared_database_manager(is_test=is_test)
+    completed = checkpoint.load(year, month)
+    records = []
+
+    for step in steps:
+        if skip_options.get(STEP_SKIP_OPTIONS[step]):
+            records.append(StepRecord(year, month, step, 'skipped'))
+            continue
+        if step in completed:
+            records.append(StepRecord(year, month, step, 'resumed', completed[step].get('rows', 0)))
+            continue
+
+        started = time.perf_counter()
+        try:
+            stats = _run_step(db_manager, year, month, step)
+            step_ok = stats.get('errors', 0) == 0
+        except Exception as e:
+            logger.error(f"{year}-{month:02d} {step} failed: {e}")
+            stats, step_ok = {}, False
+        elapsed = time.perf_counter() - started
+        rows = count_rows(stats)
+
+        if step_ok:
+            checkpoint.mark_done(year, month, step, rows, elapsed)
+        records.append(StepRecord(year, month, step, 'ok' if step_ok else 'failed', rows, elapsed))
+        logger.info(f"{year}-{month:02d} {step}: {'ok' if step_ok else 'FAILED'}, "
+                    f"{rows:,} rows in {elapsed:.2f}s")
+
+        if not step_ok and step not in OPTIONAL_STEPS:
+            break
+
+    return records
+
+
+def _init_worker():
+    """Configure logging in worker processes (needed with the spawn start method)."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+
+def _run_month_facts(year: int, month: int, is_test: bool, skip_options: Dict[str, bool],
+                     checkpoint_dir: str) -> List[StepRecord]:
+    """Process pool entry point: fact loads for one month."""
+    checkpoint = BackfillCheckpoint(Path(checkpoint_dir), is_test)
+    records = run_month_steps(year, month, FACT_STEPS, is_test, skip_options, checkpoint)
+    get_shared_database_manager(is_test=is_test).log_pool_stats()
+    return records
+
+
+def activate_latest_prices(db_manager: DatabaseManager) -> Tuple[int, int]:
+    """
+    Make the latest month the only active price per dish/material and store.
+
+    This is the state sequential month-by-month loading leaves behind; the
+    parallel fact loads skip deactivation and leave it to this step.
+
+    Returns:
+        (dish price rows changed, material price rows changed)
+    """
+    changed = []
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        for table, key in (('dish_price_history', 'dish_id'), ('material_price_history', 'material_id')):
+            cursor.execute(f"""
+                UPDATE {table} h
+                SET is_active = (h.effective_year * 100 + h.effective_month = latest.period)
+                FROM (
+                    SELECT {key}, store_id, MAX(effective_year * 100 + effective_month) AS period
+                    FROM {table}
+                    GROUP BY {key}, store_id
+                ) latest
+                WHERE h.{key} = latest.{key} AND h.store_id = latest.store_id
+                  AND h.is_active IS DISTINCT FROM (h.effective_year * 100 + h.effective_month = latest.period)
+            """)
+            changed.append(cursor.rowcount)
+        conn.commit()
+    return changed[0], changed[1]
+
+
+class BackfillResult(NamedTuple):
+    """Outcome of a backfill run."""
+    records: List[StepRecord]
+    failed_months: List[str]
+    phase_seconds: Dict[str, float]
+
+
+def run_backfill(months: List[Tuple[int, int]], is_test: bool = False,
+                 skip_options: Optional[Dict[str, bool]] = None,
+                 workers: int = CONNECTION_POOL_SIZE,
+                 checkpoint_dir: Path = DEFAULT_CHECKPOINT_DIR,
+                 reset_checkpoints: bool = False) -> BackfillResult:
+    """
+    Backfill several months: master data in order, then facts in parallel.
+
+    Args:
+        months: (year, month) tuples to load
+        is_test: Use test database
+        skip_options: skip_dishes / skip_broad_type / skip_materials /
+            skip_mapping / skip_inventory flags
+        workers: Worker processes for the fact loads, i.e. the maximum number
+            of concurrent database writers
+        checkpoint_dir: Directory for the per-month checkpoint files
+        reset_checkpoints: Reload every step even if checkpointed
+
+    Returns:
+        BackfillResult with one record per (month, step)
+    """
+    skip_options = skip_options or {}
+    months = sorted(months)
+    workers = max(1, workers)
+    checkpoint = BackfillCheckpoint(checkpoint_dir, is_test)
+    if reset_checkpoints:
+        checkpoint.clear()
+
+    db_manager = get_shared_database_manager(is_test=is_test)
+    records: List[StepRecord] = []
+    failed_months = set()
+    phase_seconds = {}
+
+    # Phase 1: master data, oldest month first so the latest values win
+    started = time.perf_counter()
+    for year, month in months:
+        logger.info(f"Master data for {year}-{month:02d}")
+        month_records = run_month_steps(year, month, MASTER_STEPS, is_test, skip_options,
+                                        checkpoint, db_manager)
+        records.extend(month_records)
+        if any(r.status == 'failed' and r.step not in OPTIONAL_STEPS for r in month_records):
+            failed_months.add((year, month))
+    phase_seconds['master'] = time.perf_counter() - started
+
+    # Phase 2: per-month facts across the process pool
+    started = time.perf_counter()
+    fact_months = [m for m in months if m not in failed_months]
+    logger.info(f"Loading facts for {len(fact_months)} month(s) with {workers} worker(s)")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = {
+            executor.submit(_run_month_facts, year, month, is_test, skip_options, str(checkpoint_dir)):
+                (year, month)
+            for year, month in fact_months
+        }
+        for future in as_completed(futures):
+            year, month = futures[future]
+            try:
+                month_records = future.result()
+            except Exception as e:
+                logger.error(f"Worker for {year}-{month:02d} failed: {e}")
+                failed_months.add((year, month))
+                continue
+            records.extend(month_records)
+            if any(r.status == 'failed' and r.step not in OPTIONAL_STEPS for r in month_records):
+                failed_months.add((year, month))
+    phase_seconds['facts'] = time.perf_counter() - started
+
+    # Phase 3: active prices, then the P&L summary of every loaded month (priced as of each month)
+    started = time.perf_counter()
+    if not (skip_options.get('skip_dishes') and skip_options.get('skip_materials')):
+        dish_changed, material_changed = activate_latest_prices(db_manager)
+        logger.info(f"Activated latest prices ({dish_changed} dish, {material_changed} material rows changed)")
+    for year, month in fact_months:
+        try:
+            StoreMonthPnl.refresh(db_manager, year, month)
+        except Exception:
+            records.append(StepRecord(year, month, 'store_month_pnl', 'failed'))
+            failed_months.add((year, month))
+    phase_seconds['finalize'] = time.perf_counter() - started
+    db_manager.log_pool_stats()
+
+    records.sort(key=lambda r: (r.year, r.month))
+    return BackfillResult(
+        records=records,
+        failed_months=[f"{year}-{month:02d}" for year, month in sorted(failed_months)],
+        phase_seconds=phase_seconds
+    )
+
+
+def print_backfill_summary(result: BackfillResult):
+    """Print rows and seconds per month, then the phase timings."""
+    per_month: Dict[Tuple[int, int], Dict] = {}
+    for record in result.records:
+        month = per_month.setdefault((record.year, record.month),
+                                     {'rows': 0, 'seconds': 0.0, 'resumed': 0, 'failed': []})
+        month['rows'] += record.rows
+        month['seconds'] += record.seconds
+        if record.status == 'resumed':
+            month['resumed'] += 1
+        elif record.status == 'failed':
+            month['failed'].append(record.step)
+
+    print("\n" + "="*70)
+    print("BACKFILL SUMMARY")
+    print("="*70)
+    print(f"{'Month':<10}{'Rows':>12}{'Seconds':>10}  Notes")
+    for (year, month), totals in sorted(per_month.items()):
+        notes = []
+        if totals['resumed']:
+            notes.append(f"{totals['resumed']} step(s) from checkpoint")
+        if totals['failed']:
+            notes.append(f"failed: {', '.join(totals['failed'])}")
+        print(f"{year:04d}-{month:02d}   {totals['rows']:>12,}{totals['seconds']:>10.1f}  {'; '.join(notes)}")
+    print("-"*70)
+    print("Phase timings: " + ", ".join(f"{name} {seconds:.1f}s"
+                                        for name, seconds in result.phase_seconds.items()))
+    print("="*70)
+
+
+__all__ = [
+    'StepRecord',
+    'BackfillCheckpoint',
+    'BackfillResult',
+    'MASTER_STEPS',
+    'FACT_STEPS',
+    'count_rows',
+    'run_month_steps',
+    'activate_latest_prices',
+    'run_backfill',
+    'print_backfill_summary'
+]
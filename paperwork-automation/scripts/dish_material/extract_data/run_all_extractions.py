@@ -1,13 +1,16 @@
 #!/usr/bin/env python3
 """
-Index script to run all dish-material extraction scripts in sequence.
+Index script to run all dish-material extractions in sequence.
 
-This script runs the following extractions in order:
+The extractors run in this process through extraction_pipeline, sharing one
+database connection pool and Excel cache. This script runs the following
+extractions in order:
 1. Dish extraction - Extracts dishes from sales data
 2. Dish broad type extraction - Updates dish broad type categories from general type files
 3. Material extraction - Extracts materials from export.XLSX 
 4. Dish-Material mapping - Creates BOM relationships between dishes and materials
-5. Inventory extraction - Extracts inventory counts from store inventory files
+5. Material usage extraction - Updates material types and prices
+6. Inventory extraction - Extracts inventory counts from store inventory files
 
 Usage:
     python run_all_extractions.py --year 2025 --month 7
@@ -17,12 +20,15 @@ Usage:
 import argparse
 import logging
 import sys
-import subprocess
 from pathlib import Path
-from typing import Dict, List
 
-# Import file discovery
-from file_discovery import discover_all_files
+# Add project root to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
+
+from scripts.dish_material.extract_data.file_discovery import discover_all_files
+from scripts.dish_material.extract_data.extraction_pipeline import (
+    run_extraction_pipeline, print_database_statistics, print_step_timings, confirm_from_console
+)
 
 # Configure logging
 logging.basicConfig(
@@ -32,50 +38,10 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def run_script(script_name: str, args: List[str]) -> bool:
-    """
-    Run a Python script with given arguments.
-    
-    Args:
-        script_name: Name of the script to run
-        args: Command line arguments to pass
-        
-    Returns:
-        True if successful, False otherwise
-    """
-    script_path = Path(__file__).parent / script_name
-    if not script_path.exists():
-        logger.error(f"Script not found: {script_path}")
-        return False
-    
-    cmd = [sys.executable, str(script_path)] + args
-    logger.info(f"Running: {' '.join(cmd)}")
-    
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8')
-        
-        # Print output
-        if result.stdout:
-            print(result.stdout)
-        if result.stderr:
-            print(result.stderr, file=sys.stderr)
-        
-        if result.returncode != 0:
-            logger.error(f"Script {script_name} failed with return code {result.returncode}")
-            return False
-            
-        logger.info(f"Script {script_name} completed successfully")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error running {script_name}: {e}")
-        return False
-
-
 def main():
     """Main entry point for the script."""
     parser = argparse.ArgumentParser(
-        description='Run all dish-material extraction scripts in sequence'
+        description='Run all dish-material extractions in sequence'
     )
     parser.add_argument(
         '--year',
@@ -186,15 +152,6 @@ def main():
             except UnicodeEncodeError:
                 print(f"Mapping: [file found]")
     
-    # Build common arguments
-    common_args = [
-        '--year', str(args.year),
-        '--month', str(args.month)
-    ]
-    
-    if args.test:
-        common_args.append('--test')
-    
     print("\n" + "="*60)
     print("DISH-MATERIAL EXTRACTION PIPELINE")
     print("="*60)
@@ -203,165 +160,44 @@ def main():
     print(f"Database: {'Test' if args.test else 'Production'}")
     print(f"Auto-discover: {args.auto_discover}")
     print("="*60 + "\n")
-    
-    success = True
-    
-    # Step 1: Extract dishes
-    if not args.skip_dishes:
-        print("\n" + "-"*60)
-        print("STEP 1: EXTRACTING DISHES")
-        print("-"*60)
-        
-        dish_args = common_args.copy()
-        if args.dish_input:
-            dish_args.extend(['--input-dir', args.dish_input])
-        
-        if not run_script('extract_dishes_to_database.py', dish_args):
-            logger.error("Dish extraction failed")
-            success = False
-            if not input("\nDish extraction failed. Continue anyway? (y/n): ").lower().startswith('y'):
-                sys.exit(1)
-    else:
-        logger.info("Skipping dish extraction")
-    
-    # Step 2: Extract dish broad types
-    if not args.skip_broad_type:
-        print("\n" + "-"*60)
-        print("STEP 2: EXTRACTING DISH BROAD TYPES")
-        print("-"*60)
-        
-        # Build target date from year and month
-        target_date = f"{args.year:04d}-{args.month:02d}-01"
-        broad_type_args = ['--target-date', target_date]
-        
-        if not run_script('extract_dish_broad_type.py', broad_type_args):
-            logger.warning("Dish broad type extraction failed - this is optional")
-            # Don't fail the whole pipeline for this optional step
-    else:
-        logger.info("Skipping dish broad type extraction")
-    
-    # Step 3: Extract materials
-    if not args.skip_materials:
-        print("\n" + "-"*60)
-        print("STEP 3: EXTRACTING MATERIALS")
-        print("-"*60)
 
-        material_args = common_args.copy()
-        if args.material_input:
-            material_args.extend(['--input-file', args.material_input])
-
-        if not run_script('extract_materials_to_database.py', material_args):
-            logger.error("Material extraction failed")
-            success = False
-            if not input("\nMaterial extraction failed. Continue anyway? (y/n): ").lower().startswith('y'):
-                sys.exit(1)
-    else:
-        logger.info("Skipping material extraction")
-    
-    # Step 4: Extract dish-material mappings
-    if not args.skip_mapping:
-        print("\n" + "-"*60)
-        print("STEP 4: EXTRACTING DISH-MATERIAL MAPPINGS")
-        print("-"*60)
-        
-        mapping_args = common_args.copy()
-        if args.mapping_input:
-            mapping_args.extend(['--input-file', args.mapping_input])
-
-        if not run_script('extract_dish_material_mapping.py', mapping_args):
-            logger.error("Dish-material mapping extraction failed")
-            success = False
-    else:
-        logger.info("Skipping dish-material mapping extraction")
-    
-    # Step 5: Extract material usage and types
-    # This should run BEFORE inventory to ensure material_use_type is populated
-    if not args.skip_materials:  # Only run if materials were extracted
-        print("\n" + "-"*60)
-        print("STEP 5: EXTRACTING MATERIAL USAGE AND TYPES")
-        print("-"*60)
-
-        usage_args = common_args.copy()
-
-        if not run_script('extract_material_usage_to_database.py', usage_args):
-            logger.warning("Material usage extraction failed - this is optional")
-            # Don't fail the pipeline for this step
-    else:
-        logger.info("Skipping material usage extraction (materials were skipped)")
-
-    # Step 6: Extract inventory counts
-    if not args.skip_inventory:
-        print("\n" + "-"*60)
-        print("STEP 6: EXTRACTING INVENTORY COUNTS")
-        print("-"*60)
-
-        inventory_args = common_args.copy()
-
-        # Check if inventory files exist for this month
-        if discovered_files.get('inventory'):
-            logger.info(f"Found {len(discovered_files['inventory'])} inventory files")
-
-            if not run_script('extract_inventory_to_database.py', inventory_args):
-                logger.error("Inventory extraction failed")
-                success = False
-                if not input("\nInventory extraction failed. Continue anyway? (y/n): ").lower().startswith('y'):
-                    sys.exit(1)
-        else:
-            logger.warning("No inventory files found for this month")
-    else:
-        logger.info("Skipping inventory extraction")
+    if not args.skip_inventory and discovered_files.get('inventory'):
+        logger.info(f"Found {len(discovered_files['inventory'])} inventory files")
+    elif not args.skip_inventory:
+        logger.warning("No inventory files found for this month")
+
+    result = run_extraction_pipeline(
+        args.year,
+        args.month,
+        is_test=args.test,
+        skip_dishes=args.skip_dishes,
+        skip_broad_type=args.skip_broad_type,
+        skip_materials=args.skip_materials,
+        skip_mapping=args.skip_mapping,
+        skip_inventory=args.skip_inventory,
+        dish_input=args.dish_input,
+        material_input=args.material_input,
+        mapping_input=args.mapping_input,
+        has_inventory_files=bool(discovered_files.get('inventory')),
+        confirm=confirm_from_console
+    )
 
     # Print summary
     print("\n" + "="*60)
     print("EXTRACTION PIPELINE SUMMARY")
     print("="*60)
-    
-    if success:
+
+    if result.success:
         print("[SUCCESS] All extractions completed successfully")
-        
-        # Print database statistics
-        try:
-            # Add parent directories to path for imports
-            sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
-            from utils.database import DatabaseManager, DatabaseConfig
-            
-            db_config = DatabaseConfig(is_test=args.test)
-            db_manager = DatabaseManager(db_config)
-            
-            with db_manager.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Get counts
-                cursor.execute('SELECT COUNT(*) FROM dish')
-                dish_count = cursor.fetchone()['count']
-                
-                cursor.execute('SELECT COUNT(*) FROM material')
-                material_count = cursor.fetchone()['count']
-                
-                cursor.execute('SELECT COUNT(*) FROM dish_material')
-                mapping_count = cursor.fetchone()['count']
-                
-                cursor.execute('SELECT COUNT(*) FROM inventory_count')
-                inventory_count = cursor.fetchone()['count']
-                
-                cursor.execute('SELECT COUNT(*) FROM dish WHERE broad_type IS NOT NULL')
-                dishes_with_broad_type = cursor.fetchone()['count']
-                
-                print(f"\nDatabase Statistics:")
-                print(f"  Dishes:               {dish_count:,}")
-                print(f"  Dishes with Broad Type: {dishes_with_broad_type:,}")
-                print(f"  Materials:            {material_count:,}")
-                print(f"  Dish-Material Links:  {mapping_count:,}")
-                print(f"  Inventory Counts:     {inventory_count:,}")
-                
-        except Exception as e:
-            logger.warning(f"Could not retrieve database statistics: {e}")
+        if result.database_statistics:
+            print_database_statistics(result.database_statistics)
     else:
         print("[FAILED] Some extractions failed - please review the logs above")
-    
+
+    print_step_timings(result.steps)
     print("="*60 + "\n")
-    
-    sys.exit(0 if success else 1)
+
+    sys.exit(0 if result.success else 1)
 
 
 if __name__ == '__main__':
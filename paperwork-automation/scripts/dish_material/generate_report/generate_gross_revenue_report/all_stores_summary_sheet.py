@@ -6,7 +6,7 @@ Generate summary sheet showing all stores' total revenue and actual material usa
 
 import sys
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 import logging
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl.utils import get_column_letter
@@ -17,6 +17,10 @@ sys.path.insert(0, str(project_root))
 
 from utils.database import DatabaseManager
 from lib.config import STORE_ID_TO_NAME_MAPPING
+from lib.database_utils import StoreMonthPnl
+from scripts.dish_material.generate_report.generate_gross_revenue_report.sheet_data_prefetcher import (
+    SheetDataPrefetcher, fetch_sheet_data
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -37,83 +41,38 @@ def get_all_stores_summary_data(db_manager: DatabaseManager, year: int, month: i
     """
     results = []
     
-    with db_manager.get_connection() as conn:
-        cursor = conn.cursor()
+    # Revenue (tax deducted), actual 成本类 material cost and margin per store,
+    # precomputed in store_month_pnl
+    for row in StoreMonthPnl.fetch(db_manager, (year, month), sales_only=True):
+        store_id = row['store_id']
         
-        # Query to get total revenue and actual material usage for each store
-        query = """
-        WITH store_revenue AS (
-            -- Get total revenue from dish sales (deducting tax)
-            SELECT
-                dms.store_id,
-                SUM(
-                    (COALESCE(dms.sale_amount, 0) - COALESCE(dms.return_amount, 0)) * COALESCE(dph.price, 0)
-                    - COALESCE(dms.tax_amount, 0)
-                ) as total_revenue
-            FROM dish_monthly_sale dms
-            LEFT JOIN dish_price_history dph ON dph.dish_id = dms.dish_id
-                AND dph.store_id = dms.store_id
-                AND dph.is_active = TRUE
-            WHERE dms.year = %s
-              AND dms.month = %s
-            GROUP BY dms.store_id
-        ),
-        material_usage AS (
-            -- Get actual material usage from material_monthly_usage (only 成本类)
-            SELECT 
-                mmu.store_id,
-                SUM(COALESCE(mmu.material_used, 0) * COALESCE(mph.price, 0)) as total_material_cost
-            FROM material_monthly_usage mmu
-            JOIN material m ON m.id = mmu.material_id AND m.store_id = mmu.store_id
-            LEFT JOIN material_price_history mph ON mph.material_id = m.id 
-                AND mph.store_id = m.store_id
-                AND mph.is_active = TRUE
-            WHERE mmu.year = %s
-              AND mmu.month = %s
-              AND mmu.material_use_type = '成本类'  -- Only include cost-type materials
-            GROUP BY mmu.store_id
-        )
-        SELECT 
-            sr.store_id,
-            COALESCE(sr.total_revenue, 0) as total_revenue,
-            COALESCE(mu.total_material_cost, 0) as total_material_cost,
-            COALESCE(sr.total_revenue, 0) - COALESCE(mu.total_material_cost, 0) as gross_profit,
-            CASE 
-                WHEN COALESCE(sr.total_revenue, 0) > 0 THEN 
-                    ((COALESCE(sr.total_revenue, 0) - COALESCE(mu.total_material_cost, 0)) / COALESCE(sr.total_revenue, 0)) * 100
-                ELSE 0
-            END as profit_margin
-        FROM store_revenue sr
-        LEFT JOIN material_usage mu ON mu.store_id = sr.store_id
-        ORDER BY sr.store_id
-        """
-        
-        cursor.execute(query, (year, month, year, month))
-        raw_data = cursor.fetchall()
-        
-        for row in raw_data:
-            store_id = row['store_id']
-            
-            # Skip Hi Bowl (store_id = 101) for now
-            if store_id == 101:
-                continue
-                
-            # Get store name
-            store_name = STORE_ID_TO_NAME_MAPPING.get(store_id, f"Store {store_id}")
+        # Skip Hi Bowl (store_id = 101) for now
+        if store_id == 101:
+            continue
             
-            results.append({
-                'store_id': store_id,
-                'store_name': store_name,
-                'total_revenue': float(row['total_revenue']) if row['total_revenue'] else 0,
-                'total_material_cost': float(row['total_material_cost']) if row['total_material_cost'] else 0,
-                'gross_profit': float(row['gross_profit']) if row['gross_profit'] else 0,
-                'profit_margin': float(row['profit_margin']) if row['profit_margin'] else 0
-            })
+        # Get store name
+        store_name = STORE_ID_TO_NAME_MAPPING.get(store_id, f"Store {store_id}")
+        
+        results.append({
+            'store_id': store_id,
+            'store_name': store_name,
+            'total_revenue': row['revenue'],
+            'total_material_cost': row['actual_cost'],
+            'gross_profit': row['revenue'] - row['actual_cost'],
+            'profit_margin': row['gross_margin']
+        })
     
     return results
 
 
-def write_all_stores_summary_sheet(worksheet, db_manager: DatabaseManager, year: int, month: int):
+def prefetch_all_stores_summary_sheet(prefetcher: SheetDataPrefetcher, db_manager: DatabaseManager,
+                                      year: int, month: int):
+    """Queue the summary sheet query on the report prefetcher"""
+    prefetcher.submit(get_all_stores_summary_data, db_manager, year, month)
+
+
+def write_all_stores_summary_sheet(worksheet, db_manager: DatabaseManager, year: int, month: int,
+                                   prefetcher: Optional[SheetDataPrefetcher] = None):
     """
     Write all stores summary data to an Excel worksheet.
     
@@ -122,6 +81,7 @@ def write_all_stores_summary_sheet(worksheet, db_manager: DatabaseManager, year:
         db_manager: Database manager instance
         year: Year for the data
         month: Month for the data
+        prefetcher: Optional report prefetcher holding the already queried data
     """
     # Add title
     title_cell = worksheet.cell(row=1, column=1, value="全店铺实际毛利汇总")
@@ -162,7 +122,7 @@ def write_all_stores_summary_sheet(worksheet, db_manager: DatabaseManager, year:
         cell.border = thin_border
     
     # Get data
-    data = get_all_stores_summary_data(db_manager, year, month)
+    data = fetch_sheet_data(prefetcher, get_all_stores_summary_data, db_manager, year, month)
     
     # Alternating row fills
     even_row_fill = PatternFill(start_color="F5F5F5", end_color="F5F5F5", fill_type="solid")
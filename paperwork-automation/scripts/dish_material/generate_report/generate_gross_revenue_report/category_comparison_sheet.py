@@ -9,7 +9,7 @@ Includes month-over-month and year-over-year comparisons.
 
 import sys
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import logging
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl.utils import get_column_letter
@@ -20,6 +20,9 @@ sys.path.insert(0, str(project_root))
 
 from utils.database import DatabaseManager
 from lib.config import STORE_ID_TO_NAME_MAPPING
+from scripts.dish_material.generate_report.generate_gross_revenue_report.sheet_data_prefetcher import (
+    SheetDataPrefetcher, fetch_sheet_data
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -298,7 +301,15 @@ def get_all_categories(db_manager: DatabaseManager) -> List[str]:
     return categories
 
 
-def write_category_comparison_sheet(worksheet, db_manager: DatabaseManager, year: int, month: int):
+def prefetch_category_comparison_sheet(prefetcher: SheetDataPrefetcher, db_manager: DatabaseManager,
+                                       year: int, month: int):
+    """Queue the category comparison queries on the report prefetcher"""
+    prefetcher.submit(get_category_gross_margin_data, db_manager, year, month)
+    prefetcher.submit(get_all_categories, db_manager)
+
+
+def write_category_comparison_sheet(worksheet, db_manager: DatabaseManager, year: int, month: int,
+                                    prefetcher: Optional[SheetDataPrefetcher] = None):
     """
     Write category comparison data to an Excel worksheet.
     
@@ -307,6 +318,7 @@ def write_category_comparison_sheet(worksheet, db_manager: DatabaseManager, year
         db_manager: Database manager instance
         year: Year for the data
         month: Month for the data
+        prefetcher: Optional report prefetcher holding the already queried data
     """
     # Add title
     title_cell = worksheet.cell(row=1, column=1, value="各店铺菜品大类毛利对比分析")
@@ -318,8 +330,8 @@ def write_category_comparison_sheet(worksheet, db_manager: DatabaseManager, year
     date_cell.alignment = Alignment(horizontal='center')
     
     # Get data
-    margin_data = get_category_gross_margin_data(db_manager, year, month)
-    categories = get_all_categories(db_manager)
+    margin_data = fetch_sheet_data(prefetcher, get_category_gross_margin_data, db_manager, year, month)
+    categories = fetch_sheet_data(prefetcher, get_all_categories, db_manager)
     
     # Merge title cells
     num_cols = 1 + len(categories) * 5  # Store name + 5 columns per category
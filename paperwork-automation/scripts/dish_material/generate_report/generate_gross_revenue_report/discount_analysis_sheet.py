@@ -7,9 +7,23 @@ import pandas as pd
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 
+from scripts.dish_material.generate_report.generate_gross_revenue_report.sheet_data_prefetcher import (
+    SheetDataPrefetcher, fetch_sheet_data
+)
+
 logger = logging.getLogger(__name__)
 
 class DiscountAnalysisSheet:
+    STORES = [
+        (1, '加拿大一店'),
+        (2, '加拿大二店'),
+        (3, '加拿大三店'),
+        (4, '加拿大四店'),
+        (5, '加拿大五店'),
+        (6, '加拿大六店'),
+        (7, '加拿大七店')
+    ]
+
     def __init__(self, db_manager, target_date: str):
         self.db_manager = db_manager
         self.target_date = datetime.strptime(target_date, '%Y-%m-%d')
@@ -109,21 +123,15 @@ class DiscountAnalysisSheet:
             'yoy_change': yoy_change
         }
 
-    def generate_sheet(self, workbook):
+    def prefetch(self, prefetcher: SheetDataPrefetcher):
+        """Queue every store's data query on the report prefetcher"""
+        for store_id, store_name in self.STORES:
+            prefetcher.submit(self._get_store_discount_analysis, store_id, store_name)
+
+    def generate_sheet(self, workbook, prefetcher: Optional[SheetDataPrefetcher] = None):
         """Generate the discount analysis sheet"""
         ws = workbook.create_sheet(self.sheet_name)
 
-        # Define stores
-        stores = [
-            (1, '加拿大一店'),
-            (2, '加拿大二店'),
-            (3, '加拿大三店'),
-            (4, '加拿大四店'),
-            (5, '加拿大五店'),
-            (6, '加拿大六店'),
-            (7, '加拿大七店')
-        ]
-
         # Style definitions
         header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
         header_font = Font(color="FFFFFF", bold=True, size=11)
@@ -185,11 +193,11 @@ class DiscountAnalysisSheet:
 
         # Get and write data for each store
         row_num = 3
-        for store_id, store_name in stores:
+        for store_id, store_name in self.STORES:
             logger.info(f"Processing discount data for {store_name}")
 
             try:
-                data = self._get_store_discount_analysis(store_id, store_name)
+                data = fetch_sheet_data(prefetcher, self._get_store_discount_analysis, store_id, store_name)
 
                 # Write store name
                 ws.cell(row=row_num, column=1, value=data['store_name']).border = border
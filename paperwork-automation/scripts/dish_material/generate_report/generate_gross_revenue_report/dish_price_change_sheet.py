@@ -7,9 +7,24 @@ import pandas as pd
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 
+from lib.bom_cost_engine import BomCostEngine
+from scripts.dish_material.generate_report.generate_gross_revenue_report.sheet_data_prefetcher import (
+    SheetDataPrefetcher, fetch_sheet_data
+)
+
 logger = logging.getLogger(__name__)
 
 class DishPriceChangeSheet:
+    STORES = [
+        (1, '加拿大一店'),
+        (2, '加拿大二店'),
+        (3, '加拿大三店'),
+        (4, '加拿大四店'),
+        (5, '加拿大五店'),
+        (6, '加拿大六店'),
+        (7, '加拿大七店')
+    ]
+
     def __init__(self, db_manager, target_date: str):
         self.db_manager = db_manager
         self.target_date = datetime.strptime(target_date, '%Y-%m-%d')
@@ -38,190 +53,88 @@ class DishPriceChangeSheet:
         year = start_date.year
         month = start_date.month
 
-        query = """
-            WITH dish_data AS (
-                SELECT
-                    d.full_code as dish_code,
-                    -- Use the first name for dishes with same full_code
-                    MIN(d.name) as dish_name,
-                    -- Aggregate IDs for dishes with same full_code
-                    ARRAY_AGG(DISTINCT d.id) as dish_ids,
-                    -- Sum quantities across all sizes
-                    SUM(dms.sale_amount) as total_quantity,
-                    -- Weighted average price
-                    SUM(dms.sale_amount * COALESCE(
-                        (SELECT dph.price
-                         FROM dish_price_history dph
-                         WHERE dph.dish_id = d.id
-                           AND dph.store_id = %s
-                           AND ((dph.effective_year < %s) OR
-                                (dph.effective_year = %s AND dph.effective_month <= %s))
-                         ORDER BY dph.effective_year DESC, dph.effective_month DESC
-                         LIMIT 1),
-                        0
-                    )) / NULLIF(SUM(dms.sale_amount), 0) as avg_price
-                FROM dish d
-                INNER JOIN dish_monthly_sale dms ON d.id = dms.dish_id
-                WHERE dms.store_id = %s
-                    AND dms.year = %s
-                    AND dms.month = %s
-                GROUP BY d.full_code
-            ),
-            material_usage AS (
-                SELECT
-                    dd.dish_code,
-                    -- Calculate theoretical material cost - sum for all dishes in this dish_code group
-                    SUM(
-                        CASE WHEN EXISTS (
-                            SELECT 1 FROM material_monthly_usage mmu
-                            WHERE mmu.material_id = m.id
-                              AND mmu.store_id = %s
-                              AND mmu.year = %s
-                              AND mmu.month = %s
-                              AND mmu.material_use_type = '成本类'
-                        )
-                        THEN
-                            -- Theoretical cost calculation
-                            COALESCE(dms.sale_amount, 0) *
-                            dm.standard_quantity * COALESCE(dm.loss_rate, 0) /
-                            COALESCE(NULLIF(dm.unit_conversion_rate, 0), 1) * COALESCE(mph.price, 0)
-                        ELSE 0
-                        END
-                    ) as theoretical_cost,
-                    -- Calculate ACTUAL material cost using actual usage from inventory
-                    SUM(
-                        CASE WHEN EXISTS (
-                            SELECT 1 FROM material_monthly_usage mmu
-                            WHERE mmu.material_id = m.id
-                              AND mmu.store_id = %s
-                              AND mmu.year = %s
-                              AND mmu.month = %s
-                              AND mmu.material_use_type = '成本类'
-                        )
-                        THEN
-                            -- Calculate this dish's proportion of total theoretical usage for this material
-                            -- Then multiply by actual usage from inventory
-                            CASE
-                                WHEN (
-                                    -- Total theoretical usage for this material across all dishes
-                                    SELECT SUM(dms2.sale_amount * dm2.standard_quantity * COALESCE(dm2.loss_rate, 0) /
-                                               COALESCE(NULLIF(dm2.unit_conversion_rate, 0), 1))
-                                    FROM dish_monthly_sale dms2
-                                    JOIN dish_material dm2 ON dm2.dish_id = dms2.dish_id AND dm2.store_id = dms2.store_id
-                                    WHERE dm2.material_id = m.id
-                                      AND dms2.store_id = %s
-                                      AND dms2.year = %s
-                                      AND dms2.month = %s
-                                ) > 0
-                                THEN
-                                    -- This dish's theoretical usage
-                                    (COALESCE(dms.sale_amount, 0) * dm.standard_quantity * COALESCE(dm.loss_rate, 0) /
-                                     COALESCE(NULLIF(dm.unit_conversion_rate, 0), 1)) /
-                                    -- Divided by total theoretical usage
-                                    (SELECT SUM(dms2.sale_amount * dm2.standard_quantity * COALESCE(dm2.loss_rate, 0) /
-                                                COALESCE(NULLIF(dm2.unit_conversion_rate, 0), 1))
-                                     FROM dish_monthly_sale dms2
-                                     JOIN dish_material dm2 ON dm2.dish_id = dms2.dish_id AND dm2.store_id = dms2.store_id
-                                     WHERE dm2.material_id = m.id
-                                       AND dms2.store_id = %s
-                                       AND dms2.year = %s
-                                       AND dms2.month = %s) *
-                                    -- Multiplied by actual usage from inventory
-                                    COALESCE((SELECT mmu.material_used
-                                              FROM material_monthly_usage mmu
-                                              WHERE mmu.material_id = m.id
-                                                AND mmu.store_id = %s
-                                                AND mmu.year = %s
-                                                AND mmu.month = %s), 0) *
-                                    -- Multiplied by material price
-                                    COALESCE(mph.price, 0)
-                                ELSE 0
-                            END
-                        ELSE 0
-                        END
-                    ) as actual_cost,
-                    -- Concatenate unique material names (without ORDER BY due to DISTINCT)
-                    STRING_AGG(
-                        DISTINCT CASE WHEN EXISTS (
-                            SELECT 1 FROM material_monthly_usage mmu
-                            WHERE mmu.material_id = m.id
-                              AND mmu.store_id = %s
-                              AND mmu.year = %s
-                              AND mmu.month = %s
-                              AND mmu.material_use_type = '成本类'
-                        )
-                        THEN m.description
-                        ELSE NULL
-                        END, ', '
-                    ) as materials_used
-                FROM dish_data dd
-                CROSS JOIN UNNEST(dd.dish_ids) as unnested_dish_id
-                LEFT JOIN dish_monthly_sale dms ON dms.dish_id = unnested_dish_id
-                    AND dms.store_id = %s
-                    AND dms.year = %s
-                    AND dms.month = %s
-                LEFT JOIN dish_material dm ON dm.dish_id = unnested_dish_id AND dm.store_id = %s
-                LEFT JOIN material m ON m.id = dm.material_id AND m.store_id = %s
-                LEFT JOIN material_price_history mph ON mph.material_id = m.id
-                    AND mph.store_id = %s
-                    AND mph.is_active = TRUE
-                GROUP BY dd.dish_code
-            )
+        dish_query = """
             SELECT
-                dd.dish_code,
-                dd.dish_name,
-                dd.dish_ids,
-                dd.avg_price,
-                dd.total_quantity,
-                COALESCE(dd.avg_price, 0) * dd.total_quantity as total_revenue,
-                COALESCE(mu.theoretical_cost, 0) as theoretical_cost,
-                COALESCE(mu.actual_cost, 0) as actual_cost,
-                COALESCE(mu.materials_used, '') as materials_used
-            FROM dish_data dd
-            LEFT JOIN material_usage mu ON mu.dish_code = dd.dish_code
-            WHERE dd.total_quantity > 0
+                d.full_code as dish_code,
+                -- Use the first name for dishes with same full_code
+                MIN(d.name) as dish_name,
+                -- Aggregate IDs for dishes with same full_code
+                ARRAY_AGG(DISTINCT d.id) as dish_ids,
+                -- Sum quantities across all sizes
+                SUM(dms.sale_amount) as total_quantity,
+                -- Weighted average price
+                SUM(dms.sale_amount * COALESCE(dph.price, 0)) / NULLIF(SUM(dms.sale_amount), 0) as avg_price
+            FROM dish d
+            INNER JOIN dish_monthly_sale dms ON d.id = dms.dish_id
+            LEFT JOIN dish_price_as_of(make_date(%s, %s, 1)) dph
+                ON dph.dish_id = d.id AND dph.store_id = dms.store_id
+            WHERE dms.store_id = %s
+                AND dms.year = %s
+                AND dms.month = %s
+            GROUP BY d.full_code
+            HAVING SUM(dms.sale_amount) > 0
+        """
+
+        # Cost-type (成本类) materials with their actual usage and current price
+        cost_material_query = """
+            SELECT
+                mmu.material_id,
+                COALESCE(mmu.material_used, 0) as material_used,
+                COALESCE(mph.price, 0) as price
+            FROM material_monthly_usage mmu
+            LEFT JOIN material_price_history mph ON mph.material_id = mmu.material_id
+                AND mph.store_id = mmu.store_id
+                AND mph.is_active = TRUE
+            WHERE mmu.store_id = %s
+                AND mmu.year = %s
+                AND mmu.month = %s
+                AND mmu.material_use_type = '成本类'
         """
 
         try:
             with self.db_manager.get_connection() as conn:
                 with conn.cursor() as cursor:
-                    cursor.execute(query, (
-                        # dish_data CTE price subquery
-                        store_id, year, year, month,
-                        # dish_data CTE main query
-                        store_id, year, month,
-                        # material_usage CTE - first EXISTS for theoretical_cost
-                        store_id, year, month,
-                        # material_usage CTE - second EXISTS for actual_cost
-                        store_id, year, month,
-                        # material_usage CTE - actual_cost subqueries
-                        store_id, year, month,  # First total theoretical subquery
-                        store_id, year, month,  # Second total theoretical subquery
-                        store_id, year, month,  # Actual usage subquery
-                        # material_usage CTE - third EXISTS for STRING_AGG
-                        store_id, year, month,
-                        # material_usage CTE - JOINs
-                        store_id, year, month,  # dish_monthly_sale
-                        store_id, store_id, store_id  # dish_material, material, material_price_history
-                    ))
-                    results = cursor.fetchall()
-
-                    dish_data = {}
-                    for row in results:
-                        # Use dish_code as the key for merged dishes
-                        dish_data[row['dish_code']] = {
-                            'dish_code': row['dish_code'],
-                            'dish_name': row['dish_name'],
-                            'dish_ids': row['dish_ids'],  # Array of dish IDs that were merged
-                            'avg_price': float(row['avg_price']) if row['avg_price'] else 0,
-                            'total_quantity': float(row['total_quantity']) if row['total_quantity'] else 0,
-                            'total_revenue': float(row['total_revenue']) if row['total_revenue'] else 0,
-                            'theoretical_cost': float(row['theoretical_cost']) if row['theoretical_cost'] else 0,
-                            'actual_cost': float(row['actual_cost']) if row['actual_cost'] else 0,
-                            'materials_used': row['materials_used'] if row['materials_used'] else ''
-                        }
-
-                    return dish_data
+                    cursor.execute(dish_query, (year, month, store_id, year, month))
+                    dish_rows = cursor.fetchall()
+
+                    cursor.execute(cost_material_query, (store_id, year, month))
+                    cost_materials = cursor.fetchall()
+
+                    engine = BomCostEngine.fetch(cursor, year, month, store_ids=[store_id])
+
+            # Theoretical cost: each dish's regular sales through its recipe at material prices.
+            # Actual cost: each material's actual usage cost split by the dish's share of
+            # the material's theoretical usage.
+            prices = {(row['material_id'], store_id): float(row['price']) for row in cost_materials}
+            actual_amounts = {(row['material_id'], store_id): float(row['material_used']) * float(row['price'])
+                              for row in cost_materials}
+            theoretical_costs = engine.dish_cost(prices, sales='regular')
+            actual_costs = engine.attribute(actual_amounts, sales='regular')
+
+            cost_lines = engine.lines[engine.lines['material_id'].isin([key[0] for key in prices])]
+            dish_material_names = cost_lines.groupby('dish_id')['material_description'].agg(
+                lambda names: set(names.dropna()))
+
+            dish_data = {}
+            for row in dish_rows:
+                dish_keys = [(dish_id, store_id) for dish_id in row['dish_ids']]
+                material_names = set().union(*(dish_material_names.get(dish_id, set())
+                                               for dish_id in row['dish_ids']))
+
+                # Use dish_code as the key for merged dishes
+                dish_data[row['dish_code']] = {
+                    'dish_code': row['dish_code'],
+                    'dish_name': row['dish_name'],
+                    'dish_ids': row['dish_ids'],  # Array of dish IDs that were merged
+                    'avg_price': float(row['avg_price']) if row['avg_price'] else 0,
+                    'total_quantity': float(row['total_quantity']) if row['total_quantity'] else 0,
+                    'total_revenue': (float(row['avg_price'] or 0) * float(row['total_quantity'] or 0)),
+                    'theoretical_cost': float(theoretical_costs.reindex(dish_keys).fillna(0).sum()),
+                    'actual_cost': float(actual_costs.reindex(dish_keys).fillna(0).sum()),
+                    'materials_used': ', '.join(sorted(material_names))
+                }
+
+            return dish_data
         except Exception as e:
             logger.error(f"Error getting dish prices and sales: {e}")
             return {}
@@ -451,21 +364,15 @@ class DishPriceChangeSheet:
         # Sort by absolute revenue impact (descending)
         return sorted(store_rows, key=lambda x: abs(x['环比影响收入']), reverse=True)
 
-    def generate_sheet(self, workbook):
+    def prefetch(self, prefetcher: SheetDataPrefetcher):
+        """Queue every store's data query on the report prefetcher"""
+        for store_id, store_name in self.STORES:
+            prefetcher.submit(self._get_store_data, store_id, store_name)
+
+    def generate_sheet(self, workbook, prefetcher: Optional[SheetDataPrefetcher] = None):
         """Generate the dish price change sheet"""
         ws = workbook.create_sheet(self.sheet_name)
 
-        # Define stores
-        stores = [
-            (1, '加拿大一店'),
-            (2, '加拿大二店'),
-            (3, '加拿大三店'),
-            (4, '加拿大四店'),
-            (5, '加拿大五店'),
-            (6, '加拿大六店'),
-            (7, '加拿大七店')
-        ]
-
         # Headers
         headers = [
             '门店', '菜品编码', '菜品名称', '本期单价', '上期单价',
@@ -494,9 +401,9 @@ class DishPriceChangeSheet:
 
         # Collect all data
         all_data = []
-        for store_id, store_name in stores:
+        for store_id, store_name in self.STORES:
             logger.info(f"Processing store: {store_name}")
-            store_data = self._get_store_data(store_id, store_name)
+            store_data = fetch_sheet_data(prefetcher, self._get_store_data, store_id, store_name)
             all_data.extend(store_data)
 
         # Write data rows
@@ -8,8 +8,10 @@ Creates an Excel workbook with a sheet for each store showing revenue and profit
 import argparse
 import sys
 import logging
+import time
 from pathlib import Path
 from datetime import datetime
+from dateutil.relativedelta import relativedelta
 from openpyxl import Workbook
 import os
 
@@ -18,18 +20,21 @@ project_root = Path(__file__).resolve().parent.parent.parent.parent.parent
 sys.path.insert(0, str(project_root))
 
 from utils.database import DatabaseManager, DatabaseConfig
-from lib.config import STORE_ID_TO_NAME_MAPPING
+from lib.config import STORE_ID_TO_NAME_MAPPING, CONNECTION_POOL_SIZE
+from scripts.dish_material.generate_report.generate_gross_revenue_report.sheet_data_prefetcher import (
+    SheetDataPrefetcher
+)
 from scripts.dish_material.generate_report.generate_gross_revenue_report.store_revenue_sheet import (
-    write_store_revenue_sheet
+    prefetch_store_revenue_sheet, write_store_revenue_sheet
 )
 from scripts.dish_material.generate_report.generate_gross_revenue_report.all_stores_summary_sheet import (
-    write_all_stores_summary_sheet
+    prefetch_all_stores_summary_sheet, write_all_stores_summary_sheet
 )
 from scripts.dish_material.generate_report.generate_gross_revenue_report.category_comparison_sheet import (
-    write_category_comparison_sheet
+    prefetch_category_comparison_sheet, write_category_comparison_sheet
 )
 from scripts.dish_material.generate_report.generate_gross_revenue_report.twelve_month_trend_sheet import (
-    write_twelve_month_trend_sheet
+    prefetch_twelve_month_trend_sheet, write_twelve_month_trend_sheet
 )
 from scripts.dish_material.generate_report.generate_gross_revenue_report.material_cost_change_sheet import (
     MaterialCostChangeSheet
@@ -55,9 +60,20 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def generate_gross_revenue_report(year: int, month: int, output_dir: str = None, test_db: bool = False, debug: bool = False):
+def get_report_stores():
+    """Stores that get their own gross revenue sheet (Hi Bowl is skipped for now)"""
+    return [(store_id, store_name) for store_id, store_name in STORE_ID_TO_NAME_MAPPING.items()
+            if store_id != 101]
+
+
+def generate_gross_revenue_report(year: int, month: int, output_dir: str = None, test_db: bool = False,
+                                  debug: bool = False, workers: int = CONNECTION_POOL_SIZE):
     """
     Generate gross revenue report for all stores.
+
+    The report is built in two phases: every sheet and store query is first
+    run concurrently on a thread pool sharing the DB connection pool, then the
+    workbook is written on this thread from the fetched data.
     
     Args:
         year: Target year
@@ -65,6 +81,7 @@ def generate_gross_revenue_report(year: int, month: int, output_dir: str = None,
         output_dir: Output directory for the Excel file
         test_db: Use test database if True
         debug: If True, include detailed columns in the output
+        workers: Number of concurrent database queries in the fetch phase
     """
     # Set up output directory
     if output_dir is None:
@@ -74,122 +91,127 @@ def generate_gross_revenue_report(year: int, month: int, output_dir: str = None,
     
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    # Create database connection
+    # Create database connection (one pooled connection per worker)
+    workers = max(1, workers)
     db_config = DatabaseConfig(is_test=test_db)
-    db_manager = DatabaseManager(db_config)
-    
-    # Create workbook
-    workbook = Workbook()
-    
-    # Remove default sheet
-    if "Sheet" in workbook.sheetnames:
-        workbook.remove(workbook["Sheet"])
-    
-    # First, create the summary sheet for all stores
-    logger.info("Creating all stores summary sheet")
-    summary_sheet = workbook.create_sheet(title="全店铺实际毛利汇总", index=0)
-    write_all_stores_summary_sheet(
-        worksheet=summary_sheet,
-        db_manager=db_manager,
-        year=year,
-        month=month
-    )
-    logger.info("Successfully created summary sheet")
-    
-    # Second, create the category comparison sheet
-    logger.info("Creating category comparison sheet")
-    category_sheet = workbook.create_sheet(title="分类毛利对比", index=1)
-    write_category_comparison_sheet(
-        worksheet=category_sheet,
-        db_manager=db_manager,
-        year=year,
-        month=month
-    )
-    logger.info("Successfully created category comparison sheet")
-    
-    # Third, create the 12-month trend sheet
-    logger.info("Creating 12-month trend sheet")
-    trend_sheet = workbook.create_sheet(title="12月趋势分析", index=2)
-    write_twelve_month_trend_sheet(
-        worksheet=trend_sheet,
-        db_manager=db_manager,
-        year=year,
-        month=month
-    )
-    logger.info("Successfully created 12-month trend sheet")
+    db_manager = DatabaseManager(db_config, pooled=True, pool_size=workers)
 
-    # Fourth, create the material cost change sheet
-    logger.info("Creating material cost change sheet")
-    target_date = f"{year}-{month:02d}-01"
-    from datetime import datetime
-    from dateutil.relativedelta import relativedelta
+    # Sheets that compare the month against last month / last year use the month end
     last_day = datetime(year, month, 1) + relativedelta(months=1) - relativedelta(days=1)
     target_date = last_day.strftime("%Y-%m-%d")
 
-    material_cost_sheet = MaterialCostChangeSheet(db_manager, target_date)
-    material_cost_sheet.generate_sheet(workbook)
-    logger.info("Successfully created material cost change sheet")
+    analysis_sheets = [
+        ("material cost change", MaterialCostChangeSheet(db_manager, target_date)),
+        ("discount analysis", DiscountAnalysisSheet(db_manager, target_date)),
+        ("dish price change", DishPriceChangeSheet(db_manager, target_date)),
+        ("gross margin analysis", GrossMarginAnalysisSheet(db_manager, target_date)),
+        ("gross margin YoY analysis", GrossMarginYoYSheet(db_manager, target_date)),
+    ]
+    stores = get_report_stores()
 
-    # Fifth, create the discount analysis sheet
-    logger.info("Creating discount analysis sheet")
-    discount_sheet = DiscountAnalysisSheet(db_manager, target_date)
-    discount_sheet.generate_sheet(workbook)
-    logger.info("Successfully created discount analysis sheet")
+    with SheetDataPrefetcher(workers) as prefetcher:
+        # Phase one: query the data for every sheet and store concurrently
+        logger.info(f"Fetching report data with {workers} worker(s)")
+        fetch_start = time.perf_counter()
+        prefetch_all_stores_summary_sheet(prefetcher, db_manager, year, month)
+        prefetch_category_comparison_sheet(prefetcher, db_manager, year, month)
+        prefetch_twelve_month_trend_sheet(prefetcher, db_manager, year, month)
+        for _, sheet in analysis_sheets:
+            sheet.prefetch(prefetcher)
+        for store_id, _ in stores:
+            prefetch_store_revenue_sheet(prefetcher, db_manager, year, month, store_id, debug)
+        prefetcher.wait()
+        fetch_time = time.perf_counter() - fetch_start
+        logger.info(f"Fetched {prefetcher.query_count} queries in {fetch_time:.2f}s")
 
-    # Sixth, create the dish price change sheet
-    logger.info("Creating dish price change sheet")
-    dish_price_sheet = DishPriceChangeSheet(db_manager, target_date)
-    dish_price_sheet.generate_sheet(workbook)
-    logger.info("Successfully created dish price change sheet")
+        # Phase two: write the workbook on this thread
+        write_start = time.perf_counter()
 
-    # Seventh, create the gross margin analysis sheet
-    logger.info("Creating gross margin analysis sheet")
-    margin_analysis_sheet = GrossMarginAnalysisSheet(db_manager, target_date)
-    margin_analysis_sheet.generate_sheet(workbook)
-    logger.info("Successfully created gross margin analysis sheet")
+        # Create workbook
+        workbook = Workbook()
+
+        # Remove default sheet
+        if "Sheet" in workbook.sheetnames:
+            workbook.remove(workbook["Sheet"])
+
+        # First, create the summary sheet for all stores
+        logger.info("Creating all stores summary sheet")
+        summary_sheet = workbook.create_sheet(title="全店铺实际毛利汇总", index=0)
+        write_all_stores_summary_sheet(
+            worksheet=summary_sheet,
+            db_manager=db_manager,
+            year=year,
+            month=month,
+            prefetcher=prefetcher
+        )
+        logger.info("Successfully created summary sheet")
+
+        # Second, create the category comparison sheet
+        logger.info("Creating category comparison sheet")
+        category_sheet = workbook.create_sheet(title="分类毛利对比", index=1)
+        write_category_comparison_sheet(
+            worksheet=category_sheet,
+            db_manager=db_manager,
+            year=year,
+            month=month,
+            prefetcher=prefetcher
+        )
+        logger.info("Successfully created category comparison sheet")
+
+        # Third, create the 12-month trend sheet
+        logger.info("Creating 12-month trend sheet")
+        trend_sheet = workbook.create_sheet(title="12月趋势分析", index=2)
+        write_twelve_month_trend_sheet(
+            worksheet=trend_sheet,
+            db_manager=db_manager,
+            year=year,
+            month=month,
+            prefetcher=prefetcher
+        )
+        logger.info("Successfully created 12-month trend sheet")
+
+        # Then the material cost, discount, dish price, margin and YoY sheets
+        for description, sheet in analysis_sheets:
+            logger.info(f"Creating {description} sheet")
+            sheet.generate_sheet(workbook, prefetcher=prefetcher)
+            logger.info(f"Successfully created {description} sheet")
+
+        # Generate sheets for each store
+        stores_processed = 0
+        for store_id, store_name in stores:
+            logger.info(f"Processing {store_name} (Store ID: {store_id})")
+
+            try:
+                # Create a sheet for this store
+                # Shorten sheet names
+                sheet_name = store_name
+                if "\u52a0\u62ff\u5927" in sheet_name:
+                    sheet_name = sheet_name.replace("\u52a0\u62ff\u5927", "CA")
+                sheet_name = f"{sheet_name}\u6bdb\u5229"
+                worksheet = workbook.create_sheet(title=sheet_name)
+
+                # Write revenue data to the sheet
+                write_store_revenue_sheet(
+                    worksheet=worksheet,
+                    db_manager=db_manager,
+                    year=year,
+                    month=month,
+                    store_id=store_id,
+                    store_name=store_name,
+                    debug=debug,
+                    prefetcher=prefetcher
+                )
+
+                stores_processed += 1
+                logger.info(f"Successfully processed {store_name}")
+
+            except Exception as e:
+                logger.error(f"Error processing {store_name}: {str(e)}", exc_info=True)
+                # Continue with next store even if this one fails
+                continue
+
+        write_time = time.perf_counter() - write_start
 
-    # Eighth, create the gross margin YoY analysis sheet
-    logger.info("Creating gross margin YoY analysis sheet")
-    margin_yoy_sheet = GrossMarginYoYSheet(db_manager, target_date)
-    margin_yoy_sheet.generate_sheet(workbook)
-    logger.info("Successfully created gross margin YoY analysis sheet")
-    
-    # Generate sheets for each store
-    stores_processed = 0
-    for store_id, store_name in STORE_ID_TO_NAME_MAPPING.items():
-        if store_id == 101:  # Skip Hi Bowl for now
-            continue
-            
-        logger.info(f"Processing {store_name} (Store ID: {store_id})")
-        
-        try:
-            # Create a sheet for this store
-            # Shorten sheet names
-            sheet_name = store_name
-            if "\u52a0\u62ff\u5927" in sheet_name:
-                sheet_name = sheet_name.replace("\u52a0\u62ff\u5927", "CA")
-            sheet_name = f"{sheet_name}\u6bdb\u5229"
-            worksheet = workbook.create_sheet(title=sheet_name)
-            
-            # Write revenue data to the sheet
-            write_store_revenue_sheet(
-                worksheet=worksheet,
-                db_manager=db_manager,
-                year=year,
-                month=month,
-                store_id=store_id,
-                store_name=store_name,
-                debug=debug
-            )
-            
-            stores_processed += 1
-            logger.info(f"Successfully processed {store_name}")
-            
-        except Exception as e:
-            logger.error(f"Error processing {store_name}: {str(e)}", exc_info=True)
-            # Continue with next store even if this one fails
-            continue
-    
     if stores_processed == 0:
         logger.error("No stores were successfully processed")
         return None
@@ -199,8 +221,13 @@ def generate_gross_revenue_report(year: int, month: int, output_dir: str = None,
     output_path = output_dir / output_filename
     
     try:
+        save_start = time.perf_counter()
         workbook.save(output_path)
+        save_time = time.perf_counter() - save_start
         logger.info(f"Report saved to: {output_path}")
+        logger.info(f"Phase timings: fetch {fetch_time:.2f}s ({workers} workers), "
+                    f"write {write_time:.2f}s, save {save_time:.2f}s")
+        db_manager.log_pool_stats()
         return output_path
     except Exception as e:
         logger.error(f"Failed to save workbook: {str(e)}")
@@ -239,6 +266,12 @@ def main():
         action='store_true',
         help='Include detailed columns (dish codes, material details)'
     )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=CONNECTION_POOL_SIZE,
+        help=f'Concurrent database queries while fetching report data (default: {CONNECTION_POOL_SIZE})'
+    )
     
     args = parser.parse_args()
     
@@ -255,6 +288,7 @@ def main():
     print(f"Month: {args.month}")
     print(f"Database: {'Test' if args.test else 'Production'}")
     print(f"Debug Mode: {'Enabled' if args.debug else 'Disabled'}")
+    print(f"Workers: {args.workers}")
     print("="*60 + "\n")
     
     # Generate report
@@ -263,7 +297,8 @@ def main():
         month=args.month,
         output_dir=args.output_dir,
         test_db=args.test,
-        debug=args.debug
+        debug=args.debug,
+        workers=args.workers
     )
     
     # Print result
@@ -7,9 +7,24 @@ import pandas as pd
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 
+from lib.database_utils import StoreMonthPnl
+from scripts.dish_material.generate_report.generate_gross_revenue_report.sheet_data_prefetcher import (
+    SheetDataPrefetcher, fetch_sheet_data
+)
+
 logger = logging.getLogger(__name__)
 
 class GrossMarginAnalysisSheet:
+    STORES = [
+        (1, '加拿大一店'),
+        (2, '加拿大二店'),
+        (3, '加拿大三店'),
+        (4, '加拿大四店'),
+        (5, '加拿大五店'),
+        (6, '加拿大六店'),
+        (7, '加拿大七店')
+    ]
+
     def __init__(self, db_manager, target_date: str):
         self.db_manager = db_manager
         self.target_date = datetime.strptime(target_date, '%Y-%m-%d')
@@ -28,199 +43,141 @@ class GrossMarginAnalysisSheet:
             'last_month': (last_month_start, last_month_end)
         }
 
-    def _get_revenue_and_cost(self, start_date: datetime, end_date: datetime, store_id: int) -> Dict[str, float]:
-        """Get revenue and cost data for a specific period"""
+    def _store_ids(self) -> Tuple[int, ...]:
+        """Store ids covered by the sheet (a tuple so it can key prefetched queries)"""
+        return tuple(store_id for store_id, _ in self.STORES)
+
+    def _get_all_revenue_and_cost(self, start_date: datetime, end_date: datetime,
+                                  store_ids: Tuple[int, ...]) -> Dict[int, Dict[str, float]]:
+        """Get revenue and cost data for a period, for all stores at once, keyed by store_id"""
         year = start_date.year
         month = start_date.month
 
-        # Get revenue from dish_monthly_sale (same as summary sheet)
-        revenue_query = """
-            SELECT
-                SUM((COALESCE(dms.sale_amount, 0) - COALESCE(dms.return_amount, 0)) * COALESCE(dph.price, 0)) as total_revenue
-            FROM dish_monthly_sale dms
-            LEFT JOIN dish_price_history dph ON dph.dish_id = dms.dish_id
-                AND dph.store_id = dms.store_id
-                AND dph.is_active = TRUE
-            WHERE dms.store_id = %s
-                AND dms.year = %s
-                AND dms.month = %s
-        """
-
-        # Get discount from daily_report (separate query)
+        # Get discount from daily_report (the current period may be month-to-date)
         discount_query = """
             SELECT
+                store_id,
                 SUM(CAST(discount_total AS DECIMAL(15,2))) as total_discount
             FROM daily_report
-            WHERE store_id = %s
+            WHERE store_id = ANY(%s)
                 AND date >= %s
                 AND date <= %s
-        """
-
-        # Get material cost (only 成本类 materials, same as summary sheet)
-        material_cost_query = """
-            SELECT
-                SUM(COALESCE(mmu.material_used, 0) * COALESCE(mph.price, 0)) as total_material_cost
-            FROM material_monthly_usage mmu
-            JOIN material m ON m.id = mmu.material_id AND m.store_id = mmu.store_id
-            LEFT JOIN material_price_history mph ON mph.material_id = m.id
-                AND mph.store_id = m.store_id
-                AND mph.is_active = TRUE
-            WHERE mmu.store_id = %s
-                AND mmu.year = %s
-                AND mmu.month = %s
-                AND mmu.material_use_type = '成本类'  -- Only include cost-type materials
+            GROUP BY store_id
         """
 
         try:
+            # Revenue (sales before tax deduction) and actual 成本类 material
+            # cost come precomputed from store_month_pnl
+            pnl_rows = StoreMonthPnl.fetch(self.db_manager, (year, month), store_ids=list(store_ids))
+            revenues = {row['store_id']: row['sales_revenue'] for row in pnl_rows}
+            costs = {row['store_id']: row['actual_cost'] for row in pnl_rows}
+
             with self.db_manager.get_connection() as conn:
                 with conn.cursor() as cursor:
-                    # Get revenue data
-                    cursor.execute(revenue_query, (store_id, year, month))
-                    revenue_result = cursor.fetchone()
-                    total_revenue = float(revenue_result['total_revenue']) if revenue_result['total_revenue'] else 0
-
                     # Get discount data from daily_report
-                    cursor.execute(discount_query, (store_id, start_date, end_date))
-                    discount_result = cursor.fetchone()
-                    total_discount = float(discount_result['total_discount']) if discount_result and discount_result['total_discount'] else 0
-
-                    # Get material cost
-                    cursor.execute(material_cost_query, (store_id, year, month))
-                    cost_result = cursor.fetchone()
-
-                    total_cost = float(cost_result['total_material_cost']) if cost_result['total_material_cost'] else 0
-
-                    return {
-                        'revenue': total_revenue,
-                        'discount': total_discount,
-                        'cost': total_cost,
-                        'gross_profit': total_revenue - total_cost,
-                        'gross_margin': ((total_revenue - total_cost) / total_revenue * 100) if total_revenue > 0 else 0
-                    }
+                    cursor.execute(discount_query, (list(store_ids), start_date, end_date))
+                    discounts = {row['store_id']: float(row['total_discount'] or 0) for row in cursor.fetchall()}
         except Exception as e:
             logger.error(f"Error getting revenue and cost data: {e}")
-            return {
-                'revenue': 0,
-                'discount': 0,
-                'cost': 0,
-                'gross_profit': 0,
-                'gross_margin': 0
+            revenues, discounts, costs = {}, {}, {}
+
+        results = {}
+        for store_id in store_ids:
+            total_revenue = revenues.get(store_id, 0)
+            total_cost = costs.get(store_id, 0)
+            results[store_id] = {
+                'revenue': total_revenue,
+                'discount': discounts.get(store_id, 0),
+                'cost': total_cost,
+                'gross_profit': total_revenue - total_cost,
+                'gross_margin': ((total_revenue - total_cost) / total_revenue * 100) if total_revenue > 0 else 0
             }
+        return results
 
-    def _get_dish_price_impact(self, store_id: int, current_month: Tuple, last_month: Tuple) -> Dict[str, float]:
-        """Calculate impact of dish price changes on gross margin"""
+    def _get_all_dish_price_impact(self, store_ids: Tuple[int, ...], current_month: Tuple,
+                                   last_month: Tuple) -> Dict[int, float]:
+        """Calculate impact of dish price changes on gross margin for all stores, keyed by store_id"""
         current_year, current_mon = current_month
         last_year, last_mon = last_month
 
+        # Last month's price is looked up for the dishes sold this month only;
+        # every other dish would be dropped by the join anyway
         query = """
             WITH current_dishes AS (
                 SELECT
+                    dms.store_id,
                     d.id,
                     dms.sale_amount,
-                    COALESCE(
-                        (SELECT dph.price
-                         FROM dish_price_history dph
-                         WHERE dph.dish_id = d.id
-                           AND dph.store_id = %s
-                           AND ((dph.effective_year < %s) OR
-                                (dph.effective_year = %s AND dph.effective_month <= %s))
-                         ORDER BY dph.effective_year DESC, dph.effective_month DESC
-                         LIMIT 1),
-                        0
-                    ) as current_price
+                    COALESCE(cur.price, 0) as current_price,
+                    COALESCE(prev.price, 0) as last_price
                 FROM dish d
                 INNER JOIN dish_monthly_sale dms ON d.id = dms.dish_id
-                WHERE dms.store_id = %s
+                LEFT JOIN dish_price_as_of(make_date(%s, %s, 1)) cur
+                    ON cur.dish_id = d.id AND cur.store_id = dms.store_id
+                LEFT JOIN dish_price_as_of(make_date(%s, %s, 1)) prev
+                    ON prev.dish_id = d.id AND prev.store_id = dms.store_id
+                WHERE dms.store_id = ANY(%s)
                     AND dms.year = %s
                     AND dms.month = %s
                     AND d.full_code != '14120001'
-            ),
-            last_dishes AS (
-                SELECT
-                    d.id,
-                    COALESCE(
-                        (SELECT dph.price
-                         FROM dish_price_history dph
-                         WHERE dph.dish_id = d.id
-                           AND dph.store_id = %s
-                           AND ((dph.effective_year < %s) OR
-                                (dph.effective_year = %s AND dph.effective_month <= %s))
-                         ORDER BY dph.effective_year DESC, dph.effective_month DESC
-                         LIMIT 1),
-                        0
-                    ) as last_price
-                FROM dish d
             )
             SELECT
+                cd.store_id,
                 SUM(CASE
-                    WHEN ld.last_price > 0 THEN (cd.current_price - ld.last_price) * cd.sale_amount
+                    WHEN cd.last_price > 0 THEN (cd.current_price - cd.last_price) * cd.sale_amount
                     ELSE 0
                 END) as price_impact
             FROM current_dishes cd
-            LEFT JOIN last_dishes ld ON cd.id = ld.id
             WHERE cd.sale_amount > 0
+            GROUP BY cd.store_id
         """
 
         try:
             with self.db_manager.get_connection() as conn:
                 with conn.cursor() as cursor:
                     cursor.execute(query,
-                                 (store_id, current_year, current_year, current_mon,
-                                  store_id, current_year, current_mon,
-                                  store_id, last_year, last_year, last_mon))
-                    result = cursor.fetchone()
-
-                    return float(result['price_impact']) if result['price_impact'] else 0
+                                 (current_year, current_mon,
+                                  last_year, last_mon,
+                                  list(store_ids), current_year, current_mon))
+                    return {row['store_id']: float(row['price_impact'] or 0) for row in cursor.fetchall()}
         except Exception as e:
             logger.error(f"Error calculating dish price impact: {e}")
-            return 0
+            return {}
 
-    def _get_material_price_impact(self, store_id: int, current_month: Tuple, last_month: Tuple) -> Dict[str, float]:
-        """Calculate impact of material price changes on gross margin"""
+    def _get_all_material_price_impact(self, store_ids: Tuple[int, ...], current_month: Tuple,
+                                       last_month: Tuple) -> Dict[int, float]:
+        """Calculate impact of material price changes on gross margin for all stores, keyed by store_id"""
         current_year, current_mon = current_month
         last_year, last_mon = last_month
 
         query = """
             WITH current_materials AS (
                 SELECT
+                    mmu.store_id,
                     mmu.material_id,
                     mmu.material_used,
-                    COALESCE(
-                        (SELECT mph.price
-                         FROM material_price_history mph
-                         WHERE mph.material_id = mmu.material_id
-                           AND mph.store_id = %s
-                           AND ((mph.effective_year < %s) OR
-                                (mph.effective_year = %s AND mph.effective_month <= %s))
-                         ORDER BY mph.effective_year DESC, mph.effective_month DESC
-                         LIMIT 1),
-                        0
-                    ) as current_price
+                    COALESCE(mph.price, 0) as current_price
                 FROM material_monthly_usage mmu
-                WHERE mmu.store_id = %s
+                LEFT JOIN material_price_as_of(make_date(%s, %s, 1)) mph
+                    ON mph.material_id = mmu.material_id AND mph.store_id = mmu.store_id
+                WHERE mmu.store_id = ANY(%s)
                     AND mmu.year = %s
                     AND mmu.month = %s
             ),
             last_materials AS (
                 SELECT
+                    mmu.store_id,
                     mmu.material_id,
-                    COALESCE(
-                        (SELECT mph.price
-                         FROM material_price_history mph
-                         WHERE mph.material_id = mmu.material_id
-                           AND mph.store_id = %s
-                           AND ((mph.effective_year < %s) OR
-                                (mph.effective_year = %s AND mph.effective_month <= %s))
-                         ORDER BY mph.effective_year DESC, mph.effective_month DESC
-                         LIMIT 1),
-                        0
-                    ) as last_price
+                    COALESCE(mph.price, 0) as last_price
                 FROM material_monthly_usage mmu
-                WHERE mmu.store_id = %s
+                LEFT JOIN material_price_as_of(make_date(%s, %s, 1)) mph
+                    ON mph.material_id = mmu.material_id AND mph.store_id = mmu.store_id
+                WHERE mmu.store_id = ANY(%s)
                     AND mmu.year = %s
                     AND mmu.month = %s
             )
             SELECT
+                cm.store_id,
                 SUM(CASE
                     WHEN lm.material_id IS NOT NULL AND lm.last_price > 0
                     THEN (cm.current_price - lm.last_price) * cm.material_used
@@ -228,121 +185,77 @@ class GrossMarginAnalysisSheet:
                 END) as price_impact
             FROM current_materials cm
             LEFT JOIN last_materials lm ON cm.material_id = lm.material_id
+                AND cm.store_id = lm.store_id
             WHERE cm.material_used > 0
+            GROUP BY cm.store_id
         """
 
         try:
             with self.db_manager.get_connection() as conn:
                 with conn.cursor() as cursor:
                     cursor.execute(query,
-                                 (store_id, current_year, current_year, current_mon,
-                                  store_id, current_year, current_mon,
-                                  store_id, last_year, last_year, last_mon,
-                                  store_id, last_year, last_mon))
-                    result = cursor.fetchone()
-
-                    return float(result['price_impact']) if result['price_impact'] else 0
+                                 (current_year, current_mon,
+                                  list(store_ids), current_year, current_mon,
+                                  last_year, last_mon,
+                                  list(store_ids), last_year, last_mon))
+                    return {row['store_id']: float(row['price_impact'] or 0) for row in cursor.fetchall()}
         except Exception as e:
             logger.error(f"Error calculating material price impact: {e}")
-            return 0
+            return {}
 
-    def _calculate_dish_loss_impact(self, store_id: int, current_month: Tuple) -> float:
-        """Calculate dish loss/waste impact (actual vs theoretical material usage)"""
+    def _calculate_all_dish_loss_impact(self, store_ids: Tuple[int, ...], current_month: Tuple) -> Dict[int, float]:
+        """Calculate dish loss/waste impact (actual vs theoretical material usage) for all stores, keyed by store_id"""
         current_year, current_mon = current_month
 
-        # Match the dish price change sheet calculation exactly
-        # Calculate total theoretical cost and actual cost, then return the difference
-        query = """
-            WITH dish_sales AS (
-                -- Get all dishes sold this month
-                SELECT
-                    dms.dish_id,
-                    SUM(dms.sale_amount) as total_quantity
-                FROM dish_monthly_sale dms
-                WHERE dms.store_id = %s
-                    AND dms.year = %s
-                    AND dms.month = %s
-                GROUP BY dms.dish_id
-            ),
-            theoretical_cost AS (
-                -- Calculate theoretical cost based on BOM
-                SELECT
-                    SUM(
-                        CASE WHEN EXISTS (
-                            SELECT 1 FROM material_monthly_usage mmu
-                            WHERE mmu.material_id = m.id
-                              AND mmu.store_id = %s
-                              AND mmu.year = %s
-                              AND mmu.month = %s
-                              AND mmu.material_use_type = '成本类'
-                        )
-                        THEN ds.total_quantity * dm.standard_quantity * COALESCE(dm.loss_rate, 0) /
-                             COALESCE(NULLIF(dm.unit_conversion_rate, 0), 1) * COALESCE(mph.price, 0)
-                        ELSE 0
-                        END
-                    ) as total_theoretical
-                FROM dish_sales ds
-                LEFT JOIN dish_material dm ON dm.dish_id = ds.dish_id AND dm.store_id = %s
-                LEFT JOIN material m ON m.id = dm.material_id AND m.store_id = %s
-                LEFT JOIN material_price_history mph ON mph.material_id = m.id
-                    AND mph.store_id = %s
-                    AND mph.is_active = TRUE
-            ),
-            actual_cost AS (
-                -- Get actual material cost
-                SELECT
-                    SUM(mmu.material_used * COALESCE(mph.price, 0)) as total_actual
-                FROM material_monthly_usage mmu
-                JOIN material m ON m.id = mmu.material_id AND m.store_id = mmu.store_id
-                LEFT JOIN material_price_history mph ON mph.material_id = m.id
-                    AND mph.store_id = m.store_id
-                    AND mph.is_active = TRUE
-                WHERE mmu.year = %s
-                  AND mmu.month = %s
-                  AND mmu.store_id = %s
-                  AND mmu.material_use_type = '成本类'
-            )
-            SELECT
-                COALESCE(ac.total_actual, 0) - COALESCE(tc.total_theoretical, 0) as loss_amount
-            FROM theoretical_cost tc, actual_cost ac
-        """
-
+        # store_month_pnl holds the same totals the dish price change sheet uses:
+        # actual 成本类 material cost and BOM theoretical cost per store
         try:
-            with self.db_manager.get_connection() as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute(query,
-                                 (store_id, current_year, current_mon,  # dish_sales CTE
-                                  store_id, current_year, current_mon,  # EXISTS check in theoretical_cost
-                                  store_id, store_id, store_id,         # JOINs in theoretical_cost
-                                  current_year, current_mon, store_id)) # actual_cost CTE
-                    result = cursor.fetchone()
-
-                    return float(result['loss_amount']) if result['loss_amount'] else 0
+            pnl_rows = StoreMonthPnl.fetch(self.db_manager, (current_year, current_mon),
+                                           store_ids=list(store_ids))
+            return {row['store_id']: row['actual_cost'] - row['theoretical_cost'] for row in pnl_rows}
         except Exception as e:
             logger.error(f"Error calculating dish loss impact: {e}")
-            return 0
+            return {}
 
-    def _get_store_analysis(self, store_id: int, store_name: str) -> Dict[str, Any]:
-        """Get complete gross margin analysis for a store"""
+    def _get_analysis_queries(self) -> Dict[str, Tuple]:
+        """The batched queries behind the sheet, as name -> (query function, args)"""
         date_ranges = self._get_date_ranges()
+        store_ids = self._store_ids()
 
-        # Get basic financial data
-        current_data = self._get_revenue_and_cost(
-            date_ranges['current'][0], date_ranges['current'][1], store_id
-        )
-        last_month_data = self._get_revenue_and_cost(
-            date_ranges['last_month'][0], date_ranges['last_month'][1], store_id
-        )
-
-        # Calculate impacts
         current_month = (date_ranges['current'][0].year, date_ranges['current'][0].month)
         last_month = (date_ranges['last_month'][0].year, date_ranges['last_month'][0].month)
 
-        dish_price_impact = self._get_dish_price_impact(store_id, current_month, last_month)
-        material_price_impact = self._get_material_price_impact(store_id, current_month, last_month)
-        dish_loss_impact = self._calculate_dish_loss_impact(store_id, current_month)
-        dish_loss_impact_last = self._calculate_dish_loss_impact(store_id, last_month)
+        return {
+            'current': (self._get_all_revenue_and_cost, (*date_ranges['current'], store_ids)),
+            'last_month': (self._get_all_revenue_and_cost, (*date_ranges['last_month'], store_ids)),
+            'dish_price_impact': (self._get_all_dish_price_impact, (store_ids, current_month, last_month)),
+            'material_price_impact': (self._get_all_material_price_impact, (store_ids, current_month, last_month)),
+            'dish_loss_impact': (self._calculate_all_dish_loss_impact, (store_ids, current_month)),
+        }
+
+    def _get_all_store_analysis(self, prefetcher: Optional[SheetDataPrefetcher] = None) -> Dict[int, Dict[str, Any]]:
+        """Get complete gross margin analysis for every store, keyed by store_id"""
+        results = {
+            name: fetch_sheet_data(prefetcher, func, *args)
+            for name, (func, args) in self._get_analysis_queries().items()
+        }
+
+        return {
+            store_id: self._build_store_analysis(
+                store_name,
+                results['current'][store_id],
+                results['last_month'][store_id],
+                results['dish_price_impact'].get(store_id, 0),
+                results['material_price_impact'].get(store_id, 0),
+                results['dish_loss_impact'].get(store_id, 0)
+            )
+            for store_id, store_name in self.STORES
+        }
 
+    def _build_store_analysis(self, store_name: str, current_data: Dict[str, float],
+                              last_month_data: Dict[str, float], dish_price_impact: float,
+                              material_price_impact: float, dish_loss_impact: float) -> Dict[str, Any]:
+        """Derive a store's restored margins and impacts from its queried figures"""
         # Calculate restored margins using the Excel formulas
         # These show what the margin would have been without each specific change
         revenue = current_data['revenue']
@@ -424,21 +337,15 @@ class GrossMarginAnalysisSheet:
             'last_revenue': last_month_data['revenue']
         }
 
-    def generate_sheet(self, workbook):
+    def prefetch(self, prefetcher: SheetDataPrefetcher):
+        """Queue the sheet's batched all-stores queries on the report prefetcher"""
+        for func, args in self._get_analysis_queries().values():
+            prefetcher.submit(func, *args)
+
+    def generate_sheet(self, workbook, prefetcher: Optional[SheetDataPrefetcher] = None):
         """Generate the gross margin analysis sheet"""
         ws = workbook.create_sheet(self.sheet_name)
 
-        # Define stores
-        stores = [
-            (1, '加拿大一店'),
-            (2, '加拿大二店'),
-            (3, '加拿大三店'),
-            (4, '加拿大四店'),
-            (5, '加拿大五店'),
-            (6, '加拿大六店'),
-            (7, '加拿大七店')
-        ]
-
         # Style definitions
         header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
         header_font = Font(color="FFFFFF", bold=True, size=11)
@@ -504,12 +411,13 @@ class GrossMarginAnalysisSheet:
         ws.merge_cells(start_row=1, start_column=21, end_row=2, end_column=21)  # Last revenue
 
         # Process each store
+        all_store_data = self._get_all_store_analysis(prefetcher)
         row_num = 3
-        for store_id, store_name in stores:
+        for store_id, store_name in self.STORES:
             logger.info(f"Processing gross margin analysis for {store_name}")
 
             try:
-                data = self._get_store_analysis(store_id, store_name)
+                data = all_store_data[store_id]
 
                 # Store name
                 ws.cell(row=row_num, column=1, value=data['store_name']).border = border
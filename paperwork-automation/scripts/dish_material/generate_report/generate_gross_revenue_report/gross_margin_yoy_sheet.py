@@ -7,9 +7,24 @@ import pandas as pd
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 
+from lib.database_utils import StoreMonthPnl
+from scripts.dish_material.generate_report.generate_gross_revenue_report.sheet_data_prefetcher import (
+    SheetDataPrefetcher, fetch_sheet_data
+)
+
 logger = logging.getLogger(__name__)
 
 class GrossMarginYoYSheet:
+    STORES = [
+        (1, '加拿大一店'),
+        (2, '加拿大二店'),
+        (3, '加拿大三店'),
+        (4, '加拿大四店'),
+        (5, '加拿大五店'),
+        (6, '加拿大六店'),
+        (7, '加拿大七店')
+    ]
+
     def __init__(self, db_manager, target_date: str):
         self.db_manager = db_manager
         self.target_date = datetime.strptime(target_date, '%Y-%m-%d')
@@ -33,20 +48,7 @@ class GrossMarginYoYSheet:
         year = start_date.year
         month = start_date.month
 
-        # Get revenue from dish_monthly_sale (same as summary sheet)
-        revenue_query = """
-            SELECT
-                SUM((COALESCE(dms.sale_amount, 0) - COALESCE(dms.return_amount, 0)) * COALESCE(dph.price, 0)) as total_revenue
-            FROM dish_monthly_sale dms
-            LEFT JOIN dish_price_history dph ON dph.dish_id = dms.dish_id
-                AND dph.store_id = dms.store_id
-                AND dph.is_active = TRUE
-            WHERE dms.store_id = %s
-                AND dms.year = %s
-                AND dms.month = %s
-        """
-
-        # Get discount from daily_report (separate query)
+        # Get discount from daily_report (the current period may be month-to-date)
         discount_query = """
             SELECT
                 SUM(CAST(discount_total AS DECIMAL(15,2))) as total_discount
@@ -56,40 +58,20 @@ class GrossMarginYoYSheet:
                 AND date <= %s
         """
 
-        # Get material cost (only 成本类 materials, same as summary sheet)
-        material_cost_query = """
-            SELECT
-                SUM(COALESCE(mmu.material_used, 0) * COALESCE(mph.price, 0)) as total_material_cost
-            FROM material_monthly_usage mmu
-            JOIN material m ON m.id = mmu.material_id AND m.store_id = mmu.store_id
-            LEFT JOIN material_price_history mph ON mph.material_id = m.id
-                AND mph.store_id = m.store_id
-                AND mph.is_active = TRUE
-            WHERE mmu.store_id = %s
-                AND mmu.year = %s
-                AND mmu.month = %s
-                AND mmu.material_use_type = '成本类'  -- Only include cost-type materials
-        """
-
         try:
+            # Revenue (sales before tax deduction) and actual 成本类 material
+            # cost come precomputed from store_month_pnl
+            pnl_rows = StoreMonthPnl.fetch(self.db_manager, (year, month), store_ids=[store_id])
+            total_revenue = pnl_rows[0]['sales_revenue'] if pnl_rows else 0
+            total_cost = pnl_rows[0]['actual_cost'] if pnl_rows else 0
+
             with self.db_manager.get_connection() as conn:
                 with conn.cursor() as cursor:
-                    # Get revenue data
-                    cursor.execute(revenue_query, (store_id, year, month))
-                    revenue_result = cursor.fetchone()
-                    total_revenue = float(revenue_result['total_revenue']) if revenue_result['total_revenue'] else 0
-
                     # Get discount data from daily_report
                     cursor.execute(discount_query, (store_id, start_date, end_date))
                     discount_result = cursor.fetchone()
                     total_discount = float(discount_result['total_discount']) if discount_result and discount_result['total_discount'] else 0
 
-                    # Get material cost
-                    cursor.execute(material_cost_query, (store_id, year, month))
-                    cost_result = cursor.fetchone()
-
-                    total_cost = float(cost_result['total_material_cost']) if cost_result['total_material_cost'] else 0
-
                     return {
                         'revenue': total_revenue,
                         'discount': total_discount,
@@ -117,19 +99,11 @@ class GrossMarginYoYSheet:
                 SELECT
                     d.id,
                     dms.sale_amount,
-                    COALESCE(
-                        (SELECT dph.price
-                         FROM dish_price_history dph
-                         WHERE dph.dish_id = d.id
-                           AND dph.store_id = %s
-                           AND ((dph.effective_year < %s) OR
-                                (dph.effective_year = %s AND dph.effective_month <= %s))
-                         ORDER BY dph.effective_year DESC, dph.effective_month DESC
-                         LIMIT 1),
-                        0
-                    ) as current_price
+                    COALESCE(dph.price, 0) as current_price
                 FROM dish d
                 INNER JOIN dish_monthly_sale dms ON d.id = dms.dish_id
+                LEFT JOIN dish_price_as_of(make_date(%s, %s, 1)) dph
+                    ON dph.dish_id = d.id AND dph.store_id = dms.store_id
                 WHERE dms.store_id = %s
                     AND dms.year = %s
                     AND dms.month = %s
@@ -138,18 +112,10 @@ class GrossMarginYoYSheet:
             last_year_dishes AS (
                 SELECT
                     d.id,
-                    COALESCE(
-                        (SELECT dph.price
-                         FROM dish_price_history dph
-                         WHERE dph.dish_id = d.id
-                           AND dph.store_id = %s
-                           AND ((dph.effective_year < %s) OR
-                                (dph.effective_year = %s AND dph.effective_month <= %s))
-                         ORDER BY dph.effective_year DESC, dph.effective_month DESC
-                         LIMIT 1),
-                        0
-                    ) as last_year_price
+                    COALESCE(dph.price, 0) as last_year_price
                 FROM dish d
+                LEFT JOIN dish_price_as_of(make_date(%s, %s, 1)) dph
+                    ON dph.dish_id = d.id AND dph.store_id = %s
             )
             SELECT
                 SUM(CASE
@@ -165,9 +131,9 @@ class GrossMarginYoYSheet:
             with self.db_manager.get_connection() as conn:
                 with conn.cursor() as cursor:
                     cursor.execute(query,
-                                 (store_id, current_year, current_year, current_mon,
+                                 (current_year, current_mon,
                                   store_id, current_year, current_mon,
-                                  store_id, last_year, last_year, last_mon))
+                                  last_year, last_mon, store_id))
                     result = cursor.fetchone()
 
                     return float(result['price_impact']) if result['price_impact'] else 0
@@ -185,18 +151,10 @@ class GrossMarginYoYSheet:
                 SELECT
                     mmu.material_id,
                     mmu.material_used,
-                    COALESCE(
-                        (SELECT mph.price
-                         FROM material_price_history mph
-                         WHERE mph.material_id = mmu.material_id
-                           AND mph.store_id = %s
-                           AND ((mph.effective_year < %s) OR
-                                (mph.effective_year = %s AND mph.effective_month <= %s))
-                         ORDER BY mph.effective_year DESC, mph.effective_month DESC
-                         LIMIT 1),
-                        0
-                    ) as current_price
+                    COALESCE(mph.price, 0) as current_price
                 FROM material_monthly_usage mmu
+                LEFT JOIN material_price_as_of(make_date(%s, %s, 1)) mph
+                    ON mph.material_id = mmu.material_id AND mph.store_id = mmu.store_id
                 WHERE mmu.store_id = %s
                     AND mmu.year = %s
                     AND mmu.month = %s
@@ -204,18 +162,10 @@ class GrossMarginYoYSheet:
             last_year_materials AS (
                 SELECT
                     mmu.material_id,
-                    COALESCE(
-                        (SELECT mph.price
-                         FROM material_price_history mph
-                         WHERE mph.material_id = mmu.material_id
-                           AND mph.store_id = %s
-                           AND ((mph.effective_year < %s) OR
-                                (mph.effective_year = %s AND mph.effective_month <= %s))
-                         ORDER BY mph.effective_year DESC, mph.effective_month DESC
-                         LIMIT 1),
-                        0
-                    ) as last_year_price
+                    COALESCE(mph.price, 0) as last_year_price
                 FROM material_monthly_usage mmu
+                LEFT JOIN material_price_as_of(make_date(%s, %s, 1)) mph
+                    ON mph.material_id = mmu.material_id AND mph.store_id = mmu.store_id
                 WHERE mmu.store_id = %s
                     AND mmu.year = %s
                     AND mmu.month = %s
@@ -235,9 +185,9 @@ class GrossMarginYoYSheet:
             with self.db_manager.get_connection() as conn:
                 with conn.cursor() as cursor:
                     cursor.execute(query,
-                                 (store_id, current_year, current_year, current_mon,
+                                 (current_year, current_mon,
                                   store_id, current_year, current_mon,
-                                  store_id, last_year, last_year, last_mon,
+                                  last_year, last_mon,
                                   store_id, last_year, last_mon))
                     result = cursor.fetchone()
 
@@ -282,18 +232,10 @@ class GrossMarginYoYSheet:
                 -- Get material prices
                 SELECT DISTINCT
                     m.id as material_id,
-                    COALESCE(
-                        (SELECT mph.price
-                         FROM material_price_history mph
-                         WHERE mph.material_id = m.id
-                           AND mph.store_id = %s
-                           AND ((mph.effective_year < %s) OR
-                                (mph.effective_year = %s AND mph.effective_month <= %s))
-                         ORDER BY mph.effective_year DESC, mph.effective_month DESC
-                         LIMIT 1),
-                        0
-                    ) as price
+                    COALESCE(mph.price, 0) as price
                 FROM material m
+                LEFT JOIN material_price_as_of(make_date(%s, %s, 1)) mph
+                    ON mph.material_id = m.id AND mph.store_id = m.store_id
                 WHERE m.store_id = %s
             )
             SELECT
@@ -312,7 +254,7 @@ class GrossMarginYoYSheet:
                     cursor.execute(query,
                                  (store_id, year, month, store_id,
                                   store_id, year, month,
-                                  store_id, year, year, month,
+                                  year, month,
                                   store_id))
                     result = cursor.fetchone()
 
@@ -340,7 +282,6 @@ class GrossMarginYoYSheet:
         dish_price_impact = self._get_dish_price_impact(store_id, current_month, last_year_month)
         material_price_impact = self._get_material_price_impact(store_id, current_month, last_year_month)
         dish_loss_impact = self._calculate_dish_loss_impact(store_id, current_month)
-        dish_loss_impact_last_year = self._calculate_dish_loss_impact(store_id, last_year_month)
 
         # Calculate restored margins using the Excel formulas
         # These show what the margin would have been without each specific change
@@ -423,21 +364,15 @@ class GrossMarginYoYSheet:
             'last_year_revenue': last_year_data['revenue']
         }
 
-    def generate_sheet(self, workbook):
+    def prefetch(self, prefetcher: SheetDataPrefetcher):
+        """Queue every store's data query on the report prefetcher"""
+        for store_id, store_name in self.STORES:
+            prefetcher.submit(self._get_store_analysis, store_id, store_name)
+
+    def generate_sheet(self, workbook, prefetcher: Optional[SheetDataPrefetcher] = None):
         """Generate the gross margin year-over-year analysis sheet"""
         ws = workbook.create_sheet(self.sheet_name)
 
-        # Define stores
-        stores = [
-            (1, '加拿大一店'),
-            (2, '加拿大二店'),
-            (3, '加拿大三店'),
-            (4, '加拿大四店'),
-            (5, '加拿大五店'),
-            (6, '加拿大六店'),
-            (7, '加拿大七店')
-        ]
-
         # Style definitions
         header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
         header_font = Font(color="FFFFFF", bold=True, size=11)
@@ -504,11 +439,11 @@ class GrossMarginYoYSheet:
 
         # Process each store
         row_num = 3
-        for store_id, store_name in stores:
+        for store_id, store_name in self.STORES:
             logger.info(f"Processing YoY gross margin analysis for {store_name}")
 
             try:
-                data = self._get_store_analysis(store_id, store_name)
+                data = fetch_sheet_data(prefetcher, self._get_store_analysis, store_id, store_name)
 
                 # Store name
                 ws.cell(row=row_num, column=1, value=data['store_name']).border = border
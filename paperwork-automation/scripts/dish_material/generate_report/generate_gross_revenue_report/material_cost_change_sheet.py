@@ -7,9 +7,23 @@ import pandas as pd
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 
+from scripts.dish_material.generate_report.generate_gross_revenue_report.sheet_data_prefetcher import (
+    SheetDataPrefetcher, fetch_sheet_data
+)
+
 logger = logging.getLogger(__name__)
 
 class MaterialCostChangeSheet:
+    STORES = [
+        (1, '加拿大一店'),
+        (2, '加拿大二店'),
+        (3, '加拿大三店'),
+        (4, '加拿大四店'),
+        (5, '加拿大五店'),
+        (6, '加拿大六店'),
+        (7, '加拿大七店')
+    ]
+
     def __init__(self, db_manager, target_date: str):
         self.db_manager = db_manager
         self.target_date = datetime.strptime(target_date, '%Y-%m-%d')
@@ -44,19 +58,11 @@ class MaterialCostChangeSheet:
                     m.material_number,
                     m.name as material_name,
                     mmu.material_used as total_usage,
-                    COALESCE(
-                        (SELECT mph.price
-                         FROM material_price_history mph
-                         WHERE mph.material_id = m.id
-                           AND mph.store_id = %s
-                           AND ((mph.effective_year < %s) OR
-                                (mph.effective_year = %s AND mph.effective_month <= %s))
-                         ORDER BY mph.effective_year DESC, mph.effective_month DESC
-                         LIMIT 1),
-                        0
-                    ) as avg_price
+                    COALESCE(mph.price, 0) as avg_price
                 FROM material m
                 INNER JOIN material_monthly_usage mmu ON m.id = mmu.material_id
+                LEFT JOIN material_price_as_of(make_date(%s, %s, 1)) mph
+                    ON mph.material_id = m.id AND mph.store_id = mmu.store_id
                 WHERE mmu.store_id = %s
                     AND mmu.year = %s
                     AND mmu.month = %s
@@ -74,7 +80,7 @@ class MaterialCostChangeSheet:
         try:
             with self.db_manager.get_connection() as conn:
                 with conn.cursor() as cursor:
-                    cursor.execute(query, (store_id, year, year, month, store_id, year, month, store_id))
+                    cursor.execute(query, (year, month, store_id, year, month, store_id))
                     results = cursor.fetchall()
 
                     material_data = {}
@@ -138,20 +144,15 @@ class MaterialCostChangeSheet:
 
         return sorted(store_rows, key=lambda x: abs(x['环比影响成本']), reverse=True)
 
-    def generate_sheet(self, workbook):
+    def prefetch(self, prefetcher: SheetDataPrefetcher):
+        """Queue every store's data query on the report prefetcher"""
+        for store_id, store_name in self.STORES:
+            prefetcher.submit(self._get_store_data, store_id, store_name)
+
+    def generate_sheet(self, workbook, prefetcher: Optional[SheetDataPrefetcher] = None):
         """Generate the material cost change sheet"""
         ws = workbook.create_sheet(self.sheet_name)
 
-        stores = [
-            (1, '加拿大一店'),
-            (2, '加拿大二店'),
-            (3, '加拿大三店'),
-            (4, '加拿大四店'),
-            (5, '加拿大五店'),
-            (6, '加拿大六店'),
-            (7, '加拿大七店')
-        ]
-
         headers = [
             '门店', '物料编码', '物料名称', '本期单价', '上期单价',
             '去年同期单价', '环比价格变动', '同比价格变动', '本期用量',
@@ -175,9 +176,9 @@ class MaterialCostChangeSheet:
             cell.border = border
 
         all_data = []
-        for store_id, store_name in stores:
+        for store_id, store_name in self.STORES:
             logger.info(f"Processing store: {store_name}")
-            store_data = self._get_store_data(store_id, store_name)
+            store_data = fetch_sheet_data(prefetcher, self._get_store_data, store_id, store_name)
             all_data.extend(store_data)
 
         row_num = 2
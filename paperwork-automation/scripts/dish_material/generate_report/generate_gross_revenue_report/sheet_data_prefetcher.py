@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Concurrent data fetching for the gross revenue report.
+
+The report is built in two phases. Phase one submits every sheet and store
+query to a thread pool, sharing the pooled DatabaseManager. Phase two writes
+the openpyxl workbook on one thread. Sheet writers look up their data with
+fetch_sheet_data(), passing the same query function and arguments they would
+call directly, so they also work without a prefetcher.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SheetDataPrefetcher:
+    """
+    Runs report queries on a thread pool and hands the results to sheet writers.
+
+    Results are keyed by (query function, arguments). A query that failed
+    re-raises its exception in the writer that asks for it, so each sheet
+    keeps its own per-store error handling.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                            thread_name_prefix='report-query')
+        self._futures: Dict[Tuple, Any] = {}
+
+    def submit(self, func: Callable, *args):
+        """Queue func(*args) unless the same query is already queued"""
+        key = (func, args)
+        if key not in self._futures:
+            self._futures[key] = self._executor.submit(func, *args)
+
+    def fetch(self, func: Callable, *args):
+        """Return the result of func(*args), running it now if it was not queued"""
+        future = self._futures.get((func, args))
+        if future is None:
+            return func(*args)
+        return future.result()
+
+    def wait(self) -> float:
+        """Block until every queued query has finished; returns seconds waited"""
+        start_time = time.perf_counter()
+        wait(list(self._futures.values()))
+        failed = sum(1 for future in self._futures.values() if future.exception() is not None)
+        if failed:
+            logger.warning(f"{failed} of {len(self._futures)} report queries failed")
+        return time.perf_counter() - start_time
+
+    @property
+    def query_count(self) -> int:
+        """Number of distinct queries submitted"""
+        return len(self._futures)
+
+    def shutdown(self):
+        """Stop the worker threads"""
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+
+def fetch_sheet_data(prefetcher: Optional[SheetDataPrefetcher], func: Callable, *args):
+    """
+    Get the data for a sheet from the prefetcher, or query it directly.
+
+    Args:
+        prefetcher: Phase-one prefetcher, or None to run the query now
+        func: Query function
+        *args: Query arguments (must match the ones used when submitting)
+
+    Returns:
+        The query result
+    """
+    if prefetcher is None:
+        return func(*args)
+    return prefetcher.fetch(func, *args)
@@ -16,6 +16,9 @@ project_root = Path(__file__).resolve().parent.parent.parent.parent.parent
 sys.path.insert(0, str(project_root))
 
 from utils.database import DatabaseManager
+from scripts.dish_material.generate_report.generate_gross_revenue_report.sheet_data_prefetcher import (
+    SheetDataPrefetcher, fetch_sheet_data
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -246,8 +249,16 @@ def get_dish_revenue_data(db_manager: DatabaseManager, year: int, month: int, st
     return results
 
 
+def prefetch_store_revenue_sheet(prefetcher: SheetDataPrefetcher, db_manager: DatabaseManager,
+                                 year: int, month: int, store_id: int, debug: bool = False):
+    """Queue one store's revenue and material usage queries on the report prefetcher"""
+    prefetcher.submit(get_dish_revenue_data, db_manager, year, month, store_id, debug)
+    prefetcher.submit(get_actual_material_usage, db_manager, year, month, store_id)
+
+
 def write_store_revenue_sheet(worksheet, db_manager: DatabaseManager, year: int, month: int, 
-                             store_id: int, store_name: str, debug: bool = False):
+                             store_id: int, store_name: str, debug: bool = False,
+                             prefetcher: Optional[SheetDataPrefetcher] = None):
     """
     Write store revenue and gross profit data to an Excel worksheet.
     
@@ -259,6 +270,7 @@ def write_store_revenue_sheet(worksheet, db_manager: DatabaseManager, year: int,
         store_id: Store ID
         store_name: Store name for display
         debug: If True, include detailed columns
+        prefetcher: Optional report prefetcher holding the already queried data
     """
     # Add title
     title_cell = worksheet.cell(row=1, column=1, value=f"{store_name} - 毛利润分析")
@@ -306,10 +318,10 @@ def write_store_revenue_sheet(worksheet, db_manager: DatabaseManager, year: int,
         cell.border = thin_border
     
     # Get data
-    data = get_dish_revenue_data(db_manager, year, month, store_id, debug)
+    data = fetch_sheet_data(prefetcher, get_dish_revenue_data, db_manager, year, month, store_id, debug)
     
     # Get actual material usage for the store
-    actual_material_usage = get_actual_material_usage(db_manager, year, month, store_id)
+    actual_material_usage = fetch_sheet_data(prefetcher, get_actual_material_usage, db_manager, year, month, store_id)
     
     # Calculate total actual material cost for the store
     total_actual_material_cost = sum(mat_info['total_cost'] for mat_info in actual_material_usage.values())
@@ -2,12 +2,12 @@
 # -*- coding: utf-8 -*-
 """
 Generate 12-month trend sheet showing actual gross profit margins over time.
-Uses actual material usage from material_monthly_usage table (same as all stores summary).
+Uses actual material usage from the store_month_pnl table (same as all stores summary).
 """
 
 import sys
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import logging
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
@@ -20,6 +20,10 @@ sys.path.insert(0, str(project_root))
 
 from utils.database import DatabaseManager
 from lib.config import STORE_ID_TO_NAME_MAPPING
+from lib.database_utils import StoreMonthPnl
+from scripts.dish_material.generate_report.generate_gross_revenue_report.sheet_data_prefetcher import (
+    SheetDataPrefetcher, fetch_sheet_data
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -49,102 +53,41 @@ def get_12_month_trend_data(db_manager: DatabaseManager, end_year: int, end_mont
     
     result = {}
     
-    with db_manager.get_connection() as conn:
-        cursor = conn.cursor()
-        
-        # Query to get overall gross margin for 12 months using actual material usage
-        query = """
-        WITH store_revenue AS (
-            -- Get total revenue from dish sales for each month (deducting tax)
-            SELECT
-                dms.store_id,
-                dms.year,
-                dms.month,
-                SUM(
-                    (COALESCE(dms.sale_amount, 0) - COALESCE(dms.return_amount, 0)) * COALESCE(dph.price, 0)
-                    - COALESCE(dms.tax_amount, 0)
-                ) as total_revenue
-            FROM dish_monthly_sale dms
-            LEFT JOIN dish_price_history dph ON dph.dish_id = dms.dish_id
-                AND dph.store_id = dms.store_id
-                AND dph.is_active = TRUE
-            WHERE (
-                (dms.year = %s AND dms.month >= %s) OR
-                (dms.year > %s AND dms.year < %s) OR
-                (dms.year = %s AND dms.month <= %s)
-            )
-            AND dms.store_id != 101  -- Exclude Hi Bowl
-            GROUP BY dms.store_id, dms.year, dms.month
-        ),
-        material_usage AS (
-            -- Get actual material usage from material_monthly_usage for each month (only 成本类)
-            SELECT 
-                mmu.store_id,
-                mmu.year,
-                mmu.month,
-                SUM(COALESCE(mmu.material_used, 0) * COALESCE(mph.price, 0)) as total_material_cost
-            FROM material_monthly_usage mmu
-            JOIN material m ON m.id = mmu.material_id AND m.store_id = mmu.store_id
-            LEFT JOIN material_price_history mph ON mph.material_id = m.id 
-                AND mph.store_id = m.store_id
-                AND mph.is_active = TRUE
-            WHERE (
-                (mmu.year = %s AND mmu.month >= %s) OR
-                (mmu.year > %s AND mmu.year < %s) OR
-                (mmu.year = %s AND mmu.month <= %s)
-            )
-            AND mmu.material_use_type = '成本类'  -- Only include cost-type materials
-            GROUP BY mmu.store_id, mmu.year, mmu.month
-        )
-        SELECT 
-            sr.store_id,
-            sr.year,
-            sr.month,
-            COALESCE(sr.total_revenue, 0) as revenue,
-            COALESCE(mu.total_material_cost, 0) as material_cost,
-            CASE 
-                WHEN COALESCE(sr.total_revenue, 0) > 0 THEN 
-                    ((COALESCE(sr.total_revenue, 0) - COALESCE(mu.total_material_cost, 0)) / COALESCE(sr.total_revenue, 0)) * 100
-                ELSE 0
-            END as gross_margin
-        FROM store_revenue sr
-        LEFT JOIN material_usage mu ON mu.store_id = sr.store_id 
-            AND mu.year = sr.year 
-            AND mu.month = sr.month
-        ORDER BY sr.store_id, sr.year, sr.month
-        """
+    # One indexed month range read from store_month_pnl (margin on revenue
+    # with tax deducted and actual 成本类 material cost)
+    rows = StoreMonthPnl.fetch(
+        db_manager,
+        (start_date.year, start_date.month),
+        (end_date.year, end_date.month),
+        sales_only=True
+    )
+    
+    # Process data into nested dictionary
+    for row in rows:
+        store_id = row['store_id']
         
-        cursor.execute(query, (
-            # For store_revenue CTE
-            start_date.year, start_date.month,  # Start year and month
-            start_date.year, end_date.year,     # Years in between
-            end_date.year, end_date.month,      # End year and month
-            # For material_usage CTE
-            start_date.year, start_date.month,  # Start year and month
-            start_date.year, end_date.year,     # Years in between
-            end_date.year, end_date.month       # End year and month
-        ))
+        # Exclude Hi Bowl
+        if store_id == 101:
+            continue
         
-        raw_data = cursor.fetchall()
+        # Initialize store dict if not exists
+        if store_id not in result:
+            result[store_id] = {}
         
-        # Process data into nested dictionary
-        for row in raw_data:
-            store_id = row['store_id']
-            year = row['year']
-            month = row['month']
-            margin = float(row['gross_margin']) if row['gross_margin'] else 0
-            
-            # Initialize store dict if not exists
-            if store_id not in result:
-                result[store_id] = {}
-            
-            # Store margin for this month
-            result[store_id][(year, month)] = margin
+        # Store margin for this month
+        result[store_id][(row['year'], row['month'])] = row['gross_margin']
     
     return result
 
 
-def write_twelve_month_trend_sheet(worksheet, db_manager: DatabaseManager, year: int, month: int):
+def prefetch_twelve_month_trend_sheet(prefetcher: SheetDataPrefetcher, db_manager: DatabaseManager,
+                                      year: int, month: int):
+    """Queue the 12-month trend query on the report prefetcher"""
+    prefetcher.submit(get_12_month_trend_data, db_manager, year, month)
+
+
+def write_twelve_month_trend_sheet(worksheet, db_manager: DatabaseManager, year: int, month: int,
+                                   prefetcher: Optional[SheetDataPrefetcher] = None):
     """
     Write 12-month overall trend data to an Excel worksheet with line chart.
     
@@ -153,6 +96,7 @@ def write_twelve_month_trend_sheet(worksheet, db_manager: DatabaseManager, year:
         db_manager: Database manager instance
         year: Ending year for the data
         month: Ending month for the data
+        prefetcher: Optional report prefetcher holding the already queried data
     """
     # Add title
     title_cell = worksheet.cell(row=1, column=1, value="12个月实际毛利趋势分析")
@@ -164,7 +108,7 @@ def write_twelve_month_trend_sheet(worksheet, db_manager: DatabaseManager, year:
     date_cell.alignment = Alignment(horizontal='center')
     
     # Get data
-    trend_data = get_12_month_trend_data(db_manager, year, month)
+    trend_data = fetch_sheet_data(prefetcher, get_12_month_trend_data, db_manager, year, month)
     
     # Calculate months to display
     end_date = datetime(year, month, 1)
@@ -10,21 +10,72 @@ from typing import Dict, List, Tuple, Optional
 import logging
 from datetime import datetime
 import argparse
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
 
 # Add parent directory to path for imports
 project_root = Path(__file__).resolve().parent.parent.parent.parent.parent
 sys.path.insert(0, str(project_root))
 
+import pandas as pd
+
 from utils.database import DatabaseManager, DatabaseConfig
+from lib.bom_cost_engine import BomCostEngine
+from lib.worksheet_writer import (
+    SheetWriter, THIN_BORDER, cell_style, shared_alignment, shared_font, solid_fill
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
+def get_theory_usage_rows(engine: BomCostEngine) -> List[Dict]:
+    """
+    Theoretical usage of each (dish, material) line of one store's month.
+
+    Regular sales use the dish's own recipe; combo dish sales use the recipe
+    the engine resolved for them (see BomCostEngine.resolve_combo_dishes).
+    Rows are ordered by material number, dish short code, regular before combo.
+    """
+    lines = engine.lines_frame()
+    lines = lines[lines['regular_sales'] != 0]
+    regular = pd.DataFrame({
+        'material_number': lines['material_number'],
+        'material_name': lines['material_description'],
+        'material_unit': lines['material_unit'],
+        'dish_short_code': lines['dish_short_code'],
+        'dish_full_code': lines['dish_full_code'].astype(str) + '-' + lines['dish_short_code'].fillna('').astype(str),
+        'dish_name': lines['dish_name'],
+        'dish_size': lines['dish_size'],
+        'quantity_sold': lines['regular_sales'],
+        'is_combo': False,
+        'standard_quantity': lines['standard_quantity'],
+        'loss_rate': lines['loss_rate'],
+        'unit_conversion': lines['unit_conversion_rate'],
+        'theory_usage': lines['regular_usage'],
+    })
+
+    combos = engine.combo_lines()
+    combo = pd.DataFrame({
+        'material_number': combos['material_number'],
+        'material_name': combos['material_description'],
+        'material_unit': combos['material_unit'],
+        'dish_short_code': combos['dish_short_code'],
+        'dish_full_code': combos['dish_full_code'],
+        'dish_name': combos['dish_name'].astype(str) + '(套餐-' + combos['combo_name'].fillna('').astype(str) + ')',
+        'dish_size': combos['dish_size'],
+        'quantity_sold': combos['sale_amount'],
+        'is_combo': True,
+        'standard_quantity': combos['standard_quantity'],
+        'loss_rate': combos['loss_rate'],
+        'unit_conversion': combos['unit_conversion_rate'],
+        'theory_usage': combos['usage'],
+    })
+
+    rows = pd.concat([regular, combo], ignore_index=True)
+    rows = rows.sort_values(['material_number', 'dish_short_code', 'is_combo'], na_position='last', kind='stable')
+    return rows.astype(object).where(rows.notna(), None).to_dict('records')
+
+
 def get_material_usage_data_from_database(db_manager: DatabaseManager, year: int, month: int, store_id: int, debug: bool = False) -> Dict:
     """
     Get material usage data comparing theoretical vs actual usage.
@@ -100,112 +151,8 @@ def get_material_usage_data_from_database(db_manager: DatabaseManager, year: int
                 'unit_conversion': 1.0  # Will be updated from dish_material
             }
         
-        # Get theoretical usage from dish sales (including combo sales)
-        # IMPORTANT: For combos without short codes, match by full code and use smallest standard_quantity
-        theory_usage_query = """
-        WITH dish_sales AS (
-            -- Regular dish sales
-            SELECT 
-                dms.dish_id,
-                d.name as dish_name,
-                d.short_code as dish_short_code,
-                d.full_code as dish_full_code,
-                d.full_code as original_full_code,
-                d.size as dish_size,
-                COALESCE(dms.sale_amount, 0) - COALESCE(dms.return_amount, 0) as quantity_sold,
-                FALSE as is_combo
-            FROM dish_monthly_sale dms
-            JOIN dish d ON d.id = dms.dish_id
-            WHERE dms.year = %s
-              AND dms.month = %s
-              AND dms.store_id = %s
-            
-            UNION ALL
-            
-            -- Combo dish sales
-            SELECT 
-                mcds.dish_id,
-                CONCAT(d.name, '(套餐-', c.name, ')') as dish_name,
-                d.short_code as dish_short_code,
-                d.full_code as dish_full_code,
-                d.full_code as original_full_code,
-                d.size as dish_size,
-                mcds.sale_amount as quantity_sold,
-                TRUE as is_combo
-            FROM monthly_combo_dish_sale mcds
-            JOIN dish d ON d.id = mcds.dish_id
-            JOIN combo c ON c.id = mcds.combo_id
-            WHERE mcds.year = %s
-              AND mcds.month = %s
-              AND mcds.store_id = %s
-        )
-        SELECT 
-            m.material_number,
-            m.description as material_name,
-            m.unit as material_unit,
-            ds.dish_short_code,
-            CASE 
-                WHEN ds.is_combo THEN ds.dish_full_code
-                ELSE CONCAT(ds.dish_full_code, '-', ds.dish_short_code)
-            END as dish_full_code,
-            ds.dish_name,
-            ds.dish_size,
-            ds.quantity_sold,
-            ds.is_combo,
-            dm.standard_quantity,
-            dm.loss_rate,
-            dm.unit_conversion_rate as unit_conversion,
-            (ds.quantity_sold * dm.standard_quantity * COALESCE(dm.loss_rate, 0) / COALESCE(NULLIF(dm.unit_conversion_rate, 0), 1)) as theory_usage
-        FROM dish_sales ds
-        JOIN dish d2 ON d2.id = COALESCE(
-            (
-                -- First try: For combos without short code, match by full code and select smallest standard_quantity
-                -- For regular dishes or combos with short code, match exactly
-                SELECT d3.id
-                FROM dish d3
-                LEFT JOIN dish_material dm_check ON dm_check.dish_id = d3.id AND dm_check.store_id = %s
-                WHERE 
-                    CASE 
-                        -- For combos without short code, match by full code only
-                        WHEN ds.is_combo AND (ds.dish_short_code IS NULL OR ds.dish_short_code = '') THEN
-                            d3.full_code = ds.original_full_code
-                        -- For everything else, exact match including size
-                        ELSE
-                            d3.full_code = ds.original_full_code 
-                            AND (
-                                (d3.size = ds.dish_size) OR 
-                                (d3.size IS NULL AND ds.dish_size IS NULL)
-                            )
-                    END
-                  AND d3.id IN (SELECT dish_id FROM dish_material WHERE store_id = %s)
-                ORDER BY 
-                    -- For combos without short code, order by smallest standard_quantity first
-                    CASE WHEN ds.is_combo AND (ds.dish_short_code IS NULL OR ds.dish_short_code = '') 
-                         THEN dm_check.standard_quantity 
-                         ELSE NULL 
-                    END ASC NULLS LAST,
-                    d3.id
-                LIMIT 1
-            ),
-            -- Second try: For combos, try to find ANY dish with material mappings that starts with same base code
-            (
-                SELECT d4.id
-                FROM dish d4
-                JOIN dish_material dm2 ON dm2.dish_id = d4.id AND dm2.store_id = %s
-                WHERE ds.is_combo 
-                  AND (ds.dish_short_code IS NULL OR ds.dish_short_code = '')
-                  AND LEFT(d4.full_code, 6) = LEFT(ds.original_full_code, 6)  -- Match first 6 digits
-                ORDER BY dm2.standard_quantity ASC, d4.id
-                LIMIT 1
-            )
-        )
-        JOIN dish_material dm ON dm.dish_id = d2.id AND dm.store_id = %s
-        JOIN material m ON m.id = dm.material_id AND m.store_id = %s
-        ORDER BY m.material_number, ds.dish_short_code, ds.is_combo
-        """
-        
-        cursor.execute(theory_usage_query, (year, month, store_id, year, month, store_id, store_id, store_id, store_id, store_id, store_id))
-        theory_usage_data = cursor.fetchall()
+        # Get theoretical usage from dish sales (including combo sales) with the shared BOM engine
+        theory_usage_data = get_theory_usage_rows(BomCostEngine.fetch(cursor, year, month, store_ids=[store_id]))
         
         for row in theory_usage_data:
             material_number = row['material_number']
@@ -358,7 +305,7 @@ def write_material_usage_to_sheet(worksheet, db_manager: DatabaseManager, year:
     Write material usage comparison to an Excel worksheet.
     
     Args:
-        worksheet: Openpyxl worksheet object
+        worksheet: Openpyxl worksheet object (normal or write-only)
         db_manager: Database manager instance
         year: Year for the data
         month: Month for the data
@@ -369,47 +316,51 @@ def write_material_usage_to_sheet(worksheet, db_manager: DatabaseManager, year:
     The sheet has headers:
     物料名称, 物料号, 物料类型, 物料单位, 理论消耗来源, 总理论消耗, 实际消耗, 数量差异(物料单位), 差异%, 使用金额, 上月使用金额, 环比差异, 金额差异, 备注
     """
+    writer = SheetWriter(worksheet)
+
+    # Column widths go first: a streamed sheet writes them ahead of its rows
+    column_widths = [30, 15, 20, 10, 50, 15, 15, 15, 10, 15, 15, 15, 15, 20]  # Added widths for last month and MoM columns
+    writer.set_column_widths(column_widths)
+
     # Add title and info at the top FIRST
-    title_cell = worksheet.cell(row=1, column=1, value=f"{store_name} - 物料理论与实际消耗对比")
-    title_cell.font = Font(size=14, bold=True)
-    worksheet.merge_cells(start_row=1, start_column=1, end_row=1, end_column=14)
-    title_cell.alignment = Alignment(horizontal='center')
-    
-    date_cell = worksheet.cell(row=2, column=1, value=f"{year}年{month}月")
-    date_cell.font = Font(size=12)
-    worksheet.merge_cells(start_row=2, start_column=1, end_row=2, end_column=14)
-    date_cell.alignment = Alignment(horizontal='center')
+    title_row = writer.append([f"{store_name} - 物料理论与实际消耗对比"],
+                              cell_style(font=shared_font(size=14, bold=True),
+                                         alignment=shared_alignment(horizontal='center')))
+    writer.merge(title_row, 1, title_row, 14)
+
+    date_row = writer.append([f"{year}年{month}月"],
+                             cell_style(font=shared_font(size=12),
+                                        alignment=shared_alignment(horizontal='center')))
+    writer.merge(date_row, 1, date_row, 14)
     
     # Leave a blank row
-    header_row = 4
+    writer.skip_rows(1)
     
     # Set headers
     headers = ['物料名称', '物料号', '物料类型', '物料单位', '理论消耗来源', '总理论消耗(KG)', '实际消耗(KG)', '数量差异(物料单位)', '差异%', '使用金额', '上月使用金额', '环比差异', '金额差异', '备注']
     
     # Style for headers
-    header_font = Font(bold=True)
-    header_fill = PatternFill(start_color="CCE5FF", end_color="CCE5FF", fill_type="solid")
-    header_alignment = Alignment(horizontal='center', vertical='center')
-    
-    # Border style
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
+    header_style = cell_style(font=shared_font(bold=True), fill=solid_fill("CCE5FF"),
+                              border=THIN_BORDER,
+                              alignment=shared_alignment(horizontal='center', vertical='center'))
     
     # Alternating row fills for better readability
-    even_row_fill = PatternFill(start_color="F5F5F5", end_color="F5F5F5", fill_type="solid")  # Light gray
-    odd_row_fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")   # White
+    even_row_fill = solid_fill("F5F5F5")  # Light gray
+    odd_row_fill = solid_fill("FFFFFF")   # White
+    large_diff_fill = solid_fill("FFB6C1")  # Pink
+    large_mom_fill = solid_fill("FFFF99")  # Yellow
+
+    # Cell alignment of the first row of each material, by column
+    center = shared_alignment(vertical='center')
+    right = shared_alignment(vertical='center', horizontal='right')
+    first_row_alignments = [
+        shared_alignment(vertical='center', wrap_text=True), center, center, center, None,
+        right, right, right, shared_alignment(vertical='center', horizontal='center'),
+        right, right, right, right, None
+    ]
     
     # Write headers
-    for col, header in enumerate(headers, 1):
-        cell = worksheet.cell(row=header_row, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = thin_border
+    writer.append(headers, header_style)
     
     # Get data
     data = get_material_usage_data_from_database(db_manager, year, month, store_id, debug=debug)
@@ -417,7 +368,6 @@ def write_material_usage_to_sheet(worksheet, db_manager: DatabaseManager, year:
     # Sort materials by material number
     sorted_materials = sorted(data.items(), key=lambda x: x[0])
     
-    current_row = header_row + 1  # Start data after header row
     material_index = 0  # Track material record index for alternating colors
     
     for material_number, material_data in sorted_materials:
@@ -427,31 +377,10 @@ def write_material_usage_to_sheet(worksheet, db_manager: DatabaseManager, year:
         usage_details = material_data['usage_details']
         num_details = max(len(usage_details), 1)  # At least one row even if no details
         
-        # Material name, number, type and unit (merged across detail rows if multiple)
-        material_name_cell = worksheet.cell(row=current_row, column=1, value=material_data['material_name'])
-        material_number_cell = worksheet.cell(row=current_row, column=2, value=material_number)
-        material_type_cell = worksheet.cell(row=current_row, column=3, value=material_data.get('material_use_type', ''))
-        material_unit_cell = worksheet.cell(row=current_row, column=4, value=material_data.get('material_unit', ''))
-        
-        if num_details > 1:
-            # Merge cells for material name, number, type and unit
-            worksheet.merge_cells(start_row=current_row, start_column=1,
-                                end_row=current_row + num_details - 1, end_column=1)
-            worksheet.merge_cells(start_row=current_row, start_column=2,
-                                end_row=current_row + num_details - 1, end_column=2)
-            worksheet.merge_cells(start_row=current_row, start_column=3,
-                                end_row=current_row + num_details - 1, end_column=3)
-            worksheet.merge_cells(start_row=current_row, start_column=4,
-                                end_row=current_row + num_details - 1, end_column=4)
-        
-        material_name_cell.alignment = Alignment(vertical='center', wrap_text=True)
-        material_number_cell.alignment = Alignment(vertical='center')
-        material_type_cell.alignment = Alignment(vertical='center')
-        material_unit_cell.alignment = Alignment(vertical='center')
-        
         # Theory usage details
         if usage_details:
-            for i, detail in enumerate(usage_details):
+            theory_sources = []
+            for detail in usage_details:
                 if debug and 'quantity_sold' in detail:
                     # Debug format with detailed calculation info
                     theory_source = (f"{detail['dish_name']} {detail['dish_code']} "
@@ -466,43 +395,16 @@ def write_material_usage_to_sheet(worksheet, db_manager: DatabaseManager, year:
                     if debug:
                         # If debug is true but no debug data, still show codes
                         theory_source = f"{detail['dish_name']} {detail['dish_code']}: {detail['usage']:.2f}"
-                
-                worksheet.cell(row=current_row + i, column=5, value=theory_source)
-                worksheet.cell(row=current_row + i, column=5).border = thin_border
+                theory_sources.append(theory_source)
         else:
-            worksheet.cell(row=current_row, column=5, value="无理论消耗")
-            worksheet.cell(row=current_row, column=5).border = thin_border
-        
-        # Total theory usage (merged)
-        total_theory_cell = worksheet.cell(row=current_row, column=6,
-                                          value=round(material_data['theory_usage'], 2))
-        if num_details > 1:
-            worksheet.merge_cells(start_row=current_row, start_column=6,
-                                end_row=current_row + num_details - 1, end_column=6)
-        total_theory_cell.alignment = Alignment(vertical='center', horizontal='right')
-        total_theory_cell.border = thin_border
-
-        # Actual usage (merged)
-        actual_usage_cell = worksheet.cell(row=current_row, column=7,
-                                          value=round(material_data['actual_usage'], 2))
-        if num_details > 1:
-            worksheet.merge_cells(start_row=current_row, start_column=7,
-                                end_row=current_row + num_details - 1, end_column=7)
-        actual_usage_cell.alignment = Alignment(vertical='center', horizontal='right')
-        actual_usage_cell.border = thin_border
+            theory_sources = ["无理论消耗"]
 
-        # Exact quantity difference (merged) - adjusted by unit_conversion
+        # Exact quantity difference - adjusted by unit_conversion
         unit_conversion = material_data.get('unit_conversion', 1.0)
         quantity_diff_raw = material_data['actual_usage'] - material_data['theory_usage']
         quantity_diff = quantity_diff_raw * unit_conversion  # Apply unit conversion
-        quantity_diff_cell = worksheet.cell(row=current_row, column=8, value=round(quantity_diff, 2))
-        if num_details > 1:
-            worksheet.merge_cells(start_row=current_row, start_column=8,
-                                end_row=current_row + num_details - 1, end_column=8)
-        quantity_diff_cell.alignment = Alignment(vertical='center', horizontal='right')
-        quantity_diff_cell.border = thin_border
         
-        # Difference percentage (merged) - Now in COLUMN 9
+        # Difference percentage
         difference = None
         if material_data['theory_usage'] != 0:
             difference = (material_data['actual_usage'] - material_data['theory_usage']) / material_data['theory_usage']
@@ -510,93 +412,65 @@ def write_material_usage_to_sheet(worksheet, db_manager: DatabaseManager, year:
         else:
             diff_text = "N/A"
 
-        diff_cell = worksheet.cell(row=current_row, column=9, value=diff_text)
-        if num_details > 1:
-            worksheet.merge_cells(start_row=current_row, start_column=9,
-                                end_row=current_row + num_details - 1, end_column=9)
-        diff_cell.alignment = Alignment(vertical='center', horizontal='center')
-        diff_cell.border = thin_border
-        
-        # We'll apply the highlight fill later with the alternating row colors
-        
-        # Usage amount column (merged) - actual usage * material price - Now in COLUMN 10
+        # Usage amount - actual usage * material price
         usage_amount = 0.0
         if 'material_price' in material_data:
             usage_amount = material_data['actual_usage'] * material_data['material_price']
 
-        usage_amount_cell = worksheet.cell(row=current_row, column=10, value=round(usage_amount, 2))
-        if num_details > 1:
-            worksheet.merge_cells(start_row=current_row, start_column=10,
-                                end_row=current_row + num_details - 1, end_column=10)
-        usage_amount_cell.alignment = Alignment(vertical='center', horizontal='right')
-        usage_amount_cell.border = thin_border
-
-        # Last month usage amount column (merged) - last month usage * last month price - Now in COLUMN 11
+        # Last month usage amount - last month usage * last month price
         last_month_amount = 0.0
         if 'last_month_price' in material_data:
             last_month_amount = material_data['last_month_usage'] * material_data['last_month_price']
 
-        last_month_amount_cell = worksheet.cell(row=current_row, column=11, value=round(last_month_amount, 2))
-        if num_details > 1:
-            worksheet.merge_cells(start_row=current_row, start_column=11,
-                                end_row=current_row + num_details - 1, end_column=11)
-        last_month_amount_cell.alignment = Alignment(vertical='center', horizontal='right')
-        last_month_amount_cell.border = thin_border
-
-        # Month-over-month difference column (merged) - current month amount - last month amount - Now in COLUMN 12
+        # Month-over-month difference - current month amount - last month amount
         mom_diff = usage_amount - last_month_amount
-        mom_diff_cell = worksheet.cell(row=current_row, column=12, value=round(mom_diff, 2))
-        if num_details > 1:
-            worksheet.merge_cells(start_row=current_row, start_column=12,
-                                end_row=current_row + num_details - 1, end_column=12)
-        mom_diff_cell.alignment = Alignment(vertical='center', horizontal='right')
-        mom_diff_cell.border = thin_border
 
-        # Amount difference column (merged) - difference amount * material price - Now in COLUMN 13
+        # Amount difference - difference amount * material price
         amount_diff = 0.0
         if 'material_price' in material_data:
             usage_diff = material_data['actual_usage'] - material_data['theory_usage']
             amount_diff = usage_diff * material_data['material_price']
 
-        amount_diff_cell = worksheet.cell(row=current_row, column=13, value=round(amount_diff, 2))
-        if num_details > 1:
-            worksheet.merge_cells(start_row=current_row, start_column=13,
-                                end_row=current_row + num_details - 1, end_column=13)
-        amount_diff_cell.alignment = Alignment(vertical='center', horizontal='right')
-        amount_diff_cell.border = thin_border
+        # Borders and alternating fills on every cell; large differences in
+        # column 9 (percentage) and column 12 (MoM > 1000) are highlighted
+        fill_to_use = even_row_fill if material_index % 2 == 0 else odd_row_fill
+        fills = [fill_to_use] * 14
+        if difference is not None and abs(difference) > 0.2:
+            fills[8] = large_diff_fill
+        if abs(mom_diff) > 1000:
+            fills[11] = large_mom_fill
+        first_row_styles = [cell_style(fill=fill, border=THIN_BORDER, alignment=alignment)
+                            for fill, alignment in zip(fills, first_row_alignments)]
+        detail_row_styles = [cell_style(fill=fill, border=THIN_BORDER) for fill in fills]
+
+        # Material columns are written on the first row and merged across detail rows
+        first_row = writer.append([
+            material_data['material_name'],
+            material_number,
+            material_data.get('material_use_type', ''),
+            material_data.get('material_unit', ''),
+            theory_sources[0],
+            round(material_data['theory_usage'], 2),
+            round(material_data['actual_usage'], 2),
+            round(quantity_diff, 2),
+            diff_text,
+            round(usage_amount, 2),
+            round(last_month_amount, 2),
+            round(mom_diff, 2),
+            round(amount_diff, 2),
+            ""  # Notes column, empty for manual input
+        ], first_row_styles)
 
-        # Notes column (merged, empty for manual input) - Now in COLUMN 14
-        notes_cell = worksheet.cell(row=current_row, column=14, value="")
         if num_details > 1:
-            worksheet.merge_cells(start_row=current_row, start_column=14,
-                                end_row=current_row + num_details - 1, end_column=14)
-        notes_cell.border = thin_border
-        
-        # Apply borders and alternating fills to all cells
-        fill_to_use = even_row_fill if material_index % 2 == 0 else odd_row_fill
-        for row in range(current_row, current_row + num_details):
-            for col in range(1, 15):  # Now 15 columns with last month and MoM columns added
-                cell = worksheet.cell(row=row, column=col)
-                cell.border = thin_border
-                # Apply alternating fill, but use highlight for large differences in column 9 (percentage)
-                if col == 9 and difference is not None and abs(difference) > 0.2:
-                    # Highlight large differences with pink
-                    cell.fill = PatternFill(start_color="FFB6C1", end_color="FFB6C1", fill_type="solid")
-                # Highlight significant MoM changes in column 12
-                elif col == 12 and abs(mom_diff) > 1000:  # Highlight if MoM difference > 1000
-                    cell.fill = PatternFill(start_color="FFFF99", end_color="FFFF99", fill_type="solid")  # Yellow
-                else:
-                    # Apply zebra striping
-                    cell.fill = fill_to_use
+            last_row = first_row + num_details - 1
+            for col in [1, 2, 3, 4] + list(range(6, 15)):
+                writer.merge(first_row, col, last_row, col)
+
+        for theory_source in theory_sources[1:]:
+            writer.append([None] * 4 + [theory_source] + [None] * 9, detail_row_styles)
         
-        current_row += num_details
         material_index += 1  # Increment for next material record
     
-    # Auto-adjust column widths
-    column_widths = [30, 15, 20, 10, 50, 15, 15, 15, 10, 15, 15, 15, 15, 20]  # Added widths for last month and MoM columns
-    for i, width in enumerate(column_widths, 1):
-        worksheet.column_dimensions[get_column_letter(i)].width = width
-    
     logger.info(f"Completed writing material usage sheet for {store_name}")
 
 
@@ -8,9 +8,9 @@ Creates an Excel workbook with a sheet for each store comparing theoretical vs a
 import argparse
 import sys
 import logging
+import time
 from pathlib import Path
 from datetime import datetime
-from openpyxl import Workbook
 import os
 
 # Add parent directory to path for imports
@@ -19,6 +19,7 @@ sys.path.insert(0, str(project_root))
 
 from utils.database import DatabaseManager, DatabaseConfig
 from lib.config import STORE_ID_TO_NAME_MAPPING
+from lib.worksheet_writer import create_report_workbook
 from scripts.dish_material.generate_report.generate_material_usage_report.compare_material_usage_sheet import (
     write_material_usage_to_sheet
 )
@@ -31,7 +32,8 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def generate_material_usage_report(year: int, month: int, output_dir: str = None, test_db: bool = False, debug: bool = False):
+def generate_material_usage_report(year: int, month: int, output_dir: str = None, test_db: bool = False, debug: bool = False,
+                                   streaming: bool = False):
     """
     Generate material usage comparison report for all stores.
     
@@ -41,6 +43,8 @@ def generate_material_usage_report(year: int, month: int, output_dir: str = None
         output_dir: Output directory for the Excel file
         test_db: Use test database if True
         debug: If True, include detailed calculation info in the output
+        streaming: If True, stream each sheet to disk row by row (openpyxl
+            write-only mode) instead of holding the whole workbook in memory
     """
     # Set up output directory
     if output_dir is None:
@@ -54,12 +58,9 @@ def generate_material_usage_report(year: int, month: int, output_dir: str = None
     db_config = DatabaseConfig(is_test=test_db)
     db_manager = DatabaseManager(db_config)
     
-    # Create workbook
-    workbook = Workbook()
-    
-    # Remove default sheet
-    if "Sheet" in workbook.sheetnames:
-        workbook.remove(workbook["Sheet"])
+    # Create workbook (without the default sheet)
+    workbook = create_report_workbook(streaming=streaming)
+    write_start = time.perf_counter()
     
     # Generate sheets for each store
     stores_processed = 0
@@ -93,6 +94,8 @@ def generate_material_usage_report(year: int, month: int, output_dir: str = None
             # Continue with next store even if this one fails
             continue
     
+    write_time = time.perf_counter() - write_start
+    
     if stores_processed == 0:
         logger.error("No stores were successfully processed")
         return None
@@ -102,8 +105,12 @@ def generate_material_usage_report(year: int, month: int, output_dir: str = None
     output_path = output_dir / output_filename
     
     try:
+        save_start = time.perf_counter()
         workbook.save(output_path)
+        save_time = time.perf_counter() - save_start
         logger.info(f"Report saved to: {output_path}")
+        logger.info(f"Phase timings ({'streaming' if streaming else 'in-memory'} workbook): "
+                    f"write {write_time:.2f}s, save {save_time:.2f}s")
         return output_path
     except Exception as e:
         logger.error(f"Failed to save workbook: {str(e)}")
@@ -142,6 +149,11 @@ def main():
         action='store_true',
         help='Include detailed calculation info (quantity sold, standard quantity, loss rate, etc.)'
     )
+    parser.add_argument(
+        '--streaming',
+        action='store_true',
+        help='Stream sheets to disk row by row (lower memory for large reports)'
+    )
     
     args = parser.parse_args()
     
@@ -158,6 +170,7 @@ def main():
     print(f"Month: {args.month}")
     print(f"Database: {'Test' if args.test else 'Production'}")
     print(f"Debug Mode: {'Enabled' if args.debug else 'Disabled'}")
+    print(f"Streaming: {'Enabled' if args.streaming else 'Disabled'}")
     print("="*60 + "\n")
     
     # Generate report
@@ -166,7 +179,8 @@ def main():
         month=args.month,
         output_dir=args.output_dir,
         test_db=args.test,
-        debug=args.debug
+        debug=args.debug,
+        streaming=args.streaming
     )
     
     # Print result
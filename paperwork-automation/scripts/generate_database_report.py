@@ -17,7 +17,7 @@ from lib.yearly_comparison_daily_worksheet import YearlyComparisonDailyWorksheet
 from lib.monthly_dishes_worksheet import MonthlyDishesWorksheetGenerator
 from lib.daily_store_tracking_worksheet import DailyStoreTrackingGenerator
 from lib.weekly_store_tracking_worksheet import WeeklyStoreTrackingGenerator
-from lib.database_queries import ReportDataProvider
+from lib.database_queries import ReportDataCache, ReportDataProvider
 from utils.database import DatabaseConfig, DatabaseManager
 import os
 from dotenv import load_dotenv
@@ -39,7 +39,7 @@ class DatabaseReportGenerator:
         self.target_date = target_date
         self.is_test = is_test
         self.config = DatabaseConfig(is_test=is_test)
-        self.db_manager = DatabaseManager(self.config)
+        self.db_manager = DatabaseManager(self.config, pooled=True)
         self.output_dir = Path(os.getenv('OUTPUT_DIR', './output'))
         self.output_dir.mkdir(exist_ok=True)
 
@@ -50,7 +50,7 @@ class DatabaseReportGenerator:
         }
 
         # Initialize data provider and worksheet generators
-        self.data_provider = ReportDataProvider(self.db_manager)
+        self.data_provider = ReportDataProvider(self.db_manager, cache=ReportDataCache())
         self.comparison_generator = ComparisonWorksheetGenerator(
             self.store_names, self.target_date)
         self.yearly_generator = YearlyComparisonWorksheetGenerator(
@@ -142,6 +142,8 @@ class DatabaseReportGenerator:
 
         # Save the report
         output_path = self.save_report(wb)
+        self.db_manager.log_pool_stats()
+        self.data_provider.cache.log_stats()
         if output_path:
             return output_path
         else:
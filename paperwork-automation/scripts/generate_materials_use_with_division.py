@@ -22,6 +22,7 @@ import argparse
 import logging
 
 from utils.database import DatabaseConfig, DatabaseManager
+from lib.bom_cost_engine import BomCostEngine
 from lib.config import STORE_NAME_MAPPING
 
 # Configure logging
@@ -45,72 +46,34 @@ class MaterialsUseCalculatorWithDivision:
         logger.info(f"Initialized calculator for {target_date} (Year: {self.year}, Month: {self.month})")
     
     def get_dish_sales_with_materials(self) -> pd.DataFrame:
-        """Get dish sales data with their material relationships"""
+        """Get dish sales (regular and combo) with their material relationships and usage"""
         try:
             with self.db_manager.get_connection() as conn:
-                query = """
-                SELECT 
-                    d.id as dish_id,
-                    d.name as dish_name,
-                    d.full_code as dish_code,
-                    d.size as dish_size,
-                    d.store_id,
-                    s.name as store_name,
-                    dct.name as dish_child_type_name,
-                    dt.name as dish_type_name,
-                    
-                    -- Dish sales data (aggregate both sales modes)
-                    COALESCE(SUM(dms.sale_amount), 0) as total_sale_amount,
-                    COALESCE(SUM(dms.return_amount), 0) as total_return_amount,
-                    (COALESCE(SUM(dms.sale_amount), 0) - COALESCE(SUM(dms.return_amount), 0)) as net_sales,
-                    
-                    -- Material information
-                    m.material_number,
-                    m.name as material_name,
-                    m.unit as material_unit,
-                    
-                    -- Material usage parameters
-                    dm.standard_quantity,
-                    dm.loss_rate,
-                    dm.unit_conversion_rate
-                    
-                FROM dish d
-                JOIN store s ON d.store_id = s.id
-                JOIN dish_child_type dct ON d.dish_child_type_id = dct.id
-                JOIN dish_type dt ON dct.dish_type_id = dt.id
-                JOIN dish_material dm ON d.id = dm.dish_id AND d.store_id = dm.store_id
-                JOIN material m ON dm.material_id = m.id AND dm.store_id = m.store_id
-                LEFT JOIN dish_monthly_sale dms ON d.id = dms.dish_id AND d.store_id = dms.store_id
-                    AND dms.year = %s AND dms.month = %s
-                    
-                WHERE d.is_active = TRUE AND m.is_active = TRUE
-                
-                GROUP BY 
-                    d.id, d.name, d.full_code, d.size, d.store_id, s.name, 
-                    dct.name, dt.name, m.material_number, m.name, m.unit,
-                    dm.standard_quantity, dm.loss_rate, dm.unit_conversion_rate
-                    
-                HAVING (COALESCE(SUM(dms.sale_amount), 0) - COALESCE(SUM(dms.return_amount), 0)) > 0
-                
-                ORDER BY d.store_id, net_sales DESC
-                """
-                
-                logger.info("Querying dish sales with material relationships...")
+                logger.info("Loading dish-material recipes and dish sales...")
                 
                 with conn.cursor() as cursor:
-                    cursor.execute(query, (self.year, self.month))
-                    rows = cursor.fetchall()
-                    
-                    # Convert to DataFrame
-                    data = []
-                    for row in rows:
-                        row_dict = dict(row)
-                        data.append(row_dict)
+                    engine = BomCostEngine.fetch(cursor, self.year, self.month, active_only=True)
                     
-                    df = pd.DataFrame(data)
-                
-                logger.info(f"Found {len(df)} dish-material combinations with sales data")
-                return df
+                    cursor.execute("""
+                    SELECT 
+                        d.id as dish_id,
+                        dct.name as dish_child_type_name,
+                        dt.name as dish_type_name
+                    FROM dish d
+                    JOIN dish_child_type dct ON d.dish_child_type_id = dct.id
+                    JOIN dish_type dt ON dct.dish_type_id = dt.id
+                    WHERE d.is_active = TRUE
+                    """)
+                    dish_types = pd.DataFrame([dict(row) for row in cursor.fetchall()],
+                                              columns=['dish_id', 'dish_child_type_name', 'dish_type_name'])
+            
+            lines = engine.lines_frame()
+            df = lines[lines['net_sales'] > 0].merge(dish_types, on='dish_id')
+            df = df.rename(columns={'dish_full_code': 'dish_code', 'usage': 'materials_use'})
+            df = df.sort_values(['store_id', 'net_sales'], ascending=[True, False])
+            
+            logger.info(f"Found {len(df)} dish-material combinations with sales data")
+            return df
                 
         except Exception as e:
             logger.error(f"Error getting dish sales with materials: {e}")
@@ -119,62 +82,30 @@ class MaterialsUseCalculatorWithDivision:
             return pd.DataFrame()
     
     def calculate_materials_use_with_division(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Calculate materials_use using DIVISION by unit_conversion_rate"""
+        """Build the materials_use calculation records (usage DIVIDES by unit_conversion_rate)"""
         
         logger.info(f"Calculating materials_use for {len(df)} records using DIVISION...")
         
-        calculation_data = []
-        
-        for _, row in df.iterrows():
-            try:
-                # Extract values
-                store_id = row['store_id']
-                store_name = row['store_name']
-                dish_name = row['dish_name']
-                dish_code = row['dish_code']
-                dish_size = row['dish_size'] if pd.notna(row['dish_size']) else ''
-                
-                net_sales = float(row['net_sales'])
-                standard_quantity = float(row['standard_quantity']) if pd.notna(row['standard_quantity']) else 0.0
-                loss_rate = float(row['loss_rate']) if pd.notna(row['loss_rate']) else 1.0
-                unit_conversion_rate = float(row['unit_conversion_rate']) if pd.notna(row['unit_conversion_rate']) else 1.0
-                
-                material_number = row['material_number']
-                material_name = row['material_name']
-                material_unit = row['material_unit'] if pd.notna(row['material_unit']) else ''
-                
-                # CRITICAL: Calculate materials_use using DIVISION by unit_conversion_rate
-                if unit_conversion_rate != 0:
-                    materials_use = net_sales * standard_quantity * loss_rate / unit_conversion_rate
-                else:
-                    materials_use = 0.0
-                    logger.warning(f"Zero conversion rate for dish {dish_code}, material {material_number}")
-                
-                # Create calculation record
-                calculation_data.append({
-                    'store_id': store_id,
-                    '门店名称': store_name,
-                    '菜品大类': row['dish_type_name'],
-                    '菜品子类': row['dish_child_type_name'],
-                    '菜品编码': dish_code,
-                    '菜品名称': dish_name,
-                    '规格': dish_size,
-                    'sale_amount': net_sales,
-                    '出品分量(kg)': standard_quantity,
-                    '损耗': loss_rate,
-                    '物料单位': unit_conversion_rate,
-                    '物料号': material_number,
-                    '物料名称': material_name,
-                    '单位': material_unit,
-                    'materials_use': materials_use,
-                    'calculation_method': 'division'  # Track the method used
-                })
-                
-            except Exception as e:
-                logger.error(f"Error calculating materials_use for row: {e}")
-                continue
-        
-        result_df = pd.DataFrame(calculation_data)
+        # materials_use = sale_amount * standard_quantity * loss_rate / unit_conversion_rate,
+        # already computed by the BOM engine
+        result_df = pd.DataFrame({
+            'store_id': df['store_id'],
+            '门店名称': df['store_name'],
+            '菜品大类': df['dish_type_name'],
+            '菜品子类': df['dish_child_type_name'],
+            '菜品编码': df['dish_code'],
+            '菜品名称': df['dish_name'],
+            '规格': df['dish_size'].fillna(''),
+            'sale_amount': df['net_sales'],
+            '出品分量(kg)': df['standard_quantity'],
+            '损耗': df['loss_rate'],
+            '物料单位': df['unit_conversion_rate'],
+            '物料号': df['material_number'],
+            '物料名称': df['material_name'],
+            '单位': df['material_unit'].fillna(''),
+            'materials_use': df['materials_use'],
+            'calculation_method': 'division'  # Track the method used
+        }).reset_index(drop=True)
         logger.info(f"Generated {len(result_df)} materials_use calculations using DIVISION")
         
         # Show some examples to verify the calculation
@@ -546,16 +546,8 @@ class MonthlyGrossMarginReportGenerator:
             FROM material_monthly_usage mmu
             JOIN material m ON mmu.material_id = m.id
             JOIN store s ON mmu.store_id = s.id
-            LEFT JOIN LATERAL (
-                SELECT price 
-                FROM material_price_history 
-                WHERE material_id = mmu.material_id 
-                    AND store_id = mmu.store_id 
-                    AND is_active = true
-                    AND effective_date <= (date_trunc('month', make_date(%s, %s, 1)) + interval '1 month - 1 day')::date
-                ORDER BY effective_date DESC
-                LIMIT 1
-            ) mph ON true
+            LEFT JOIN material_price_as_of(make_date(%s, %s, 1)) mph
+                ON mph.material_id = mmu.material_id AND mph.store_id = mmu.store_id
             WHERE mmu.year = %s AND mmu.month = %s
         ),
         prev_month AS (
@@ -565,15 +557,8 @@ class MonthlyGrossMarginReportGenerator:
                 COALESCE(mph.price, 0) as avg_price
             FROM material_monthly_usage mmu
             JOIN store s ON mmu.store_id = s.id
-            LEFT JOIN LATERAL (
-                SELECT price 
-                FROM material_price_history 
-                WHERE material_id = mmu.material_id 
-                    AND store_id = mmu.store_id 
-                    AND effective_date = %s
-                ORDER BY effective_date DESC
-                LIMIT 1
-            ) mph ON true
+            LEFT JOIN material_price_as_of(%s::date) mph
+                ON mph.material_id = mmu.material_id AND mph.store_id = mmu.store_id
             WHERE mmu.year = %s AND mmu.month = %s
         ),
         last_year AS (
@@ -583,15 +568,8 @@ class MonthlyGrossMarginReportGenerator:
                 COALESCE(mph.price, 0) as avg_price
             FROM material_monthly_usage mmu
             JOIN store s ON mmu.store_id = s.id
-            LEFT JOIN LATERAL (
-                SELECT price 
-                FROM material_price_history 
-                WHERE material_id = mmu.material_id 
-                    AND store_id = mmu.store_id 
-                    AND effective_date = %s
-                ORDER BY effective_date DESC
-                LIMIT 1
-            ) mph ON true
+            LEFT JOIN material_price_as_of(%s::date) mph
+                ON mph.material_id = mmu.material_id AND mph.store_id = mmu.store_id
             WHERE mmu.year = %s AND mmu.month = %s
         )
         SELECT 
@@ -772,16 +750,8 @@ class MonthlyGrossMarginReportGenerator:
                 mmu.store_id,
                 SUM(mmu.material_used * COALESCE(mph.price, 0)) as material_cost
             FROM material_monthly_usage mmu
-            LEFT JOIN LATERAL (
-                SELECT price 
-                FROM material_price_history 
-                WHERE material_id = mmu.material_id 
-                    AND store_id = mmu.store_id 
-                    AND is_active = true
-                    AND effective_date <= (date_trunc('month', make_date(%s, %s, 1)) + interval '1 month - 1 day')::date
-                ORDER BY effective_date DESC
-                LIMIT 1
-            ) mph ON true
+            LEFT JOIN material_price_as_of(make_date(%s, %s, 1)) mph
+                ON mph.material_id = mmu.material_id AND mph.store_id = mmu.store_id
             WHERE mmu.year = %s AND mmu.month = %s
             GROUP BY mmu.store_id
         ),
@@ -798,16 +768,8 @@ class MonthlyGrossMarginReportGenerator:
                 mmu.store_id,
                 SUM(mmu.material_used * COALESCE(mph.price, 0)) as material_cost
             FROM material_monthly_usage mmu
-            LEFT JOIN LATERAL (
-                SELECT price 
-                FROM material_price_history 
-                WHERE material_id = mmu.material_id 
-                    AND store_id = mmu.store_id 
-                    AND is_active = true
-                    AND effective_date <= (date_trunc('month', make_date(%s, %s, 1)) + interval '1 month - 1 day')::date
-                ORDER BY effective_date DESC
-                LIMIT 1
-            ) mph ON true
+            LEFT JOIN material_price_as_of(make_date(%s, %s, 1)) mph
+                ON mph.material_id = mmu.material_id AND mph.store_id = mmu.store_id
             WHERE mmu.year = %s AND mmu.month = %s
             GROUP BY mmu.store_id
         ),
@@ -824,16 +786,8 @@ class MonthlyGrossMarginReportGenerator:
                 mmu.store_id,
                 SUM(mmu.material_used * COALESCE(mph.price, 0)) as material_cost
             FROM material_monthly_usage mmu
-            LEFT JOIN LATERAL (
-                SELECT price 
-                FROM material_price_history 
-                WHERE material_id = mmu.material_id 
-                    AND store_id = mmu.store_id 
-                    AND is_active = true
-                    AND effective_date <= (date_trunc('month', make_date(%s, %s, 1)) + interval '1 month - 1 day')::date
-                ORDER BY effective_date DESC
-                LIMIT 1
-            ) mph ON true
+            LEFT JOIN material_price_as_of(make_date(%s, %s, 1)) mph
+                ON mph.material_id = mmu.material_id AND mph.store_id = mmu.store_id
             WHERE mmu.year = %s AND mmu.month = %s
             GROUP BY mmu.store_id
         )
@@ -923,16 +877,8 @@ class MonthlyGrossMarginReportGenerator:
                 mmu.store_id,
                 SUM(mmu.material_used * COALESCE(mph.price, 0)) as material_cost
             FROM material_monthly_usage mmu
-            LEFT JOIN LATERAL (
-                SELECT price 
-                FROM material_price_history 
-                WHERE material_id = mmu.material_id 
-                    AND store_id = mmu.store_id 
-                    AND is_active = true
-                    AND effective_date <= %s
-                ORDER BY effective_date DESC
-                LIMIT 1
-            ) mph ON true
+            LEFT JOIN material_price_as_of(%s::date) mph
+                ON mph.material_id = mmu.material_id AND mph.store_id = mmu.store_id
             WHERE mmu.year = %s AND mmu.month = %s
             GROUP BY mmu.store_id
         ),
@@ -941,16 +887,8 @@ class MonthlyGrossMarginReportGenerator:
                 mmu.store_id,
                 SUM(mmu.material_used * COALESCE(mph.price, 0)) as material_cost
             FROM material_monthly_usage mmu
-            LEFT JOIN LATERAL (
-                SELECT price 
-                FROM material_price_history 
-                WHERE material_id = mmu.material_id 
-                    AND store_id = mmu.store_id 
-                    AND is_active = true
-                    AND effective_date <= %s
-                ORDER BY effective_date DESC
-                LIMIT 1
-            ) mph ON true
+            LEFT JOIN material_price_as_of(%s::date) mph
+                ON mph.material_id = mmu.material_id AND mph.store_id = mmu.store_id
             WHERE mmu.year = %s AND mmu.month = %s
             GROUP BY mmu.store_id
         ),
@@ -959,16 +897,8 @@ class MonthlyGrossMarginReportGenerator:
                 mmu.store_id,
                 SUM(mmu.material_used * COALESCE(mph.price, 0)) as material_cost
             FROM material_monthly_usage mmu
-            LEFT JOIN LATERAL (
-                SELECT price 
-                FROM material_price_history 
-                WHERE material_id = mmu.material_id 
-                    AND store_id = mmu.store_id 
-                    AND is_active = true
-                    AND effective_date <= %s
-                ORDER BY effective_date DESC
-                LIMIT 1
-            ) mph ON true
+            LEFT JOIN material_price_as_of(%s::date) mph
+                ON mph.material_id = mmu.material_id AND mph.store_id = mmu.store_id
             WHERE mmu.year = %s AND mmu.month = %s
             GROUP BY mmu.store_id
         )
@@ -26,7 +26,7 @@ from dotenv import load_dotenv
 from openpyxl import Workbook
 
 from lib.weekly_yoy_comparison_worksheet import WeeklyYoYComparisonWorksheetGenerator
-from lib.database_queries import ReportDataProvider
+from lib.database_queries import ReportDataCache, ReportDataProvider
 from utils.database import DatabaseConfig, DatabaseManager
 
 # Load environment variables
@@ -50,7 +50,7 @@ class WeeklyYoYReportGenerator:
 
         # Setup database connection
         self.config = DatabaseConfig(is_test=is_test)
-        self.db_manager = DatabaseManager(self.config)
+        self.db_manager = DatabaseManager(self.config, pooled=True)
 
         # Setup output directory
         self.output_dir = Path(output_dir) if output_dir else Path(
@@ -58,7 +58,7 @@ class WeeklyYoYReportGenerator:
         self.output_dir.mkdir(exist_ok=True)
 
         # Initialize data provider
-        self.data_provider = ReportDataProvider(self.db_manager)
+        self.data_provider = ReportDataProvider(self.db_manager, cache=ReportDataCache())
 
         # Initialize worksheet generator
         self.weekly_yoy_generator = WeeklyYoYComparisonWorksheetGenerator(
@@ -119,6 +119,7 @@ class WeeklyYoYReportGenerator:
         wb.save(output_path)
         print(f"\n✅ Report saved to: {output_path}")
         print(f"   Worksheets: {', '.join(worksheets_generated)}")
+        self.data_provider.cache.log_stats()
 
         return str(output_path)
 
@@ -12,7 +12,7 @@ from pathlib import Path
 import logging
 import argparse
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Set, Tuple
 import sys
 import zipfile
 import tempfile
@@ -145,6 +145,69 @@ class ExcelImagePreserver:
             return False
 
 
+def key_text(value) -> str:
+    """Stripped text of a duplicate-check field; empty for blank/falsy values"""
+    return str(value).strip() if value else ""
+
+
+class DuplicateTransactionIndex:
+    """Set of (date, description, debit, credit) keys for one bank sheet.
+
+    Covers the same rows the old full-sheet scan compared against: from row 3
+    down to the first row without a date. Rows written later join the index
+    once that scan would reach them, so each check is a set lookup instead of
+    a re-read of the whole sheet.
+    """
+
+    def __init__(self, ws, header_positions: Dict[str, int],
+                 normalize_date: Callable[[object], str]):
+        self.ws = ws
+        self.normalize_date = normalize_date
+        self.date_col = header_positions.get('Date', 1)
+        self.desc_col = header_positions.get('Transaction Description', 3)
+        self.debit_col = header_positions.get('Debit', 6)
+        self.credit_col = header_positions.get('Credit', 7)
+        self.rebuild()
+
+    def rebuild(self):
+        """Re-read every indexed row from the top of the sheet"""
+        self.keys: Set[Tuple[str, str, str, str]] = set()
+        self.next_row = 3
+        self.extend()
+
+    def extend(self):
+        """Index consecutive dated rows starting at next_row"""
+        max_row = self.ws.max_row
+        while self.next_row <= max_row:
+            if not self.ws.cell(row=self.next_row, column=self.date_col).value:
+                break
+            self.keys.add(self.row_key(self.next_row))
+            self.next_row += 1
+
+    def row_key(self, row: int) -> Tuple[str, str, str, str]:
+        """Duplicate-check key of an existing worksheet row"""
+        cell = self.ws.cell
+        return (
+            self.normalize_date(cell(row=row, column=self.date_col).value),
+            key_text(cell(row=row, column=self.desc_col).value),
+            key_text(cell(row=row, column=self.debit_col).value),
+            key_text(cell(row=row, column=self.credit_col).value)
+        )
+
+    def row_written(self, row: int):
+        """Update the index after a row has been written to the worksheet"""
+        if row < self.next_row:
+            self.rebuild()
+        elif row == self.next_row:
+            self.extend()
+
+    def __contains__(self, key) -> bool:
+        return key in self.keys
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
 class BankTransactionProcessor:
     """Process bank transactions from multiple sources and append to existing worksheets"""
 
@@ -181,6 +244,9 @@ class BankTransactionProcessor:
             "3088": "RBC3088（USD）-Hi Bowl"
         }
 
+        # Duplicate-check indexes per worksheet title, built when the workbook loads
+        self.duplicate_indexes: Dict[str, DuplicateTransactionIndex] = {}
+
     def process_all_transactions(self) -> None:
         """Main processing function"""
         logger.info(
@@ -618,6 +684,14 @@ class BankTransactionProcessor:
             logger.info(f"Loading copied workbook: {self.output_file}")
             wb = load_workbook(self.output_file)
 
+            # Index existing transactions once per sheet for duplicate checks
+            self.duplicate_indexes = {}
+            for sheet_name in all_transactions:
+                if sheet_name in wb.sheetnames:
+                    index = self.get_duplicate_index(wb[sheet_name])
+                    logger.info(
+                        f"Sheet '{sheet_name}': Indexed {len(index)} existing transactions")
+
             total_added = 0
 
             for sheet_name, transactions in all_transactions.items():
@@ -784,6 +858,8 @@ class BankTransactionProcessor:
                         cell.fill = PatternFill(
                             start_color='FFB6C1', end_color='FFB6C1', fill_type='solid')  # Light red
 
+            # Later transactions in this batch are checked against the new row too
+            self.get_duplicate_index(ws).row_written(new_row)
             added_count += 1
 
         if skipped_count > 0:
@@ -791,59 +867,27 @@ class BankTransactionProcessor:
 
         return added_count
 
+    def get_duplicate_index(self, ws) -> DuplicateTransactionIndex:
+        """Get (building on first use) the duplicate-check index for a worksheet"""
+        index = self.duplicate_indexes.get(ws.title)
+        if index is None or index.ws is not ws:
+            index = DuplicateTransactionIndex(
+                ws, self.get_header_positions_for_sheet(ws.title), self.normalize_date)
+            self.duplicate_indexes[ws.title] = index
+        return index
+
+    def transaction_key(self, transaction: Dict) -> Tuple[str, str, str, str]:
+        """Duplicate-check key of an incoming transaction"""
+        return (
+            self.normalize_date(transaction.get('Date')),
+            str(transaction.get('Transaction Description', '')).strip(),
+            key_text(transaction.get('Debit')),
+            key_text(transaction.get('Credit'))
+        )
+
     def is_duplicate_transaction(self, ws, transaction: Dict, last_row: int) -> bool:
         """Check if transaction already exists in worksheet"""
-        # Get bank-specific header positions for this sheet
-        header_positions = self.get_header_positions_for_sheet(ws.title)
-
-        # Extract column positions for key fields
-        date_col = header_positions.get('Date', 1)
-        desc_col = header_positions.get('Transaction Description', 3)
-        debit_col = header_positions.get('Debit', 6)
-        credit_col = header_positions.get('Credit', 7)
-
-        # Check ALL existing rows in the worksheet for duplicates
-        # Start from row 3 to skip headers, check up to max_row
-        start_row = 3
-
-        for row in range(start_row, ws.max_row + 1):
-            existing_date = ws.cell(row=row, column=date_col).value
-            
-            # Stop if we hit empty rows
-            if not existing_date:
-                break
-                
-            existing_desc = ws.cell(row=row, column=desc_col).value
-            existing_debit = ws.cell(row=row, column=debit_col).value
-            existing_credit = ws.cell(row=row, column=credit_col).value
-
-            # Normalize dates for comparison (handle different date formats)
-            existing_date_normalized = self.normalize_date(existing_date)
-            transaction_date_normalized = self.normalize_date(
-                transaction.get('Date'))
-
-            # Convert other fields to strings for comparison, handling None values properly
-            existing_desc_str = str(existing_desc).strip() if existing_desc else ""
-            existing_debit_str = str(
-                existing_debit).strip() if existing_debit and str(existing_debit).strip() != "" else ""
-            existing_credit_str = str(
-                existing_credit).strip() if existing_credit and str(existing_credit).strip() != "" else ""
-
-            transaction_desc_str = str(
-                transaction.get('Transaction Description', '')).strip()
-            transaction_debit_str = str(transaction.get('Debit', '')).strip() if transaction.get(
-                'Debit') and str(transaction.get('Debit')).strip() != "" else ""
-            transaction_credit_str = str(transaction.get('Credit', '')).strip() if transaction.get(
-                'Credit') and str(transaction.get('Credit')).strip() != "" else ""
-
-            # Check if key fields match (using normalized dates)
-            if (existing_date_normalized == transaction_date_normalized and
-                existing_desc_str == transaction_desc_str and
-                existing_debit_str == transaction_debit_str and
-                    existing_credit_str == transaction_credit_str):
-                return True
-
-        return False
+        return self.transaction_key(transaction) in self.get_duplicate_index(ws)
 
     def normalize_date(self, date_value) -> str:
         """Normalize date to a standard format for comparison"""
@@ -949,9 +993,9 @@ class BankTransactionProcessor:
                                     
                                     transactions.append({
                                         'date': existing_date_normalized,
-                                        'description': str(existing_desc).strip() if existing_desc else "",
-                                        'debit': str(existing_debit).strip() if existing_debit and str(existing_debit).strip() != "" else "",
-                                        'credit': str(existing_credit).strip() if existing_credit and str(existing_credit).strip() != "" else ""
+                                        'description': key_text(existing_desc),
+                                        'debit': key_text(existing_debit),
+                                        'credit': key_text(existing_credit)
                                     })
                         
                         if transactions:
@@ -970,20 +1014,13 @@ class BankTransactionProcessor:
             return False
         
         # Normalize transaction data for comparison
-        trans_date = self.normalize_date(transaction.get('Date'))
-        trans_desc = str(transaction.get('Transaction Description', '')).strip()
-        trans_debit = str(transaction.get('Debit', '')).strip() if transaction.get('Debit') and str(transaction.get('Debit')).strip() != "" else ""
-        trans_credit = str(transaction.get('Credit', '')).strip() if transaction.get('Credit') and str(transaction.get('Credit')).strip() != "" else ""
-        
+        trans_key = self.transaction_key(transaction)
+
         # Check against each transaction in the reference
-        for ref_trans in last_date_transactions[sheet_name]:
-            if (ref_trans['date'] == trans_date and
-                ref_trans['description'] == trans_desc and
-                ref_trans['debit'] == trans_debit and
-                ref_trans['credit'] == trans_credit):
-                return True
-        
-        return False
+        return any(
+            (ref_trans['date'], ref_trans['description'], ref_trans['debit'], ref_trans['credit']) == trans_key
+            for ref_trans in last_date_transactions[sheet_name]
+        )
 
 
 def main():
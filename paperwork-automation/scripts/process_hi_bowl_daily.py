@@ -26,10 +26,11 @@ def main():
     parser.add_argument('--output-file', type=str, help='Output Excel file path')
     parser.add_argument('--target-month', type=str, help='Target month in YYYYMM format')
     parser.add_argument('--test', action='store_true', help='Run test with sample file')
+    parser.add_argument('--workers', type=int, help='Processes used to parse day-sheets (default: CPU count)')
     
     args = parser.parse_args()
     
-    processor = HiBowlDailyProcessor()
+    processor = HiBowlDailyProcessor(workers=args.workers)
     
     if args.test:
         # Test with the sample file
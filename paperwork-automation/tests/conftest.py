@@ -124,4 +124,32 @@ def expected_time_segment_mapping():
         '14:00-16:59': 2,
         '17:00-21:59': 3,
         '22:00-(次)07:59': 4
-    } 
\ No newline at end of file
+    } 
+@pytest.fixture
+def staged_copy(request):
+    """
+    Mocked cursor and connection for the set-based extractor tests, with
+    StagingLoader.copy_to_temp_table recording each staged frame.
+
+    On a unittest.TestCase (use @pytest.mark.usefixtures('staged_copy')) it
+    sets self.cursor, self.conn and self.staged ({table_name: DataFrame of
+    the staged columns}) before setUp runs.
+    """
+    from unittest.mock import patch
+    from lib.database_utils import StagingLoader
+
+    cursor = MagicMock()
+    conn = MagicMock()
+    conn.cursor.return_value = cursor
+    staged = {}
+
+    def copy_to_temp_table(cursor, df, table_name, column_types):
+        staged[table_name] = df[list(column_types)].reset_index(drop=True)
+        return len(df)
+
+    if request.instance is not None:
+        request.instance.cursor = cursor
+        request.instance.conn = conn
+        request.instance.staged = staged
+    with patch.object(StagingLoader, 'copy_to_temp_table', side_effect=copy_to_temp_table):
+        yield cursor, conn, staged
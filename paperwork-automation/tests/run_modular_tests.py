@@ -304,10 +304,82 @@ class ModularTestRunner:
                 print("Good performance")
             else:
                 print("Consider optimization")
-                
+
         except Exception as e:
             print(f"Benchmark failed: {e}")
 
+        self.run_transform_benchmarks()
+        self.run_bank_rule_benchmarks()
+
+    def run_transform_benchmarks(self):
+        """Benchmark QBI export transforms against the old row-by-row loops"""
+        try:
+            from lib.data_extraction import (
+                transform_daily_report_data, transform_time_segment_data, STORE_IDS
+            )
+            from tests.test_data_extraction_comprehensive import (
+                make_qbi_export, legacy_transform_daily_report_data,
+                legacy_transform_time_segment_data
+            )
+
+            # One year of all stores, as a backfill would load it
+            daily_df = make_qbi_export(days=365)
+            segment_df = make_qbi_export(days=365, with_time_segments=True)
+
+            cases = [
+                ('Daily report', daily_df,
+                 legacy_transform_daily_report_data, transform_daily_report_data),
+                ('Time segment roll-up', segment_df,
+                 legacy_transform_daily_report_data, transform_daily_report_data),
+                ('Time segment rows', segment_df,
+                 legacy_transform_time_segment_data, transform_time_segment_data),
+            ]
+
+            print(f"\nQBI transforms over 365 days x {len(STORE_IDS)} stores:")
+            for name, df, legacy, vectorized in cases:
+                start_time = time.time()
+                legacy(df)
+                legacy_time = time.time() - start_time
+
+                start_time = time.time()
+                vectorized(df)
+                vectorized_time = time.time() - start_time
+
+                print(f"{name}: {len(df):,} rows, row-by-row {legacy_time:.3f}s, "
+                      f"vectorized {vectorized_time:.3f}s "
+                      f"({legacy_time / max(vectorized_time, 1e-9):.1f}x)")
+
+        except Exception as e:
+            print(f"Transform benchmark failed: {e}")
+
+    def run_bank_rule_benchmarks(self):
+        """Benchmark the compiled bank rule classifier against a linear rule scan"""
+        try:
+            from configs.bank_statement.bank_transaction_rules import (
+                BANK_TRANSACTION_RULES, COMPILED_TRANSACTION_RULES
+            )
+            from tests.test_bank_transaction_rules import make_bank_year, linear_match
+
+            transactions = make_bank_year(days=365)
+
+            start_time = time.time()
+            for description, amount, transaction_type in transactions:
+                linear_match(description, amount, transaction_type)
+            linear_time = time.time() - start_time
+
+            start_time = time.time()
+            for description, amount, transaction_type in transactions:
+                COMPILED_TRANSACTION_RULES.match(description, amount, transaction_type)
+            compiled_time = time.time() - start_time
+
+            print(f"\nBank rules ({len(BANK_TRANSACTION_RULES)} rules) over "
+                  f"{len(transactions):,} transactions: linear {linear_time:.3f}s, "
+                  f"compiled {compiled_time:.3f}s "
+                  f"({linear_time / max(compiled_time, 1e-9):.1f}x)")
+
+        except Exception as e:
+            print(f"Bank rule benchmark failed: {e}")
+
 
 def main():
     """Main test runner entry point"""
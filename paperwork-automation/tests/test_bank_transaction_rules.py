@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the compiled bank transaction rule engine.
+Checks that CompiledTransactionRules returns exactly what a linear scan of
+BANK_TRANSACTION_RULES with rule.matches() returns (first match wins).
+"""
+
+import unittest
+import sys
+import os
+import random
+
+# Add project root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from configs.bank_statement.bank_transaction_rules import (
+    BANK_TRANSACTION_RULES, COMPILED_TRANSACTION_RULES, CompiledTransactionRules,
+    TransactionMatchRule, classify_transaction, format_sheet_classification
+)
+
+# Descriptions shaped like the regex rules plus bank text no rule knows about
+SAMPLE_DESCRIPTIONS = [
+    "MC123456 789", "VI0042 12", "UP77 3", "EF1 2", "AMX9 100",
+    "PAYROLL TBJ 0001 BUS/ENT", "PAYROLL E1F PAY BUS/ENT", "IOT PAY 8812 MSP/DIV",
+    "DP3301 DEP MSP/DIV", "MRCH5501 MSP/DIV", "VSA FEE12 MSP/DIV", "MC FEE 7 MSP/DIV",
+    "SNAPPYON 22 EXP/RDD", "UBER CANADA/UBEREATS", "uber holdings",
+    "RENT/LEASE Rent 2024", "INTEREST PAID", "PCRQ 1234 BUS/ENT", "GST-P 99 BUS/ENT",
+    "Service Charge / Correction", "SERVICE CHARGE", "E-TRANSFER 1002 ACME CORP",
+    "POS PURCHASE GROCERY 44", "CHQ#00123", "", "WIRE IN 3345 CAFÉ LTD",
+]
+
+
+def linear_match(description, amount=None, transaction_type=None, rules=BANK_TRANSACTION_RULES):
+    """Reference implementation: evaluate every rule in order"""
+    for rule, classification in rules:
+        if rule.matches(description, amount, transaction_type):
+            return rule, classification
+    return None
+
+
+def make_bank_year(days=365, per_day=60, seed=2025):
+    """
+    Build a synthetic year of bank transactions as (description, amount, type) tuples.
+
+    Descriptions combine rule literals (in mixed case), regex-shaped samples and
+    unknown text; amounts include the exact recurring amounts used by rules.
+    """
+    rng = random.Random(seed)
+    fragments = list(SAMPLE_DESCRIPTIONS)
+    amounts = [None, 0.0, 25.0, 120.0, 999.99, 5000.0, 150000.0]
+    for rule, _ in BANK_TRANSACTION_RULES:
+        pattern = rule.description_pattern
+        if isinstance(pattern, str):
+            fragments.extend([pattern, pattern.lower(), pattern.upper()])
+        if isinstance(rule.amount_pattern, (int, float)):
+            amounts.extend([rule.amount_pattern, rule.amount_pattern + 0.005])
+
+    transactions = []
+    for _ in range(days * per_day):
+        description = " ".join(rng.choice(fragments) for _ in range(rng.randint(1, 3)))
+        amount = rng.choice(amounts)
+        if amount is not None and rng.random() < 0.3:
+            amount = -amount
+        transaction_type = rng.choice(['credit', 'debit', 'debit', None])
+        transactions.append((description, amount, transaction_type))
+    return transactions
+
+
+class TestCompiledTransactionRules(unittest.TestCase):
+    """Compiled classifier must agree with the linear rule scan"""
+
+    def test_matches_linear_scan(self):
+        """Every synthetic transaction resolves to the same rule as a linear scan"""
+        for description, amount, transaction_type in make_bank_year(days=60):
+            expected = linear_match(description, amount, transaction_type)
+            actual = COMPILED_TRANSACTION_RULES.match(description, amount, transaction_type)
+            self.assertIs(actual[1] if actual else None, expected[1] if expected else None,
+                          f"{description!r} {amount} {transaction_type}")
+
+    def test_first_match_wins(self):
+        """An earlier broad rule shadows a later, more specific one"""
+        broad = TransactionMatchRule(description_pattern="ACME")
+        specific = TransactionMatchRule(description_pattern="ACME CORP", amount_pattern=10.0)
+        rules = [(broad, {"品名": "broad"}), (specific, {"品名": "specific"})]
+        compiled = CompiledTransactionRules(rules)
+
+        self.assertEqual(compiled.classify("acme corp", 10.0)["品名"], "broad")
+
+    def test_amount_and_type_filters(self):
+        """Amount predicates and credit/debit buckets behave like rule.matches()"""
+        rules = [
+            (TransactionMatchRule(description_pattern="FEE", amount_pattern=('>=', 100),
+                                  transaction_type='debit'), {"品名": "large debit"}),
+            (TransactionMatchRule(description_pattern="FEE", amount_pattern=(10, 20)),
+             {"品名": "range"}),
+            (TransactionMatchRule(description_pattern="FEE", amount_pattern=('!=', 5)),
+             {"品名": "bad operator"}),
+            (TransactionMatchRule(description_pattern="FEE", transaction_type='credit'),
+             {"品名": "credit"}),
+        ]
+        compiled = CompiledTransactionRules(rules)
+
+        for amount in (None, -150.0, 150.0, 15.0, -20.0, 5.0, 50.0):
+            for transaction_type in ('credit', 'debit', None, 'other'):
+                expected = linear_match("Monthly fee", amount, transaction_type, rules)
+                self.assertEqual(compiled.match("Monthly fee", amount, transaction_type), expected)
+
+    def test_case_sensitive_and_non_ascii(self):
+        """Case-sensitive literals and non-ASCII text keep regex semantics"""
+        rules = [
+            (TransactionMatchRule(description_pattern="Rent", case_sensitive=True),
+             {"品名": "sensitive"}),
+            (TransactionMatchRule(description_pattern="café"), {"品名": "accented"}),
+            (TransactionMatchRule(description_pattern="sk"), {"品名": "ascii"}),
+        ]
+        compiled = CompiledTransactionRules(rules)
+
+        for description in ("RENT", "Rent", "CAFÉ 12", "DEſK", "DESK", "KEY"):
+            self.assertEqual(compiled.match(description), linear_match(description, rules=rules))
+
+    def test_recompiles_after_rule_added(self):
+        """Rules appended after compilation are picked up"""
+        rules = [(TransactionMatchRule(description_pattern="ALPHA"), {"品名": "alpha"})]
+        compiled = CompiledTransactionRules(rules)
+        self.assertIsNone(compiled.classify("BETA 1"))
+
+        rules.append((TransactionMatchRule(description_pattern="BETA"), {"品名": "beta"}))
+        self.assertEqual(compiled.classify("BETA 1")["品名"], "beta")
+
+    def test_sheet_classification_format(self):
+        """Confirmation flags become 待确认 / '' and strings pass through"""
+        formatted = format_sheet_classification({
+            "品名": "租金", "单据号": True, "附件": "群里", "备注": False})
+
+        self.assertEqual(formatted["品名"], "租金")
+        self.assertEqual(formatted["付款详情"], "")
+        self.assertEqual(formatted["单据号"], "待确认")
+        self.assertEqual(formatted["附件"], "群里")
+        self.assertEqual(formatted["是否登记线下付款表"], "")
+        self.assertEqual(formatted["备注"], "")
+
+        unmatched = classify_transaction("NOTHING MATCHES THIS 000", 1.0, 'debit')
+        self.assertEqual(unmatched["品名"], "待确认")
+        self.assertEqual(unmatched["付款详情"], "")
+
+
+if __name__ == '__main__':
+    unittest.main()
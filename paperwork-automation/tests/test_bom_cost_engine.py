@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Tests for lib/bom_cost_engine.py
+Checks usage, cost and attribution against row-by-row calculations.
+"""
+
+import unittest
+from unittest.mock import MagicMock
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Add project root to path
+import sys
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from lib.bom_cost_engine import BomCostEngine
+
+
+def recipe(dish_id, material_id, standard_quantity, loss_rate=1.0, unit_conversion_rate=1.0,
+           store_id=1, full_code=None, size=None):
+    return {'dish_id': dish_id, 'material_id': material_id, 'store_id': store_id,
+            'standard_quantity': standard_quantity, 'loss_rate': loss_rate,
+            'unit_conversion_rate': unit_conversion_rate,
+            'dish_full_code': full_code or str(dish_id), 'dish_size': size}
+
+
+class TestBomCostEngine(unittest.TestCase):
+    """Test the vectorized usage, cost and attribution"""
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.bom = pd.DataFrame([
+            recipe(dish_id, material_id, round(rng.random(), 3),
+                   loss_rate=None if (dish_id + material_id) % 5 == 0 else 1.2,
+                   unit_conversion_rate=0 if (dish_id * material_id) % 7 == 0 else 2.5,
+                   store_id=store_id)
+            for store_id in (1, 2)
+            for dish_id in range(1, 21)
+            for material_id in rng.choice(np.arange(100, 115), 4, replace=False)
+        ])
+        self.sales = pd.DataFrame([
+            {'dish_id': dish_id, 'store_id': store_id, 'net_sales': float(rng.integers(-2, 50))}
+            for store_id in (1, 2) for dish_id in range(1, 25)
+        ])
+        self.combo = pd.DataFrame([
+            {'dish_id': dish_id, 'store_id': 1, 'sale_amount': 3.0} for dish_id in (2, 5, 30)
+        ])
+        self.engine = BomCostEngine(self.bom, self.sales, self.combo)
+
+    def brute_force_usage(self, sales_by_dish):
+        """Usage per (material_id, store_id) computed one recipe line at a time"""
+        usage = {}
+        for row in self.bom.itertuples():
+            loss_rate = 1.0 if pd.isna(row.loss_rate) else row.loss_rate
+            conversion = row.unit_conversion_rate or 1.0
+            sold = sales_by_dish.get((row.dish_id, row.store_id), 0)
+            key = (row.material_id, row.store_id)
+            usage[key] = usage.get(key, 0) + sold * row.standard_quantity * loss_rate / conversion
+        return usage
+
+    def test_material_usage_matches_row_by_row(self):
+        """Test regular and combo usage match a row-by-row calculation"""
+        regular = {(r.dish_id, r.store_id): r.net_sales for r in self.sales.itertuples()}
+        combo = {(r.dish_id, r.store_id): r.sale_amount for r in self.combo.itertuples()}
+
+        usage = self.engine.material_usage()
+
+        for key, expected in self.brute_force_usage(regular).items():
+            self.assertAlmostEqual(usage.loc[key, 'regular_usage'], expected)
+        for key, expected in self.brute_force_usage(combo).items():
+            self.assertAlmostEqual(usage.loc[key, 'combo_usage'], expected)
+        np.testing.assert_allclose(usage['theoretical_usage'], usage['regular_usage'] + usage['combo_usage'])
+
+    def test_dish_cost_and_attribution(self):
+        """Test per-dish cost and attribution add back up to material totals"""
+        prices = {key: float(key[0] % 10 + 1) for key in self.engine.materials}
+        usage = self.engine.material_usage()
+
+        dish_cost = self.engine.dish_cost(prices)
+        expected_total = sum(usage.loc[key, 'theoretical_usage'] * price for key, price in prices.items())
+        self.assertAlmostEqual(dish_cost.sum(), expected_total)
+
+        partial = self.engine.dish_cost({(100, 1): 2.0})
+        self.assertAlmostEqual(partial.sum(), usage.loc[(100, 1), 'theoretical_usage'] * 2.0)
+
+        amounts = {key: 10.0 for key in self.engine.materials}
+        attributed = self.engine.attribute(amounts)
+        used = usage['theoretical_usage'] != 0
+        self.assertAlmostEqual(attributed.sum(), 10.0 * used.sum())
+        self.assertAlmostEqual(self.engine.attribute(amounts, sales='regular').sum()
+                               + self.engine.attribute(amounts, sales='combo').sum(), attributed.sum())
+
+    def test_lines_frame(self):
+        """Test recipe lines carry each dish's sales and line usage"""
+        lines = self.engine.lines_frame()
+
+        row = lines[(lines['dish_id'] == 2) & (lines['store_id'] == 1)].iloc[0]
+        sold = self.sales.set_index(['dish_id', 'store_id']).loc[(2, 1), 'net_sales']
+        self.assertEqual(row['regular_sales'], sold)
+        self.assertEqual(row['combo_sales'], 3.0)
+        self.assertAlmostEqual(row['usage'], (sold + 3.0) * row['per_unit'])
+        with self.assertRaises(ValueError):
+            self.engine.sales_vector('takeout')
+
+    def test_empty_month(self):
+        """Test an engine without recipes or sales yields empty results"""
+        engine = BomCostEngine(pd.DataFrame(), None, None)
+
+        self.assertTrue(engine.material_usage().empty)
+        self.assertEqual(engine.dish_cost({}).sum(), 0)
+        self.assertTrue(engine.combo_lines().empty)
+
+
+class TestComboDishResolution(unittest.TestCase):
+    """Test which recipe combo dish sales use"""
+
+    def setUp(self):
+        self.bom = pd.DataFrame([
+            recipe(1, 100, 0.8, full_code='9001', size='大份'),
+            recipe(2, 100, 0.3, full_code='9001', size='小份'),
+            recipe(3, 100, 0.5, full_code='900155', size=None),
+            recipe(4, 100, 0.2, full_code='900155', size=None, store_id=2),
+        ])
+
+    def resolve(self, rows):
+        combo = pd.DataFrame([
+            {'dish_id': dish_id, 'store_id': 1, 'sale_amount': 1.0, 'dish_full_code': code,
+             'dish_short_code': short_code, 'dish_size': size}
+            for dish_id, code, short_code, size in rows
+        ])
+        return list(BomCostEngine.resolve_combo_dishes(combo, self.bom)['bom_dish_id'])
+
+    def test_own_recipe_is_used(self):
+        """Test a short-coded combo dish with its own recipe keeps it"""
+        self.assertEqual(self.resolve([(1, '9001', 'A1', '大份')]), [1])
+
+    def test_own_recipe_without_short_code(self):
+        """Test a combo dish without a short code takes the smallest variant, even over its own recipe"""
+        self.assertEqual(self.resolve([(1, '9001', None, '大份'), (3, '900155', '', None)]), [2, 3])
+
+    def test_match_by_code(self):
+        """Test short-coded combos match size; others take the smallest variant"""
+        self.assertEqual(self.resolve([
+            (50, '9001', 'A1', '大份'),
+            (51, '9001', None, '中份'),
+            (52, '9001', 'A2', '中份'),
+        ]), [1, 2, 52])
+
+    def test_prefix_fallback(self):
+        """Test combos without a short code fall back to the first 6 code digits in the same store"""
+        self.assertEqual(self.resolve([(60, '90015599', '', None), (61, '77777777', None, None)]), [3, 61])
+
+
+class TestBomCostEngineFetch(unittest.TestCase):
+    """Test the three load queries"""
+
+    def test_fetch_filters_and_builds_engine(self):
+        """Test store and active filters reach every query"""
+        cursor = MagicMock()
+        cursor.fetchall.side_effect = [
+            [dict(recipe(1, 100, 0.5), dish_name='牛肉', material_number='100')],
+            [{'dish_id': 1, 'store_id': 1, 'net_sales': 4}],
+            [],
+        ]
+
+        engine = BomCostEngine.fetch(cursor, 2025, 6, store_ids=[1], active_only=True,
+                                     has_conversion_rate=False)
+
+        sqls = [c[0][0] for c in cursor.execute.call_args_list]
+        params = [c[0][1] for c in cursor.execute.call_args_list]
+        self.assertIn('1.0 as unit_conversion_rate', sqls[0])
+        self.assertIn('m.is_active = TRUE', sqls[0])
+        self.assertEqual(params, [([1],), (2025, 6, [1]), (2025, 6, [1])])
+        self.assertEqual(engine.material_usage().loc[(100, 1), 'theoretical_usage'], 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for scripts/complete_monthly_automation_new.py
+Checks that dish-material loads are only recorded in the ingestion ledger when every row succeeds.
+"""
+
+import unittest
+from unittest.mock import MagicMock, patch
+from pathlib import Path
+
+import pandas as pd
+
+# Add project root to path
+import sys
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from scripts import complete_monthly_automation_new
+from scripts.complete_monthly_automation_new import MonthlyAutomationProcessor
+
+
+class TestDishMaterialLedger(unittest.TestCase):
+    """Test failed dish-material rows keep the file out of the ledger"""
+
+    def setUp(self):
+        self.processor = MonthlyAutomationProcessor.__new__(MonthlyAutomationProcessor)
+        self.processor.target_date = '2025-06-30'
+        self.processor.ledger = MagicMock()
+        self.processor.ledger.all_unchanged.return_value = False
+        self.processor.results = {'dish_materials': 0, 'skipped_files': [], 'errors': []}
+        self.cursor = MagicMock()
+        self.cursor.rowcount = 1
+        conn = MagicMock()
+        conn.cursor.return_value = self.cursor
+        self.processor.db_manager = MagicMock()
+        self.processor.db_manager.get_connection.return_value.__enter__.return_value = conn
+
+        df = pd.DataFrame({
+            'store_id': [1, 2],
+            '菜品编码': ['1001', '1002'],
+            '物料号': ['150', '200'],
+            '规格': ['大份', None],
+            '出品分量(kg)': [0.2, 0.1],
+        })
+        for target, value in [('ExcelFile', MagicMock(sheet_names=['Sheet1'])), ('read_excel', df)]:
+            patcher = patch.object(complete_monthly_automation_new.pd, target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def executed_sql(self):
+        return [c[0][0] for c in self.cursor.execute.call_args_list]
+
+    def test_clean_load_is_recorded(self):
+        """Test every row succeeding records the file with the rows written"""
+        self.assertTrue(self.processor.extract_dish_materials(Path('dish_material.xlsx')))
+
+        self.processor.ledger.record.assert_called_once_with(
+            'dish_material', Path('dish_material.xlsx'), 2025, 6, rows_read=2, rows_written=2)
+        inserts = [sql for sql in self.executed_sql() if 'INSERT INTO dish_material' in sql]
+        self.assertEqual(len(inserts), 2)
+        self.assertFalse(any('d.store_id' in sql for sql in inserts))
+
+    def test_failed_row_is_rolled_back_and_not_recorded(self):
+        """Test a failed row rolls back to its savepoint and the file is not recorded"""
+        def execute(sql, params=None):
+            if 'INSERT INTO dish_material' in sql and params[3] == '1001':
+                raise RuntimeError('insert failed')
+        self.cursor.execute.side_effect = execute
+
+        self.assertTrue(self.processor.extract_dish_materials(Path('dish_material.xlsx')))
+
+        self.processor.ledger.record.assert_not_called()
+        self.assertIn('ROLLBACK TO SAVEPOINT dish_material_row', self.executed_sql())
+        self.assertEqual(self.processor.results['dish_materials'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
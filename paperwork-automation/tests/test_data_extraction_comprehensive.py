@@ -9,13 +9,15 @@ import sys
 from pathlib import Path
 import pandas as pd
 import numpy as np
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 
 # Add parent directory to path for imports
 sys.path.append(str(Path(__file__).parent.parent))
 from lib.data_extraction import (
     extract_daily_reports, extract_time_segments,
-    transform_daily_report_data, transform_time_segment_data
+    transform_daily_report_data, transform_time_segment_data,
+    aggregate_time_segment_to_daily, safe_float_conversion,
+    insert_daily_data_to_database, STORE_IDS, TIME_SEGMENT_IDS
 )
 
 
@@ -609,6 +611,232 @@ class TestDataExtractionIntegration(unittest.TestCase):
             for field in required_fields:
                 self.assertIn(field, record)
 
+def make_qbi_export(days=365, with_time_segments=False, start=date(2024, 1, 1)):
+    """Build a synthetic multi-store QBI export (营业基础表 or 分时段基础表 layout)."""
+    rng = np.random.default_rng(42)
+    stores = ['加拿大一店', '加拿大二店', '加拿大三店', '加拿大四店',
+              '加拿大五店', '加拿大六店', '加拿大七店', '加拿大八店', '未知门店']
+    segments = ['08:00-13:59', '14:00-16:59', '17:00-21:59', '22:00-(次)07:59', '-']
+    dates = [int((start + timedelta(days=offset)).strftime('%Y%m%d')) for offset in range(days)]
+
+    keys = [(store, day, segment)
+            for day in dates
+            for store in stores
+            for segment in (segments if with_time_segments else [None])]
+    n = len(keys)
+
+    def numeric(low, high):
+        values = rng.uniform(low, high, n).round(2).astype(object)
+        values[rng.random(n) < 0.03] = '-'
+        values[rng.random(n) < 0.02] = np.nan
+        return values
+
+    df = pd.DataFrame({
+        '门店名称': [key[0] for key in keys],
+        '日期': [key[1] for key in keys],
+        '节假日': rng.choice(['节假日', '工作日'], n),
+        '营业桌数': numeric(0, 200),
+        '营业桌数(考核)': numeric(0, 200),
+        '翻台率(考核)': numeric(0, 6),
+        '营业收入(不含税)': numeric(0, 50000),
+        '营业桌数(考核)(外卖)': numeric(0, 20),
+        '就餐人数': numeric(0, 600),
+        '优惠总金额(不含税)': numeric(0, 2000),
+        '营业收入(外卖)(不含税)': rng.uniform(0, 3000, n).round(2),
+    })
+    if with_time_segments:
+        df['分时段'] = [key[2] for key in keys]
+        df['所有餐位数'] = rng.choice([0, 40, 53, 60, np.nan], n)
+
+    # A few malformed dates that the transforms must skip
+    df.loc[df.index[::997], '日期'] = np.nan
+    return df
+
+
+def _legacy_date(date_int):
+    date_str = str(int(date_int))
+    return f"{int(date_str[:4]):04d}-{int(date_str[4:6]):02d}-{int(date_str[6:8]):02d}"
+
+
+def legacy_transform_daily_report_data(df):
+    """Row-by-row reference for transform_daily_report_data (pre-vectorization)."""
+    if '分时段' in df.columns:
+        return legacy_aggregate_time_segment_to_daily(df, STORE_IDS)
+
+    transformed_data = []
+    for _, row in df.iterrows():
+        if row['门店名称'] not in STORE_IDS:
+            continue
+        try:
+            formatted_date = _legacy_date(row['日期'])
+        except (ValueError, TypeError):
+            continue
+        transformed_data.append({
+            'store_id': STORE_IDS[row['门店名称']],
+            'date': formatted_date,
+            'is_holiday': row['节假日'] == '节假日',
+            'tables_served': safe_float_conversion(row['营业桌数']),
+            'tables_served_validated': safe_float_conversion(row['营业桌数(考核)']),
+            'turnover_rate': safe_float_conversion(row['翻台率(考核)']),
+            'revenue_tax_not_included': safe_float_conversion(row['营业收入(不含税)']),
+            'takeout_tables': safe_float_conversion(row['营业桌数(考核)(外卖)']),
+            'customers': safe_float_conversion(row['就餐人数']),
+            'discount_total': safe_float_conversion(row['优惠总金额(不含税)']),
+            'takeout_revenue': safe_float_conversion(row.get('营业收入(外卖)(不含税)', 0))
+        })
+    return transformed_data
+
+
+def legacy_aggregate_time_segment_to_daily(df, store_ids):
+    """Row-by-row reference for aggregate_time_segment_to_daily (pre-vectorization)."""
+    daily_aggregated = {}
+    for _, row in df.iterrows():
+        if row['门店名称'] not in store_ids:
+            continue
+        try:
+            formatted_date = _legacy_date(row['日期'])
+        except (ValueError, TypeError):
+            continue
+        key = (store_ids[row['门店名称']], formatted_date)
+        if key not in daily_aggregated:
+            daily_aggregated[key] = {
+                'store_id': key[0],
+                'date': formatted_date,
+                'is_holiday': row['节假日'] == '节假日',
+                'tables_served': 0,
+                'tables_served_validated': 0,
+                'revenue_tax_not_included': 0,
+                'takeout_tables': 0,
+                'customers': 0,
+                'discount_total': 0,
+                'available_seats': safe_float_conversion(row['所有餐位数']) or 53
+            }
+        data = daily_aggregated[key]
+        data['tables_served'] += safe_float_conversion(row['营业桌数']) or 0
+        data['tables_served_validated'] += safe_float_conversion(row['营业桌数(考核)']) or 0
+        data['revenue_tax_not_included'] += safe_float_conversion(row['营业收入(不含税)']) or 0
+        data['takeout_tables'] += safe_float_conversion(row['营业桌数(考核)(外卖)']) or 0
+        data['customers'] += safe_float_conversion(row['就餐人数']) or 0
+        data['discount_total'] += safe_float_conversion(row['优惠总金额(不含税)']) or 0
+
+    transformed_data = []
+    for data in daily_aggregated.values():
+        available_seats = data.pop('available_seats')
+        data['turnover_rate'] = (data['tables_served_validated'] / available_seats
+                                 if available_seats > 0 else 0)
+        transformed_data.append(data)
+    return transformed_data
+
+
+def legacy_transform_time_segment_data(df):
+    """Row-by-row reference for transform_time_segment_data (pre-vectorization)."""
+    transformed_data = []
+    for _, row in df.iterrows():
+        if row['门店名称'] not in STORE_IDS or row['分时段'] not in TIME_SEGMENT_IDS:
+            continue
+        try:
+            formatted_date = _legacy_date(row['日期'])
+        except (ValueError, TypeError):
+            continue
+        transformed_data.append({
+            'store_id': STORE_IDS[row['门店名称']],
+            'date': formatted_date,
+            'time_segment_id': TIME_SEGMENT_IDS[row['分时段']],
+            'is_holiday': row['节假日'] == '节假日',
+            'tables_served_validated': safe_float_conversion(row['营业桌数(考核)']),
+            'turnover_rate': safe_float_conversion(row['翻台率(考核)'])
+        })
+    return transformed_data
+
+
+class TestVectorizedTransformEquivalence(unittest.TestCase):
+    """Vectorized transforms must match the original row-by-row output"""
+
+    def assert_records_equal(self, actual, expected):
+        self.assertEqual(len(actual), len(expected))
+        for actual_row, expected_row in zip(actual, expected):
+            self.assertEqual(list(actual_row.keys()), list(expected_row.keys()))
+            for key, expected_value in expected_row.items():
+                actual_value = actual_row[key]
+                if expected_value is None or isinstance(expected_value, (bool, str)):
+                    self.assertEqual(actual_value, expected_value, f"{key} in {expected_row}")
+                    self.assertIs(type(actual_value), type(expected_value), key)
+                else:
+                    # Group sums may differ from the naive loop in the last bit,
+                    # and the old loop left all-empty sums as int 0
+                    self.assertAlmostEqual(actual_value, expected_value, places=6,
+                                           msg=f"{key} in {expected_row}")
+
+    def test_daily_report_matches_legacy(self):
+        df = make_qbi_export(days=60)
+        self.assert_records_equal(transform_daily_report_data(df),
+                                  legacy_transform_daily_report_data(df))
+
+    def test_time_segment_aggregation_matches_legacy(self):
+        df = make_qbi_export(days=30, with_time_segments=True)
+        self.assert_records_equal(aggregate_time_segment_to_daily(df, STORE_IDS),
+                                  legacy_aggregate_time_segment_to_daily(df, STORE_IDS))
+
+    def test_time_segment_data_matches_legacy(self):
+        df = make_qbi_export(days=30, with_time_segments=True)
+        self.assert_records_equal(transform_time_segment_data(df),
+                                  legacy_transform_time_segment_data(df))
+
+    def test_mixed_cell_types_match_legacy(self):
+        df = make_qbi_export(days=3)
+        df['日期'] = df['日期'].astype(object)
+        df.loc[0, '日期'] = '20240101'
+        df.loc[1, '日期'] = 20240101.0
+        df.loc[2, '日期'] = '2024-01-01'
+        df.loc[3, '营业桌数'] = ' 12.5 '
+        df.loc[4, '营业桌数'] = 'abc'
+        df.loc[5, '营业桌数'] = ''
+        self.assert_records_equal(transform_daily_report_data(df),
+                                  legacy_transform_daily_report_data(df))
+
+    def test_missing_takeout_revenue_column_defaults_to_zero(self):
+        df = make_qbi_export(days=2).drop(columns=['营业收入(外卖)(不含税)'])
+        result = transform_daily_report_data(df)
+
+        self.assertTrue(result)
+        self.assertTrue(all(row['takeout_revenue'] == 0.0 for row in result))
+        self.assert_records_equal(result, legacy_transform_daily_report_data(df))
+
+    def test_unknown_stores_only_returns_empty(self):
+        df = make_qbi_export(days=2)
+        df['门店名称'] = '未知门店'
+        self.assertEqual(transform_daily_report_data(df), [])
+
+
+
+class TestDailyInsertPnlRefresh(unittest.TestCase):
+    """A failed store_month_pnl refresh must not fail the committed daily insert"""
+
+    @patch('lib.data_extraction.invalidate_report_caches')
+    @patch('lib.data_extraction.StoreMonthPnl')
+    @patch('lib.data_extraction.get_shared_database_manager')
+    def test_refresh_failure_still_succeeds(self, mock_get_manager, mock_pnl, mock_invalidate):
+        """Test the insert returns True and report caches are invalidated"""
+        cursor = MagicMock()
+        cursor.fetchone.return_value = {'inserted': True}
+        conn = MagicMock()
+        conn.cursor.return_value.__enter__.return_value = cursor
+        db_manager = mock_get_manager.return_value
+        db_manager.test_connection.return_value = True
+        db_manager.get_connection.return_value.__enter__.return_value = conn
+        mock_pnl.refresh_months.side_effect = Exception('refresh_store_month_pnl failed')
+        record = {
+            'store_id': 1, 'date': '2025-06-01', 'is_holiday': False, 'tables_served': 10,
+            'tables_served_validated': 10, 'turnover_rate': 1.5, 'revenue_tax_not_included': 1000.0,
+            'takeout_tables': 0, 'customers': 30, 'discount_total': 0
+        }
+
+        self.assertTrue(insert_daily_data_to_database([record]))
+
+        conn.commit.assert_called_once()
+        mock_pnl.refresh_months.assert_called_once()
+        mock_invalidate.assert_called_once()
+
 
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -10,15 +10,18 @@ import sys
 import tempfile
 import pandas as pd
 from pathlib import Path
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, mock_open
 
 # Add parent directory to path for imports
 sys.path.append(str(Path(__file__).parent.parent))
 
+import psycopg2.extensions
+
 from utils.database import (
-    DatabaseConfig, DatabaseManager, DatabaseSetup,
+    DatabaseConfig, DatabaseManager, DatabaseSetup, ConnectionPool, PoolTimeoutError,
     get_database_manager, setup_database_for_tests,
-    verify_database_connection
+    verify_database_connection, close_all_pools,
+    SchemaCapabilities, get_schema_capabilities, refresh_schema_capabilities
 )
 
 class TestDatabaseConfig(unittest.TestCase):
@@ -179,6 +182,183 @@ class TestDatabaseManager(unittest.TestCase):
         self.assertEqual(result, [{'id': 1, 'name': 'test'}])
         mock_cursor.execute.assert_called_with("SELECT * FROM test", None)
 
+def _make_pooled_connection():
+    """Mock connection that looks open and idle to the pool"""
+    conn = MagicMock()
+    conn.closed = 0
+    conn.get_transaction_status.return_value = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    return conn
+
+
+class TestConnectionPool(unittest.TestCase):
+    """Test pooled connection management"""
+    
+    def setUp(self):
+        self.mock_config = MagicMock()
+        self.mock_config.host = 'localhost'
+        self.mock_config.port = 5432
+        self.mock_config.user = 'testuser'
+        self.mock_config.password = 'testpass'
+        self.mock_config.database = 'pooltest'
+        close_all_pools()
+    
+    def tearDown(self):
+        close_all_pools()
+    
+    @patch('utils.database.psycopg2.connect')
+    def test_pooled_manager_reuses_connection(self, mock_connect):
+        """Repeated queries on a pooled manager share one connection"""
+        mock_connect.side_effect = lambda **kwargs: _make_pooled_connection()
+        db_manager = DatabaseManager(self.mock_config, pooled=True, pool_size=2)
+        
+        for _ in range(5):
+            db_manager.fetch_all("SELECT 1")
+        
+        self.assertEqual(mock_connect.call_count, 1)
+        stats = db_manager.pool_stats()
+        self.assertEqual(stats['checkouts'], 5)
+        self.assertEqual(stats['creates'], 1)
+        self.assertEqual(stats['waits'], 0)
+        self.assertEqual(stats['idle'], 1)
+    
+    @patch('utils.database.psycopg2.connect')
+    def test_pooled_managers_share_process_pool(self, mock_connect):
+        """Managers for the same database share a single pool"""
+        mock_connect.side_effect = lambda **kwargs: _make_pooled_connection()
+        first = DatabaseManager(self.mock_config, pooled=True)
+        second = DatabaseManager(self.mock_config, pooled=True)
+        
+        first.fetch_one("SELECT 1")
+        second.fetch_one("SELECT 1")
+        
+        self.assertIs(first.pool, second.pool)
+        self.assertEqual(mock_connect.call_count, 1)
+    
+    @patch('utils.database.psycopg2.connect')
+    def test_open_transaction_rolled_back_on_return(self, mock_connect):
+        """Connections returned mid-transaction are rolled back before reuse"""
+        conn = _make_pooled_connection()
+        conn.get_transaction_status.return_value = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        mock_connect.return_value = conn
+        pool = ConnectionPool(self.mock_config, max_size=1)
+        
+        pool.putconn(pool.getconn())
+        
+        conn.rollback.assert_called_once()
+    
+    @patch('utils.database.psycopg2.connect')
+    def test_closed_connection_replaced(self, mock_connect):
+        """A connection closed while idle fails the health check and is replaced"""
+        stale, fresh = _make_pooled_connection(), _make_pooled_connection()
+        mock_connect.side_effect = [stale, fresh]
+        pool = ConnectionPool(self.mock_config, max_size=1)
+        
+        pool.putconn(pool.getconn())
+        stale.closed = 1
+        
+        self.assertIs(pool.getconn(), fresh)
+        self.assertEqual(pool.stats()['health_check_failures'], 1)
+    
+    @patch('utils.database.psycopg2.connect')
+    def test_connection_recycled_after_max_lifetime(self, mock_connect):
+        """Connections older than max_lifetime are closed and reopened"""
+        old, new = _make_pooled_connection(), _make_pooled_connection()
+        mock_connect.side_effect = [old, new]
+        pool = ConnectionPool(self.mock_config, max_size=1, max_lifetime=0)
+        
+        pool.putconn(pool.getconn())
+        
+        self.assertIs(pool.getconn(), new)
+        old.close.assert_called_once()
+    
+    @patch('utils.database.psycopg2.connect')
+    def test_exhausted_pool_times_out(self, mock_connect):
+        """Checkout waits for a free connection and records the wait"""
+        mock_connect.side_effect = lambda **kwargs: _make_pooled_connection()
+        pool = ConnectionPool(self.mock_config, max_size=1, checkout_timeout=0.05)
+        pool.getconn()
+        
+        with self.assertRaises(PoolTimeoutError):
+            pool.getconn()
+        self.assertEqual(pool.stats()['waits'], 1)
+    
+    def test_unpooled_manager_has_no_stats(self):
+        """Unpooled managers keep the connect-per-call behaviour"""
+        db_manager = DatabaseManager(self.mock_config)
+        
+        self.assertIsNone(db_manager.pool)
+        self.assertEqual(db_manager.pool_stats(), {})
+
+
+class TestSchemaCapabilities(unittest.TestCase):
+    """Test the per-process schema cache"""
+    
+    def setUp(self):
+        self.mock_config = MagicMock()
+        self.mock_config.host = 'localhost'
+        self.mock_config.port = 5432
+        self.mock_config.user = 'testuser'
+        self.mock_config.database = 'schematest'
+        self.db_manager = DatabaseManager(self.mock_config)
+        refresh_schema_capabilities()
+    
+    def tearDown(self):
+        refresh_schema_capabilities()
+    
+    def mock_catalog(self, mock_connect, rows):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchall.return_value = rows
+        mock_connect.return_value = mock_conn
+        return mock_cursor
+    
+    def test_answers_from_memory(self):
+        """Table and column checks read the loaded catalog"""
+        schema = SchemaCapabilities({'dish_material': frozenset({'dish_id', 'loss_rate'})})
+        
+        self.assertTrue(schema.has_table('dish_material'))
+        self.assertFalse(schema.has_table('combo'))
+        self.assertTrue(schema.has_column('dish_material', 'loss_rate'))
+        self.assertFalse(schema.has_column('dish_material', 'unit_conversion_rate'))
+        self.assertFalse(schema.has_column('combo', 'id'))
+    
+    @patch('utils.database.psycopg2.connect')
+    def test_catalog_loaded_once(self, mock_connect):
+        """Repeated checks run a single information_schema query"""
+        cursor = self.mock_catalog(mock_connect, [
+            {'table_name': 'dish_material', 'column_name': 'unit_conversion_rate'}])
+        
+        for _ in range(3):
+            self.assertTrue(self.db_manager.schema.has_column('dish_material', 'unit_conversion_rate'))
+        
+        self.assertEqual(cursor.execute.call_count, 1)
+        self.assertIs(get_schema_capabilities(DatabaseManager(self.mock_config)), self.db_manager.schema)
+    
+    @patch('utils.database.psycopg2.connect')
+    def test_load_failure_not_cached(self, mock_connect):
+        """A failed catalog read answers False and is retried next time"""
+        mock_connect.side_effect = psycopg2.OperationalError("down")
+        self.assertFalse(self.db_manager.schema.has_table('dish'))
+        
+        mock_connect.side_effect = None
+        self.mock_catalog(mock_connect, [{'table_name': 'dish', 'column_name': 'id'}])
+        self.assertTrue(self.db_manager.schema.has_table('dish'))
+    
+    @patch('utils.database.psycopg2.connect')
+    @patch('builtins.open', new_callable=mock_open, read_data="ALTER TABLE dish ADD COLUMN note TEXT;")
+    @patch('pathlib.Path.exists', return_value=True)
+    def test_sql_file_refreshes_schema(self, mock_exists, mock_file, mock_connect):
+        """Running a SQL file drops the cached schema so new columns are seen"""
+        self.mock_catalog(mock_connect, [{'table_name': 'dish', 'column_name': 'id'}])
+        self.assertFalse(self.db_manager.schema.has_column('dish', 'note'))
+        
+        self.db_manager.execute_sql_file('migration.sql')
+        self.mock_catalog(mock_connect, [{'table_name': 'dish', 'column_name': 'id'},
+                                         {'table_name': 'dish', 'column_name': 'note'}])
+        
+        self.assertTrue(self.db_manager.schema.has_column('dish', 'note'))
+
+
 class TestDatabaseSetup(unittest.TestCase):
     """Test database setup functionality"""
     
@@ -207,13 +387,10 @@ class TestDatabaseSetup(unittest.TestCase):
     def test_verify_database_structure_success(self):
         """Test successful database structure verification"""
         # Mock table existence checks
-        self.mock_db_manager.fetch_one.side_effect = [
-            {'count': 1},  # store table exists
-            {'count': 1},  # time_segment table exists
-            {'count': 1},  # daily_report table exists
-            {'count': 1},  # store_time_report table exists
-            {'count': 1},  # store_monthly_target table exists
-        ]
+        self.mock_db_manager.schema = SchemaCapabilities({
+            table: frozenset({'id'}) for table in
+            ('store', 'time_segment', 'daily_report', 'store_time_report', 'store_monthly_target')
+        })
         
         # Mock data population checks
         self.mock_db_manager.fetch_all.side_effect = [
@@ -228,13 +405,13 @@ class TestDatabaseSetup(unittest.TestCase):
     def test_verify_database_structure_missing_table(self):
         """Test database structure verification with missing table"""
         # Mock missing table
-        self.mock_db_manager.fetch_one.side_effect = [
-            {'count': 0},  # store table missing
-        ]
+        self.mock_db_manager.schema = SchemaCapabilities({'time_segment': frozenset({'id'})})
         
         result = self.db_setup.verify_database_structure()
         
         self.assertFalse(result)
+        self.mock_db_manager.fetch_one.assert_not_called()
+        self.mock_db_manager.fetch_all.assert_not_called()
 
 class TestDatabaseIntegration(unittest.TestCase):
     """Test database integration functions"""
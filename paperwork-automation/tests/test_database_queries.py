@@ -7,11 +7,13 @@ import unittest
 from unittest.mock import Mock, patch, MagicMock
 import sys
 from pathlib import Path
-from datetime import datetime
+from datetime import date, datetime, timedelta
 
 # Add parent directory to path for imports
 sys.path.append(str(Path(__file__).parent.parent))
-from lib.database_queries import ReportDataProvider
+from lib.database_queries import (
+    ReportDataCache, ReportDataProvider, ReportPeriods, invalidate_report_caches
+)
 from utils.database import DatabaseManager, DatabaseConfig
 
 
@@ -531,6 +533,125 @@ class TestReportDataProviderIntegration(unittest.TestCase):
         self.assertTrue(len(monthly_data) > 0)
         self.assertTrue(len(previous_month_data) > 0)
 
+class TestReportPeriods(unittest.TestCase):
+    """Test half-open date ranges used by ReportDataProvider queries"""
+
+    def test_target_day_and_month_ranges(self):
+        periods = ReportPeriods("2025-06-10")
+
+        self.assertEqual(periods.target_day, (date(2025, 6, 10), date(2025, 6, 11)))
+        self.assertEqual(periods.month_start, date(2025, 6, 1))
+        self.assertEqual(periods.current_month, (date(2025, 6, 1), date(2025, 7, 1)))
+        self.assertEqual(periods.prev_month_full, (date(2025, 5, 1), date(2025, 6, 1)))
+        self.assertEqual(periods.prev_year_month, (date(2024, 6, 1), date(2024, 7, 1)))
+
+    def test_mtd_ranges(self):
+        periods = ReportPeriods("2025-06-10")
+
+        self.assertEqual(periods.current_mtd, (date(2025, 6, 1), date(2025, 6, 11)))
+        self.assertEqual(periods.prev_month_mtd, (date(2025, 5, 1), date(2025, 5, 11)))
+        self.assertEqual(periods.prev_year_mtd, (date(2024, 6, 1), date(2024, 6, 11)))
+
+    def test_january_rolls_back_to_december(self):
+        periods = ReportPeriods("2025-01-15")
+
+        self.assertEqual((periods.prev_month_year, periods.prev_month), (2024, 12))
+        self.assertEqual(periods.prev_month_mtd, (date(2024, 12, 1), date(2024, 12, 16)))
+        self.assertEqual(periods.prev_month_full, (date(2024, 12, 1), date(2025, 1, 1)))
+
+    def test_december_month_ends_next_year(self):
+        periods = ReportPeriods("2025-12-31")
+
+        self.assertEqual(periods.current_month, (date(2025, 12, 1), date(2026, 1, 1)))
+        self.assertEqual(periods.current_mtd, (date(2025, 12, 1), date(2026, 1, 1)))
+
+    def test_mtd_clamped_to_shorter_month(self):
+        """Day 31 against a shorter month covers the whole shorter month"""
+        periods = ReportPeriods("2025-03-31")
+        self.assertEqual(periods.prev_month_mtd, (date(2025, 2, 1), date(2025, 3, 1)))
+
+        leap = ReportPeriods("2024-02-29")
+        self.assertEqual(leap.prev_year_mtd, (date(2023, 2, 1), date(2023, 3, 1)))
+
+    def test_matches_extract_day_semantics(self):
+        """Range covers exactly the days the old EXTRACT(DAY) <= day filter matched"""
+        for target in ("2025-03-31", "2025-05-31", "2024-02-29", "2025-07-01"):
+            periods = ReportPeriods(target)
+            start, end = periods.prev_month_mtd
+            covered = [start + timedelta(days=i) for i in range((end - start).days)]
+            expected = [
+                d for d in (start + timedelta(days=i) for i in range(31))
+                if d.month == periods.prev_month and d.day <= periods.day
+            ]
+            self.assertEqual(covered, expected, target)
+
+    def test_accepts_date_objects(self):
+        self.assertEqual(ReportPeriods(date(2025, 6, 10)).current_mtd,
+                         ReportPeriods(datetime(2025, 6, 10)).current_mtd)
+
+    def test_invalid_date_raises(self):
+        with self.assertRaises(ValueError):
+            ReportPeriods("2025-13-01")
+
+
+class TestReportDataCache(unittest.TestCase):
+    """Each distinct provider query runs once per report run"""
+
+    def setUp(self):
+        self.mock_db_manager = Mock(spec=DatabaseManager)
+        mock_connection = MagicMock()
+        self.mock_cursor = MagicMock()
+        mock_connection.__enter__.return_value = mock_connection
+        mock_connection.cursor.return_value = self.mock_cursor
+        self.mock_cursor.fetchall.return_value = [{'store_id': 1, 'period_type': 'target_day'}]
+        self.mock_db_manager.get_connection.return_value = mock_connection
+
+        self.cache = ReportDataCache()
+        self.provider = ReportDataProvider(self.mock_db_manager, cache=self.cache)
+
+    def test_repeated_query_hits_database_once(self):
+        first = self.provider.get_all_report_data("2025-06-10")
+        second = self.provider.get_all_report_data("2025-06-10")
+
+        self.assertEqual(first, second)
+        self.mock_cursor.execute.assert_called_once()
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1, 'entries': 1})
+
+    def test_keyed_by_arguments(self):
+        self.provider.get_all_report_data("2025-06-10")
+        self.provider.get_all_report_data("2025-06-11")
+
+        self.assertEqual(self.mock_cursor.execute.call_count, 2)
+        self.assertEqual(self.cache.stats()['misses'], 2)
+
+    def test_callers_cannot_modify_cached_result(self):
+        self.provider.get_all_report_data("2025-06-10")[0]['store_id'] = 99
+        self.assertEqual(self.provider.get_all_report_data("2025-06-10")[0]['store_id'], 1)
+
+    def test_invalidation_forces_requery(self):
+        self.provider.get_all_report_data("2025-06-10")
+        invalidate_report_caches()
+        self.provider.get_all_report_data("2025-06-10")
+
+        self.assertEqual(self.mock_cursor.execute.call_count, 2)
+        self.assertEqual(self.cache.stats(), {'hits': 0, 'misses': 2, 'entries': 1})
+
+    def test_error_result_is_not_cached(self):
+        self.mock_cursor.execute.side_effect = [Exception("connection reset"), None]
+
+        self.assertEqual(self.provider.get_all_report_data("2025-06-10"), [])
+        result = self.provider.get_all_report_data("2025-06-10")
+
+        self.assertEqual(result, [{'store_id': 1, 'period_type': 'target_day'}])
+        self.assertEqual(self.mock_cursor.execute.call_count, 2)
+        self.assertEqual(self.cache.stats(), {'hits': 0, 'misses': 2, 'entries': 1})
+
+    def test_provider_without_cache_always_queries(self):
+        provider = ReportDataProvider(self.mock_db_manager)
+        provider.get_all_report_data("2025-06-10")
+        provider.get_all_report_data("2025-06-10")
+        self.assertEqual(self.mock_cursor.execute.call_count, 2)
+
 
 if __name__ == '__main__':
-    unittest.main() 
\ No newline at end of file
+    unittest.main()
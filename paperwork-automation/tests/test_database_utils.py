@@ -4,6 +4,8 @@ Comprehensive tests for lib/database_utils.py
 Tests database operations that were consolidated from 50+ files.
 """
 
+import os
+import tempfile
 import unittest
 from unittest.mock import Mock, MagicMock, patch, call
 from pathlib import Path
@@ -16,7 +18,10 @@ import sys
 project_root = Path(__file__).parent.parent
 sys.path.append(str(project_root))
 
-from lib.database_utils import DatabaseOperations, CommonQueries
+from lib.database_utils import (
+    DatabaseOperations, CommonQueries, StagingLoader, DimensionCache, StoreMonthPnl, IngestionLedger,
+    PriceAsOfIndex
+)
 
 
 class TestDatabaseOperations(unittest.TestCase):
@@ -466,6 +471,375 @@ class TestCommonQueries(unittest.TestCase):
         self.assertIn(str(month), query)
 
 
+class TestStagingLoader(unittest.TestCase):
+    """Test COPY staging and set-based upsert helpers"""
+    
+    def setUp(self):
+        self.mock_cursor = Mock()
+        self.copied = {}
+        
+        def capture_copy(sql, buffer):
+            self.copied['sql'] = sql
+            self.copied['data'] = buffer.read()
+        
+        self.mock_cursor.copy_expert.side_effect = capture_copy
+    
+    def test_copy_to_temp_table(self):
+        """Test DataFrame is staged with NULL markers and integer columns intact"""
+        df = pd.DataFrame({
+            'full_code': ['1060061', '1060062'],
+            'size': ['', '大份'],
+            'store_id': [1.0, None],
+            'ignored': ['x', 'y']
+        })
+        
+        count = StagingLoader.copy_to_temp_table(
+            self.mock_cursor, df, 'stg_test',
+            {'full_code': 'varchar', 'size': 'varchar', 'store_id': 'integer'})
+        
+        self.assertEqual(count, 2)
+        create_sql = self.mock_cursor.execute.call_args_list[1][0][0]
+        self.assertIn('CREATE TEMP TABLE stg_test', create_sql)
+        self.assertIn('ON COMMIT DROP', create_sql)
+        self.assertIn("NULL '\\N'", self.copied['sql'])
+        self.assertEqual(self.copied['data'].splitlines(),
+                         ['1060061,,1', '1060062,大份,\\N'])
+    
+    def test_copy_to_temp_table_empty(self):
+        """Test empty DataFrame creates the table without copying"""
+        df = pd.DataFrame({'full_code': []})
+        
+        count = StagingLoader.copy_to_temp_table(
+            self.mock_cursor, df, 'stg_test', {'full_code': 'varchar'})
+        
+        self.assertEqual(count, 0)
+        self.mock_cursor.copy_expert.assert_not_called()
+    
+    def test_execute_upsert_counts(self):
+        """Test RETURNING (xmax = 0) rows are split into inserted/updated"""
+        self.mock_cursor.fetchall.return_value = [
+            {'inserted': True}, {'inserted': False}, {'inserted': True}
+        ]
+        
+        inserted, updated = StagingLoader.execute_upsert(self.mock_cursor, "INSERT ...", (1,))
+        
+        self.assertEqual((inserted, updated), (2, 1))
+        self.mock_cursor.execute.assert_called_once_with("INSERT ...", (1,))
+
+
+class TestStoreMonthPnl(unittest.TestCase):
+    """Test the store_month_pnl refresh and range read helpers"""
+    
+    def setUp(self):
+        self.mock_cursor = Mock()
+        self.mock_conn = Mock()
+        self.mock_conn.cursor.return_value = self.mock_cursor
+        self.mock_db_manager = Mock()
+        
+        @contextmanager
+        def get_connection():
+            yield self.mock_conn
+        
+        self.mock_db_manager.get_connection = get_connection
+    
+    def test_fetch_month_range(self):
+        """Test an inclusive month range becomes a month_start range and numerics become floats"""
+        self.mock_cursor.fetchall.return_value = [{
+            'store_id': 1, 'year': 2025, 'month': 6, 'has_sales': True,
+            'sales_revenue': 1100, 'tax_amount': 100, 'revenue': 1000, 'discount': None,
+            'theoretical_cost': 300, 'actual_cost': 350, 'gross_margin': 65
+        }]
+        
+        rows = StoreMonthPnl.fetch(self.mock_db_manager, (2024, 7), (2025, 6),
+                                   store_ids=[1, 2], sales_only=True)
+        
+        sql, params = self.mock_cursor.execute.call_args[0]
+        self.assertIn('FROM store_month_pnl', sql)
+        self.assertIn('month_start >= %s AND month_start <= %s', sql)
+        self.assertIn('store_id = ANY(%s)', sql)
+        self.assertIn('has_sales', sql)
+        self.assertEqual(params, (datetime(2024, 7, 1).date(), datetime(2025, 6, 1).date(), [1, 2]))
+        self.assertEqual(rows[0]['revenue'], 1000.0)
+        self.assertIsInstance(rows[0]['actual_cost'], float)
+        self.assertEqual(rows[0]['discount'], 0)
+    
+    def test_fetch_single_month(self):
+        """Test end defaults to start"""
+        self.mock_cursor.fetchall.return_value = []
+        
+        StoreMonthPnl.fetch(self.mock_db_manager, (2025, 12))
+        
+        sql, params = self.mock_cursor.execute.call_args[0]
+        self.assertNotIn('ANY', sql)
+        self.assertEqual(params, (datetime(2025, 12, 1).date(), datetime(2025, 12, 1).date()))
+    
+    def test_refresh_months(self):
+        """Test each distinct month is refreshed once and committed"""
+        self.mock_cursor.fetchone.return_value = {'refreshed': 7}
+        
+        total = StoreMonthPnl.refresh_months(self.mock_db_manager, [(2025, 6), (2025, 5), (2025, 6)])
+        
+        self.assertEqual(total, 14)
+        self.assertEqual([c[0][1] for c in self.mock_cursor.execute.call_args_list],
+                         [(2025, 5), (2025, 6)])
+        self.assertEqual(self.mock_conn.commit.call_count, 2)
+    
+    def test_refresh_failure_is_raised(self):
+        """Test a failed refresh reaches the caller"""
+        self.mock_cursor.execute.side_effect = Exception('function refresh_store_month_pnl does not exist')
+        
+        with self.assertRaises(Exception):
+            StoreMonthPnl.refresh(self.mock_db_manager, 2025, 6)
+        self.mock_conn.commit.assert_not_called()
+
+
+class TestPriceAsOfIndex(unittest.TestCase):
+    """Test bulk as-of price resolution against a row-by-row lookup"""
+    
+    def setUp(self):
+        self.history = []
+        for material_id in range(1, 6):
+            for store_id in (1, 2):
+                for year, month in [(2024, 11), (2025, 2), (2025, 3), (2025, 7)][material_id % 3:]:
+                    self.history.append({
+                        'material_id': material_id, 'store_id': store_id,
+                        'effective_year': year, 'effective_month': month,
+                        'price': material_id * 10 + store_id + month / 100
+                    })
+        self.index = PriceAsOfIndex(pd.DataFrame(self.history))
+    
+    def brute_force(self, material_id, store_id, as_of):
+        """Latest price whose effective month starts on or before as_of"""
+        candidates = [row for row in self.history
+                      if row['material_id'] == material_id and row['store_id'] == store_id
+                      and datetime(row['effective_year'], row['effective_month'], 1) <= as_of]
+        if not candidates:
+            return None
+        latest = max(candidates, key=lambda row: (row['effective_year'], row['effective_month']))
+        return latest['price']
+    
+    def test_resolve_matches_brute_force(self):
+        """Test per-row dates resolve like a row-by-row lookup, keeping row order and index"""
+        dates = [datetime(2024, 10, 15), datetime(2024, 11, 1), datetime(2025, 2, 28),
+                 datetime(2025, 3, 1), datetime(2025, 6, 30), datetime(2025, 8, 1)]
+        rows = pd.DataFrame([
+            {'material_id': material_id, 'store_id': store_id, 'usage_date': as_of}
+            for as_of in reversed(dates) for material_id in range(1, 7) for store_id in (1, 2)
+        ])
+        rows.index = rows.index + 100
+        
+        resolved = self.index.resolve(rows, date_column='usage_date')
+        
+        self.assertEqual(list(resolved.index), list(rows.index))
+        for row in resolved.itertuples():
+            expected = self.brute_force(row.material_id, row.store_id, row.usage_date)
+            if expected is None:
+                self.assertTrue(pd.isna(row.price))
+            else:
+                self.assertAlmostEqual(row.price, expected)
+    
+    def test_lookup_single_date(self):
+        """Test lookup prices pairs at one date and omits pairs without a price yet"""
+        prices = self.index.lookup([(1, 1), (3, 2), (9, 1)], datetime(2025, 3, 31))
+        
+        self.assertEqual(prices, {(1, 1): self.brute_force(1, 1, datetime(2025, 3, 31)),
+                                  (3, 2): self.brute_force(3, 2, datetime(2025, 3, 31))})
+        self.assertEqual(PriceAsOfIndex(pd.DataFrame()).lookup([(1, 1)], datetime(2025, 3, 1)), {})
+    
+    def test_fetch_filters(self):
+        """Test fetch limits history to the target month and requested pairs"""
+        mock_cursor = Mock()
+        mock_cursor.fetchall.return_value = [
+            {'dish_id': 4, 'store_id': 1, 'effective_year': 2025, 'effective_month': 5, 'price': 38}]
+        
+        index = PriceAsOfIndex.fetch(mock_cursor, 'dish', until=(2025, 6), pairs=[(4, 1)])
+        
+        sql, params = mock_cursor.execute.call_args[0]
+        self.assertIn('FROM dish_price_history', sql)
+        self.assertIn('(effective_year, effective_month) <= (%s, %s)', sql)
+        self.assertIn('(dish_id, store_id) = ANY(%s)', sql)
+        self.assertEqual(params, (2025, 6, [(4, 1)]))
+        self.assertEqual(index.lookup([(4, 1)], datetime(2025, 6, 1)), {(4, 1): 38.0})
+        with self.assertRaises(ValueError):
+            PriceAsOfIndex.fetch(mock_cursor, 'beverage')
+
+
+class TestDimensionCache(unittest.TestCase):
+    """Test dimension keys are loaded once and misses created in one statement"""
+    
+    def setUp(self):
+        self.cache = DimensionCache()
+        self.cursor = MagicMock()
+    
+    def executed_sql(self):
+        return [c[0][0] for c in self.cursor.execute.call_args_list]
+    
+    def test_each_table_loaded_once(self):
+        """Test repeated lookups reuse the first load, with blank dish sizes keyed as ''"""
+        self.cursor.fetchall.side_effect = [
+            [{'id': 1, 'name': '锅底'}, {'id': 2, 'name': '荤菜'}],
+            [{'id': 7, 'full_code': '1001', 'size': ''}, {'id': 9, 'full_code': '1001', 'size': ''}],
+        ]
+        
+        self.assertEqual(self.cache.get(self.cursor, 'dish_type', '荤菜'), 2)
+        self.assertIsNone(self.cache.get(self.cursor, 'dish_type', '素菜'))
+        self.assertEqual(self.cache.get_many(self.cursor, 'dish_type', ['锅底', '素菜']), {'锅底': 1})
+        self.assertEqual(self.cache.get(self.cursor, 'dish', ('1001', '')), 7)
+        
+        sqls = self.executed_sql()
+        self.assertEqual(len(sqls), 2)
+        self.assertIn("COALESCE(size, '') AS size", sqls[1])
+        with self.assertRaises(ValueError):
+            self.cache.get(self.cursor, 'combo', 'C1')
+    
+    def test_get_or_create_batches_misses(self):
+        """Test all missing keys are inserted by one statement and kept for later lookups"""
+        self.cursor.fetchall.side_effect = [
+            [(1, 10, '毛肚类')],
+            [(2, 10, '虾滑类'), (3, 11, '锅底类')],
+        ]
+        
+        ids, created = self.cache.get_or_create(
+            self.cursor, 'dish_child_type', [(10, '毛肚类'), (10, '虾滑类'), (11, '锅底类'), (10, '虾滑类'), None],
+            defaults={'is_active': True}, values={(11, '锅底类'): {'description': '锅底'}})
+        
+        self.assertEqual(ids, {(10, '毛肚类'): 1, (10, '虾滑类'): 2, (11, '锅底类'): 3})
+        self.assertEqual(created, 2)
+        insert_sql, params = self.cursor.execute.call_args_list[1][0]
+        self.assertIn('INSERT INTO dish_child_type (dish_type_id, name, is_active, description)', insert_sql)
+        self.assertIn('ON CONFLICT DO NOTHING', insert_sql)
+        self.assertEqual(params, [10, '虾滑类', True, None, 11, '锅底类', True, '锅底'])
+        
+        self.assertEqual(self.cache.get_or_create(self.cursor, 'dish_child_type', [(10, '虾滑类')]),
+                         ({(10, '虾滑类'): 2}, 0))
+        self.assertEqual(self.cursor.execute.call_count, 2)
+    
+    def test_conflicting_insert_reloads(self):
+        """Test keys another session created meanwhile are read back by reloading"""
+        self.cursor.fetchall.side_effect = [[], [], [(5, '八店')]]
+        
+        ids, created = self.cache.get_or_create(self.cursor, 'store', ['八店'])
+        
+        self.assertEqual((ids, created), ({'八店': 5}, 0))
+        self.assertEqual(self.cursor.execute.call_count, 3)
+    
+    def test_add_and_invalidate(self):
+        """Test rows created elsewhere are registered, and invalidated tables reload"""
+        self.cursor.fetchall.side_effect = [[], [(4, 2, '150')]]
+        
+        self.cache.get(self.cursor, 'material', (2, '150'))
+        self.cache.add('material', (2, '151'), 5)
+        self.assertEqual(self.cache.get(self.cursor, 'material', (2, '151')), 5)
+        
+        self.cache.invalidate('material')
+        self.assertEqual(self.cache.get(self.cursor, 'material', (2, '150')), 4)
+        self.assertEqual(self.cursor.execute.call_count, 2)
+    
+    def test_get_or_create_lookup_uses_cache(self):
+        """Test DatabaseOperations lookups do not query again for a known value"""
+        mock_db_manager = Mock()
+        mock_db_manager.get_connection.return_value = Mock()
+        mock_db_manager.get_connection.return_value.cursor.return_value = self.cursor
+        self.cursor.fetchall.side_effect = [[(1, '锅底')]]
+        self.cursor.fetchone.side_effect = [[123]]
+        db_ops = DatabaseOperations(mock_db_manager)
+        
+        for _ in range(2):
+            self.assertEqual(db_ops.get_or_create_lookup('dish_type', {'name': '锅底'}), 1)
+            self.assertEqual(db_ops.get_or_create_lookup('stores', {'name': 'Test Store'}), 123)
+        
+        self.assertEqual(self.cursor.execute.call_count, 2)
+
+
+class TestIngestionLedger(unittest.TestCase):
+    """Test the skip decision and recording of ingested source files"""
+    
+    def setUp(self):
+        self.mock_cursor = Mock()
+        self.mock_conn = Mock()
+        self.mock_conn.cursor.return_value = self.mock_cursor
+        self.mock_db_manager = Mock()
+        
+        @contextmanager
+        def get_connection():
+            yield self.mock_conn
+        
+        self.mock_db_manager.get_connection = get_connection
+        
+        fd, self.file_path = tempfile.mkstemp(suffix='.xlsx')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'inventory')
+        self.stat = os.stat(self.file_path)
+        self.ledger = IngestionLedger(self.mock_db_manager)
+    
+    def tearDown(self):
+        os.remove(self.file_path)
+    
+    def ledger_entry(self, **overrides):
+        entry = {'file_size': self.stat.st_size, 'file_mtime': self.stat.st_mtime,
+                 'content_hash': self.ledger.content_hash(self.file_path)}
+        entry.update(overrides)
+        return entry
+    
+    def test_new_file_is_changed(self):
+        """Test a file without a ledger entry is loaded"""
+        self.mock_cursor.fetchone.return_value = None
+        
+        self.assertFalse(self.ledger.is_unchanged('inventory', self.file_path, 2025, 6))
+        params = self.mock_cursor.execute.call_args[0][1]
+        self.assertEqual(params, ('inventory', str(Path(self.file_path).resolve()), 2025, 6))
+    
+    def test_same_size_and_mtime_is_unchanged(self):
+        """Test matching size and mtime skip without touching the ledger"""
+        self.mock_cursor.fetchone.return_value = self.ledger_entry()
+        
+        with patch.object(self.ledger, 'content_hash') as content_hash:
+            self.assertTrue(self.ledger.is_unchanged('inventory', self.file_path, 2025, 6))
+            content_hash.assert_not_called()
+        self.assertEqual(self.mock_cursor.execute.call_count, 1)
+    
+    def test_new_mtime_same_content_is_unchanged(self):
+        """Test a touched file with the same content is skipped and its mtime updated"""
+        self.mock_cursor.fetchone.return_value = self.ledger_entry(file_mtime=0.0)
+        
+        self.assertTrue(self.ledger.is_unchanged('inventory', self.file_path, 2025, 6))
+        update_sql, params = self.mock_cursor.execute.call_args[0]
+        self.assertIn('UPDATE ingestion_ledger SET file_mtime', update_sql)
+        self.assertEqual(params[0], self.stat.st_mtime)
+        self.mock_conn.commit.assert_called_once()
+    
+    def test_changed_content_is_changed(self):
+        """Test a different size or hash is loaded"""
+        self.mock_cursor.fetchone.return_value = self.ledger_entry(file_size=1)
+        self.assertFalse(self.ledger.is_unchanged('inventory', self.file_path, 2025, 6))
+        
+        self.mock_cursor.fetchone.return_value = self.ledger_entry(file_mtime=0.0, content_hash='0' * 64)
+        self.assertFalse(self.ledger.is_unchanged('inventory', self.file_path, 2025, 6))
+    
+    def test_force_and_ledger_failure_never_skip(self):
+        """Test forced runs and ledger errors always load"""
+        self.mock_cursor.fetchone.return_value = self.ledger_entry()
+        forced = IngestionLedger(self.mock_db_manager, force=True)
+        self.assertFalse(forced.is_unchanged('inventory', self.file_path, 2025, 6))
+        self.assertFalse(forced.all_unchanged('inventory', [], 2025, 6))
+        
+        self.mock_cursor.execute.side_effect = Exception('relation "ingestion_ledger" does not exist')
+        self.assertFalse(self.ledger.is_unchanged('inventory', self.file_path, 2025, 6))
+        self.assertFalse(self.ledger.record('inventory', self.file_path, 2025, 6))
+    
+    def test_record_upserts_fingerprint(self):
+        """Test record writes size, mtime, hash and row counts"""
+        self.assertTrue(self.ledger.record('inventory', self.file_path, 2025, 6, rows_read=10, rows_written=8))
+        
+        sql, params = self.mock_cursor.execute.call_args[0]
+        self.assertIn('ON CONFLICT (source, file_path, target_year, target_month)', sql)
+        self.assertEqual(params, ('inventory', str(Path(self.file_path).resolve()), self.stat.st_size,
+                                  self.stat.st_mtime, self.ledger.content_hash(self.file_path),
+                                  2025, 6, 10, 8))
+        self.assertEqual(len(params[4]), 64)
+        self.mock_conn.commit.assert_called_once()
+
+
 class TestDatabaseOperationsIntegration(unittest.TestCase):
     """Test integration scenarios for database operations"""
     
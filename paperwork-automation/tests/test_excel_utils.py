@@ -22,7 +22,9 @@ from lib.excel_utils import (
     suppress_excel_warnings, safe_read_excel, clean_dish_code, clean_material_number,
     validate_required_columns, clean_numeric_value, get_material_reading_dtype,
     get_dish_reading_dtype, safe_get_sheet_names, detect_sheet_structure,
-    COMMON_SHEET_PATTERNS, standardize_column_names
+    COMMON_SHEET_PATTERNS, standardize_column_names,
+    get_workbook_sheet_names, read_workbook_sheets, read_workbook_sheet, read_first_sheet_cached,
+    clear_workbook_cache
 )
 
 
@@ -212,6 +214,81 @@ class TestExcelReading(unittest.TestCase):
         self.assertEqual(sheet_names, [])
 
 
+class TestWorkbookCache(unittest.TestCase):
+    """Test the single-pass workbook loader and its parse cache"""
+
+    def setUp(self):
+        """Set up a two-sheet workbook"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_path = Path(self.temp_dir) / 'qbi.xlsx'
+        with pd.ExcelWriter(self.file_path) as writer:
+            pd.DataFrame({'物料': ['000000000001500680'], '数量': [1.5]}).to_excel(
+                writer, sheet_name='营业基础表', index=False)
+            pd.DataFrame({'门店名称': ['加拿大一店'], '分时段': ['08:00-13:59']}).to_excel(
+                writer, sheet_name='分时段基础表', index=False)
+        clear_workbook_cache()
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        import shutil
+        clear_workbook_cache()
+        shutil.rmtree(self.temp_dir)
+
+    def test_reads_all_sheets_in_one_parse(self):
+        """Every sheet comes from a single read_excel call and is then cached"""
+        with patch('lib.excel_utils.pd.read_excel', wraps=pd.read_excel) as mock_read:
+            sheets = read_workbook_sheets(self.file_path)
+            self.assertEqual(list(sheets), ['营业基础表', '分时段基础表'])
+            self.assertEqual(get_workbook_sheet_names(self.file_path), list(sheets))
+
+            read_workbook_sheet(self.file_path, '分时段基础表')
+            read_workbook_sheets(self.file_path, ['营业基础表'])
+            self.assertEqual(mock_read.call_count, 1)
+
+    def test_dtype_spec_is_part_of_cache_key(self):
+        """Different dtype specs are parsed separately"""
+        plain = read_workbook_sheet(self.file_path, '营业基础表')
+        typed = read_workbook_sheet(self.file_path, '营业基础表', dtype_spec=MATERIAL_DTYPE_SPEC)
+
+        self.assertNotIsInstance(plain['物料'].iloc[0], str)
+        self.assertEqual(typed['物料'].iloc[0], '000000000001500680')
+
+    def test_returns_independent_copies(self):
+        """Callers may modify the DataFrame without touching the cache"""
+        df = read_workbook_sheet(self.file_path, '营业基础表')
+        df.columns = ['a', 'b']
+
+        again = read_workbook_sheet(self.file_path, '营业基础表')
+        self.assertEqual(list(again.columns), ['物料', '数量'])
+
+    def test_changed_file_is_parsed_again(self):
+        """A new modification time or size invalidates cached sheets"""
+        read_workbook_sheets(self.file_path)
+        pd.DataFrame({'物料': ['1', '2']}).to_excel(
+            self.file_path, sheet_name='营业基础表', index=False)
+        os.utime(self.file_path, ns=(0, 10 ** 9))
+
+        self.assertEqual(get_workbook_sheet_names(self.file_path), ['营业基础表'])
+        self.assertEqual(len(read_workbook_sheet(self.file_path, '营业基础表')), 2)
+
+    def test_read_first_sheet_cached(self):
+        """The first sheet is parsed once for repeated reads with the same dtype"""
+        with patch('lib.excel_utils.pd.read_excel', wraps=pd.read_excel) as mock_read:
+            first = read_first_sheet_cached(self.file_path, dtype_spec=MATERIAL_DTYPE_SPEC)
+            again = read_first_sheet_cached(str(self.file_path), dtype_spec=MATERIAL_DTYPE_SPEC)
+            self.assertEqual(mock_read.call_count, 1)
+
+        self.assertEqual(first['物料'].iloc[0], '000000000001500680')
+        pd.testing.assert_frame_equal(first, again)
+
+    def test_missing_file_and_sheet(self):
+        """Missing files raise FileNotFoundError, missing sheets ValueError"""
+        with self.assertRaises(FileNotFoundError):
+            read_workbook_sheets('/nonexistent/file.xlsx')
+        with self.assertRaises(ValueError):
+            read_workbook_sheet(self.file_path, 'NoSuchSheet')
+
+
 class TestValidationFunctions(unittest.TestCase):
     """Test data validation functions"""
     
@@ -150,19 +150,16 @@ class TestValidationFunctions(unittest.TestCase):
         self.assertTrue(any('Missing required sheets' in warning for warning in warnings))
     
     @patch('lib.data_extraction.os.path.exists')
-    @patch('lib.data_extraction.pd.ExcelFile')
+    @patch('lib.data_extraction.read_workbook_sheets')
     @patch('lib.data_extraction.validate_daily_sheet')
     @patch('lib.data_extraction.validate_time_segment_sheet')
-    def test_validate_excel_file_valid(self, mock_validate_time, mock_validate_daily, mock_excel_file, mock_exists):
+    def test_validate_excel_file_valid(self, mock_validate_time, mock_validate_daily, mock_read_sheets, mock_exists):
         """Test validation with valid Excel file."""
         # Mock file exists
         mock_exists.return_value = True
         
-        # Mock Excel file with correct sheet names
-        mock_excel_instance = MagicMock()
-        mock_excel_instance.sheet_names = ['营业基础表', '分时段基础表']
-        mock_excel_instance.close = MagicMock()
-        mock_excel_file.return_value = mock_excel_instance
+        # Mock parsed workbook with correct sheet names
+        mock_read_sheets.return_value = {'营业基础表': pd.DataFrame(), '分时段基础表': pd.DataFrame()}
         
         # Mock validation functions to return no warnings
         mock_validate_daily.return_value = []
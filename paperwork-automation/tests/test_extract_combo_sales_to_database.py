@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests for scripts/dish_material/extract_data/extract_combo_sales_to_database.py
+Checks the aggregated sales frame and per-file statements with a mocked cursor.
+"""
+
+import unittest
+from unittest.mock import MagicMock
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+# Add project root to path
+import sys
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from scripts.dish_material.extract_data.extract_combo_sales_to_database import ComboSalesExtractor
+
+
+@pytest.mark.usefixtures('staged_copy')
+class TestComboSalesLoad(unittest.TestCase):
+    """Test combo sales are looked up and written per file, not per row"""
+
+    def setUp(self):
+        self.extractor = ComboSalesExtractor(MagicMock())
+
+        self.stats = {'combos_created': 0, 'combos_validated': 0, 'dishes_validated': 0,
+                      'sales_created': 0, 'sales_updated': 0, 'errors': 0}
+        self.df = pd.DataFrame({
+            'combo_code': ['C1', 'C1', 'C1', 'C1', 'C2', 'C2'],
+            'combo_name': ['双人餐', '双人餐', '双人餐', '双人餐', None, None],
+            'dish_code': ['1001', '1001', '1001', '1002', '1001', '9999'],
+            'dish_name': ['毛肚', '毛肚', '毛肚', '虾滑', '毛肚', '未知'],
+            'dish_size': ['大份', '大份', '小份', '单份', '中份', None],
+            'store_id': [1, 1, 1, 1, 2, 2],
+            'sale_quantity': [3.0, 2.0, 1.0, 4.0, 5.0, 1.0],
+            'return_quantity': [1.0, 0.0, 0.0, 0.0, 0.0, 0.0],
+            'tax': [0.5, 0.5, 0.1, 0.2, 0.3, 0.1],
+        })
+
+    def test_update_combos(self):
+        """Test combos are looked up once, renamed and created in bulk"""
+        self.cursor.fetchall.side_effect = [
+            [{'id': 10, 'combo_code': 'C1'}],  # existing combos
+            [{'id': 11, 'combo_code': 'C2'}],  # created combos
+        ]
+
+        self.extractor._update_combos(self.conn, self.df, self.stats)
+
+        self.assertEqual(self.extractor.combos_cache, {'C1': 10, 'C2': 11})
+        self.assertEqual((self.stats['combos_validated'], self.stats['combos_created']), (1, 1))
+        self.assertEqual(self.staged[ComboSalesExtractor.COMBO_STAGING_TABLE]['combo_code'].tolist(), ['C1', 'C2'])
+        self.assertEqual(self.cursor.execute.call_count, 3)
+
+    def test_sales_resolve_size_then_code(self):
+        """Test sales aggregate per dish row, matching the size before the code"""
+        self.extractor.combos_cache = {'C1': 10, 'C2': 11}
+        self.cursor.fetchall.side_effect = [
+            [{'id': 1, 'full_code': '1001', 'size': '小份'},
+             {'id': 2, 'full_code': '1001', 'size': '大份'},
+             {'id': 3, 'full_code': '1002', 'size': ''}],
+            [{'inserted': True}, {'inserted': True}, {'inserted': False}],
+        ]
+
+        self.extractor._validate_dishes(self.conn, self.df, self.stats)
+        self.extractor._create_combo_dish_sales(self.conn, self.df, 2025, 6, self.stats)
+
+        staged = self.staged[ComboSalesExtractor.SALES_STAGING_TABLE]
+        rows = {(r.combo_id, r.dish_id, r.store_id): (r.sale_amount, round(r.tax_amount, 2))
+                for r in staged.itertuples()}
+        self.assertEqual(rows, {
+            (10, 2, 1): (4.0, 1.0),   # 大份 rows summed
+            (10, 1, 1): (1.0, 0.1),   # 小份
+            (10, 3, 1): (4.0, 0.2),   # 单份 has no row, falls back to the code
+            (11, 1, 2): (5.0, 0.3),   # 中份 falls back to the lowest id
+        })
+        self.assertEqual(self.stats, {'combos_created': 0, 'combos_validated': 0, 'dishes_validated': 2,
+                                      'sales_created': 2, 'sales_updated': 1, 'errors': 1})
+        params = [c[0][1] for c in self.cursor.execute.call_args_list]
+        self.assertEqual(params[-1], (6, 2025))
+
+    def test_missing_quantity_columns(self):
+        """Test nothing is written without quantity columns"""
+        df = self.df.drop(columns=['sale_quantity', 'return_quantity'])
+        self.extractor._create_combo_dish_sales(self.conn, df, 2025, 6, self.stats)
+        self.cursor.execute.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
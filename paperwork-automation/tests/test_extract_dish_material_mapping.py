@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Tests for scripts/dish_material/extract_data/extract_dish_material_mapping.py
+Checks the staged mapping frame, error report and bulk upsert with a mocked cursor.
+"""
+
+import unittest
+from unittest.mock import MagicMock
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+# Add project root to path
+import sys
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from scripts.dish_material.extract_data.extract_dish_material_mapping import DishMaterialExtractor
+
+
+class TestMappingFrame(unittest.TestCase):
+    """Test quantities are derived per (dish, size, material, store)"""
+
+    def test_quantities_match_row_by_row_rules(self):
+        """Test averaging, defaults and the waste percentage conversion"""
+        df = pd.DataFrame({
+            'dish_code': ['1001', '1001', '1002', '1003', '1004'],
+            'dish_size': ['大份', '大份', None, '小份', '小份'],
+            'material_number': ['00150', '00150', '200', '300', '400'],
+            'store_id': [1, 1, 2, 3, 3],
+            'serving_size_kg': [0.2, 0.4, 0.0, 0.5, 0.5],
+            'waste_percentage': [10.0, 10.0, 1.1, 0.0, 2.0],
+            'material_unit': [0.0, 0.0, 5.0, 2.0, 2.0],
+        })
+
+        frame = DishMaterialExtractor._mapping_frame(df).set_index('material_number')
+
+        self.assertEqual(len(frame), 3)  # missing sizes are dropped by the grouping, as before
+        self.assertAlmostEqual(frame.loc['150', 'standard_quantity'], 0.3)
+        self.assertAlmostEqual(frame.loc['150', 'loss_rate'], 1.1)
+        self.assertEqual(frame.loc['150', 'unit_conversion_rate'], 1.0)
+        self.assertEqual(frame.loc['300', 'loss_rate'], 1.0)
+        self.assertEqual(frame.loc['400', 'loss_rate'], 2.0)
+        self.assertEqual(frame.loc['400', 'unit_conversion_rate'], 2.0)
+
+    def test_missing_columns(self):
+        """Test no frame is built without dish, material and store columns"""
+        self.assertIsNone(DishMaterialExtractor._mapping_frame(pd.DataFrame({'dish_code': ['1']})))
+
+
+@pytest.mark.usefixtures('staged_copy')
+class TestMappingStagedLoad(unittest.TestCase):
+    """Test dishes and mappings are applied per file, not per row"""
+
+    def setUp(self):
+
+        self.stats = {'dishes_validated': 0, 'dishes_created': 0, 'mappings_created': 0,
+                      'mappings_updated': 0, 'mappings_skipped': 0, 'errors': 0}
+        self.df = pd.DataFrame({
+            'dish_code': ['1001', '1001', '1002'],
+            'dish_name': ['毛肚', '毛肚', '虾滑'],
+            'dish_size': ['大份', '大份', None],
+            'dish_type_name': ['荤菜', '荤菜', '荤菜'],
+            'dish_child_type_name': ['毛肚类', '毛肚类', None],
+            'material_number': ['150', '151', '200'],
+            'store_id': [1, 1, 2],
+            'serving_size_kg': [0.2, 0.2, 0.1],
+        })
+
+    def executed_sql(self):
+        return [c[0][0] for c in self.cursor.execute.call_args_list]
+
+    def test_validate_dish_types(self):
+        """Test dish types come from the dimension cache and child types are created in one insert"""
+        extractor = DishMaterialExtractor(MagicMock())
+        self.cursor.fetchall.side_effect = [[(1, '荤菜')], [], [(5, 1, '毛肚类')]]
+
+        extractor._validate_dish_types(self.conn, self.df, self.stats)
+
+        self.assertEqual(extractor.dish_types_cache, {'荤菜': 1})
+        self.assertEqual(extractor.dish_child_types_cache, {('荤菜', '毛肚类'): 5})
+        self.assertEqual(self.cursor.execute.call_count, 3)
+
+    def test_validate_dishes(self):
+        """Test unique dishes are staged once with their child type"""
+        extractor = DishMaterialExtractor(MagicMock())
+        extractor.dish_child_types_cache[('荤菜', '毛肚类')] = 7
+        self.cursor.fetchall.side_effect = [[{'id': 1}], [{'id': 2}]]
+
+        extractor._validate_dishes(self.conn, self.df, self.stats)
+
+        staged = self.staged[DishMaterialExtractor.DISH_STAGING_TABLE]
+        self.assertEqual(staged['dish_code'].tolist(), ['1001', '1002'])
+        self.assertEqual(staged['dish_size'].tolist(), ['大份', ''])
+        self.assertEqual(staged.loc[0, 'dish_child_type_id'], 7)
+        self.assertTrue(pd.isna(staged.loc[1, 'dish_child_type_id']))
+        self.assertEqual((self.stats['dishes_validated'], self.stats['dishes_created']), (1, 1))
+        self.assertEqual(self.cursor.execute.call_count, 2)
+
+    def test_mappings_upserted_with_error_report(self):
+        """Test skipped rows are reported and the rest upserted in one statement"""
+        extractor = DishMaterialExtractor(MagicMock())
+        self.cursor.fetchall.side_effect = [
+            [{'dish_code': '1002', 'dish_size': '', 'material_number': '200', 'store_id': 2,
+              'reason': 'material_not_in_store'}],
+            [{'store_id': 1, 'inserted': True}, {'store_id': 1, 'inserted': False}],
+        ]
+
+        extractor._create_dish_material_mappings(self.conn, self.df, 2025, 6, self.stats)
+
+        self.assertEqual(len(self.staged[DishMaterialExtractor.MAPPING_STAGING_TABLE]), 2)
+        self.assertEqual(extractor.error_report['reason'].tolist(), ['material_not_in_store'])
+        self.assertEqual((self.stats['mappings_created'], self.stats['mappings_updated'],
+                          self.stats['mappings_skipped'], self.stats['errors']), (1, 1, 1, 0))
+        upserts = [sql for sql in self.executed_sql() if 'INSERT INTO dish_material' in sql]
+        self.assertEqual(len(upserts), 1)
+        self.assertFalse(any('TRIGGER' in sql or 'CONSTRAINTS' in sql for sql in self.executed_sql()))
+
+    def test_trigger_modes(self):
+        """Test the store consistency trigger is deferred or disabled around the upsert"""
+        for mode, expected in [
+            ('deferred', ['SET CONSTRAINTS trigger_dish_material_store_consistency DEFERRED']),
+            ('disabled', ['ALTER TABLE dish_material DISABLE TRIGGER trigger_dish_material_store_consistency',
+                          'ALTER TABLE dish_material ENABLE TRIGGER trigger_dish_material_store_consistency']),
+        ]:
+            with self.subTest(mode=mode):
+                self.cursor.reset_mock()
+                self.cursor.fetchall.side_effect = [[], []]
+
+                DishMaterialExtractor(MagicMock(), trigger_mode=mode)._create_dish_material_mappings(
+                    self.conn, self.df, 2025, 6, self.stats)
+
+                switches = [sql for sql in self.executed_sql() if 'TRIGGER' in sql or 'CONSTRAINTS' in sql]
+                self.assertEqual(switches, expected)
+
+        with self.assertRaises(ValueError):
+            DishMaterialExtractor(MagicMock(), trigger_mode='off')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Tests for scripts/dish_material/extract_data/extract_inventory_to_database.py
+Checks the staged inventory frame and set-based upserts with a mocked cursor.
+"""
+
+import unittest
+from unittest.mock import MagicMock
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+# Add project root to path
+import sys
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from scripts.dish_material.extract_data.extract_inventory_to_database import InventoryExtractor
+
+
+@pytest.mark.usefixtures('staged_copy')
+class TestInventoryStagedLoad(unittest.TestCase):
+    """Test inventory counts and usage are applied per file, not per row"""
+
+    def setUp(self):
+        self.extractor = InventoryExtractor(MagicMock())
+        self.extractor.material_types = {'1500680': '成本类'}
+        self.cursor.rowcount = 1
+        self.cursor.fetchall.side_effect = [
+            [{'material_code': '999'}],                         # materials not found
+            [{'inserted': True}, {'inserted': False}],          # inventory_count upsert
+            [{'material_use_type': '成本类'}, {'material_use_type': None}],  # usage upsert
+        ]
+
+        self.stats = {'materials_found': 0, 'materials_not_found': 0, 'counts_created': 0,
+                      'counts_updated': 0, 'material_types_updated': 0, 'errors': 0}
+
+    def test_update_inventory_counts(self):
+        """Test stats match the per-row loader and materials resolve by store"""
+        df = pd.DataFrame({
+            'material_code': ['1500680', '1500681', 'nan', '999'],
+            'count_quantity': [1.0, 2.0, 3.0, 4.0],
+            'stock_quantity': [5.0, 6.0, 7.0, 8.0],
+        })
+        df['actual_usage'] = df['stock_quantity'] - df['count_quantity']
+
+        self.extractor._update_inventory_counts(self.conn, df, 2, 2025, 6, self.stats)
+
+        staged = self.staged[InventoryExtractor.STAGING_TABLE]
+        self.assertEqual(staged['material_code'].tolist(), ['1500680', '1500681', '999'])
+        self.assertEqual(staged['row_no'].tolist(), [0, 1, 2])
+        self.assertEqual(staged.loc[0, 'material_use_type'], '成本类')
+        self.assertTrue(pd.isna(staged.loc[1, 'material_use_type']))
+
+        self.assertEqual(self.stats, {'materials_found': 2, 'materials_not_found': 1, 'counts_created': 1,
+                                      'counts_updated': 1, 'material_types_updated': 2, 'errors': 0})
+        params = [c[0][1] for c in self.cursor.execute.call_args_list if len(c[0]) > 1]
+        self.assertEqual(params[0], (2,))
+        self.assertIn((2, 2025, 6), params)
+
+    def test_missing_columns(self):
+        """Test nothing is loaded without material code and count columns"""
+        self.extractor._update_inventory_counts(self.conn, pd.DataFrame({'material_code': ['1']}),
+                                                2, 2025, 6, self.stats)
+        self.cursor.execute.assert_not_called()
+        self.assertEqual(self.staged, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
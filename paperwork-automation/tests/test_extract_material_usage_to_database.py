@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Tests for scripts/dish_material/extract_data/extract_material_usage_to_database.py
+Checks material prices are written after a single material lookup.
+"""
+
+import unittest
+from unittest.mock import MagicMock
+from pathlib import Path
+
+# Add project root to path
+import sys
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from scripts.dish_material.extract_data.extract_material_usage_to_database import MaterialUsageExtractor
+
+
+class TestMaterialPriceUpdate(unittest.TestCase):
+    """Test material prices resolve every store's material in one query"""
+
+    def setUp(self):
+        self.cursor = MagicMock()
+        self.cursor.rowcount = 1
+        self.cursor.fetchall.return_value = [
+            {'id': 1, 'store_id': 1, 'material_number': '1500680'},
+            {'id': 2, 'store_id': 2, 'material_number': '1500680'},
+            {'id': 3, 'store_id': 1, 'material_number': '1500681'},
+        ]
+        conn = MagicMock()
+        conn.cursor.return_value = self.cursor
+        db_manager = MagicMock()
+        db_manager.get_connection.return_value.__enter__.return_value = conn
+        self.extractor = MaterialUsageExtractor(db_manager)
+
+    def test_one_material_lookup(self):
+        """Test one ANY() lookup, then a price per store material"""
+        updated = self.extractor._update_material_prices(
+            {'1500680': 12.5, '1500681': 3.0, '9999999': 1.0}, 2025, 6, deactivate_old_prices=False)
+
+        lookups = [c for c in self.cursor.execute.call_args_list if 'FROM material\n' in c[0][0]]
+        self.assertEqual(len(lookups), 1)
+        self.assertIn('material_number = ANY(%s)', lookups[0][0][0])
+        self.assertEqual(lookups[0][0][1], (['1500680', '1500681', '9999999'],))
+
+        inserts = [c[0][1] for c in self.cursor.execute.call_args_list
+                   if 'INSERT INTO material_price_history' in c[0][0]]
+        self.assertEqual([params[:3] for params in inserts], [(1, 1, 12.5), (2, 2, 12.5), (3, 1, 3.0)])
+        self.assertEqual(updated, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Tests for scripts/dish_material/extract_data/extract_materials_to_database.py
+Checks the staged frames and set-based upserts with a mocked cursor.
+"""
+
+import unittest
+from unittest.mock import MagicMock
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+# Add project root to path
+import sys
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from scripts.dish_material.extract_data.extract_materials_to_database import MaterialExtractor
+
+
+@pytest.mark.usefixtures('staged_copy')
+class TestMaterialStagedLoads(unittest.TestCase):
+    """Test materials, prices and usage are loaded with one upsert each"""
+
+    def setUp(self):
+        self.extractor = MaterialExtractor(MagicMock())
+        self.extractor.material_child_types_cache = {('成本类', '肉类'): 5, ('成本类', None): 4}
+        self.cursor.fetchall.side_effect = lambda: (
+            [] if 'm.id IS NULL' in self.cursor.execute.call_args[0][0]
+            else [{'inserted': True}, {'inserted': False}])
+
+        self.df = pd.DataFrame({
+            'material_number': ['1500680', '1500680', '1500681', 'nan'],
+            'store_id': [1, 1, 2, 1],
+            'material_187_generic': [None, '牛肉卷', '', '羊肉'],
+            'material_description': ['牛肉', '牛肉片', '鸭血', None],
+            'unit_description': ['kg', None, '', 'kg'],
+            'material_187_level1': ['成本类', '成本类', '成本类', None],
+            'material_187_level2': ['肉类', None, None, None],
+            'unit_price': [10.0, 20.0, 0.0, 5.0],
+            'quantity': [1.0, 2.0, 3.0, 4.0],
+            'total_amount': [10.0, 40.0, 0.0, 20.0],
+        })
+        self.stats = {'materials_created': 0, 'materials_updated': 0, 'materials_skipped': 0,
+                      'prices_inserted': 0, 'usage_inserted': 0}
+
+    def executed_sql(self):
+        return [c[0][0] for c in self.cursor.execute.call_args_list]
+
+    def test_update_materials(self):
+        """Test one staged row per store material with blanks left to the stored values"""
+        self.extractor._update_materials(self.conn, self.df, self.stats)
+
+        staged = self.staged[MaterialExtractor.MATERIAL_STAGING_TABLE]
+        self.assertEqual(staged['material_number'].tolist(), ['1500680', '1500681'])
+        self.assertEqual(staged['name'].tolist(), ['牛肉', '鸭血'])
+        self.assertEqual(staged.loc[0, 'unit'], 'kg')
+        self.assertTrue(pd.isna(staged.loc[1, 'unit']))
+        self.assertEqual(staged['material_child_type_id'].tolist(), [5, 4])
+
+        sql = self.executed_sql()
+        self.assertEqual(len(sql), 2)
+        self.assertIn('s.unit IS NULL', sql[0])
+        self.assertIn('ON CONFLICT (store_id, material_number)', sql[1])
+        self.assertEqual((self.stats['materials_created'], self.stats['materials_updated'],
+                          self.stats['materials_skipped']), (1, 1, 0))
+
+    def test_update_materials_fills_blanks_before_insert(self):
+        """Test blanks come from the stored row in the SELECT, not from the conflict update"""
+        self.extractor._update_materials(self.conn, self.df, self.stats)
+
+        upsert = self.executed_sql()[1]
+        select = upsert[:upsert.index('ON CONFLICT')]
+        self.assertIn('LEFT JOIN material m', select)
+        self.assertIn('COALESCE(s.name, m.name)', select)
+        self.assertIn('COALESCE(s.unit, m.unit)', select)
+        self.assertIn('COALESCE(s.unit, m.unit) IS NOT NULL', select)
+        self.assertNotIn('material.unit', upsert)
+
+    def test_update_materials_reports_incomplete_new_materials(self):
+        """Test new materials without a name or unit are counted as skipped"""
+        self.cursor.fetchall.side_effect = [
+            [{'material_number': '1500681', 'store_id': 2}],
+            [{'inserted': False}],
+        ]
+
+        self.extractor._update_materials(self.conn, self.df, self.stats)
+
+        self.assertEqual((self.stats['materials_created'], self.stats['materials_updated'],
+                          self.stats['materials_skipped']), (0, 1, 1))
+
+    def test_update_material_prices(self):
+        """Test prices are averaged per store material and old prices deactivated in one statement"""
+        self.extractor._update_material_prices(self.conn, self.df, 2025, 6, self.stats)
+
+        staged = self.staged[MaterialExtractor.PRICE_STAGING_TABLE]
+        self.assertEqual(staged.to_dict('records'),
+                         [{'material_number': '1500680', 'store_id': 1, 'unit_price': 15.0}])
+        sql = self.executed_sql()
+        self.assertTrue(any('SET is_active = FALSE' in statement for statement in sql))
+        self.assertEqual(self.cursor.execute.call_args[0][1], (6, 2025))
+        self.assertEqual(self.stats['prices_inserted'], 2)
+
+    def test_keep_old_prices(self):
+        """Test old prices stay active when deactivation is off"""
+        self.extractor._update_material_prices(self.conn, self.df, 2025, 6, self.stats,
+                                               deactivate_old_prices=False)
+        self.assertFalse(any('SET is_active = FALSE' in statement for statement in self.executed_sql()))
+
+    def test_update_material_usage(self):
+        """Test usage quantities are summed per store material"""
+        self.extractor._update_material_usage(self.conn, self.df, 2025, 6, self.stats)
+
+        staged = self.staged[MaterialExtractor.USAGE_STAGING_TABLE]
+        self.assertEqual(staged['quantity'].tolist(), [3.0, 3.0])
+        self.assertIn('INSERT INTO material_monthly_usage', self.executed_sql()[-1])
+        self.assertEqual(self.stats['usage_inserted'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
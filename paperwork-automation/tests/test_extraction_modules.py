@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Tests for lib/extraction_modules.py bulk dish loading and row-by-row dish lookups.
+"""
+
+import unittest
+from unittest.mock import MagicMock, patch
+from pathlib import Path
+import sys
+
+import pandas as pd
+
+# Add project root to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from lib.extraction_modules import BulkDishLoader, ExtractionOrchestrator, StoreMapping
+
+
+class TestBulkDishLoader(unittest.TestCase):
+    """Test BulkDishLoader staging and upsert flow"""
+
+    def setUp(self):
+        self.mock_db_manager = MagicMock()
+        self.mock_connection = MagicMock()
+        self.mock_cursor = MagicMock()
+        self.mock_db_manager.get_connection.return_value.__enter__.return_value = self.mock_connection
+        self.mock_connection.cursor.return_value = self.mock_cursor
+        self.loader = BulkDishLoader(self.mock_db_manager)
+        self.store_mapping = StoreMapping.get_store_name_mapping()
+
+        self.df = pd.DataFrame({
+            '菜品名称': [' 番茄锅底 ', '肥牛', '无效'],
+            '菜品编码': [1060061.0, '1060062', 'abc'],
+            '规格': ['单锅', None, None],
+            '大类名称': ['锅底类', '荤菜类', None],
+            '子类名称': ['单锅', None, None],
+            '门店名称': ['加拿大一店', '未知门店', '加拿大二店'],
+            '单价': ['n/a', 12.5, 3.0],
+            '菜品单价': [18.0, 99.0, None],
+            '数量': [10, None, 5],
+        })
+
+    def test_prepare_staging_frame(self):
+        """Test staging frame cleaning matches the row-by-row extractors"""
+        staged = self.loader.prepare_staging_frame(self.df, '菜品名称', '菜品编码', self.store_mapping)
+
+        self.assertEqual(list(staged['full_code']), ['1060061', '1060062'])
+        self.assertEqual(list(staged['size']), ['单锅', ''])
+        self.assertEqual(staged.iloc[0]['name'], '番茄锅底')
+        self.assertEqual(staged.iloc[0]['dish_child_type'], '单锅')
+        self.assertTrue(pd.isna(staged.iloc[1]['dish_type']))
+        self.assertEqual(staged.iloc[0]['store_id'], 1)
+        self.assertTrue(pd.isna(staged.iloc[1]['store_id']))
+        # First convertible price column wins, missing quantities become 0
+        self.assertEqual(list(staged['price']), [18.0, 12.5])
+        self.assertEqual(list(staged['quantity']), [10.0, 0.0])
+
+    @patch('lib.extraction_modules.StagingLoader')
+    def test_load_runs_one_statement_per_table(self, mock_staging):
+        """Test load stages once and upserts each table in one transaction"""
+        mock_staging.copy_to_temp_table.return_value = 2
+        mock_staging.execute_upsert.side_effect = [(3, 1), (1, 0), (0, 1)]
+
+        results = self.loader.load(self.df, '菜品名称', '菜品编码', '2025-06-30', self.store_mapping)
+
+        self.assertEqual(results, {
+            'dishes': {'inserted': 3, 'updated': 1},
+            'price_history': {'inserted': 1, 'updated': 0},
+            'monthly_sales': {'inserted': 0, 'updated': 1},
+        })
+        mock_staging.copy_to_temp_table.assert_called_once()
+        self.assertEqual(mock_staging.execute_upsert.call_count, 3)
+        dish_params = mock_staging.execute_upsert.call_args_list[0][0][2]
+        self.assertEqual(dish_params, ([1, 2, 3, 4, 5, 6, 7, 8],))
+        sales_params = mock_staging.execute_upsert.call_args_list[2][0][2]
+        self.assertEqual(sales_params, (2025, 6))
+        self.mock_connection.commit.assert_called_once()
+
+    @patch('lib.extraction_modules.StagingLoader')
+    def test_load_rolls_back_on_error(self, mock_staging):
+        """Test a failed upsert rolls back the whole load"""
+        mock_staging.copy_to_temp_table.return_value = 2
+        mock_staging.execute_upsert.side_effect = RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            self.loader.load(self.df, '菜品名称', '菜品编码', '2025-06-30', self.store_mapping)
+
+        self.mock_connection.rollback.assert_called_once()
+        self.mock_connection.commit.assert_not_called()
+
+
+
+class TestRowExtractorDishLookups(unittest.TestCase):
+    """Test price and sales rows find dishes through the orchestrator's dimension cache"""
+
+    def setUp(self):
+        self.cursor = MagicMock()
+        self.cursor.fetchall.return_value = [{'id': 7, 'full_code': '1060061', 'size': '单锅'}]
+        self.cursor.rowcount = 1
+        self.orchestrator = ExtractionOrchestrator(MagicMock(), bulk=False)
+
+    def dish_queries(self):
+        return [c[0][0] for c in self.cursor.execute.call_args_list if 'FROM dish' in c[0][0]]
+
+    def test_dish_table_loaded_once(self):
+        """Test one dish query serves every price and sales row, without a store filter"""
+        row = pd.Series({'菜品编码': '1060061', '规格': '单锅', '门店名称': '加拿大一店', '单价': 18.0})
+        store_mapping = {'加拿大一店': 1, '加拿大二店': 2}
+
+        self.assertEqual(self.orchestrator.price_extractor._process_single_price(
+            self.cursor, row, '菜品名称', '菜品编码', '2025-06-30', store_mapping), 1)
+        for store_id in (1, 2):
+            self.assertEqual(self.orchestrator.sales_extractor._process_single_sales(self.cursor, {
+                'full_code': '1060061', 'size': '单锅', 'store_id': store_id, 'total_quantity': 3.0
+            }, 2025, 6), 1)
+        self.assertEqual(self.orchestrator.sales_extractor._process_single_sales(self.cursor, {
+            'full_code': '1060061', 'size': '', 'store_id': 1, 'total_quantity': 3.0
+        }, 2025, 6), 0)
+
+        self.assertEqual(len(self.dish_queries()), 1)
+        self.assertNotIn('store_id', self.dish_queries()[0])
+        self.assertIs(self.orchestrator.price_extractor.dimensions, self.orchestrator.sales_extractor.dimensions)
+
+
+if __name__ == '__main__':
+    unittest.main()
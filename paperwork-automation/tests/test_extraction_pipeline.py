@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Tests for scripts/dish_material/extract_data/extraction_pipeline.py
+Checks step order, skip flags and failure handling with mocked extractors.
+"""
+
+import unittest
+from unittest.mock import MagicMock, patch
+from pathlib import Path
+
+import pandas as pd
+
+# Add project root to path
+import sys
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from scripts.dish_material.extract_data import extraction_pipeline
+from scripts.dish_material.extract_data import (
+    extract_inventory_to_database, extract_material_usage_to_database, extract_materials_to_database
+)
+from scripts.dish_material.extract_data.extraction_pipeline import run_extraction_pipeline
+
+EXTRACTOR_METHODS = {
+    'DishExtractor': ('dishes', 'extract_dishes_for_month'),
+    'MaterialExtractor': ('materials', 'extract_materials_for_month'),
+    'DishMaterialExtractor': ('dish_material_mapping', 'extract_dish_material_mappings'),
+    'MaterialUsageExtractor': ('material_usage', 'extract_material_usage_for_month'),
+    'InventoryExtractor': ('inventory', 'extract_inventory_for_month'),
+}
+
+
+class TestExtractionPipeline(unittest.TestCase):
+    """Test the in-process extraction pipeline"""
+
+    def setUp(self):
+        self.calls = []
+        self.errors = {}
+        self.db_manager = MagicMock()
+        self.db_manager.test_connection.return_value = True
+
+        self.patchers = []
+        for class_name, (step, method) in EXTRACTOR_METHODS.items():
+            extractor_class = MagicMock()
+            getattr(extractor_class.return_value, method).side_effect = self._recorder(step)
+            self.patchers.append(patch.object(extraction_pipeline, class_name, extractor_class))
+        self.patchers.append(patch.object(extraction_pipeline, 'extract_broad_types_for_month',
+                                          side_effect=self._recorder('broad_types')))
+        self.patchers.append(patch.object(extraction_pipeline, 'get_database_statistics',
+                                          return_value={'dishes': 1}))
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def _recorder(self, step):
+        def run(*args, **kwargs):
+            self.calls.append(step)
+            return {'errors': self.errors.get(step, 0)}
+        return run
+
+    def run_pipeline(self, **kwargs):
+        with patch('builtins.print'):
+            return run_extraction_pipeline(2025, 7, db_manager=self.db_manager, **kwargs)
+
+    def test_steps_run_in_order(self):
+        """Test all steps run in the original script order"""
+        result = self.run_pipeline()
+
+        self.assertTrue(result.success)
+        self.assertEqual(self.calls, ['dishes', 'broad_types', 'materials', 'dish_material_mapping',
+                                      'material_usage', 'inventory'])
+        self.assertEqual([step.status for step in result.steps], ['ok'] * 6)
+        self.assertEqual(result.database_statistics, {'dishes': 1})
+
+    def test_skip_flags(self):
+        """Test skipped steps are recorded but not run"""
+        result = self.run_pipeline(skip_dishes=True, skip_materials=True, has_inventory_files=False)
+
+        self.assertTrue(result.success)
+        self.assertEqual(self.calls, ['broad_types', 'dish_material_mapping'])
+        statuses = {step.name: step.status for step in result.steps}
+        self.assertEqual(statuses['material_usage'], 'skipped')
+        self.assertEqual(statuses['inventory'], 'skipped')
+
+    def test_optional_step_failure_keeps_success(self):
+        """Test a failing optional step only warns"""
+        self.errors['broad_types'] = 1
+        result = self.run_pipeline()
+
+        self.assertTrue(result.success)
+        self.assertEqual(len(self.calls), 6)
+
+    def test_required_step_failure_aborts_without_confirm(self):
+        """Test a failing required step stops a non-interactive run"""
+        self.errors['dishes'] = 2
+        result = self.run_pipeline()
+
+        self.assertFalse(result.success)
+        self.assertTrue(result.aborted)
+        self.assertEqual(self.calls, ['dishes'])
+
+    def test_required_step_failure_continues_when_confirmed(self):
+        """Test confirm decides whether to continue after a failed step"""
+        self.errors['materials'] = 1
+        confirm = MagicMock(return_value=True)
+        result = self.run_pipeline(confirm=confirm)
+
+        self.assertFalse(result.success)
+        self.assertFalse(result.aborted)
+        self.assertEqual(len(self.calls), 6)
+        confirm.assert_called_once()
+
+    def test_mapping_failure_does_not_prompt(self):
+        """Test a mapping failure fails the run but continues without asking"""
+        self.errors['dish_material_mapping'] = 1
+        confirm = MagicMock(return_value=False)
+        result = self.run_pipeline(confirm=confirm)
+
+        self.assertFalse(result.success)
+        self.assertEqual(len(self.calls), 6)
+        confirm.assert_not_called()
+
+    def test_connection_failure(self):
+        """Test no step runs when the database is unreachable"""
+        self.db_manager.test_connection.return_value = False
+        result = self.run_pipeline()
+
+        self.assertFalse(result.success)
+        self.assertEqual(self.calls, [])
+
+
+
+class TestMaterialExportReads(unittest.TestCase):
+    """Test the steps reading the material export share one parsed-sheet cache entry"""
+
+    def test_same_dtype_spec(self):
+        """Test material, usage and inventory steps read the export with the same dtype spec"""
+        material_file = MagicMock(spec=Path)
+        material_file.__str__.return_value = '/data/material_detail.xlsx'
+        material_file.exists.return_value = True
+        reads = []
+
+        def read_first_sheet_cached(file_path, dtype_spec=None, **kwargs):
+            reads.append((str(file_path), dtype_spec))
+            return pd.DataFrame()
+
+        modules = (extract_materials_to_database, extract_material_usage_to_database, extract_inventory_to_database)
+        with patch.object(extract_material_usage_to_database, 'find_material_file', return_value=material_file), \
+                patch.object(extract_inventory_to_database, 'find_material_file', return_value=material_file):
+            patchers = [patch.object(module, 'read_first_sheet_cached', side_effect=read_first_sheet_cached)
+                        for module in modules]
+            for patcher in patchers:
+                patcher.start()
+            try:
+                extract_materials_to_database.MaterialExtractor(MagicMock())._read_and_process_excel(
+                    material_file, 2025, 6)
+                extract_material_usage_to_database.MaterialUsageExtractor(MagicMock())._load_material_data(
+                    2025, 6, True)
+                extract_inventory_to_database.InventoryExtractor(MagicMock())._load_material_types(2025, 6)
+            finally:
+                for patcher in patchers:
+                    patcher.stop()
+
+        self.assertEqual(len(reads), 3)
+        self.assertEqual(len(set((path, repr(sorted(spec.items()))) for path, spec in reads)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
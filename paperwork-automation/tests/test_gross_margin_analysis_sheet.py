@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the batched all-stores queries in GrossMarginAnalysisSheet.
+"""
+
+import unittest
+import sys
+import os
+from contextlib import contextmanager
+
+from openpyxl import Workbook
+
+# Add project root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from scripts.dish_material.generate_report.generate_gross_revenue_report.gross_margin_analysis_sheet import (
+    GrossMarginAnalysisSheet
+)
+
+
+class _FakeCursor:
+    """Answers each batched query with one row per store, based on the selected column"""
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.rows = []
+
+    def execute(self, sql, params=None):
+        self.manager.queries.append(sql)
+        store_ids = next(p for p in params if isinstance(p, list))
+        if 'FROM store_month_pnl' in sql:
+            self.rows = [{'store_id': s, 'year': 2025, 'month': 6, 'has_sales': True,
+                          **{column: values(s) for column, values in self.manager.pnl.items()}}
+                         for s in store_ids if s != 3]
+            return
+        for column, values in self.manager.figures.items():
+            if f"as {column}" in sql:
+                self.rows = [{'store_id': s, column: values(s)} for s in store_ids if s != 3]
+                return
+        raise AssertionError(f"unexpected query: {sql}")
+
+    def fetchall(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class _FakeDatabaseManager:
+    def __init__(self):
+        self.queries = []
+        self.figures = {
+            'total_discount': lambda s: 50.0,
+            'price_impact': lambda s: 10.0,
+        }
+        self.pnl = {
+            'sales_revenue': lambda s: 1000.0 * s,
+            'tax_amount': lambda s: 0.0,
+            'revenue': lambda s: 1000.0 * s,
+            'discount': lambda s: 50.0,
+            'theoretical_cost': lambda s: 400.0 * s - 5.0,
+            'actual_cost': lambda s: 400.0 * s,
+            'gross_margin': lambda s: 60.0,
+        }
+
+    @contextmanager
+    def get_connection(self):
+        outer = self
+
+        class _Connection:
+            def cursor(self):
+                return _FakeCursor(outer)
+
+        yield _Connection()
+
+
+class TestGrossMarginAnalysisBatching(unittest.TestCase):
+    """The sheet's query count must not grow with the number of stores"""
+
+    def run_sheet(self, store_count):
+        db = _FakeDatabaseManager()
+        sheet = GrossMarginAnalysisSheet(db, '2025-06-30')
+        sheet.STORES = [(store_id, f'店{store_id}') for store_id in range(1, store_count + 1)]
+        ws = sheet.generate_sheet(Workbook())
+        return db, ws
+
+    def test_constant_query_count(self):
+        db_small, _ = self.run_sheet(3)
+        db_large, _ = self.run_sheet(12)
+        self.assertEqual(len(db_small.queries), len(db_large.queries))
+        self.assertTrue(all('ANY(%s)' in sql for sql in db_large.queries))
+
+    def test_revenue_cost_and_loss_come_from_store_month_pnl(self):
+        db, ws = self.run_sheet(2)
+        self.assertFalse(any('material_monthly_usage mmu\n            JOIN material' in sql for sql in db.queries))
+        # Store 1: actual 400 - theoretical 395
+        self.assertEqual(ws.cell(row=3, column=17).value, 5.0)
+
+    def test_rows_are_keyed_by_store(self):
+        _, ws = self.run_sheet(4)
+        self.assertEqual([ws.cell(row=r, column=1).value for r in range(3, 7)],
+                         ['店1', '店2', '店3', '店4'])
+
+        # Store 2: revenue 2000, cost 800 -> 60% margin
+        self.assertAlmostEqual(ws.cell(row=4, column=2).value, 0.6)
+        self.assertEqual(ws.cell(row=4, column=20).value, 2000.0)
+        self.assertEqual(ws.cell(row=4, column=5).value, 10.0)
+
+        # Store 3 has no rows in any query and falls back to zeros
+        self.assertEqual(ws.cell(row=5, column=2).value, 0)
+        self.assertEqual(ws.cell(row=5, column=17).value, 0)
+        self.assertEqual(ws.cell(row=5, column=20).value, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Tests for lib/hi_bowl_daily_processor.py
+Checks header detection, day-sheet loading and the summary on generated order workbooks.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import Workbook
+
+# Add project root to path
+import sys
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from lib.hi_bowl_daily_processor import HiBowlDailyProcessor, find_header_rows, read_order_sheet
+
+ORDER_HEADER = ['开台时间', '完结时间', '订单编号', '就餐人数', '订单税前实收金额Totals', '订单税金Tax',
+                '折扣金额（合计）', '小费', '退款订单']
+
+
+def order_row(day: int, order_no: int):
+    """One order closing at a different hour per order number, with the money formats seen in exports."""
+    hour = (8 + order_no * 5) % 24
+    revenue = f"${1000 + order_no:,}.50" if order_no % 7 == 0 else f"${20 + order_no}.50"
+    tips = "n/a" if order_no % 11 == 0 else ("$1.00" if order_no % 2 else None)
+    return [f"2025-07-{day:02d} {hour:02d}:00:00", f"2025-07-{day:02d} {hour:02d}:30:00",
+            f"HB{day:02d}{order_no:04d}", 1 + order_no % 4, revenue, f"${2 + order_no % 3}.10",
+            f"-${order_no % 5}.00", tips, "R1" if order_no == 3 else None]
+
+
+def write_order_workbook(path: str, days, orders_per_day: int = 6, title_rows: int = 1):
+    """Day-sheets named YYYY-MM-DD with title rows above the order header."""
+    wb = Workbook()
+    wb.remove(wb.active)
+    for day in days:
+        ws = wb.create_sheet(f"2025-07-{day:02d}")
+        for _ in range(title_rows):
+            ws.append(["HaiDiLao order report"])
+        ws.append(ORDER_HEADER)
+        for order_no in range(orders_per_day):
+            ws.append(order_row(day, order_no))
+    notes = wb.create_sheet("说明")
+    notes.append(["no order header here"])
+    wb.save(path)
+
+
+def reference_parse_money(value) -> float:
+    """Per-cell money parsing used before the vectorized parser."""
+    if pd.isna(value):
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace('$', '').replace(',', ''))
+    except ValueError:
+        return 0.0
+
+
+def reference_summary(df: pd.DataFrame, target_month: str, sheet_count: int) -> dict:
+    """Filter-per-metric summary computed before the single groupby."""
+    df = df[(df['date'].dt.year == int(target_month[:4])) & (df['date'].dt.month == int(target_month[4:6]))].copy()
+    close_hour = pd.to_datetime(df['完结时间'], errors='coerce').dt.hour
+    weekday_mask = df['date'].dt.weekday < 5
+    non_refund = df['refund_order'].isna() | (df['refund_order'] == '')
+    discount_total = abs(df['discount_amount'].sum())
+    summary = {
+        'scheduled_operating_days': sheet_count,
+        'total_discount_with_tax': discount_total * 1.13,
+        'total_discount_without_tax': discount_total,
+        'total_tips': df['tips'].sum(),
+        'actual_operating_days': df['date'].nunique(),
+        'weekday_days': df[weekday_mask]['date'].nunique(),
+        'weekend_days': df[~weekday_mask]['date'].nunique(),
+        'total_guests': int(df['guest_count'].sum()),
+        'weekday_guests': int(df[weekday_mask]['guest_count'].sum()),
+        'weekend_guests': int(df[~weekday_mask]['guest_count'].sum()),
+        'total_orders': len(df[non_refund]),
+        'weekday_orders': len(df[non_refund & weekday_mask]),
+        'weekend_orders': len(df[non_refund & ~weekday_mask]),
+        'period': target_month[2:6],
+    }
+    for name, (start, end) in HiBowlDailyProcessor.TIME_SEGMENTS.items():
+        if start < end:
+            mask = (close_hour >= start) & (close_hour < end)
+        else:
+            mask = (close_hour >= start) | (close_hour < 8)
+        summary[f'revenue_{name}'] = df[mask]['revenue_before_tax'].sum() - df[mask]['tax'].sum()
+        summary[f'orders_{name}'] = len(df[mask & non_refund])
+    return summary
+
+
+class TestHiBowlDailyData(unittest.TestCase):
+    """Test reading the day-sheets of an order workbook"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.input_file = os.path.join(self.temp_dir, "orders.xlsx")
+        write_order_workbook(self.input_file, [3, 1, 2])
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_find_header_rows(self):
+        """Test header rows are found in the first rows and missing headers are None"""
+        self.assertEqual(find_header_rows(self.input_file),
+                         {'2025-07-03': 1, '2025-07-01': 1, '2025-07-02': 1, '说明': None})
+
+    def test_read_daily_data_in_date_order(self):
+        """Test sheets are parsed once each and combined in date order"""
+        daily_data, sheet_count = HiBowlDailyProcessor(workers=1)._read_daily_data(self.input_file)
+
+        self.assertEqual(sheet_count, 3)
+        self.assertEqual(len(daily_data), 18)
+        self.assertTrue(daily_data['date'].is_monotonic_increasing)
+        self.assertEqual(daily_data['订单编号'].iloc[0], 'HB010000')
+        self.assertEqual(daily_data['revenue_before_tax'].iloc[0], 1000.5)
+
+    def test_worker_pool_matches_in_process(self):
+        """Test the process pool gives the same frame as parsing in-process"""
+        serial, _ = HiBowlDailyProcessor(workers=1)._read_daily_data(self.input_file)
+        parallel, _ = HiBowlDailyProcessor(workers=2)._read_daily_data(self.input_file)
+        pd.testing.assert_frame_equal(serial, parallel)
+
+
+class TestHiBowlSummary(unittest.TestCase):
+    """Test the vectorized money parsing and summary against the per-cell versions"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        input_file = os.path.join(cls.temp_dir, "month.xlsx")
+        write_order_workbook(input_file, range(1, 32), orders_per_day=120)
+        cls.processor = HiBowlDailyProcessor(workers=1)
+        cls.daily_data, cls.sheet_count = cls.processor._read_daily_data(input_file)
+
+        # Raw (unparsed) orders, as _parse_monetary_columns receives them
+        raw = []
+        for sheet_name, header_row in find_header_rows(input_file).items():
+            if header_row is not None:
+                df = read_order_sheet(input_file, sheet_name, header_row)
+                df['date'] = pd.to_datetime(sheet_name)
+                raw.append(df)
+        cls.raw_orders = pd.concat(raw, ignore_index=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir)
+
+    def test_parse_money_matches_per_cell(self):
+        """Test currency strings, blanks, junk and numbers parse as before"""
+        values = pd.Series(['$1,234.50', '-$3.00', ' $7.25 ', '', 'n/a', None, float('nan'), 12, 4.5],
+                           dtype=object)
+        expected = [reference_parse_money(value) for value in values]
+        self.assertEqual(HiBowlDailyProcessor._parse_money(values).tolist(), expected)
+        self.assertEqual(HiBowlDailyProcessor._parse_money(pd.Series([1, None, 2.5])).tolist(),
+                         [1.0, 0.0, 2.5])
+
+    def test_summary_matches_reference(self):
+        """Test the groupby summary equals the per-metric filter summary on a 31-sheet month"""
+        self.assertEqual(self.sheet_count, 31)
+        expected = reference_summary(self.daily_data, '202507', self.sheet_count)
+        summary = self.processor._calculate_summary(self.daily_data.copy(), '202507', self.sheet_count)
+
+        self.assertEqual(set(summary), set(expected))
+        for key, value in expected.items():
+            if isinstance(value, str):
+                self.assertEqual(summary[key], value, key)
+            else:
+                self.assertAlmostEqual(summary[key], value, places=6, msg=key)
+        self.assertEqual(summary['weekday_days'] + summary['weekend_days'], 31)
+
+    def test_vectorized_benchmark(self):
+        """Print parse + summary timings for the per-cell and vectorized versions"""
+        monetary_columns = ['revenue_before_tax', 'tax', 'discount_amount', 'tips']
+
+        def reference():
+            orders = self.raw_orders.copy()
+            orders.columns = self.daily_data.columns
+            for col in monetary_columns:
+                orders[col] = orders[col].apply(reference_parse_money)
+            orders['guest_count'] = pd.to_numeric(orders['guest_count'], errors='coerce').fillna(0)
+            return reference_summary(orders, '202507', 31)
+
+        def vectorized():
+            orders = self.processor._parse_monetary_columns(self.raw_orders.copy())
+            return self.processor._calculate_summary(orders, '202507', 31)
+
+        timings = {}
+        for name, run in (('per-cell', reference), ('vectorized', vectorized)):
+            started = time.perf_counter()
+            for _ in range(5):
+                run()
+            timings[name] = (time.perf_counter() - started) / 5 * 1000
+
+        print(f"\n📊 Hi-Bowl parse + summary over {len(self.raw_orders)} orders: "
+              f"per-cell {timings['per-cell']:.1f}ms, vectorized {timings['vectorized']:.1f}ms "
+              f"({timings['per-cell'] / timings['vectorized']:.1f}x)")
+        self.assertEqual(vectorized()['total_orders'], reference()['total_orders'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Tests for scripts/dish_material/extract_data/historical_backfill.py
+Checks phase ordering, checkpoints and failure handling with mocked steps.
+"""
+
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+# Add project root to path
+import sys
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from scripts.dish_material.extract_data import historical_backfill
+from scripts.dish_material.extract_data.historical_backfill import (
+    FACT_STEPS, MASTER_STEPS, BackfillCheckpoint, StepRecord, count_rows, run_backfill, run_month_steps
+)
+
+
+class TestBackfillCheckpoint(unittest.TestCase):
+    """Test the per-month checkpoint files"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_mark_done_and_clear(self):
+        """Test completed steps persist per database and can be cleared"""
+        checkpoint = BackfillCheckpoint(Path(self.temp_dir), is_test=True)
+        checkpoint.mark_done(2025, 7, 'dish_master', rows=12, seconds=1.5)
+
+        reloaded = BackfillCheckpoint(Path(self.temp_dir), is_test=True)
+        self.assertTrue(reloaded.is_done(2025, 7, 'dish_master'))
+        self.assertEqual(reloaded.load(2025, 7)['dish_master']['rows'], 12)
+        self.assertFalse(reloaded.is_done(2025, 8, 'dish_master'))
+        self.assertFalse(BackfillCheckpoint(Path(self.temp_dir)).is_done(2025, 7, 'dish_master'))
+
+        reloaded.clear()
+        self.assertFalse(reloaded.is_done(2025, 7, 'dish_master'))
+
+    def test_count_rows(self):
+        """Test only written-row statistics are counted"""
+        stats = {'dishes_created': 3, 'dishes_updated': 2, 'sales_inserted': 5,
+                 'material_types_set': 1, 'files_processed': 4, 'errors': 0}
+        self.assertEqual(count_rows(stats), 11)
+
+
+class TestBackfillScheduling(unittest.TestCase):
+    """Test run_month_steps and run_backfill with mocked steps"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.calls = []
+        self.failures = set()
+        self.lock = threading.Lock()
+
+        def fake_step(db_manager, year, month, step):
+            with self.lock:
+                self.calls.append((year, month, step))
+            return {'rows_inserted': 1, 'errors': 1 if (year, month, step) in self.failures else 0}
+
+        self.patchers = [
+            patch.object(historical_backfill, '_run_step', side_effect=fake_step),
+            patch.object(historical_backfill, 'get_shared_database_manager', return_value=MagicMock()),
+            patch.object(historical_backfill, 'ProcessPoolExecutor', ThreadPoolExecutor),
+            patch.object(historical_backfill, 'activate_latest_prices', return_value=(0, 0)),
+            patch.object(historical_backfill.StoreMonthPnl, 'refresh'),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def test_checkpointed_steps_are_resumed(self):
+        """Test checkpointed steps are not run again"""
+        checkpoint = BackfillCheckpoint(Path(self.temp_dir))
+        checkpoint.mark_done(2025, 7, 'dish_facts', rows=5, seconds=1.0)
+
+        records = run_month_steps(2025, 7, FACT_STEPS, False, {'skip_inventory': True}, checkpoint)
+
+        self.assertEqual([step for _, _, step in self.calls], ['material_facts', 'material_usage'])
+        self.assertEqual([r.status for r in records], ['resumed', 'ok', 'ok', 'skipped'])
+        self.assertTrue(checkpoint.is_done(2025, 7, 'material_usage'))
+
+    def test_required_failure_stops_month(self):
+        """Test a failed required step is not checkpointed and stops the month"""
+        self.failures.add((2025, 7, 'material_master'))
+        checkpoint = BackfillCheckpoint(Path(self.temp_dir))
+
+        records = run_month_steps(2025, 7, MASTER_STEPS, False, {}, checkpoint)
+
+        self.assertEqual(records[-1].status, 'failed')
+        self.assertNotIn((2025, 7, 'dish_material_mapping'), self.calls)
+        self.assertFalse(checkpoint.is_done(2025, 7, 'material_master'))
+
+    def test_master_data_loaded_before_facts(self):
+        """Test every month's master data loads, oldest first, before any fact load"""
+        result = run_backfill([(2025, 8), (2025, 7)], workers=2, checkpoint_dir=Path(self.temp_dir))
+
+        master_calls = [(y, m) for y, m, step in self.calls if step in MASTER_STEPS]
+        self.assertEqual(master_calls, [(2025, 7)] * 4 + [(2025, 8)] * 4)
+        first_fact = next(i for i, (_, _, step) in enumerate(self.calls) if step in FACT_STEPS)
+        self.assertEqual(first_fact, 8)
+        self.assertEqual(len(self.calls), 16)
+        self.assertEqual(result.failed_months, [])
+        self.assertEqual(historical_backfill.StoreMonthPnl.refresh.call_count, 2)
+
+    def test_failed_pnl_refresh_fails_month(self):
+        """Test a month whose P&L refresh fails is reported as failed"""
+        def refresh(db_manager, year, month):
+            if month == 8:
+                raise RuntimeError('refresh failed')
+            return 3
+        historical_backfill.StoreMonthPnl.refresh.side_effect = refresh
+
+        result = run_backfill([(2025, 7), (2025, 8)], workers=2, checkpoint_dir=Path(self.temp_dir))
+
+        self.assertEqual(result.failed_months, ['2025-08'])
+        self.assertIn(StepRecord(2025, 8, 'store_month_pnl', 'failed'), result.records)
+
+    def test_failed_master_month_skips_facts(self):
+        """Test a month whose master data failed gets no fact loads"""
+        self.failures.add((2025, 7, 'dish_master'))
+        result = run_backfill([(2025, 7), (2025, 8)], workers=2, checkpoint_dir=Path(self.temp_dir))
+
+        self.assertEqual(result.failed_months, ['2025-07'])
+        self.assertFalse(any(step in FACT_STEPS for y, m, step in self.calls if (y, m) == (2025, 7)))
+
+    def test_rerun_resumes_from_checkpoints(self):
+        """Test a second run only repeats steps that did not complete"""
+        self.failures.add((2025, 8, 'inventory'))
+        run_backfill([(2025, 8)], workers=1, checkpoint_dir=Path(self.temp_dir))
+
+        self.calls.clear()
+        self.failures.clear()
+        result = run_backfill([(2025, 8)], workers=1, checkpoint_dir=Path(self.temp_dir))
+
+        self.assertEqual(self.calls, [(2025, 8, 'inventory')])
+        self.assertEqual(result.failed_months, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -14,6 +14,8 @@ from unittest.mock import Mock, patch, MagicMock
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from utils.database import refresh_schema_capabilities
+
 
 class TestMonthlyDishesWorksheetGenerator(unittest.TestCase):
     """Comprehensive tests for MonthlyDishesWorksheetGenerator"""
@@ -325,5 +327,78 @@ class TestMonthlyDishesWorksheetGenerator(unittest.TestCase):
                     f"Worksheet generation should handle errors gracefully: {e}")
 
 
+class TestMaterialVarianceQueries(unittest.TestCase):
+    """Test the material variance data is fetched with a fixed number of queries"""
+
+    def setUp(self):
+        refresh_schema_capabilities()
+        self.generator = MonthlyDishesWorksheetGenerator({1: "加拿大一店"}, "2025-06-30")
+        self.cursor = MagicMock()
+        self.data_provider = MagicMock()
+        self.cursor.__enter__.return_value = self.cursor
+        connection = self.data_provider.db_manager.get_connection.return_value.__enter__.return_value
+        connection.cursor.return_value = self.cursor
+        self.schema_rows = [{'table_name': 'dish_material', 'column_name': 'unit_conversion_rate'}]
+
+    def tearDown(self):
+        refresh_schema_capabilities()
+
+    def recipe_row(self, dish_id, material_id, dish_name, standard_quantity=0.5):
+        return {'dish_id': dish_id, 'material_id': material_id, 'store_id': 1,
+                'standard_quantity': standard_quantity, 'loss_rate': 1.0, 'unit_conversion_rate': 1.0,
+                'dish_name': dish_name, 'dish_full_code': str(dish_id), 'dish_short_code': None,
+                'dish_size': None, 'dish_spec': None, 'material_number': str(material_id),
+                'material_name': f'物料{material_id}', 'material_description': None,
+                'material_unit': '公斤', 'store_name': '加拿大一店'}
+
+    def material_row(self, material_id, **values):
+        row = {'material_id': material_id, 'store_id': 1, 'store_name': '加拿大一店',
+               'material_name': f'物料{material_id}', 'material_number': str(material_id),
+               'material_unit': '公斤'}
+        row.update(values)
+        return row
+
+    def test_column_check_is_cached(self):
+        """Test the schema is read from information_schema once per database"""
+        self.cursor.fetchall.return_value = self.schema_rows
+
+        self.assertTrue(self.generator.check_unit_conversion_rate_column_exists(self.data_provider.db_manager))
+        self.assertTrue(self.generator.check_unit_conversion_rate_column_exists(self.data_provider.db_manager))
+        self.assertEqual(self.cursor.execute.call_count, 1)
+
+    def test_variance_uses_fixed_queries(self):
+        """Test theoretical usage and dish details come from one recipe load, not per-material queries"""
+        material_count = 50
+        recipes = [self.recipe_row(100, 1, '牛肉'), self.recipe_row(101, 1, '羊肉')]
+        recipes += [self.recipe_row(200 + i, i, f'菜{i}', standard_quantity=1.0)
+                    for i in range(2, material_count + 1)]
+        self.cursor.fetchall.side_effect = [
+            self.schema_rows,
+            recipes,
+            [{'dish_id': 100, 'store_id': 1, 'net_sales': 20}, {'dish_id': 101, 'store_id': 1, 'net_sales': 4}],
+            [{'combo_id': 9, 'combo_name': '双人餐', 'dish_id': 100, 'store_id': 1, 'sale_amount': 5,
+              'dish_name': '牛肉', 'dish_full_code': '100', 'dish_short_code': None, 'dish_size': None}],
+            [self.material_row(i, system_record=12.0) for i in range(1, material_count + 1)],
+            [],
+            [{'material_id': 1, 'store_id': 1, 'effective_year': 2025, 'effective_month': 3, 'price': 8},
+             {'material_id': 1, 'store_id': 1, 'effective_year': 2025, 'effective_month': 5, 'price': 9}],
+        ]
+
+        variance_data = self.generator.get_material_variance_data(self.data_provider, 2025, 6)
+
+        self.assertEqual(len(variance_data), material_count)
+        self.assertEqual(self.cursor.execute.call_count, 7)  # schema + 3 engine loads + 3 data queries
+        rows = {row['material_id']: row for row in variance_data}
+        self.assertEqual(rows[1]['theoretical_usage'], 12.0)
+        self.assertEqual(rows[1]['combo_usage'], 2.5)
+        self.assertEqual(rows[1]['dish_usage_details'].split('\n'), [
+            "牛肉 sale-20 出品分量(kg)-0.5 损耗-1 物料单位-1 materials_use-10.0000",
+            "羊肉 sale-4 出品分量(kg)-0.5 损耗-1 物料单位-1 materials_use-2.0000",
+            "套餐 - 2.5000",
+        ])
+        self.assertEqual(rows[2]['dish_usage_details'], "无使用记录")
+        self.assertEqual((rows[1]['material_price'], rows[2]['material_price']), (9.0, 0))
+
+
 if __name__ == '__main__':
     unittest.main()
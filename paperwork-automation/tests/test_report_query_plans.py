@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Query plan regression benchmark for ReportDataProvider date filters.
+
+Seeds several years of synthetic daily_report / store_time_report rows into
+session-local TEMP tables (which shadow the real tables for this connection
+only), then EXPLAINs the SQL the provider actually issues and checks that the
+report tables are read through an index instead of a sequential scan.
+
+Requires the test database (DatabaseConfig(is_test=True)); skipped otherwise.
+"""
+
+import unittest
+import sys
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from utils.database import DatabaseConfig, _open_connection
+    from lib.database_queries import ReportDataProvider, ReportPeriods
+except ImportError as e:
+    print(f"Import error: {e}")
+    print("Database tests disabled - missing dependencies")
+    sys.exit(0)
+
+
+MIGRATION_FILE = (Path(__file__).parent.parent / 'haidilao-database-querys'
+                  / 'migrations' / 'add_report_date_indexes.sql')
+
+REPORT_TABLES = ('daily_report', 'store_time_report')
+INDEXED_NODE_TYPES = ('Index Scan', 'Index Only Scan', 'Bitmap Heap Scan')
+
+SEED_START = '2019-01-01'
+SEED_END = '2025-06-30'
+TARGET_DATE = '2025-06-10'
+
+
+class _ExplainCursor:
+    """Cursor stand-in that EXPLAINs each statement instead of running it"""
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def execute(self, sql, params=None):
+        self.manager.explain(sql, params)
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return None
+
+
+class _PlanCapturingManager:
+    """DatabaseManager stand-in that records the plan of every query on one connection"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.plans = []
+
+    def explain(self, sql, params=None):
+        cursor = self.conn.cursor()
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        self.plans.append(cursor.fetchone()['QUERY PLAN'][0]['Plan'])
+
+    @contextmanager
+    def get_connection(self):
+        outer = self
+
+        class _Connection:
+            def cursor(self):
+                return _ExplainCursor(outer)
+
+        yield _Connection()
+
+    def fetch_all(self, sql, params=None):
+        self.explain(sql, params)
+        return []
+
+    def fetch_one(self, sql, params=None):
+        self.explain(sql, params)
+        return None
+
+
+def _scan_nodes(plan):
+    """Yield (relation, node type) for every node reading a report table"""
+    if plan.get('Relation Name') in REPORT_TABLES:
+        yield plan['Relation Name'], plan['Node Type']
+    for child in plan.get('Plans', []):
+        yield from _scan_nodes(child)
+
+
+class TestReportQueryPlans(unittest.TestCase):
+    """Report period filters must stay index-friendly as history grows"""
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            cls.conn = _open_connection(DatabaseConfig(is_test=True))
+        except Exception as e:
+            raise unittest.SkipTest(f"Database connection failed: {e}")
+
+        cls.conn.autocommit = True
+        cursor = cls.conn.cursor()
+
+        # TEMP tables live in pg_temp, which is searched before public, so the
+        # provider's unqualified table names resolve to the seeded copies.
+        for table in REPORT_TABLES:
+            cursor.execute(
+                f"CREATE TEMP TABLE {table} (LIKE public.{table} INCLUDING ALL)")
+
+        cursor.execute("""
+            INSERT INTO daily_report (
+                store_id, date, is_holiday, tables_served, tables_served_validated,
+                turnover_rate, revenue_tax_not_included, takeout_tables,
+                customers, discount_total
+            )
+            SELECT s, d::date, false, 150 + random() * 50, 150 + random() * 50,
+                   3 + random(), 20000 + random() * 10000, random() * 10,
+                   400 + random() * 200, random() * 1000
+            FROM generate_series(1, 8) s,
+                 generate_series(%s::date, %s::date, interval '1 day') d
+        """, (SEED_START, SEED_END))
+
+        cursor.execute("""
+            INSERT INTO store_time_report (
+                store_id, date, time_segment_id, is_holiday,
+                tables_served_validated, turnover_rate
+            )
+            SELECT s, d::date, ts, false, 30 + random() * 20, random() * 2
+            FROM generate_series(1, 8) s,
+                 generate_series(%s::date, %s::date, interval '1 day') d,
+                 generate_series(1, 4) ts
+        """, (SEED_START, SEED_END))
+
+        cursor.execute(MIGRATION_FILE.read_text(encoding='utf-8'))
+
+    @classmethod
+    def tearDownClass(cls):
+        conn = getattr(cls, 'conn', None)
+        if conn is not None:
+            conn.close()
+
+    def assert_indexed(self, method_name):
+        manager = _PlanCapturingManager(self.conn)
+        provider = ReportDataProvider(manager)
+        getattr(provider, method_name)(TARGET_DATE)
+
+        scans = [scan for plan in manager.plans for scan in _scan_nodes(plan)]
+        self.assertTrue(scans, f"{method_name} issued no report table query")
+        for relation, node_type in scans:
+            self.assertIn(node_type, INDEXED_NODE_TYPES,
+                          f"{method_name} reads {relation} with {node_type}")
+
+    def test_all_report_data_uses_index(self):
+        self.assert_indexed('get_all_report_data')
+
+    def test_time_segment_data_uses_index(self):
+        self.assert_indexed('get_time_segment_data')
+
+    def test_time_segment_mtd_data_uses_index(self):
+        self.assert_indexed('get_time_segment_mtd_data')
+
+    def test_profit_mtd_data_uses_index(self):
+        self.assert_indexed('get_profit_mtd_data')
+
+    def test_gross_margin_discount_data_uses_index(self):
+        self.assert_indexed('get_gross_margin_discount_data')
+
+    def test_range_versus_extract_benchmark(self):
+        """Print MTD timings for the old EXTRACT filter and the range filter"""
+        periods = ReportPeriods(TARGET_DATE)
+        queries = {
+            'extract': ("""
+                SELECT store_id, SUM(revenue_tax_not_included)
+                FROM daily_report
+                WHERE EXTRACT(YEAR FROM date) = %s
+                    AND EXTRACT(MONTH FROM date) = %s
+                    AND EXTRACT(DAY FROM date) <= %s
+                GROUP BY store_id
+            """, (periods.year, periods.month, periods.day)),
+            'range': ("""
+                SELECT store_id, SUM(revenue_tax_not_included)
+                FROM daily_report
+                WHERE date >= %s AND date < %s
+                GROUP BY store_id
+            """, periods.current_mtd),
+        }
+
+        cursor = self.conn.cursor()
+        timings = {}
+        for name, (sql, params) in queries.items():
+            started = time.perf_counter()
+            for _ in range(20):
+                cursor.execute(sql, params)
+                cursor.fetchall()
+            timings[name] = (time.perf_counter() - started) / 20 * 1000
+
+        print(f"\n📊 MTD query over {SEED_START}..{SEED_END}: "
+              f"EXTRACT {timings['extract']:.2f}ms, range {timings['range']:.2f}ms")
+
+        manager = _PlanCapturingManager(self.conn)
+        manager.explain(*queries['range'])
+        for _, node_type in _scan_nodes(manager.plans[0]):
+            self.assertIn(node_type, INDEXED_NODE_TYPES)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the gross revenue report's concurrent data prefetcher.
+"""
+
+import unittest
+import sys
+import os
+import threading
+
+# Add project root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from scripts.dish_material.generate_report.generate_gross_revenue_report.sheet_data_prefetcher import (
+    SheetDataPrefetcher, fetch_sheet_data
+)
+
+
+class TestSheetDataPrefetcher(unittest.TestCase):
+    """Phase-one queries are run once, on worker threads, and handed to writers"""
+
+    def setUp(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def query(self, store_id, debug=False):
+        with self.lock:
+            self.calls.append((store_id, debug, threading.current_thread().name))
+        return {'store_id': store_id, 'debug': debug}
+
+    def test_prefetched_results_are_served(self):
+        """Writers get the prefetched result without querying again"""
+        with SheetDataPrefetcher(workers=4) as prefetcher:
+            for store_id in range(1, 8):
+                prefetcher.submit(self.query, store_id, False)
+            prefetcher.submit(self.query, 1, False)
+            prefetcher.wait()
+
+            self.assertEqual(prefetcher.query_count, 7)
+            self.assertEqual(fetch_sheet_data(prefetcher, self.query, 3, False),
+                             {'store_id': 3, 'debug': False})
+
+        self.assertEqual(len(self.calls), 7)
+        self.assertTrue(all(name.startswith('report-query') for _, _, name in self.calls))
+
+    def test_unsubmitted_query_runs_directly(self):
+        """Queries that were not prefetched (or no prefetcher) run on the caller's thread"""
+        with SheetDataPrefetcher(workers=2) as prefetcher:
+            result = fetch_sheet_data(prefetcher, self.query, 5, True)
+        self.assertEqual(result, {'store_id': 5, 'debug': True})
+        self.assertEqual(fetch_sheet_data(None, self.query, 6), {'store_id': 6, 'debug': False})
+        self.assertEqual([name for _, _, name in self.calls],
+                         [threading.current_thread().name] * 2)
+
+    def test_failed_query_raises_in_writer(self):
+        """A query error surfaces where the writer fetches the data"""
+        def broken(store_id):
+            raise RuntimeError(f"store {store_id} failed")
+
+        with SheetDataPrefetcher(workers=2) as prefetcher:
+            prefetcher.submit(broken, 2)
+            prefetcher.submit(self.query, 1)
+            prefetcher.wait()
+
+            with self.assertRaises(RuntimeError):
+                fetch_sheet_data(prefetcher, broken, 2)
+            self.assertEqual(fetch_sheet_data(prefetcher, self.query, 1)['store_id'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
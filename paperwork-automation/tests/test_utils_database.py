@@ -13,7 +13,7 @@ from psycopg2 import sql
 
 # Add parent directory to path for imports
 sys.path.append(str(Path(__file__).parent.parent))
-from utils.database import DatabaseConfig, DatabaseManager, DatabaseSetup
+from utils.database import DatabaseConfig, DatabaseManager, DatabaseSetup, SchemaCapabilities
 from utils.database import get_database_manager, setup_database_for_tests, verify_database_connection
 
 
@@ -460,46 +460,45 @@ class TestDatabaseSetup(unittest.TestCase):
         
         self.assertFalse(result)
 
+    def schema(self, *tables):
+        return SchemaCapabilities({table: frozenset({'id'}) for table in tables})
+
     def test_verify_database_structure_success(self):
         """Test successful database structure verification"""
-        # Mock table existence checks
-        self.mock_db_manager.fetch_one.side_effect = [
-            {'exists': True},  # stores table
-            {'exists': True},  # daily_report table
-            {'exists': True},  # time_segment_report table
-            {'exists': True}   # monthly_targets table
-        ]
+        # Table existence comes from the cached schema
+        self.mock_db_manager.schema = self.schema(
+            'store', 'time_segment', 'daily_report', 'store_time_report', 'store_monthly_target')
+        self.mock_db_manager.fetch_all.side_effect = [[{'count': 7}], [{'count': 4}]]
         
         result = self.setup.verify_database_structure()
         
         self.assertTrue(result)
-        self.assertEqual(self.mock_db_manager.fetch_one.call_count, 4)
+        self.mock_db_manager.fetch_one.assert_not_called()
+        self.assertEqual(self.mock_db_manager.fetch_all.call_count, 2)
 
     def test_verify_database_structure_missing_table(self):
         """Test database structure verification with missing table"""
-        # Mock missing table
-        self.mock_db_manager.fetch_one.side_effect = [
-            {'exists': True},   # stores table
-            {'exists': False},  # daily_report table missing
-            {'exists': True},   # time_segment_report table
-            {'exists': True}    # monthly_targets table
-        ]
+        self.mock_db_manager.schema = self.schema(
+            'store', 'time_segment', 'store_time_report', 'store_monthly_target')
         
         result = self.setup.verify_database_structure()
         
         self.assertFalse(result)
+        self.mock_db_manager.fetch_all.assert_not_called()
 
     def test_verify_database_structure_error(self):
         """Test database structure verification with error"""
-        self.mock_db_manager.fetch_one.side_effect = Exception("Database error")
+        self.mock_db_manager.schema = self.schema(
+            'store', 'time_segment', 'daily_report', 'store_time_report', 'store_monthly_target')
+        self.mock_db_manager.fetch_all.side_effect = Exception("Database error")
         
         result = self.setup.verify_database_structure()
         
         self.assertFalse(result)
 
-    def test_verify_database_structure_none_result(self):
-        """Test database structure verification with None result"""
-        self.mock_db_manager.fetch_one.return_value = None
+    def test_verify_database_structure_unreadable_schema(self):
+        """Test an empty schema (catalog not readable) fails verification"""
+        self.mock_db_manager.schema = SchemaCapabilities()
         
         result = self.setup.verify_database_structure()
         
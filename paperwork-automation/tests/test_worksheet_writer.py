@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Tests for lib/worksheet_writer.py
+Checks that the in-memory and streaming (write-only) backends produce the same workbook.
+"""
+
+import unittest
+import tempfile
+import os
+from pathlib import Path
+
+# Add project root to path
+import sys
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from openpyxl import load_workbook
+
+from lib.worksheet_writer import (
+    THIN_BORDER, SheetWriter, cell_style, create_report_workbook, is_streaming_workbook,
+    shared_alignment, shared_font, solid_fill
+)
+
+
+def write_sample_sheet(workbook):
+    """Write the same small styled sheet through a SheetWriter."""
+    writer = SheetWriter(workbook.create_sheet("样例"))
+    writer.set_column_widths([20, 12, 12])
+    writer.freeze_panes("A4")
+
+    title_row = writer.append(["物料对比"], cell_style(font=shared_font(bold=True, size=14),
+                                                       alignment=shared_alignment(horizontal='center')))
+    writer.merge(title_row, 1, title_row, 3)
+    writer.skip_rows(1)
+    writer.append(["物料", "理论", "实际"], cell_style(font=shared_font(bold=True), fill=solid_fill("CCE5FF"),
+                                                     border=THIN_BORDER))
+
+    data_style = cell_style(border=THIN_BORDER, number_format='#,##0.00')
+    first_row = writer.append(["牛肉", 1.5, 2.25], data_style, height=18)
+    writer.merge(first_row, 1, first_row + 1, 1)
+    writer.append([None, 3.0, 4.0], [cell_style(border=THIN_BORDER), data_style, None])
+    return workbook
+
+
+def dump_sheet(path):
+    """Cells, merges and dimensions of the first sheet of a saved workbook."""
+    ws = load_workbook(path).active
+    cells = {}
+    for row in ws.iter_rows():
+        for cell in row:
+            if cell.has_style or cell.value is not None:
+                cells[cell.coordinate] = (cell.value, repr(cell.font), repr(cell.fill),
+                                          repr(cell.border), repr(cell.alignment), cell.number_format)
+    return {
+        'cells': cells,
+        'merged': sorted(str(r) for r in ws.merged_cells.ranges),
+        'widths': {k: v.width for k, v in ws.column_dimensions.items()},
+        'heights': {k: v.height for k, v in ws.row_dimensions.items() if v.height},
+        'freeze_panes': ws.freeze_panes,
+    }
+
+
+class TestSharedStyles(unittest.TestCase):
+    """Test style interning"""
+
+    def test_styles_are_shared(self):
+        """Test equal arguments return the same style object"""
+        self.assertIs(shared_font(bold=True, size=10), shared_font(bold=True, size=10))
+        self.assertIs(solid_fill("F5F5F5"), solid_fill("F5F5F5"))
+        self.assertIs(shared_alignment(horizontal='center'), shared_alignment(horizontal='center'))
+        self.assertIs(cell_style(border=THIN_BORDER), cell_style(border=THIN_BORDER))
+
+    def test_solid_fill_color(self):
+        """Test solid fill uses the color for both ends"""
+        fill = solid_fill("FFB6C1")
+        self.assertEqual(fill.fill_type, "solid")
+        self.assertEqual(fill.start_color.rgb, "00FFB6C1")
+        self.assertEqual(fill.end_color.rgb, "00FFB6C1")
+
+
+class TestSheetWriter(unittest.TestCase):
+    """Test SheetWriter on both backends"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for name in os.listdir(self.temp_dir):
+            os.remove(os.path.join(self.temp_dir, name))
+        os.rmdir(self.temp_dir)
+
+    def save(self, workbook, name):
+        path = os.path.join(self.temp_dir, name)
+        workbook.save(path)
+        return path
+
+    def test_create_report_workbook(self):
+        """Test report workbooks start without the default sheet"""
+        self.assertEqual(create_report_workbook().sheetnames, [])
+        self.assertFalse(is_streaming_workbook(create_report_workbook()))
+        self.assertTrue(is_streaming_workbook(create_report_workbook(streaming=True)))
+
+    def test_row_numbers(self):
+        """Test append returns the row written and skip_rows advances"""
+        writer = SheetWriter(create_report_workbook().create_sheet("a"))
+        self.assertEqual(writer.append(["x"]), 1)
+        writer.skip_rows(2)
+        self.assertEqual(writer.append(["y"]), 4)
+        self.assertEqual(writer.worksheet.cell(row=4, column=1).value, "y")
+
+    def test_in_memory_sheet_contents(self):
+        """Test values, styles and merges in the in-memory backend"""
+        path = self.save(write_sample_sheet(create_report_workbook()), "memory.xlsx")
+        sheet = dump_sheet(path)
+
+        self.assertEqual(sheet['cells']['A1'][0], "物料对比")
+        self.assertEqual(sheet['cells']['B4'][0], 1.5)
+        self.assertEqual(sheet['cells']['B4'][5], '#,##0.00')
+        self.assertEqual(sheet['merged'], ['A1:C1', 'A4:A5'])
+        self.assertEqual(sheet['widths']['A'], 20)
+        self.assertEqual(sheet['heights'][4], 18)
+        self.assertEqual(sheet['freeze_panes'], "A4")
+        self.assertEqual(sheet['cells']['C5'][5], 'General')
+
+    def test_streaming_matches_in_memory(self):
+        """Test the streaming backend writes the same workbook"""
+        memory = dump_sheet(self.save(write_sample_sheet(create_report_workbook()), "memory.xlsx"))
+        streamed = dump_sheet(self.save(write_sample_sheet(create_report_workbook(streaming=True)),
+                                        "streamed.xlsx"))
+        self.assertEqual(streamed, memory)
+
+
+if __name__ == '__main__':
+    unittest.main()
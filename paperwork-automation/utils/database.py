@@ -6,6 +6,9 @@ Handles PostgreSQL connections, schema setup, and data operations.
 
 import os
 import sys
+import time
+import atexit
+import threading
 import psycopg2
 import psycopg2.extras
 from typing import Optional, List, Dict, Any, Tuple
@@ -59,27 +62,357 @@ class DatabaseConfig:
         return f"DatabaseConfig(host={self.host}, port={self.port}, user={self.user}, database={self.database}, is_test={self.is_test})"
 
 
+def _open_connection(config: DatabaseConfig):
+    """Open a new PostgreSQL connection for the given configuration"""
+    return psycopg2.connect(
+        host=config.host,
+        port=config.port,
+        user=config.user,
+        password=config.password,
+        database=config.database,
+        cursor_factory=psycopg2.extras.RealDictCursor,
+        client_encoding='utf8'
+    )
+
+
+class PoolTimeoutError(psycopg2.OperationalError):
+    """Raised when no pooled connection becomes available in time"""
+
+
+class ConnectionPool:
+    """
+    Thread-safe PostgreSQL connection pool.
+
+    Connections are created lazily up to ``max_size``. Idle connections are
+    health-checked before being handed out and are recycled once they exceed
+    ``max_lifetime`` seconds. Callers that find the pool exhausted wait up to
+    ``checkout_timeout`` seconds for a connection to be returned.
+    """
+
+    def __init__(self, config: DatabaseConfig, max_size: int,
+                 max_lifetime: float = 1800.0, health_check_after: float = 30.0,
+                 checkout_timeout: float = 30.0):
+        if max_size < 1:
+            raise ValueError("Connection pool size must be at least 1")
+
+        self.config = config
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.checkout_timeout = checkout_timeout
+
+        self._idle: List[Tuple[Any, float, float]] = []  # (conn, created_at, returned_at)
+        self._created_at: Dict[int, float] = {}
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._stats = self._empty_stats()
+
+    @staticmethod
+    def _empty_stats() -> Dict[str, Any]:
+        return {
+            'checkouts': 0,
+            'waits': 0,
+            'creates': 0,
+            'discards': 0,
+            'health_check_failures': 0,
+            'connect_seconds': 0.0,
+            'wait_seconds': 0.0,
+            'in_use_seconds': 0.0,
+        }
+
+    def _is_healthy(self, conn, returned_at: float) -> bool:
+        """Check a connection that has been sitting idle in the pool"""
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - returned_at < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        """Close a connection and release its slot (caller holds the lock)"""
+        self._created_at.pop(id(conn), None)
+        self._size -= 1
+        self._stats['discards'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _create(self):
+        """Create a new connection outside the lock, accounting for connect time"""
+        started = time.monotonic()
+        try:
+            conn = _open_connection(self.config)
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        elapsed = time.monotonic() - started
+        with self._condition:
+            self._stats['creates'] += 1
+            self._stats['connect_seconds'] += elapsed
+            self._created_at[id(conn)] = time.monotonic()
+        return conn
+
+    def getconn(self):
+        """Check a connection out of the pool, creating one if there is room"""
+        deadline = time.monotonic() + self.checkout_timeout
+        waited = False
+        wait_started = None
+
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise psycopg2.InterfaceError("Connection pool is closed")
+
+                while self._idle:
+                    conn, created_at, returned_at = self._idle.pop()
+                    if time.monotonic() - created_at > self.max_lifetime:
+                        self._discard(conn)
+                        continue
+                    if not self._is_healthy(conn, returned_at):
+                        self._stats['health_check_failures'] += 1
+                        self._discard(conn)
+                        continue
+                    self._record_checkout(waited, wait_started)
+                    return conn
+
+                if self._size < self.max_size:
+                    self._size += 1
+                    self._record_checkout(waited, wait_started)
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError(
+                        f"No database connection available after {self.checkout_timeout}s "
+                        f"(pool size {self.max_size})")
+                if not waited:
+                    waited = True
+                    wait_started = time.monotonic()
+                    self._stats['waits'] += 1
+                self._condition.wait(remaining)
+
+        return self._create()
+
+    def _record_checkout(self, waited: bool, wait_started: Optional[float]):
+        self._stats['checkouts'] += 1
+        if waited and wait_started is not None:
+            self._stats['wait_seconds'] += time.monotonic() - wait_started
+
+    def putconn(self, conn, in_use_seconds: float = 0.0, discard: bool = False):
+        """Return a connection to the pool, resetting any open transaction"""
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        with self._condition:
+            self._stats['in_use_seconds'] += in_use_seconds
+            created_at = self._created_at.get(id(conn), time.monotonic())
+            if discard or conn.closed or self._closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+            self._condition.notify()
+
+    def closeall(self):
+        """Close every idle connection and refuse further checkouts"""
+        with self._condition:
+            self._closed = True
+            while self._idle:
+                conn, _, _ = self._idle.pop()
+                self._discard(conn)
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of pool counters and timings"""
+        with self._condition:
+            snapshot = dict(self._stats)
+            snapshot['size'] = self._size
+            snapshot['idle'] = len(self._idle)
+            snapshot['max_size'] = self.max_size
+        return snapshot
+
+    def reset_stats(self):
+        """Reset counters, e.g. at the start of a report run"""
+        with self._condition:
+            self._stats = self._empty_stats()
+
+
+# Per-process pool registry so every pooled DatabaseManager pointing at the
+# same database shares one set of connections.
+_pools: Dict[Tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_key(config: DatabaseConfig) -> Tuple:
+    return (os.getpid(), config.host, config.port, config.user, config.database)
+
+
+def _pool_settings() -> Dict[str, Any]:
+    """Pool settings from lib.config, with DB_POOL_SIZE as an override"""
+    try:
+        from lib.config import (CONNECTION_POOL_SIZE, CONNECTION_MAX_LIFETIME,
+                                CONNECTION_HEALTH_CHECK_AFTER)
+        settings = {
+            'max_size': CONNECTION_POOL_SIZE,
+            'max_lifetime': CONNECTION_MAX_LIFETIME,
+            'health_check_after': CONNECTION_HEALTH_CHECK_AFTER,
+        }
+    except ImportError:
+        settings = {'max_size': 5}
+
+    env_size = os.getenv("DB_POOL_SIZE")
+    if env_size:
+        settings['max_size'] = int(env_size)
+    return settings
+
+
+def get_connection_pool(config: DatabaseConfig, pool_size: Optional[int] = None) -> ConnectionPool:
+    """Get (or create) the process-wide connection pool for a configuration"""
+    key = _pool_key(config)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            settings = _pool_settings()
+            if pool_size is not None:
+                settings['max_size'] = pool_size
+            pool = ConnectionPool(config, **settings)
+            _pools[key] = pool
+        return pool
+
+
+def close_all_pools():
+    """Close every connection pool owned by this process"""
+    with _pools_lock:
+        pools = [pool for key, pool in _pools.items() if key[0] == os.getpid()]
+        _pools.clear()
+    for pool in pools:
+        pool.closeall()
+
+
+atexit.register(close_all_pools)
+
+
+class SchemaCapabilities:
+    """Tables and columns of the current schema, answered from memory"""
+
+    def __init__(self, columns: Optional[Dict[str, frozenset]] = None):
+        self._columns = columns or {}
+
+    @classmethod
+    def load(cls, db_manager: 'DatabaseManager') -> 'SchemaCapabilities':
+        """Read every table and column in one information_schema query"""
+        columns: Dict[str, set] = {}
+        with db_manager.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT table_name, column_name
+                    FROM information_schema.columns
+                    WHERE table_schema = current_schema()
+                """)
+                for row in cursor.fetchall():
+                    columns.setdefault(row['table_name'], set()).add(row['column_name'])
+        return cls({table: frozenset(names) for table, names in columns.items()})
+
+    def has_table(self, table: str) -> bool:
+        return table in self._columns
+
+    def has_column(self, table: str, column: str) -> bool:
+        return column in self._columns.get(table, ())
+
+    def columns(self, table: str) -> frozenset:
+        return self._columns.get(table, frozenset())
+
+
+# Per-process schema cache, keyed like the pool registry
+_schema_capabilities: Dict[Tuple, SchemaCapabilities] = {}
+
+
+def get_schema_capabilities(db_manager: 'DatabaseManager') -> SchemaCapabilities:
+    """
+    Get the cached schema of a database, loading it on first use.
+
+    If the catalog cannot be read the result is empty (every check answers
+    False) and is not cached, so the next call tries again.
+    """
+    key = _pool_key(db_manager.config)
+    capabilities = _schema_capabilities.get(key)
+    if capabilities is None:
+        try:
+            capabilities = SchemaCapabilities.load(db_manager)
+        except Exception as e:
+            logger.error(f"Failed to load schema capabilities: {e}")
+            return SchemaCapabilities()
+        _schema_capabilities[key] = capabilities
+    return capabilities
+
+
+def refresh_schema_capabilities(db_manager: Optional['DatabaseManager'] = None):
+    """Drop the cached schema of one database (or all) after DDL; it reloads on next use"""
+    if db_manager is None:
+        _schema_capabilities.clear()
+    else:
+        _schema_capabilities.pop(_pool_key(db_manager.config), None)
+
+
 class DatabaseManager:
     """Database connection and operation manager"""
 
-    def __init__(self, config: DatabaseConfig):
+    def __init__(self, config: DatabaseConfig, pooled: bool = False,
+                 pool_size: Optional[int] = None):
         self.config = config
+        self.pooled = pooled
+        self.pool_size = pool_size
         self._connection = None
 
+    @property
+    def pool(self) -> Optional[ConnectionPool]:
+        """Shared connection pool, or None when running unpooled"""
+        if not self.pooled:
+            return None
+        return get_connection_pool(self.config, self.pool_size)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Pool counters (checkouts, waits, creates) and connect/wait/in-use timings"""
+        pool = self.pool
+        return pool.stats() if pool else {}
+
+    def log_pool_stats(self):
+        """Log pool statistics for the current run"""
+        stats = self.pool_stats()
+        if not stats:
+            return
+        logger.info(
+            f"DB pool: {stats['checkouts']} checkouts, {stats['creates']} connects "
+            f"({stats['connect_seconds']:.2f}s), {stats['waits']} waits "
+            f"({stats['wait_seconds']:.2f}s), {stats['in_use_seconds']:.2f}s in use, "
+            f"{stats['discards']} discarded")
+
     @contextmanager
     def get_connection(self):
         """Get database connection with automatic cleanup"""
+        if self.pooled:
+            with self._get_pooled_connection() as conn:
+                yield conn
+            return
+
         conn = None
         try:
-            conn = psycopg2.connect(
-                host=self.config.host,
-                port=self.config.port,
-                user=self.config.user,
-                password=self.config.password,
-                database=self.config.database,
-                cursor_factory=psycopg2.extras.RealDictCursor,
-                client_encoding='utf8'
-            )
+            conn = _open_connection(self.config)
             yield conn
         except psycopg2.Error as e:
             logger.error(f"Database connection error: {e}")
@@ -90,6 +423,32 @@ class DatabaseManager:
             if conn:
                 conn.close()
 
+    @contextmanager
+    def _get_pooled_connection(self):
+        """Check a connection out of the shared pool and return it afterwards"""
+        pool = self.pool
+        conn = pool.getconn()
+        checked_out = time.monotonic()
+        broken = False
+        try:
+            yield conn
+        except psycopg2.Error as e:
+            logger.error(f"Database connection error: {e}")
+            broken = conn.closed != 0
+            if not broken:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            raise
+        finally:
+            pool.putconn(conn, time.monotonic() - checked_out, discard=broken)
+
+    @property
+    def schema(self) -> SchemaCapabilities:
+        """Cached tables and columns of this database"""
+        return get_schema_capabilities(self)
+
     def test_connection(self) -> bool:
         """Test database connection"""
         try:
@@ -125,6 +484,7 @@ class DatabaseManager:
                             cursor.execute(statement)
 
                     conn.commit()
+                    refresh_schema_capabilities(self)
                     logger.info(f"Successfully executed SQL file: {file_path}")
                     return True
 
@@ -217,12 +577,10 @@ class DatabaseSetup:
                            'store_time_report', 'store_monthly_target']
 
         try:
+            # Answered from the cached schema instead of one catalog query per table
+            schema = self.db_manager.schema
             for table in required_tables:
-                result = self.db_manager.fetch_one(
-                    "SELECT COUNT(*) as count FROM information_schema.tables WHERE table_name = %s",
-                    (table,)
-                )
-                if not result or result['count'] == 0:
+                if not schema.has_table(table):
                     logger.error(f"Required table '{table}' not found")
                     return False
 
@@ -254,6 +612,25 @@ def get_database_manager(is_test: bool = False) -> DatabaseManager:
     return DatabaseManager(config)
 
 
+_shared_managers: Dict[Tuple[int, bool], DatabaseManager] = {}
+
+
+def get_shared_database_manager(is_test: bool = False) -> DatabaseManager:
+    """
+    Get the per-process pooled database manager.
+
+    Extractors and worksheet generators that use this manager share a single
+    connection pool sized by ``lib.config.CONNECTION_POOL_SIZE``.
+    """
+    key = (os.getpid(), is_test)
+    with _pools_lock:
+        manager = _shared_managers.get(key)
+        if manager is None:
+            manager = DatabaseManager(DatabaseConfig(is_test=is_test), pooled=True)
+            _shared_managers[key] = manager
+        return manager
+
+
 def setup_database_for_tests() -> bool:
     """Setup database for testing"""
     try: